@@ -19,8 +19,17 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_addressing import AddressLedger, assign_address
+from ansible.module_utils.pn_addressing import fabric_inband_ledger
+from ansible.module_utils.pn_csv import DciRow, group_by_switch
+from ansible.module_utils.pn_csv import parse_csv, ThirdPartyRow
+from ansible.module_utils.pn_journal import Journal
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_vlans import vlan_engine
+from ansible.module_utils.pn_wait import PORT_TIMEOUT, ROUTE_TIMEOUT
+from ansible.module_utils.pn_wait import ports_enabled, routes_present
+from ansible.module_utils.pn_wait import wait_for
 import shlex
-import time
 
 DOCUMENTATION = """
 ---
@@ -193,7 +202,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -215,17 +224,21 @@ def auto_accept_eula(module):
     :param module: The Ansible module to fetch input parameters.
     :return: The output of run_cli() method.
     """
+    global CHANGED_FLAG
     password = module.params['pn_clipassword']
     cli = ' /usr/bin/cli --quiet --skip-setup eula-show '
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if err:
         cli = '/usr/bin/cli --quiet'
         cli += ' --skip-setup --script-password '
         cli += ' switch-setup-modify password ' + password
         cli += ' eula-accepted true '
-        return run_cli(module, cli)
+        output = run_cli(module, cli)
+        if 'Setup completed successfully' in output:
+            CHANGED_FLAG.append(True)
+        return output
     elif out:
         return ' EULA has been accepted already '
 
@@ -237,6 +250,7 @@ def update_switch_names(module, switch_name):
     :param switch_name: Name to assign to the switch.
     :return: String describing switch name got modified or not.
     """
+    global CHANGED_FLAG
     cli = pn_cli(module)
     cli += ' switch-setup-show format switch-name '
     if switch_name in run_cli(module, cli).split()[1]:
@@ -245,6 +259,7 @@ def update_switch_names(module, switch_name):
         cli = pn_cli(module)
         cli += ' switch-setup-modify switch-name ' + switch_name
         run_cli(module, cli)
+        CHANGED_FLAG.append(True)
         return ' Updated switch name to match hostname! '
 
 
@@ -261,14 +276,15 @@ def assign_inband_ip(module):
     switch_position = leaf_list.index(current_switch) + 1
 
     address = inband_ip.split('.')
-    static_part = str(address[0]) + '.' + str(address[1]) + '.'
-    last_octet = str(address[3]).split('/')
-    subnet = last_octet[1]
-
-    ip = static_part + str(switch_position) + '.'
-    ip += str(switch_position) + '/' + subnet
+    subnet = str(address[3]).split('/')[1]
 
+    # Leaf N takes a.b.N.N, every leaf in a subnet of its own.
     cli = pn_cli(module)
+    ledger = fabric_inband_ledger(
+        module, cli, '%s.%s.0.0/16' % (address[0], address[1]),
+        stride=257, prefix_len=subnet)
+    ip = assign_address(module, ledger, current_switch, switch_position)
+
     cli += 'switch-setup-modify in-band-ip %s ' % ip
 
     if 'Setup completed successfully' in run_cli(module, cli):
@@ -283,6 +299,7 @@ def create_switch_routes(module, inband_ip):
     Method to create a switch routes
     :param module: The Ansible module to fetch input parameters.
     :param inband_ip: in-band ip of the switch.
+    :return: List of the networks routes were created for.
     """
     inband_address = inband_ip.split(':')[1].split('.')
     static_part = str(inband_address[0]) + '.' + str(inband_address[1]) + '.'
@@ -291,17 +308,21 @@ def create_switch_routes(module, inband_ip):
     subnet = last_octet[1]
     gateway_ip = gateway_static_part + str(int(last_octet[0]) + 1)
     switch_count = 1
+    networks = []
 
     while switch_count <= len(module.params['pn_leaf_list']):
         network_ip = static_part + str(switch_count) + '.' + str(0)
         network_ip += '/' + subnet
+        networks.append(network_ip)
         cli = pn_cli(module)
         cli += ' switch-route-create network %s gateway-ip %s ' % (
             network_ip, gateway_ip
         )
         switch_count += 1
         cli = shlex.split(cli)
-        module.run_command(cli)
+        pn_run_command(module, cli)
+
+    return networks
 
 
 def configure_fabric(module, switch):
@@ -355,32 +376,23 @@ def configure_fabric(module, switch):
     return output
 
 
-def find_clustered_switches(module):
+def find_clustered_switches(rows):
     """
     Method to find clustered switches from the input csv file.
-    :param module: The Ansible module to fetch input parameters.
+    :param rows: The DciRow rows of the csv file.
     :return: It returns a dict whose first value is list of pairs of cluster
     and second is list of switches in cluster.
     """
-    csv_data = module.params['pn_csv_data']
-    csv_data = csv_data.replace(' ', '')
-    csv_data = csv_data.split('\n')
     cluster_dict_info = {}
     cluster_list = []
     cluster_switches = []
 
-    for line in csv_data:
-        if line != '':
-            line = line.split(',')
-            cluster_node_1 = line[2]
-            cluster_node_2 = line[3]
-
-            if not cluster_node_2.isdigit():
-                temp_list = [cluster_node_1, cluster_node_2]
-                if temp_list not in cluster_list:
-                    cluster_switches.append(cluster_node_1)
-                    cluster_switches.append(cluster_node_2)
-                    cluster_list.append(temp_list)
+    for row in rows:
+        if row.clustered():
+            temp_list = list(row.switches())
+            if temp_list not in cluster_list:
+                cluster_switches += temp_list
+                cluster_list.append(temp_list)
 
     cluster_dict_info[0] = cluster_list
     cluster_dict_info[1] = cluster_switches
@@ -441,7 +453,7 @@ def join_fabric(module, switch_ip):
 
     cli += ' fabric-info format name no-show-headers'
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if err:
         cli = clicopy
@@ -556,85 +568,101 @@ def configure_loopback_interface(module, switch, router_id):
         )
 
 
-def configure_ebgp_connections(module, switch, third_party_data, bgp_nic_ip):
+def configure_ebgp_connections(module, switch, neighbors, bgp_nic_ip):
     """
     Method to configure eBGP connection to remaining third party neighbors.
     :param module: The Ansible module to fetch input parameters.
     :param switch: Name of the switch.
-    :param third_party_data: Third party BGP data in csv format.
+    :param neighbors: List of [third party switch, neighbor ip, remote as]
+    of the remaining neighbors.
     :param bgp_nic_ip: Ip of first bgp neighbor added.
     :return: String describing eBGP configuration.
     """
     global CHANGED_FLAG
     output = ''
     vrouter_name = switch + '-vrouter'
-    skip_flag = False
     address = bgp_nic_ip.split('.')
     bgp_static_part = str(address[0]) + '.' + str(address[1]) + '.'
     bgp_static_part += str(address[2]) + '.'
     bgp_last_octet = str(address[3]).split('/')
     bgp_subnet = bgp_last_octet[1]
 
-    for row in third_party_data:
-        row = row.split(',')
-        if not skip_flag and row[4] == switch:
-            skip_flag = True
-            continue
+    for neighbor_name, neighbor_ip, remote_as in neighbors:
+        address = neighbor_ip.split('.')
+        static_part = str(address[0]) + '.' + str(address[1]) + '.'
+        static_part += str(address[2]) + '.'
+        last_octet = str(int(address[3]) - 1)
+        ip = static_part + last_octet + '/' + bgp_subnet
 
-        if skip_flag and row[4] == switch:
-            neighbor_name = row[0]
-            neighbor_ip = row[1]
-            remote_as = row[2]
+        l3_port = get_l3_port(module, neighbor_name)
 
-            address = neighbor_ip.split('.')
-            static_part = str(address[0]) + '.' + str(address[1]) + '.'
-            static_part += str(address[2]) + '.'
-            last_octet = str(int(address[3]) - 1)
-            ip = static_part + last_octet + '/' + bgp_subnet
+        cli = pn_cli(module)
+        clicopy = cli
+        cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_name
+        cli += ' format ip no-show-headers '
+        exisiting_ip = run_cli(module, cli).split()
 
-            l3_port = get_l3_port(module, neighbor_name)
+        if ip not in exisiting_ip:
+            cli = clicopy
+            cli += ' vrouter-interface-add vrouter-name %s ' % vrouter_name
+            cli += ' l3-port %s ip %s ' % (l3_port, ip)
+            run_cli(module, cli)
+            output += ' %s: Added vrouter interface %s \n' % (switch, ip)
+        else:
+            output += ' %s: Vrouter interface %s already added \n' % (
+                switch, ip
+            )
 
-            cli = pn_cli(module)
-            clicopy = cli
-            cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_name
-            cli += ' format ip no-show-headers '
-            exisiting_ip = run_cli(module, cli).split()
+        cli = clicopy
+        cli += ' vrouter-bgp-show vrouter-name %s ' % vrouter_name
+        cli += ' format neighbor no-show-headers '
+        exisiting_neighbor = run_cli(module, cli).split()
 
-            if ip not in exisiting_ip:
-                cli = clicopy
-                cli += ' vrouter-interface-add vrouter-name %s ' % vrouter_name
-                cli += ' l3-port %s ip %s ' % (l3_port, ip)
-                run_cli(module, cli)
-                output += ' %s: Added vrouter interface %s \n' % (switch, ip)
-            else:
-                output += ' %s: Vrouter interface %s already added \n' % (
-                    switch, ip
-                )
+        if neighbor_ip not in exisiting_neighbor:
+            cli = clicopy
+            cli += ' vrouter-bgp-add vrouter-name %s ' % vrouter_name
+            cli += ' neighbor %s remote-as %s bfd ' % (neighbor_ip,
+                                                       remote_as)
+            cli += ' allowas-in '
+            run_cli(module, cli)
+            output += ' %s: Added eBGP neighbor %s \n' % (switch,
+                                                          neighbor_ip)
 
             cli = clicopy
-            cli += ' vrouter-bgp-show vrouter-name %s ' % vrouter_name
-            cli += ' format neighbor no-show-headers '
-            exisiting_neighbor = run_cli(module, cli).split()
+            cli += ' vrouter-modify name %s ' % vrouter_name
+            cli += ' bgp-max-paths %s ' % module.params['pn_bgp_max_path']
+            cli += ' bgp-bestpath-as-path multipath-relax '
+            run_cli(module, cli)
+        else:
+            output += ' %s: eBGP neighbor %s already added \n' % (
+                switch, neighbor_ip
+            )
 
-            if neighbor_ip not in exisiting_neighbor:
-                cli = clicopy
-                cli += ' vrouter-bgp-add vrouter-name %s ' % vrouter_name
-                cli += ' neighbor %s remote-as %s bfd ' % (neighbor_ip,
-                                                           remote_as)
-                cli += ' allowas-in '
-                run_cli(module, cli)
-                output += ' %s: Added eBGP neighbor %s \n' % (switch,
-                                                              neighbor_ip)
+    return output
 
-                cli = clicopy
-                cli += ' vrouter-modify name %s ' % vrouter_name
-                cli += ' bgp-max-paths %s ' % module.params['pn_bgp_max_path']
-                cli += ' bgp-bestpath-as-path multipath-relax '
-                run_cli(module, cli)
-            else:
-                output += ' %s: eBGP neighbor %s already added \n' % (
-                    switch, neighbor_ip
-                )
+
+def create_vlans(module, requests):
+    """
+    Method to create vlans, the switches in parallel. The vlans of the
+    fabric are pulled once per run.
+    :param module: The Ansible module to fetch input parameters.
+    :param requests: List of [switch name, vlan id, scope of the vlan].
+    :return: List of strings describing every vlan creation details.
+    """
+    global CHANGED_FLAG
+    engine = vlan_engine(module, pn_cli(module))
+    output = []
+    for (switch, vlan_id, scope), created in zip(
+            requests, engine.create([tuple(request) for request in requests])):
+        if created:
+            CHANGED_FLAG.append(True)
+            output.append(' %s: Vlan id %s with scope %s created \n' % (
+                switch, vlan_id, scope
+            ))
+        else:
+            output.append(' %s: Vlan id %s with scope %s already exists \n' % (
+                switch, vlan_id, scope
+            ))
 
     return output
 
@@ -648,28 +676,7 @@ def create_vlan(module, vlan_id, switch, scope):
     :param scope: Scope of the vlan to create.
     :return: String describing vlan creation details.
     """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s vlan-show format id no-show-headers ' % switch
-    existing_vlan_ids = run_cli(module, cli).split()
-    existing_vlan_ids = list(set(existing_vlan_ids))
-
-    if vlan_id not in existing_vlan_ids:
-        cli = clicopy
-        cli += ' switch %s vlan-create id %s scope %s ' % (switch, vlan_id,
-                                                           scope)
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-
-        return ' %s: Vlan id %s with scope %s created \n' % (
-            switch, vlan_id, scope
-        )
-
-    else:
-        return ' %s: Vlan id %s with scope %s already exists \n' % (
-            switch, vlan_id, scope
-        )
+    return create_vlans(module, [[switch, vlan_id, scope]])[0]
 
 
 def configure_ibgp_connection(module, switch, local_ip, remote_ip, remote_as):
@@ -921,51 +928,43 @@ def add_vrouter_interface_for_non_cluster_switch(module, vrrp_ip, switch,
         )
 
 
-def configure_vrrp(module):
+def configure_vrrp(module, journal, rows):
     """
     Method to configure VRRP L3.
     :param module: The Ansible module to fetch input parameters.
+    :param journal: The Journal of the run.
+    :param rows: The DciRow rows of the csv file.
     :return: Output string of configuration.
     """
     output = ''
-    csv_data = module.params['pn_csv_data']
-    csv_data = csv_data.replace(" ", "")
-    csv_data_list = csv_data.split('\n')
-
-    # Parse csv file data and configure VRRP.
-    for row in csv_data_list:
-        elements = row.split(',')
-        cluster_list = []
-        vlan_id = elements[0]
-        vrrp_ip = elements[1]
-        cluster_node1 = str(elements[2])
-        if len(elements) > 5:
+    for row in rows:
+        vlan_id = row.vlan
+        vrrp_ip = row.ip
+        cluster_node1 = row.switch1
+        if row.clustered():
             # Configure VRRP for clustered switches
-            cluster_node2 = str(elements[3])
-            vrrp_id = elements[4]
-            active_switch = str(elements[5])
-            cluster_list.append(cluster_node1)
-            cluster_list.append(cluster_node2)
-            cluster_name = cluster_node1 + '-to-' + cluster_node2 + '-cluster'
+            cluster_list = list(row.switches())
+            cluster_name = cluster_node1 + '-to-' + row.switch2 + '-cluster'
             host_count = 1
 
             # Create a cluster and vlan with scope cluster
-            output += create_cluster(module, cluster_name, cluster_list)
-            output += create_vlan(module, vlan_id, cluster_node1, 'cluster')
+            output += journal.run(create_cluster, cluster_name, cluster_list)
+            output += journal.run(create_vlan, vlan_id, cluster_node1,
+                                  'cluster')
 
             for switch in cluster_list:
-                output += modify_vrouter(module, switch, vrrp_id)
+                output += journal.run(modify_vrouter, switch, row.vrrp_id)
                 host_count += 1
-                vrrp_priority = '110' if switch == active_switch else '100'
-                output += create_vrouter_interface(module, switch, vrrp_ip,
-                                                   vlan_id, vrrp_id,
-                                                   str(host_count),
-                                                   vrrp_priority)
+                vrrp_priority = '110' if switch == row.active_switch else '100'
+                output += journal.run(create_vrouter_interface, switch,
+                                      vrrp_ip, vlan_id, row.vrrp_id,
+                                      str(host_count), vrrp_priority)
         else:
             # Configure VRRP for non clustered switches.
-            output += create_vlan(module, vlan_id, cluster_node1, 'local')
-            output += add_vrouter_interface_for_non_cluster_switch(
-                module, vrrp_ip, cluster_node1, vlan_id)
+            output += journal.run(create_vlan, vlan_id, cluster_node1,
+                                  'local')
+            output += journal.run(add_vrouter_interface_for_non_cluster_switch,
+                                  vrrp_ip, cluster_node1, vlan_id)
 
     return output
 
@@ -1089,102 +1088,81 @@ def add_vxlan_to_tunnel(module, vxlan, tunnel_name, switch):
                                                          tunnel_name)
 
 
-def configure_vxlan(module):
+def configure_vxlan(module, journal, rows):
     """
     Method to configure vxlan.
     :param module: The Ansible module to fetch input parameters.
+    :param journal: The Journal of the run.
+    :param rows: The DciRow rows of the csv file.
     :return: Output string of configuration.
     """
     output = ''
     vxlan_switches_list = []
-    csv_data = module.params['pn_csv_data']
-    csv_data = csv_data.replace(" ", "")
-    csv_data_list = csv_data.split('\n')
-
-    for row in csv_data_list:
-        elements = row.split(',')
-        vlan_id = elements[0]
-        leaf_switch_1 = elements[2]
-        if len(elements) == 7:
-            leaf_switch_2 = elements[3]
-            vxlan_id = elements[6]
-            vxlan_switches_list.append([leaf_switch_1, leaf_switch_2, vlan_id])
-            output += add_vxlan_to_vlan(module, vlan_id, vxlan_id,
-                                        leaf_switch_1)
-            output += add_vxlan_to_vlan(module, vlan_id, vxlan_id,
-                                        leaf_switch_2)
-        elif len(elements) == 4:
-            vxlan_id = elements[3]
-            vxlan_switches_list.append([leaf_switch_1, vlan_id])
-            output += add_vxlan_to_vlan(module, vlan_id, vxlan_id,
-                                        leaf_switch_1)
-
-    for row in csv_data_list:
-        elements = row.split(',')
-        vlan_id = elements[0]
-        leaf_switch_1 = elements[2]
-
-        if len(elements) == 7 or len(elements) == 4:
-            if len(elements) == 7:
-                leaf_switch_2 = elements[3]
-                vxlan_id = elements[6]
-                cluster = [leaf_switch_1, leaf_switch_2, vlan_id]
-                scope = 'cluster'
+    # Rows without a vxlan id only configure VRRP.
+    rows = [row for row in rows if row.vxlan is not None]
+
+    for row in rows:
+        vxlan_switches_list.append(list(row.switches()) + [row.vlan])
+        for switch in row.switches():
+            output += journal.run(add_vxlan_to_vlan, row.vlan, row.vxlan,
+                                  switch)
+
+    for row in rows:
+        vlan_id = row.vlan
+        leaf_switch_1 = row.switch1
+        leaf_switch_2 = row.switch2
+        vxlan_id = row.vxlan
+        cluster = list(row.switches()) + [vlan_id]
+        scope = 'cluster' if row.clustered() else 'local'
+
+        for switches in vxlan_switches_list:
+            if switches == cluster:
+                continue
             else:
-                leaf_switch_2 = None
-                vxlan_id = elements[3]
-                cluster = [leaf_switch_1, vlan_id]
-                scope = 'local'
-
-            for switches in vxlan_switches_list:
-                if switches == cluster:
-                    continue
-                else:
-                    tunnel_name = leaf_switch_1 + '-' + switches[0] + '-tunnel'
-                    local_ip = get_vrouter_interface_ip(module, leaf_switch_1,
-                                                        vlan_id)
-                    if len(switches) == 3:
-                        remote_vlan = switches[2]
-                    else:
-                        remote_vlan = switches[1]
-
-                    remote_ip = get_vrouter_interface_ip(module, switches[0],
-                                                         remote_vlan)
-
-                    output += create_tunnel(module, leaf_switch_1, tunnel_name,
-                                            scope, local_ip, remote_ip,
-                                            leaf_switch_2)
-
-                    output += add_vxlan_to_tunnel(module, vxlan_id, tunnel_name,
-                                                  leaf_switch_1)
+                tunnel_name = leaf_switch_1 + '-' + switches[0] + '-tunnel'
+                local_ip = get_vrouter_interface_ip(module, leaf_switch_1,
+                                                    vlan_id)
+                remote_ip = get_vrouter_interface_ip(module, switches[0],
+                                                     switches[-1])
+
+                output += journal.run(create_tunnel, leaf_switch_1,
+                                      tunnel_name, scope, local_ip,
+                                      remote_ip, leaf_switch_2)
+
+                output += journal.run(add_vxlan_to_tunnel, vxlan_id,
+                                      tunnel_name, leaf_switch_1)
 
     return output
 
 
-def configure_ibgp_vrrp_vxlan(module):
+def configure_ibgp_vrrp_vxlan(module, journal, rows, third_party):
     """
     Method to configure iBGP, VRRP and Vxlan for DCI.
     :param module: The Ansible module to fetch input parameters.
+    :param journal: The Journal of the run.
+    :param rows: The DciRow rows of the csv file.
+    :param third_party: The ThirdPartyRow rows of the third party csv file,
+    grouped by switch.
     :return: String describing details of all configurations.
     """
     global CHANGED_FLAG
     output = ''
-    cluster_dict_info = find_clustered_switches(module)
+    cluster_dict_info = find_clustered_switches(rows)
     cluster_list = cluster_dict_info[0]
 
+    # Create local vlans on the nodes of all clusters at once.
+    vlan_id = module.params['pn_ibgp_vlan']
+    output += ''.join(journal.run(create_vlans, [
+        [node, vlan_id, 'local'] for cluster in cluster_list
+        for node in cluster]))
+
     # Configure iBGP connection between clusters
     for cluster in cluster_list:
         cluster_node1 = cluster[0]
         cluster_node2 = cluster[1]
-        vlan_id = module.params['pn_ibgp_vlan']
-        vlan_scope = 'local'
         ibgp_ip_range = module.params['pn_ibgp_ip_range']
         subnet_count = 0
 
-        # Create local vlans on both cluster nodes.
-        output += create_vlan(module, vlan_id, cluster_node1, vlan_scope)
-        output += create_vlan(module, vlan_id, cluster_node2, vlan_scope)
-
         address = ibgp_ip_range.split('.')
         static_part = str(address[0]) + '.' + str(address[1]) + '.'
         static_part += str(address[2]) + '.'
@@ -1196,36 +1174,53 @@ def configure_ibgp_vrrp_vxlan(module):
         node2_ip = static_part + str(ip_count + 2) + '/' + subnet
         subnet_count += 1
 
-        # Get the bgp-as values of cluster nodes.
-        third_party_data = module.params['pn_third_party_bgp_data'].replace(' ',
-                                                                            '')
-        third_party_data = third_party_data.split('\n')
-        for row in third_party_data:
-            row = row.split(',')
-            if row[4] == cluster_node1 or row[4] == cluster_node2:
-                bgp_as = row[3]
-                break
+        # Get the bgp-as value of the first third party row of the nodes.
+        node_rows = (third_party.get(cluster_node1, [])[:1] +
+                     third_party.get(cluster_node2, [])[:1])
+        if not node_rows:
+            module.exit_json(
+                error='1',
+                failed=True,
+                msg='No third party bgp data for cluster %s, %s' % (
+                    cluster_node1, cluster_node2),
+                changed=False
+            )
+        bgp_as = min(node_rows, key=lambda row: row.line).bgp_as
 
         # Configure iBGP connection.
-        output += configure_ibgp_connection(module, cluster_node1, node1_ip,
-                                            node2_ip, bgp_as)
+        output += journal.run(configure_ibgp_connection, cluster_node1,
+                              node1_ip, node2_ip, bgp_as)
 
-        output += configure_ibgp_connection(module, cluster_node2, node2_ip,
-                                            node1_ip, bgp_as)
+        output += journal.run(configure_ibgp_connection, cluster_node2,
+                              node2_ip, node1_ip, bgp_as)
 
     # Configure VRRP to be used for VTEP HA
-    output += configure_vrrp(module)
+    output += configure_vrrp(module, journal, rows)
 
     # Configure vxlan tunnels
-    output += configure_vxlan(module)
+    output += configure_vxlan(module, journal, rows)
 
     return output
 
 
-def implement_dci(module):
+def get_inband_ip(module):
+    """
+    Method to get the in-band ip of the switch.
+    :param module: The Ansible module to fetch input parameters.
+    :return: The output of switch-setup-show.
+    """
+    cli = pn_cli(module)
+    cli += ' switch-setup-show format in-band-ip no-show-headers '
+    return run_cli(module, cli)
+
+
+def implement_dci(module, journal, third_party):
     """
     Method to implement initial DCI setup: fabric creation/join and eBGP.
     :param module: The Ansible module to fetch input parameters.
+    :param journal: The Journal of the run.
+    :param third_party: The ThirdPartyRow rows of the third party csv file,
+    grouped by switch.
     :return: String describing details of DCI implementation.
     """
     global CHANGED_FLAG
@@ -1234,8 +1229,7 @@ def implement_dci(module):
     bgp_ip = module.params['pn_bgp_ip']
     leaf_list = module.params['pn_leaf_list']
     loopback_ip = module.params['pn_loopback_ip']
-    third_party_data = module.params['pn_third_party_bgp_data'].replace(' ', '')
-    third_party_data = third_party_data.split('\n')
+    neighbors = third_party.get(current_switch, [])
 
     address = bgp_ip.split('.')
     bgp_static_part = str(address[0]) + '.' + str(address[1]) + '.'
@@ -1243,19 +1237,15 @@ def implement_dci(module):
     bgp_last_octet = str(address[3]).split('/')
     bgp_subnet = bgp_last_octet[1]
 
+    # Calculate router-id to be assigned to vrouter, leaf N takes a.b.N.N.
     address = loopback_ip.split('.')
-    loopback_static_part = str(address[0]) + '.' + str(address[1]) + '.'
-
-    # Calculate router-id to be assigned to vrouter.
     switch_index = leaf_list.index(current_switch)
-    router_count = switch_index + 1
-    router_id = loopback_static_part + str(router_count) + '.'
-    router_id += str(router_count)
+    router_ids = AddressLedger('%s.%s.0.0/16' % (address[0], address[1]),
+                               stride=257)
+    router_id = router_ids.host(switch_index + 1)
 
     # Calculate in-band-nic-ip and in-band-nic-netmask for vrouter creation.
-    cli = pn_cli(module)
-    cli += ' switch-setup-show format in-band-ip no-show-headers '
-    inband_ip = run_cli(module, cli)
+    inband_ip = get_inband_ip(module)
     address = inband_ip.split(':')[1]
     address = address.replace(' ', '')
     address = address.split('.')
@@ -1268,19 +1258,14 @@ def implement_dci(module):
     # Get the neighbor ip and remote-as value of the first neighbor
     # Third party csv format: (third party switch name, neighbor-ip,
     # bgp-as of third party switch, remote-as, neighbor switch name)
-    neighbor_name, neighbor_ip, remote_as, bgp_as = None, None, None, None
-    for row in third_party_data:
-        row = row.split(',')
-        if row[4] == current_switch:
-            neighbor_name = row[0]
-            neighbor_ip = row[1]
-            remote_as = row[2]
-            bgp_as = row[3]
-            break
-
-    if neighbor_name is None or neighbor_ip is None or remote_as is None:
+    if not neighbors:
         return ' %s: Could not find remote bgp data \n' % current_switch
 
+    neighbor_name = neighbors[0].neighbor_name
+    neighbor_ip = neighbors[0].neighbor_ip
+    remote_as = neighbors[0].remote_as
+    bgp_as = neighbors[0].bgp_as
+
     # Calculate bgp-nic-l3-port number connected to first neighbor
     bgp_nic_l3_port = get_l3_port(module, neighbor_name)
 
@@ -1296,25 +1281,30 @@ def implement_dci(module):
     bgp_nic_ip = n_static_part + n_last_octet + '/' + bgp_subnet
 
     # Create and configure vrouter on this switch.
-    output += create_vrouter(module, current_switch, bgp_as, router_id,
-                             bgp_nic_ip, bgp_nic_l3_port, neighbor_ip,
-                             remote_as, inband_nic_ip, inband_nic_netmask,
-                             fabric_network_address)
+    output += journal.run(create_vrouter, current_switch, bgp_as, router_id,
+                          bgp_nic_ip, bgp_nic_l3_port, neighbor_ip, remote_as,
+                          inband_nic_ip, inband_nic_netmask,
+                          fabric_network_address)
 
     # Configure other eBGP connection to third party switches
-    output += configure_ebgp_connections(module, current_switch,
-                                         third_party_data, bgp_nic_ip)
+    output += journal.run(configure_ebgp_connections, current_switch,
+                          [[row.neighbor_name, row.neighbor_ip, row.remote_as]
+                           for row in neighbors[1:]], bgp_nic_ip)
 
     # Configure loopback interface for debugging purpose.
-    output += configure_loopback_interface(module, current_switch, router_id)
+    output += journal.run(configure_loopback_interface, current_switch,
+                          router_id)
 
     # Create a switch routes to all other switches
     if switch_index != 0:
-        create_switch_routes(module, inband_ip)
-        time.sleep(10)
+        networks = journal.run(create_switch_routes, inband_ip)
+        if not wait_for(routes_present(module, pn_cli(module), networks),
+                        ROUTE_TIMEOUT):
+            output += ' %s: Switch routes not present after %d seconds \n' % (
+                current_switch, ROUTE_TIMEOUT)
 
     # Configure fabric
-    output += configure_fabric(module, current_switch)
+    output += journal.run(configure_fabric, current_switch)
 
     return output
 
@@ -1323,8 +1313,10 @@ def toggle_40g_local(module):
     """
     Method to toggle 40g ports to 10g ports.
     :param module: The Ansible module to fetch input parameters.
-    :return: The output messages for assignment.
+    :return: The output messages for the toggled ports.
     """
+    global CHANGED_FLAG
+    switch = module.params['pn_current_switch']
     output = ''
     cli = pn_cli(module)
     clicopy = cli
@@ -1338,6 +1330,7 @@ def toggle_40g_local(module):
     if len(ports_40g) > 0 and ports_40g != 'Success':
         ports_40g = ports_40g.split()
         ports_to_modify = list(set(ports_40g) - set(local_ports))
+        modified = []
 
         for port in ports_to_modify:
             next_port = str(int(port) + 1)
@@ -1349,26 +1342,33 @@ def toggle_40g_local(module):
             if '.2' in bezel_port:
                 end_port = int(port) + 3
                 range_port = port + '-' + str(end_port)
+                modified.append(range_port)
 
                 cli = clicopy
                 cli += ' port-config-modify port %s ' % port
                 cli += ' disable '
-                output += 'port ' + port + ' disabled'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
 
                 cli = clicopy
                 cli += ' port-config-modify port %s ' % port
                 cli += ' speed 10g '
-                output += 'port ' + port + ' converted to 10g'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
 
                 cli = clicopy
                 cli += ' port-config-modify port %s ' % range_port
                 cli += ' enable '
-                output += 'port range_port ' + range_port + '  enabled'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
 
-        time.sleep(10)
+        # Wait for the converted ports to be enabled rather than a fixed
+        # delay. They have no LLDP neighbor, so they may never come up.
+        if modified:
+            CHANGED_FLAG.append(True)
+            output += ' %s: Toggled 40G ports to 10G \n' % switch
+            ports = ','.join(modified)
+            enabled = ports_enabled(module, clicopy, ports, '10g')
+            if not wait_for(enabled, PORT_TIMEOUT):
+                output += ' %s: Ports %s not enabled after %d seconds \n' % (
+                    switch, ports, PORT_TIMEOUT)
 
     return output
 
@@ -1403,32 +1403,39 @@ def main():
     current_switch = module.params['pn_current_switch']
     message = ''
     global CHANGED_FLAG
+    # Validate the csv files before running any command.
+    third_party = group_by_switch(parse_csv(
+        module, module.params['pn_third_party_bgp_data'], ThirdPartyRow))
+    if not module.params['pn_run_initial_setup']:
+        rows = parse_csv(module, module.params['pn_csv_data'], DciRow)
+    # A retry resumes after the steps the failed attempt completed. Steps
+    # flag their changes themselves, and replayed steps flag them again.
+    journal = Journal(module, 'pn_dci', CHANGED_FLAG)
 
     if module.params['pn_run_initial_setup']:
         # Auto accept EULA
-        if 'Setup completed successfully' in auto_accept_eula(module):
+        if 'Setup completed successfully' in journal.run(auto_accept_eula):
             message += ' %s: EULA accepted \n' % current_switch
-            CHANGED_FLAG.append(True)
         else:
             message += ' %s: EULA has already been accepted \n' % current_switch
 
         # Update switch names to match host names from hosts file
-        if 'Updated' in update_switch_names(module, current_switch):
-            CHANGED_FLAG.append(True)
+        journal.run(update_switch_names, current_switch)
 
         # Toggle 40g ports to 10g
-        if toggle_40g_local(module):
-            message += ' %s: Toggled 40G ports to 10G \n' % current_switch
-            CHANGED_FLAG.append(True)
+        message += journal.run(toggle_40g_local)
 
         # Assign in-band ip
-        message += assign_inband_ip(module)
+        message += journal.run(assign_inband_ip)
 
         # Implement Data Center Interconnect
-        message += implement_dci(module)
+        message += implement_dci(module, journal, third_party)
     else:
         # Configure iBGP, VRRP and vxlan
-        message += configure_ibgp_vrrp_vxlan(module)
+        message += configure_ibgp_vrrp_vxlan(module, journal, rows,
+                                             third_party)
+
+    journal.finish()
 
     # Exit the module and return the required JSON
     module.exit_json(
@@ -19,6 +19,12 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_addressing import loopback_plan
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot
+from ansible.module_utils.pn_numbering import GroupNumbering
+from ansible.module_utils.pn_reconcile import apply_plan, Lookup, Reconciler
+from ansible.module_utils.pn_reconcile import save_plans, saved_plans
 import shlex
 
 DOCUMENTATION = """
@@ -113,6 +119,15 @@ options:
       required: False
       type: str
       default: '0'
+    pn_plan_file:
+      description:
+        - File holding the planned router id, cluster and routing commands.
+        - In check mode the plan gets written to it, otherwise the plan it
+          holds is applied without planning again and the file is removed.
+          If the fabric changed since it was written, e.g. by a failed run,
+          what is left of the plan is diffed against the fabric first.
+      required: False
+      type: str
 """
 
 EXAMPLES = """
@@ -141,6 +156,24 @@ failed:
 
 CHANGED_FLAG = []
 
+# Show tables the routing setup is planned against.
+SNAPSHOT_TABLES = ('fabric-node-show', 'cluster-show', 'vlan-show',
+                   'vrouter-show', 'vrouter-interface-show',
+                   'vrouter-loopback-interface-show', 'vrouter-bgp-show',
+                   'vrouter-ospf-show', 'port-show', 'lldp-show')
+
+
+def snapshot_tables(module):
+    """
+    Method to list the show tables to plan against.
+    :param module: The Ansible module to fetch input parameters.
+    :return: SNAPSHOT_TABLES, plus the interface configs OSPF BFD goes to.
+    """
+    if module.params['pn_bfd'] and \
+            module.params['pn_routing_protocol'] == 'ospf':
+        return SNAPSHOT_TABLES + ('vrouter-interface-config-show',)
+    return SNAPSHOT_TABLES
+
 
 def pn_cli(module):
     """
@@ -168,7 +201,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -184,123 +217,93 @@ def run_cli(module, cli):
         return 'Success'
 
 
-def find_dict_bgp_as(module):
+def apply_changes(module, cli, snapshot, plan):
     """
-    Method to find bgp-as for all switches and store in dictionary.
+    Method to configure the changes of a plan.
     :param module: The Ansible module to fetch input parameters.
-    :return: Dictionary containing area_id of all leaf.
+    :param cli: The cli prefix returned by pn_cli().
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param plan: The plan, as returned by Reconciler.plan().
+    :return: String describing the changes.
     """
-    leaf_list = module.params['pn_leaf_list']
-    spine_list = module.params['pn_spine_list']
-    bgp_as = int(module.params['pn_bgp_as_range'])
-    cluster_leaf_list = []
-    cli = pn_cli(module)
-    clicopy = cli
-    dict_bgp_as = {}
+    global CHANGED_FLAG
+    if not plan:
+        return ''
 
-    for spine in module.params['pn_spine_list']:
-        dict_bgp_as[spine] = str(bgp_as)
+    CHANGED_FLAG.append(True)
+    return apply_plan(module, cli, snapshot, plan)
 
-    cli += ' cluster-show format name no-show-headers'
-    cluster_list = run_cli(module, cli).split()
 
-    if 'Success' not in cluster_list:
-        for cluster in cluster_list:
+def find_dict_bgp_as(module, snapshot):
+    """
+    Method to find bgp-as for all switches and store in dictionary. The
+    bgp-as the vrouters already have is kept, only switches without one get
+    the next free number, so re-runs and added leafs renumber nothing.
+    :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :return: Dictionary containing bgp-as of all switches.
+    """
+    leaf_list = module.params['pn_leaf_list']
+    bgp_as = int(module.params['pn_bgp_as_range'])
+    cluster_leaf_list = set()
 
-            cli = clicopy
-            cli += ' cluster-show name %s' % cluster
-            cli += ' format cluster-node-1,cluster-node-2 no-show-headers'
-            cluster_nodes = run_cli(module, cli).split()
+    current = dict((row.location, row.bgp_as)
+                   for row in snapshot.rows['vrouter-show'])
+    numbering = GroupNumbering(bgp_as + 1, current)
+    numbering.pin(module.params['pn_spine_list'], bgp_as)
 
-            if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
-                bgp_as += 1
-                dict_bgp_as[cluster_nodes[0]] = str(bgp_as)
-                dict_bgp_as[cluster_nodes[1]] = str(bgp_as)
-                cluster_leaf_list.append(cluster_nodes[0])
-                cluster_leaf_list.append(cluster_nodes[1])
+    leafs = set(leaf_list)
+    for cluster, node1, node2 in snapshot.cluster_nodes():
+        if node1 in leafs and node2 in leafs:
+            numbering.assign((node1, node2))
+            cluster_leaf_list.update((node1, node2))
 
-    noncluster_leaf_list = list(set(leaf_list) - set(cluster_leaf_list))
-    for leaf in noncluster_leaf_list:
-        bgp_as += 1
-        dict_bgp_as[leaf] = str(bgp_as)
+    for leaf in leaf_list:
+        if leaf not in cluster_leaf_list:
+            numbering.assign((leaf,))
 
-    return dict_bgp_as
+    return numbering.mapping()
 
 
-def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip, remote_as):
+def vrouter_interface_ibgp_add(module, snapshot, reconciler, switch_name,
+                               interface_ip, neighbor_ip, remote_as):
     """
-    Method to create interfaces and add ibgp neighbors.
+    Method to declare the interfaces and ibgp neighbors.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param switch_name: The name of the switch to run interface.
     :param interface_ip: Interface ip to create a vrouter interface.
     :param neighbor_ip: Neighbor_ip for the ibgp neighbor.
     :param remote_as: Bgp-as for remote switch.
-    :return: String describing if ibgp neighbours got added or already exists.
+    :return: String describing if ibgp neighbours already exist.
     """
-    global CHANGED_FLAG
     output = ''
     vlan_id = module.params['pn_ibgp_vlan']
 
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s vlan-show format id no-show-headers ' % switch_name
-    existing_vlans = run_cli(module, cli).split()
-
-    if vlan_id not in existing_vlans:
-        cli = clicopy
-        cli += ' switch %s vlan-create id %s scope local ' % (switch_name,
-                                                              vlan_id)
-        run_cli(module, cli)
-
-        output += ' %s: Vlan with id %s created \n' % (switch_name, vlan_id)
-        CHANGED_FLAG.append(True)
-
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
-
-    cli = clicopy
-    cli += ' vrouter-interface-show ip %s vlan %s' % (interface_ip, vlan_id)
-    cli += ' format switch no-show-headers'
-    existing_vrouter_interface = run_cli(module, cli).split()
-
-    if vrouter not in existing_vrouter_interface:
-        cli = clicopy
-        cli += ' vrouter-interface-add vrouter-name %s ip %s vlan %s ' % (
-            vrouter, interface_ip, vlan_id
-        )
-        run_cli(module, cli)
+    reconciler.want('vlan', switch_name, [('id', vlan_id), ('scope', 'local')],
+                    message=' %s: Vlan with id %s created \n' % (switch_name,
+                                                                 vlan_id))
 
-        output += ' %s: Added vrouter interface with ip %s on %s \n' % (
-            switch_name, interface_ip, vrouter
-        )
-        CHANGED_FLAG.append(True)
-    else:
+    vrouter = snapshot.vrouter(switch_name)
+
+    if not reconciler.want('vrouter-interface', switch_name, [
+            ('vrouter-name', vrouter), ('ip', interface_ip), ('vlan', vlan_id)
+    ], message=' %s: Added vrouter interface with ip %s on %s \n' % (
+            switch_name, interface_ip, vrouter)):
         output += ' %s: Vrouter interface %s already exists for %s \n' % (
             switch_name, interface_ip, vrouter
         )
 
     neighbor_ip = neighbor_ip.split('/')[0]
-    cli = clicopy
-    cli += ' vrouter-bgp-show remote-as ' + remote_as
-    cli += ' neighbor %s format switch no-show-headers' % neighbor_ip
-    already_added = run_cli(module, cli).split()
-
-    if vrouter not in already_added:
-        cli = clicopy
-        cli += ' vrouter-bgp-add vrouter-name %s' % vrouter
-        cli += ' neighbor %s remote-as %s next-hop-self' % (neighbor_ip,
-                                                            remote_as)
-        if module.params['pn_bfd']:
-            cli += ' bfd '
-
-        if 'Success' in run_cli(module, cli):
-            output += ' %s: Added iBGP neighbor %s for %s \n' % (switch_name,
-                                                                 neighbor_ip,
-                                                                 vrouter)
-            CHANGED_FLAG.append(True)
-    else:
+    args = [('vrouter-name', vrouter), ('neighbor', neighbor_ip),
+            ('remote-as', remote_as), ('next-hop-self', None)]
+    if module.params['pn_bfd']:
+        args.append(('bfd', None))
+
+    if not reconciler.want('vrouter-bgp', switch_name, args,
+                           message=' %s: Added iBGP neighbor %s for %s \n' % (
+                               switch_name, neighbor_ip, vrouter)):
         output += ' %s: iBGP neighbour %s already exists for %s \n' % (
             switch_name, neighbor_ip, vrouter
         )
@@ -308,10 +311,12 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip, r
     return output
 
 
-def assign_ibgp_interface(module, dict_bgp_as):
+def assign_ibgp_interface(module, snapshot, reconciler, dict_bgp_as):
     """
     Method to create interfaces and add ibgp neighbors.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param dict_bgp_as: The dictionary containing bgp-as of all switches.
     :return: The output of vrouter_interface_ibgp_add() method.
     """
@@ -322,37 +327,27 @@ def assign_ibgp_interface(module, dict_bgp_as):
     subnet_count = 0
     supernet = 30
 
-    cli = pn_cli(module)
-    clicopy = cli
-
     address = ibgp_ip_range.split('.')
     static_part = str(address[0]) + '.' + str(address[1]) + '.'
     static_part += str(address[2]) + '.'
 
-    cli += ' cluster-show format name no-show-headers '
-    cluster_list = run_cli(module, cli).split()
-
-    if len(cluster_list) > 0 and cluster_list[0] != 'Success':
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s format cluster-node-1' % cluster
-            cli += ' no-show-headers'
-            cluster_node_1 = run_cli(module, cli).split()[0]
+    cluster_list = snapshot.cluster_nodes()
 
+    if len(cluster_list) > 0:
+        for cluster, cluster_node_1, cluster_node_2 in cluster_list:
             if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
                 ip_count = subnet_count * 4
                 ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
                 ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
 
-                cli = clicopy
-                cli += ' cluster-show name %s format cluster-node-2' % cluster
-                cli += ' no-show-headers'
-                cluster_node_2 = run_cli(module, cli).split()[0]
-
                 remote_as = dict_bgp_as[cluster_node_1]
-                output += vrouter_interface_ibgp_add(module, cluster_node_1,
+                output += vrouter_interface_ibgp_add(module, snapshot,
+                                                     reconciler,
+                                                     cluster_node_1,
                                                      ip1, ip2, remote_as)
-                output += vrouter_interface_ibgp_add(module, cluster_node_2,
+                output += vrouter_interface_ibgp_add(module, snapshot,
+                                                     reconciler,
+                                                     cluster_node_2,
                                                      ip2, ip1, remote_as)
 
                 subnet_count += 1
@@ -362,55 +357,28 @@ def assign_ibgp_interface(module, dict_bgp_as):
     return output
 
 
-def add_bgp_neighbor(module, dict_bgp_as):
+def add_bgp_neighbor(module, snapshot, reconciler, dict_bgp_as):
     """
-    Method to add bgp_neighbor to the vrouters.
+    Method to declare the bgp_neighbor of the vrouters.
     :param module: The Ansible module to fetch input parameters.
-    :param vrouter_names: List of vrouter names.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param dict_bgp_as: Dictionary containing bgp-as of all switches.
-    :return: String describing if bgp neighbors got added or not.
+    :return: String describing if bgp neighbors already exist.
     """
-    global CHANGED_FLAG
     output = ''
-    cli = pn_cli(module)
-    clicopy = cli
 
     for spine in module.params['pn_spine_list']:
-        cli = clicopy
-        cli += ' vrouter-show location %s' % spine
-        cli += ' format name no-show-headers'
-        vrouter_spine = run_cli(module, cli).split()[0]
-
-        cli = clicopy
-        cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_spine
-        cli += ' format l3-port no-show-headers '
-        port_list = run_cli(module, cli).split()
-        port_list = list(set(port_list))
-        port_list.remove(vrouter_spine)
-
-        for port in port_list:
-            cli = clicopy
-            cli += ' switch %s port-show port %s ' % (spine, port)
-            cli += ' format hostname no-show-headers '
-            leaf = run_cli(module, cli).split()[0]
-
-            cli = clicopy
-            cli += ' vrouter-show location %s' % leaf
-            cli += ' format name no-show-headers'
-            vrouter_leaf = run_cli(module, cli).split()[0]
+        vrouter_spine = snapshot.vrouter(spine)
+
+        for port in snapshot.l3_ports(vrouter_spine):
+            leaf = snapshot.topology().peer(spine, port)[0]
+            vrouter_leaf = snapshot.vrouter(leaf)
 
             bgp_leaf = dict_bgp_as[leaf]
             bgp_spine = dict_bgp_as[spine]
 
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name %s ' % (
-                vrouter_spine)
-            cli += ' l3-port %s format ip no-show-headers ' % port
-            ip = run_cli(module, cli).split()
-            ip = list(set(ip))
-            ip.remove(vrouter_spine)
-            ip = ip[0]
-
+            ip = snapshot.interface_ip(vrouter_spine, port)
             ip = ip.split('/')[0]
             ip_spine = ip
 
@@ -420,193 +388,140 @@ def add_bgp_neighbor(module, dict_bgp_as):
             leaf_last_octet = int(ip[3]) - 1
             ip_leaf = static_part + str(leaf_last_octet)
 
-            cli = clicopy
-            cli += ' vrouter-bgp-show remote-as ' + bgp_leaf
-            cli += ' neighbor %s format switch no-show-headers ' % (
-                ip_leaf)
-            already_added = run_cli(module, cli).split()
+            args = [('vrouter-name', vrouter_spine), ('neighbor', ip_leaf),
+                    ('remote-as', bgp_leaf)]
+            if module.params['pn_bfd']:
+                args.append(('bfd', None))
 
-            if vrouter_spine in already_added:
+            if not reconciler.want('vrouter-bgp', spine, args,
+                                   message=' %s: Added BGP Neighbor %s for '
+                                           '%s \n' % (spine, ip_leaf,
+                                                      vrouter_spine)):
                 output += ' %s: ' % spine
                 output += 'BGP Neighbor %s already exists for %s \n' % (
                     ip_leaf, vrouter_spine
                 )
-            else:
-                cli = clicopy
-                cli += ' vrouter-bgp-add vrouter-name ' + vrouter_spine
-                cli += ' neighbor %s remote-as %s ' % (ip_leaf,
-                                                       bgp_leaf)
-                if module.params['pn_bfd']:
-                    cli += ' bfd '
-
-                if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                        spine, ip_leaf, vrouter_spine
-                    )
-                    CHANGED_FLAG.append(True)
-
-            cli = clicopy
-            cli += ' vrouter-bgp-show remote-as ' + bgp_spine
-            cli += ' neighbor %s format switch no-show-headers ' % (
-                ip_spine)
-            already_added = run_cli(module, cli).split()
-
-            if vrouter_leaf in already_added:
+
+            args = [('vrouter-name', vrouter_leaf), ('neighbor', ip_spine),
+                    ('remote-as', bgp_spine)]
+            if module.params['pn_bfd']:
+                args.append(('bfd', None))
+
+            if snapshot.cluster(leaf) is not None:
+                args += [('weight', '100'), ('allowas-in', None)]
+
+            if not reconciler.want('vrouter-bgp', leaf, args,
+                                   message=' %s: Added BGP Neighbor %s for '
+                                           '%s \n' % (leaf, ip_spine,
+                                                      vrouter_leaf)):
                 output += ' %s: ' % leaf
                 output += 'BGP Neighbor %s already exists for %s \n' % (
                     ip_spine, vrouter_leaf
                 )
-            else:
-                cli = clicopy
-                cli += ' vrouter-bgp-add vrouter-name ' + vrouter_leaf
-                cli += ' neighbor %s remote-as %s ' % (ip_spine,
-                                                       bgp_spine)
-                if module.params['pn_bfd']:
-                    cli += ' bfd '
-
-                temp_cli = clicopy
-                temp_cli += ' cluster-show format name no-show-headers'
-                cluster_list = run_cli(module, temp_cli).split()
-                for cluster in cluster_list:
-                    if leaf in cluster:
-                        cli += ' weight 100 allowas-in '
-                        break
-
-                if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added BGP Neighbor %s for %s \n' % (
-                        leaf, ip_spine, vrouter_leaf
-                    )
-                    CHANGED_FLAG.append(True)
 
     return output
 
 
-def assign_router_id(module, vrouter_names):
+def assign_router_id(module, snapshot, reconciler, vrouter_names):
     """
     Method to assign router-id to vrouters which is same as loopback ip.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param vrouter_names: List of vrouter names.
-    :return: String describing if router id got assigned or not.
+    :return: Empty string, the changes are described once applied.
     """
-    global CHANGED_FLAG
-    output = ''
-    cli = pn_cli(module)
-    clicopy = cli
-
-    if len(vrouter_names) > 0:
-        for vrouter in vrouter_names:
-            cli = clicopy
-            cli += ' vrouter-loopback-interface-show vrouter-name ' + vrouter
-            cli += ' format ip no-show-headers '
-            loopback_ip = run_cli(module, cli).split()
-            loopback_ip.remove(vrouter)
-
-            cli = clicopy
-            cli += ' vrouter-modify name %s router-id %s ' % (vrouter,
-                                                              loopback_ip[0])
-            if 'Success' in run_cli(module, cli):
-                cli = clicopy
-                cli += ' vrouter-show name ' + vrouter
-                cli += ' format location no-show-headers '
-                switch = run_cli(module, cli).split()[0]
-
-                output += ' %s: Added router id %s to %s \n' % (switch,
-                                                                loopback_ip[0],
-                                                                vrouter)
-                CHANGED_FLAG.append(True)
+    plan = loopback_plan(module, vrouter_names, snapshot.loopbacks)
 
-    return output
+    for vrouter in vrouter_names:
+        router_id = plan.ips.get(vrouter)
+        if router_id:
+            switch = snapshot.location(vrouter)
+            reconciler.want('vrouter', switch, [('name', vrouter),
+                                                ('router-id', router_id)],
+                            compare=('router-id',),
+                            message=' %s: Added router id %s to %s \n' % (
+                                switch, router_id, vrouter))
+
+    return ''
 
 
-def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
+def configure_bgp(module, snapshot, reconciler, vrouter_names, dict_bgp_as,
+                  bgp_max, bgp_redis):
     """
     Method to add bgp_redistribute to the vrouter.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param dict_bgp_as: Dictionary containing the bgp-as for all the switches.
     :param vrouter_names: List of vrouter names.
     :param bgp_max: Maxpath for bgp.
     :param bgp_redis: Bgp redistribute for bgp.
-    :return: String describing if bgp-redistribute got added or not.
+    :return: String describing if bgp is already configured.
     """
-    global CHANGED_FLAG
     output = ''
-    cli = pn_cli(module)
-    clicopy = cli
 
     for vrouter in vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-show name ' + vrouter
-        cli += ' format location no-show-headers '
-        switch = run_cli(module, cli).split()[0]
-
-        cli = clicopy
-        cli += ' vrouter-modify name %s bgp-as %s bgp-max-paths %s bgp-redistribute %s' % (vrouter,
-                                                            dict_bgp_as[switch], bgp_max, bgp_redis)
-        if 'Success' in run_cli(module, cli):
-            output += ' %s: Added BGP_REDISTRIBUTE %s BGP_AS %s BGP_MAXPATH %s to %s\n' % (switch,
-                                                          bgp_redis, dict_bgp_as[switch], bgp_max,
-                                                                   vrouter)
-            CHANGED_FLAG.append(True)
+        switch = snapshot.location(vrouter)
+        if not reconciler.want('vrouter', switch, [
+                ('name', vrouter), ('bgp-as', dict_bgp_as[switch]),
+                ('bgp-max-paths', bgp_max), ('bgp-redistribute', bgp_redis)
+        ], compare=('bgp-as', 'bgp-max-paths', 'bgp-redistribute'),
+                message=' %s: Added BGP_REDISTRIBUTE %s BGP_AS %s '
+                        'BGP_MAXPATH %s to %s\n' % (switch, bgp_redis,
+                                                    dict_bgp_as[switch],
+                                                    bgp_max, vrouter)):
+            output += ' %s: BGP_AS %s is already configured for %s\n' % (
+                switch, dict_bgp_as[switch], vrouter)
 
     return output
 
 
-def find_non_clustered_leafs(module):
+def find_non_clustered_leafs(module, snapshot):
     """
     Method to find leafs which are not part of any cluster.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :return: List of non clustered leaf switches.
     """
     non_clustered_leafs = []
-    cli = pn_cli(module)
-    cli += ' cluster-show format cluster-node-1,cluster-node-2 '
-    cli += ' no-show-headers '
-    clustered_nodes = run_cli(module, cli).split()
 
     for leaf in module.params['pn_leaf_list']:
-        if leaf not in clustered_nodes:
+        if snapshot.cluster(leaf) is None:
             non_clustered_leafs.append(leaf)
 
     return non_clustered_leafs
 
 
-def create_cluster(module, switch, name, node1, node2):
+def create_cluster(reconciler, switch, name, node1, node2):
     """
-    Method to create a cluster between two switches.
-    :param module: The Ansible module to fetch input parameters.
+    Method to declare a cluster between two switches.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: Name of the local switch.
     :param name: The name of the cluster to create.
     :param node1: First node of the cluster.
     :param node2: Second node of the cluster.
-    :return: String describing if cluster got created or if it's already exists.
+    :return: String describing if cluster already exists.
     """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s cluster-show format name no-show-headers ' % node1
-    cluster_list = run_cli(module, cli).split()
-    if name not in cluster_list:
-        cli = clicopy
-        cli += ' switch %s cluster-create name %s ' % (switch, name)
-        cli += ' cluster-node-1 %s cluster-node-2 %s ' % (node1, node2)
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: %s created successfully \n' % (switch, name)
-    else:
-        return ' %s: %s already exists \n' % (switch, name)
+    if reconciler.want('cluster', switch, [
+            ('name', name), ('cluster-node-1', node1),
+            ('cluster-node-2', node2)
+    ], message=' %s: %s created successfully \n' % (switch, name)):
+        return ''
+    return ' %s: %s already exists \n' % (switch, name)
 
 
-def create_leaf_clusters(module):
+def create_leaf_clusters(module, snapshot, reconciler):
     """
     Method to create cluster between two physically connected leaf switches.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :return: Output of create_cluster() method.
     """
     output = ''
-    non_clustered_leafs = find_non_clustered_leafs(module)
+    non_clustered_leafs = find_non_clustered_leafs(module, snapshot)
     non_clustered_leafs_count = 0
-    cli = pn_cli(module)
-    clicopy = cli
 
     while non_clustered_leafs_count == 0:
         if len(non_clustered_leafs) == 0:
@@ -615,228 +530,151 @@ def create_leaf_clusters(module):
             node1 = non_clustered_leafs[0]
             non_clustered_leafs.remove(node1)
 
-            cli = clicopy
-            cli += ' switch %s lldp-show ' % node1
-            cli += ' format sys-name no-show-headers '
-            system_names = run_cli(module, cli).split()
-            system_names = list(set(system_names))
-
-            cli = clicopy
-            cli += ' switch %s fabric-node-show ' % node1
-            cli += ' format name no-show-headers '
-            nodes_in_fabric = run_cli(module, cli).split()
-            nodes_in_fabric = list(set(nodes_in_fabric))
-
-            for system in system_names:
-                if system not in nodes_in_fabric:
-                    system_names.remove(system)
-
-            terminate_flag = 0
-            node_count = 0
-            while (node_count < len(system_names)) and (terminate_flag == 0):
-                node2 = system_names[node_count]
+            for node2 in snapshot.topology().fabric_peers(node1):
                 if node2 in non_clustered_leafs:
                     # Cluster creation
                     cluster_name = node1 + '-to-' + node2 + '-cluster'
-                    output += create_cluster(module, node2, cluster_name,
+                    output += create_cluster(reconciler, node2, cluster_name,
                                              node1, node2)
 
                     non_clustered_leafs.remove(node2)
-                    terminate_flag += 1
-
-                node_count += 1
+                    break
 
     return output
 
 
-def configure_ospf_bfd(module, vrouter, ip):
+def add_ospf_bfd(module, snapshot, reconciler, switch, vrouter, ip):
     """
-    Method to add ospf_bfd to the vrouter.
+    Method to declare ospf-bfd on the interface of an ospf network.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
+    :param switch: The name of the switch hosting the vrouter.
     :param vrouter: The vrouter name to add ospf bfd.
     :param ip: The interface ip to associate the ospf bfd.
-    :return: String describing if OSPF BFD got added or if it already exists.
+    :return: String describing if OSPF BFD is already enabled.
     """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-interface-show vrouter-name %s' % vrouter
-    cli += ' ip %s format nic no-show-headers ' % ip
-    nic_interface = run_cli(module, cli).split()
-    nic_interface = list(set(nic_interface))
-    nic_interface.remove(vrouter)
-
-    cli = clicopy
-    cli += ' vrouter-interface-config-show vrouter-name %s' % vrouter
-    cli += ' nic %s format ospf-bfd no-show-headers ' % nic_interface[0]
-    ospf_status = run_cli(module, cli).split()
-    ospf_status = list(set(ospf_status))
-
-    cli = clicopy
-    cli += ' vrouter-show name ' + vrouter
-    cli += ' format location no-show-headers '
-    switch = run_cli(module, cli).split()[0]
-
-    if 'Success' in ospf_status:
-        cli = clicopy
-        cli += ' vrouter-interface-config-add vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Added OSPF BFD to %s \n' % (switch, vrouter)
-
-    elif 'enable' not in ospf_status:
-        ospf_status.remove(vrouter)        
-        cli = clicopy
-        cli += ' vrouter-interface-config-modify vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Modified OSPF BFD to enable for %s \n' % (switch, vrouter)
-    else:
+    if not module.params['pn_bfd']:
+        return ''
+
+    # Interfaces added by the plan only get their nic once it ran.
+    nic = snapshot.interface_nic(vrouter, ip) or Lookup(
+        'vrouter-interface-show', 'nic', 'vrouter-name %s ip %s' % (vrouter,
+                                                                     ip))
+    operation = reconciler.want('vrouter-interface-config', switch, [
+        ('vrouter-name', vrouter), ('nic', nic), ('ospf-bfd', 'enable')
+    ], compare=('ospf-bfd',),
+        message=' %s: Added OSPF BFD to %s \n' % (switch, vrouter))
+
+    if operation is None:
         return ' %s: OSPF BFD already enabled for %s \n' % (switch, vrouter)
+    if operation.action == 'modify':
+        operation.message = ' %s: Modified OSPF BFD to enable for %s \n' % (
+            switch, vrouter)
+    return ''
+
+
+def add_ospf_network(reconciler, switch, vrouter, ospf_network, ospf_area_id):
+    """
+    Method to declare an ospf network of a vrouter.
+    :param reconciler: The Reconciler of the fabric.
+    :param switch: The name of the switch hosting the vrouter.
+    :param vrouter: The vrouter name to add the network to.
+    :param ospf_network: The network for adding the ospf neighbor.
+    :param ospf_area_id: The area_id of the network.
+    :return: String describing if OSPF Neighbor already exists.
+    """
+    if reconciler.want('vrouter-ospf', switch, [
+            ('vrouter-name', vrouter), ('network', ospf_network),
+            ('ospf-area', ospf_area_id)
+    ], message=' %s: Added OSPF neighbor %s to %s \n' % (switch, ospf_network,
+                                                         vrouter)):
+        return ''
+    return ' %s: OSPF Neighbor %s already exists for %s \n' % (
+        switch, ospf_network, vrouter
+    )
 
 
-def add_ospf_loopback_spine(module, switch, vrouter, ospf_network, ospf_area_id):
+def add_ospf_loopback_spine(reconciler, switch, vrouter, ospf_network,
+                            ospf_area_id):
     """
     Method to add ospf_neighbor for loopback network for spines.
-    :param module: The Ansible module to fetch input parameters.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: The name of the ansible switch to add neighbor.
     :param vrouter: The vrouter name to add ospf bfd.
     :param ospf_network: The network for adding the ospf neighbor.
     :param ospf_area_id: The area_id for the spines loopback neighbor.
-    :return: String describing if OSPF Neighbor got added or if it already exists.
+    :return: String describing if OSPF Neighbor already exists.
     """
-    global CHANGED_FLAG
-    output = ''
-    cli = pn_cli(module)
-    clicopy = cli
-
-    cli += ' vrouter-ospf-show'
-    cli += ' network %s format switch no-show-headers ' % ospf_network
-    already_added = run_cli(module, cli).split()
-
-    if vrouter in already_added:
-        output += ' %s: OSPF Neighbor %s already exists for %s \n' % (
-            switch, ospf_network, vrouter
-        )
-    else:
-        cli = clicopy
-        cli += ' vrouter-ospf-add vrouter-name ' + vrouter
-        cli += ' network %s ospf-area %s' % (ospf_network,
-                                             ospf_area_id)
-
-        if 'Success' in run_cli(module, cli):
-            output += ' %s: Added OSPF neighbor %s to %s \n' % (
-                switch, ospf_network, vrouter
-            )
-            CHANGED_FLAG.append(True)
-
-    return output
+    return add_ospf_network(reconciler, switch, vrouter, ospf_network,
+                            ospf_area_id)
 
 
-def dict_area_id_leaf(module):
+def dict_area_id_leaf(module, snapshot):
     """
-    Method to find area_id for all leaf and store in dictionary.
+    Method to find area_id for all leaf and store in dictionary. The area
+    the leafs already advertise their networks in is kept, only leafs
+    without one get the next free area, so re-runs and added leafs renumber
+    nothing.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :return: Dictionary containing area_id of all leaf.
     """
     leaf_list = module.params['pn_leaf_list']
     ospf_area_id = int(module.params['pn_ospf_area_id'])
-    cluster_leaf_list = []
-    cli = pn_cli(module)
-    clicopy = cli
-    dict_area_id = {}
-
-    cli += ' cluster-show format name no-show-headers'
-    cluster_list = run_cli(module, cli).split()
+    cluster_leaf_list = set()
 
-    if 'Success' not in cluster_list:
-        for cluster in cluster_list:
+    # Area of the first non backbone network of every leaf.
+    leafs = set(leaf_list)
+    current = {}
+    for row in snapshot.rows['vrouter-ospf-show']:
+        leaf = snapshot.location(row.vrouter_name)
+        if leaf in leafs and row.ospf_area not in ('', '0'):
+            current.setdefault(leaf, row.ospf_area)
+    numbering = GroupNumbering(ospf_area_id + 1, current)
 
-            cli = clicopy
-            cli += ' cluster-show name %s' % cluster
-            cli += ' format cluster-node-1,cluster-node-2 no-show-headers'
-            cluster_nodes = run_cli(module, cli).split()
+    for cluster, node1, node2 in snapshot.cluster_nodes():
+        if node1 in leafs and node2 in leafs:
+            numbering.assign((node1, node2))
+            cluster_leaf_list.update((node1, node2))
 
-            if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
-                ospf_area_id += 1
-                dict_area_id[cluster_nodes[0]] = str(ospf_area_id)
-                dict_area_id[cluster_nodes[1]] = str(ospf_area_id)
-                cluster_leaf_list.append(cluster_nodes[0])
-                cluster_leaf_list.append(cluster_nodes[1])
+    for leaf in leaf_list:
+        if leaf not in cluster_leaf_list:
+            numbering.assign((leaf,))
 
-    noncluster_leaf_list = list(set(leaf_list) - set(cluster_leaf_list))
-    for leaf in noncluster_leaf_list:
-        ospf_area_id += 1
-        dict_area_id[leaf] = str(ospf_area_id)
+    return numbering.mapping()
 
-    return dict_area_id
 
-
-def add_ospf_neighbor(module, dict_area_id):
+def add_ospf_neighbor(module, snapshot, reconciler, dict_area_id):
     """
     Method to add ospf_neighbor to the vrouters.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param dict_area_id: Dictionary containing area_id of leafs.
-    :return: String describing if ospf neighbors got added or not.
+    :return: String describing if ospf neighbors already exist.
     """
-    global CHANGED_FLAG
     output = ''
-    cli = pn_cli(module)
-    clicopy = cli
-    leaf_list = module.params['pn_leaf_list']
     spine_list = module.params['pn_spine_list']
 
     for spine in spine_list:
-        cli = clicopy
-        cli += ' vrouter-show location %s' % spine
-        cli += ' format name no-show-headers'
-        vrouter_spine = run_cli(module, cli).split()[0]
+        vrouter_spine = snapshot.vrouter(spine)
 
         if spine_list.index(spine) == 0:
-            cli = clicopy
-            cli += ' vrouter-loopback-interface-show vrouter-name ' + vrouter_spine
-            cli += ' format ip no-show-headers '
-            loopback_ip = run_cli(module, cli).split()
-            loopback_ip.remove(vrouter_spine)
-            vrouter_loopback_ip = loopback_ip[0]
-
-            loopback_ip = loopback_ip[0].split('.')
+            loopback_ip = snapshot.loopbacks[vrouter_spine][0].split('.')
             loopback_network = loopback_ip[0] + '.' + loopback_ip[1] + '.'
             loopback_network += loopback_ip[2] + '.' + '0/24'
 
-        output += add_ospf_loopback_spine(module, spine, vrouter_spine, loopback_network, '0')
+        output += add_ospf_loopback_spine(reconciler, spine, vrouter_spine,
+                                          loopback_network, '0')
 
-        cli = clicopy
-        cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_spine
-        cli += ' format l3-port no-show-headers '
-        port_list = run_cli(module, cli).split()
-        port_list = list(set(port_list))
-        port_list.remove(vrouter_spine)
-
-        for port in port_list:
-            cli = clicopy
-            cli += ' switch %s port-show port %s' % (spine, port)
-            cli += ' format hostname no-show-headers'
-            hostname = run_cli(module, cli).split()[0]
+        for port in snapshot.l3_ports(vrouter_spine):
+            hostname = snapshot.topology().peer(spine, port)[0]
 
             ospf_area_id = dict_area_id[hostname]
+            vrouter_hostname = snapshot.vrouter(hostname)
 
-            cli = clicopy
-            cli += ' vrouter-show location %s' % hostname
-            cli += ' format name no-show-headers'
-            vrouter_hostname = run_cli(module, cli).split()[0]
-
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name %s l3-port %s' % (
-                vrouter_spine, port
-            )
-            cli += ' format ip no-show-headers'
-            ip = run_cli(module, cli).split()
-            ip = list(set(ip))
-            ip.remove(vrouter_spine)
-            ip = ip[0]
+            ip = snapshot.interface_ip(vrouter_spine, port)
 
             ip = ip.split('.')
             static_part = str(ip[0]) + '.' + str(ip[1]) + '.'
@@ -852,166 +690,88 @@ def add_ospf_neighbor(module, dict_area_id):
             ip_leaf = static_part + str(leaf_last_octet)
             ip_spine = static_part + last_octet[0]
 
-            cli = clicopy
-            cli += ' vrouter-ospf-show'
-            cli += ' network %s format switch no-show-headers ' % ospf_network
-            already_added = run_cli(module, cli).split()
-
-            if vrouter_spine in already_added:
-                output += ' %s: OSPF Neighbor %s already exists for %s \n' % (
-                    spine, ospf_network, vrouter_spine
-                )
-            else:
-                if module.params['pn_bfd']:
-                    output += configure_ospf_bfd(module, vrouter_spine,
-                                                 ip_spine)
-
-                cli = clicopy
-                cli += ' vrouter-ospf-add vrouter-name ' + vrouter_spine
-                cli += ' network %s ospf-area %s' % (ospf_network,
-                                                     ospf_area_id)
-
-                if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added OSPF neighbor %s to %s \n' % (
-                        spine, ospf_network, vrouter_spine
-                    )
-                    CHANGED_FLAG.append(True)
-
-            if vrouter_hostname in already_added:
-                output += ' %s: OSPF Neighbor %s already exists for %s \n' % (
-                    hostname, ospf_network, vrouter_hostname
-                )
-            else:
-                if module.params['pn_bfd']:
-                    output += configure_ospf_bfd(module, vrouter_hostname,
-                                                 ip_leaf)
-
-                cli = clicopy
-                cli += ' vrouter-ospf-add vrouter-name ' + vrouter_hostname
-                cli += ' network %s ospf-area %s' % (ospf_network,
-                                                     ospf_area_id)
-
-                if 'Success' in run_cli(module, cli):
-                    output += ' %s: Added OSPF neighbor %s to %s \n' % (
-                        hostname, ospf_network, vrouter_hostname
-                    )
-                    CHANGED_FLAG.append(True)
+            output += add_ospf_network(reconciler, spine, vrouter_spine,
+                                       ospf_network, ospf_area_id)
+            output += add_ospf_bfd(module, snapshot, reconciler, spine,
+                                   vrouter_spine, ip_spine)
+            output += add_ospf_network(reconciler, hostname,
+                                       vrouter_hostname, ospf_network,
+                                       ospf_area_id)
+            output += add_ospf_bfd(module, snapshot, reconciler, hostname,
+                                   vrouter_hostname, ip_leaf)
 
     return output
 
 
-def add_ospf_redistribute(module, vrouter_names):
+def add_ospf_redistribute(snapshot, reconciler, vrouter_names):
     """
     Method to add ospf_redistribute to the vrouters.
-    :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param vrouter_names: List of vrouter names.
-    :return: String describing if ospf-redistribute got added or not.
+    :return: String describing if ospf-redistribute is already configured.
     """
-    global CHANGED_FLAG
     output = ''
-    cli = pn_cli(module)
-    clicopy = cli
 
     for vrouter in vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-modify name %s' % vrouter
-        cli += ' ospf-redistribute static,connected'
-        if 'Success' in run_cli(module, cli):
-            cli = clicopy
-            cli += ' vrouter-show name ' + vrouter
-            cli += ' format location no-show-headers '
-            switch = run_cli(module, cli).split()[0]
-
-            output += ' %s: Added OSPF_REDISTRIBUTE to %s \n' % (switch,
-                                                                 vrouter)
-            CHANGED_FLAG.append(True)
+        switch = snapshot.location(vrouter)
+        if not reconciler.want('vrouter', switch, [
+                ('name', vrouter), ('ospf-redistribute', 'static,connected')
+        ], compare=('ospf-redistribute',),
+                message=' %s: Added OSPF_REDISTRIBUTE to %s \n' % (switch,
+                                                                   vrouter)):
+            output += ' %s: OSPF_REDISTRIBUTE is already configured ' % switch
+            output += 'for %s \n' % vrouter
 
     return output
 
 
-def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
-                                 ospf_network, ospf_area_id):
+def vrouter_leafcluster_ospf_add(module, snapshot, reconciler, switch_name,
+                                 interface_ip, ospf_network, ospf_area_id):
     """
-    Method to create interfaces and add ospf neighbors.
+    Method to declare the interfaces and ospf neighbors.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param switch_name: The name of the switch to run interface.
     :param interface_ip: Interface ip to create a vrouter interface.
     :param ospf_network: Ospf network for the ospf neighbor.
     :ospf_area_id: The area_id for ospf neighborship.
-    :return: String describing if ospf neighbors got added or not.
+    :return: String describing if ospf neighbors already exist.
     """
-    global CHANGED_FLAG
     output = ''
     vlan_id = module.params['pn_iospf_vlan']
 
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s vlan-show format id no-show-headers ' % switch_name
-    existing_vlans = run_cli(module, cli).split()
-
-    if vlan_id not in existing_vlans:
-        cli = clicopy
-        cli += ' switch %s vlan-create id %s scope local ' % (switch_name,
-                                                              vlan_id)
-        run_cli(module, cli)
-        output = ' %s: Vlan with id %s created successfully \n' % (switch_name,
-                                                                   vlan_id)
-        CHANGED_FLAG.append(True)
-
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
-
-    cli = clicopy
-    cli += ' vrouter-interface-show ip %s vlan %s' % (interface_ip, vlan_id)
-    cli += ' format switch no-show-headers'
-    existing_vrouter_interface = run_cli(module, cli).split()
-
-    if vrouter not in existing_vrouter_interface:
-        cli = clicopy
-        cli += ' vrouter-interface-add vrouter-name %s ip %s vlan %s ' % (
-            vrouter, interface_ip, vlan_id
-        )
-        run_cli(module, cli)
-        output += ' %s: Added vrouter interface with ip %s on %s \n' % (
-            switch_name, interface_ip, vrouter
-        )
-        CHANGED_FLAG.append(True)
-    else:
+    reconciler.want('vlan', switch_name, [('id', vlan_id), ('scope', 'local')],
+                    message=' %s: Vlan with id %s created successfully \n' % (
+                        switch_name, vlan_id))
+
+    vrouter = snapshot.vrouter(switch_name)
+
+    if not reconciler.want('vrouter-interface', switch_name, [
+            ('vrouter-name', vrouter), ('ip', interface_ip), ('vlan', vlan_id)
+    ], message=' %s: Added vrouter interface with ip %s on %s \n' % (
+            switch_name, interface_ip, vrouter)):
         output += ' %s: Vrouter interface %s already exists for %s \n' % (
             switch_name, interface_ip, vrouter
         )
 
-    cli = clicopy
-    cli += ' vrouter-ospf-show'
-    cli += ' network %s format switch no-show-headers ' % ospf_network
-    already_added = run_cli(module, cli).split()
-
-    if vrouter in already_added:
-        output += ' %s: OSPF Neighbor %s already exists for %s \n' % (switch_name,
-                                                                  ospf_network, vrouter)
-    else:
-        interface_ip_without_supernet = interface_ip.split('/')[0]
-        if module.params['pn_bfd']:
-            output += configure_ospf_bfd(module, vrouter,
-                                         interface_ip_without_supernet)
-        cli = clicopy
-        cli += ' vrouter-ospf-add vrouter-name ' + vrouter
-        cli += ' network %s ospf-area %s' % (ospf_network, ospf_area_id)
-
-        if 'Success' in run_cli(module, cli):
-            output += ' %s: Added OSPF neighbor %s to %s \n' % (switch_name,
-                                                             ospf_network, vrouter)
-            CHANGED_FLAG.append(True)
+    interface_ip_without_supernet = interface_ip.split('/')[0]
+    output += add_ospf_network(reconciler, switch_name, vrouter, ospf_network,
+                               ospf_area_id)
+    output += add_ospf_bfd(module, snapshot, reconciler, switch_name, vrouter,
+                           interface_ip_without_supernet)
 
     return output
 
 
-def assign_leafcluster_ospf_interface(module, dict_area_id):
+def assign_leafcluster_ospf_interface(module, snapshot, reconciler,
+                                      dict_area_id):
     """
     Method to create interfaces and add ospf neighbor for leaf cluster.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param dict_area_id: Dictionary containing area_id of leafs.
     :return: The output of vrouter_interface_ibgp_add() method.
     """
@@ -1022,39 +782,31 @@ def assign_leafcluster_ospf_interface(module, dict_area_id):
     subnet_count = 0
     supernet = 30
 
-    cli = pn_cli(module)
-    clicopy = cli
-
     address = iospf_ip_range.split('.')
     static_part = str(address[0]) + '.' + str(address[1]) + '.'
     static_part += str(address[2]) + '.'
 
-    cli += ' cluster-show format name no-show-headers '
-    cluster_list = run_cli(module, cli).split()
-
-    if len(cluster_list) > 0 and cluster_list[0] != 'Success':
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s format cluster-node-1' % cluster
-            cli += ' no-show-headers'
-            cluster_node_1 = run_cli(module, cli).split()[0]
+    cluster_list = snapshot.cluster_nodes()
 
+    if len(cluster_list) > 0:
+        for cluster, cluster_node_1, cluster_node_2 in cluster_list:
             if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
                 ip_count = subnet_count * 4
                 ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
                 ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
                 ospf_network = static_part + str(ip_count) + '/' + str(supernet)
 
-                cli = clicopy
-                cli += ' cluster-show name %s format cluster-node-2' % cluster
-                cli += ' no-show-headers'
-                cluster_node_2 = run_cli(module, cli).split()[0]
-
                 ospf_area_id = dict_area_id[cluster_node_1]
-                output += vrouter_leafcluster_ospf_add(module, cluster_node_1,
-                                                       ip1, ospf_network, ospf_area_id)
-                output += vrouter_leafcluster_ospf_add(module, cluster_node_2,
-                                                       ip2, ospf_network, ospf_area_id)
+                output += vrouter_leafcluster_ospf_add(module, snapshot,
+                                                       reconciler,
+                                                       cluster_node_1, ip1,
+                                                       ospf_network,
+                                                       ospf_area_id)
+                output += vrouter_leafcluster_ospf_add(module, snapshot,
+                                                       reconciler,
+                                                       cluster_node_2, ip2,
+                                                       ospf_network,
+                                                       ospf_area_id)
 
                 subnet_count += 1
     else:
@@ -1063,6 +815,54 @@ def assign_leafcluster_ospf_interface(module, dict_area_id):
     return output
 
 
+def configure_routing(module, cli, tables):
+    """
+    Method to plan and configure the router ids, leaf clusters and the
+    routing protocol.
+    :param module: The Ansible module to fetch input parameters.
+    :param cli: The cli prefix returned by pn_cli().
+    :param tables: The show tables to plan against.
+    :return: String describing the configuration.
+    """
+    routing_protocol = module.params['pn_routing_protocol']
+
+    # Pull the fabric state once, every lookup below is served from it.
+    snapshot = FabricSnapshot(module, cli, tables)
+    vrouter_names = snapshot.vrouter_names()
+
+    # The leaf clusters decide the bgp-as and ospf areas, so they get
+    # configured before the routing protocol is planned.
+    reconciler = Reconciler(snapshot)
+    message = assign_router_id(module, snapshot, reconciler, vrouter_names)
+    message += create_leaf_clusters(module, snapshot, reconciler)
+    message += apply_changes(module, cli, snapshot, reconciler.plan())
+
+    reconciler = Reconciler(snapshot)
+    if routing_protocol == 'ebgp':
+        dict_bgp_as = find_dict_bgp_as(module, snapshot)
+        message += configure_bgp(module, snapshot, reconciler,
+                                 vrouter_names, dict_bgp_as,
+                                 module.params['pn_bgp_maxpath'],
+                                 module.params['pn_bgp_redistribute'])
+        message += add_bgp_neighbor(module, snapshot, reconciler, dict_bgp_as)
+        message += assign_ibgp_interface(module, snapshot, reconciler,
+                                         dict_bgp_as)
+    elif routing_protocol == 'ospf':
+        dict_area_id = dict_area_id_leaf(module, snapshot)
+        message += add_ospf_neighbor(module, snapshot, reconciler,
+                                     dict_area_id)
+        message += add_ospf_redistribute(snapshot, reconciler, vrouter_names)
+        message += assign_leafcluster_ospf_interface(module, snapshot,
+                                                     reconciler, dict_area_id)
+    message += apply_changes(module, cli, snapshot, reconciler.plan())
+
+    if module.check_mode:
+        # Check mode stops at the plans, saved for a later run to apply.
+        save_plans(module, snapshot)
+
+    return message
+
+
 def main():
     """ This section is for arguments parsing """
     module = AnsibleModule(
@@ -1087,34 +887,22 @@ def main():
             pn_ospf_area_id=dict(required=False, type='str', default='0'),
             pn_routing_protocol=dict(required=False, type='str',
                                      choices=['ebgp', 'ospf'], default='ebgp'),
-        )
+            pn_plan_file=dict(required=False, type='str'),
+        ),
+        supports_check_mode=True
     )
 
     global CHANGED_FLAG
-    routing_protocol = module.params['pn_routing_protocol']
-    dict_area_id = {}
-    dict_bgp_as = {}
-
-    # Get the list of vrouter names.
     cli = pn_cli(module)
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
-
-    message = assign_router_id(module, vrouter_names)
-    message += create_leaf_clusters(module)
-
-    if routing_protocol == 'ebgp':
-        dict_bgp_as = find_dict_bgp_as(module)
-        message += configure_bgp(module,
-                                 vrouter_names, dict_bgp_as,
-           module.params['pn_bgp_maxpath'], module.params['pn_bgp_redistribute'])
-        message += add_bgp_neighbor(module, dict_bgp_as)
-        message += assign_ibgp_interface(module, dict_bgp_as)
-    elif routing_protocol == 'ospf':
-        dict_area_id = dict_area_id_leaf(module)
-        message += add_ospf_neighbor(module, dict_area_id)
-        message += add_ospf_redistribute(module, vrouter_names)
-        message += assign_leafcluster_ospf_interface(module, dict_area_id)
+    tables = snapshot_tables(module)
+    saved = saved_plans(module, cli, tables)
+    if saved is None:
+        message = configure_routing(module, cli, tables)
+    else:
+        # Apply the plans of an earlier check mode run.
+        snapshot, plans = saved
+        message = ''.join(apply_changes(module, cli, snapshot, plan)
+                          for plan in plans)
 
     module.exit_json(
         stdout=message,
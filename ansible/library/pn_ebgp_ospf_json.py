@@ -19,6 +19,10 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot
+from ansible.module_utils.pn_numbering import GroupNumbering
+from ansible.module_utils.pn_results import message_summary
 import shlex
 
 DOCUMENTATION = """
@@ -141,6 +145,12 @@ failed:
 
 CHANGED_FLAG = []
 
+# Show tables the routing setup is looked up in.
+SNAPSHOT_TABLES = ('fabric-node-show', 'cluster-show', 'vrouter-show',
+                   'vrouter-interface-show',
+                   'vrouter-loopback-interface-show', 'vrouter-bgp-show',
+                   'vrouter-ospf-show', 'port-show', 'lldp-show')
+
 
 def pn_cli(module):
     """
@@ -168,7 +178,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     results = []
     if out:
         return out
@@ -190,53 +200,43 @@ def run_cli(module, cli):
         return 'Success'
 
 
-def find_dict_bgp_as(module):
+def find_dict_bgp_as(module, snapshot):
     """
-    Method to find bgp-as for all switches and store in dictionary.
+    Method to find bgp-as for all switches and store in dictionary. The
+    bgp-as the vrouters already have is kept, only switches without one get
+    the next free number, so re-runs and added leafs renumber nothing.
     :param module: The Ansible module to fetch input parameters.
-    :return: Dictionary containing area_id of all leaf.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :return: Dictionary containing bgp-as of all switches.
     """
     leaf_list = module.params['pn_leaf_list']
-    spine_list = module.params['pn_spine_list']
     bgp_as = int(module.params['pn_bgp_as_range'])
-    cluster_leaf_list = []
-    cli = pn_cli(module)
-    clicopy = cli
-    dict_bgp_as = {}
-
-    for spine in module.params['pn_spine_list']:
-        dict_bgp_as[spine] = str(bgp_as)
+    cluster_leaf_list = set()
 
-    cli += ' cluster-show format name no-show-headers'
-    cluster_list = run_cli(module, cli).split()
+    current = dict((row.location, row.bgp_as)
+                   for row in snapshot.rows['vrouter-show'])
+    numbering = GroupNumbering(bgp_as + 1, current)
+    numbering.pin(module.params['pn_spine_list'], bgp_as)
 
-    if 'Success' not in cluster_list:
-        for cluster in cluster_list:
+    leafs = set(leaf_list)
+    for cluster, node1, node2 in snapshot.cluster_nodes():
+        if node1 in leafs and node2 in leafs:
+            numbering.assign((node1, node2))
+            cluster_leaf_list.update((node1, node2))
 
-            cli = clicopy
-            cli += ' cluster-show name %s' % cluster
-            cli += ' format cluster-node-1,cluster-node-2 no-show-headers'
-            cluster_nodes = run_cli(module, cli).split()
+    for leaf in leaf_list:
+        if leaf not in cluster_leaf_list:
+            numbering.assign((leaf,))
 
-            if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
-                bgp_as += 1
-                dict_bgp_as[cluster_nodes[0]] = str(bgp_as)
-                dict_bgp_as[cluster_nodes[1]] = str(bgp_as)
-                cluster_leaf_list.append(cluster_nodes[0])
-                cluster_leaf_list.append(cluster_nodes[1])
+    return numbering.mapping()
 
-    noncluster_leaf_list = list(set(leaf_list) - set(cluster_leaf_list))
-    for leaf in noncluster_leaf_list:
-        bgp_as += 1
-        dict_bgp_as[leaf] = str(bgp_as)
 
-    return dict_bgp_as
-
-
-def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip, remote_as):
+def vrouter_interface_ibgp_add(module, snapshot, switch_name, interface_ip,
+                               neighbor_ip, remote_as):
     """
     Method to create interfaces and add ibgp neighbors.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch_name: The name of the switch to run interface.
     :param interface_ip: Interface ip to create a vrouter interface.
     :param neighbor_ip: Neighbor_ip for the ibgp neighbor.
@@ -261,22 +261,17 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip, r
         output += ' %s: Vlan with id %s created \n' % (switch_name, vlan_id)
         CHANGED_FLAG.append(True)
 
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
+    vrouter = snapshot.vrouter(switch_name)
 
-    cli = clicopy
-    cli += ' vrouter-interface-show ip %s vlan %s' % (interface_ip, vlan_id)
-    cli += ' format switch no-show-headers'
-    existing_vrouter_interface = run_cli(module, cli).split()
-
-    if vrouter not in existing_vrouter_interface:
+    if not snapshot.has_interface(vrouter, interface_ip):
         cli = clicopy
         cli += ' vrouter-interface-add vrouter-name %s ip %s vlan %s ' % (
             vrouter, interface_ip, vlan_id
         )
         run_cli(module, cli)
+        snapshot.record('vrouter-interface-show', {
+            'vrouter-name': vrouter, 'ip': interface_ip, 'vlan': vlan_id
+        })
 
         output += ' %s: Added vrouter interface with ip %s on %s \n' % (
             switch_name, interface_ip, vrouter
@@ -288,12 +283,8 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip, r
         )
 
     neighbor_ip = neighbor_ip.split('/')[0]
-    cli = clicopy
-    cli += ' vrouter-bgp-show remote-as ' + remote_as
-    cli += ' neighbor %s format switch no-show-headers' % neighbor_ip
-    already_added = run_cli(module, cli).split()
 
-    if vrouter not in already_added:
+    if not snapshot.has_bgp_neighbor(vrouter, neighbor_ip, remote_as):
         cli = clicopy
         cli += ' vrouter-bgp-add vrouter-name %s' % vrouter
         cli += ' neighbor %s remote-as %s next-hop-self' % (neighbor_ip,
@@ -302,6 +293,10 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip, r
             cli += ' bfd '
 
         if 'Success' in run_cli(module, cli):
+            snapshot.record('vrouter-bgp-show', {
+                'vrouter-name': vrouter, 'neighbor': neighbor_ip,
+                'remote-as': remote_as
+            })
             output += ' %s: Added iBGP neighbor %s for %s \n' % (switch_name,
                                                                  neighbor_ip,
                                                                  vrouter)
@@ -314,10 +309,11 @@ def vrouter_interface_ibgp_add(module, switch_name, interface_ip, neighbor_ip, r
     return output
 
 
-def assign_ibgp_interface(module, dict_bgp_as):
+def assign_ibgp_interface(module, snapshot, dict_bgp_as):
     """
     Method to create interfaces and add ibgp neighbors.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param dict_bgp_as: The dictionary containing bgp-as of all switches.
     :return: The output of vrouter_interface_ibgp_add() method.
     """
@@ -328,37 +324,25 @@ def assign_ibgp_interface(module, dict_bgp_as):
     subnet_count = 0
     supernet = 30
 
-    cli = pn_cli(module)
-    clicopy = cli
-
     address = ibgp_ip_range.split('.')
     static_part = str(address[0]) + '.' + str(address[1]) + '.'
     static_part += str(address[2]) + '.'
 
-    cli += ' cluster-show format name no-show-headers '
-    cluster_list = run_cli(module, cli).split()
-
-    if len(cluster_list) > 0 and cluster_list[0] != 'Success':
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s format cluster-node-1' % cluster
-            cli += ' no-show-headers'
-            cluster_node_1 = run_cli(module, cli).split()[0]
+    cluster_list = snapshot.cluster_nodes()
 
+    if len(cluster_list) > 0:
+        for cluster, cluster_node_1, cluster_node_2 in cluster_list:
             if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
                 ip_count = subnet_count * 4
                 ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
                 ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
 
-                cli = clicopy
-                cli += ' cluster-show name %s format cluster-node-2' % cluster
-                cli += ' no-show-headers'
-                cluster_node_2 = run_cli(module, cli).split()[0]
-
                 remote_as = dict_bgp_as[cluster_node_1]
-                output += vrouter_interface_ibgp_add(module, cluster_node_1,
+                output += vrouter_interface_ibgp_add(module, snapshot,
+                                                     cluster_node_1,
                                                      ip1, ip2, remote_as)
-                output += vrouter_interface_ibgp_add(module, cluster_node_2,
+                output += vrouter_interface_ibgp_add(module, snapshot,
+                                                     cluster_node_2,
                                                      ip2, ip1, remote_as)
 
                 subnet_count += 1
@@ -368,11 +352,11 @@ def assign_ibgp_interface(module, dict_bgp_as):
     return output
 
 
-def add_bgp_neighbor(module, dict_bgp_as):
+def add_bgp_neighbor(module, snapshot, dict_bgp_as):
     """
     Method to add bgp_neighbor to the vrouters.
     :param module: The Ansible module to fetch input parameters.
-    :param vrouter_names: List of vrouter names.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param dict_bgp_as: Dictionary containing bgp-as of all switches.
     :return: String describing if bgp neighbors got added or not.
     """
@@ -382,41 +366,16 @@ def add_bgp_neighbor(module, dict_bgp_as):
     clicopy = cli
 
     for spine in module.params['pn_spine_list']:
-        cli = clicopy
-        cli += ' vrouter-show location %s' % spine
-        cli += ' format name no-show-headers'
-        vrouter_spine = run_cli(module, cli).split()[0]
+        vrouter_spine = snapshot.vrouter(spine)
 
-        cli = clicopy
-        cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_spine
-        cli += ' format l3-port no-show-headers '
-        port_list = run_cli(module, cli).split()
-        port_list = list(set(port_list))
-        port_list.remove(vrouter_spine)
-
-        for port in port_list:
-            cli = clicopy
-            cli += ' switch %s port-show port %s ' % (spine, port)
-            cli += ' format hostname no-show-headers '
-            leaf = run_cli(module, cli).split()[0]
-
-            cli = clicopy
-            cli += ' vrouter-show location %s' % leaf
-            cli += ' format name no-show-headers'
-            vrouter_leaf = run_cli(module, cli).split()[0]
+        for port in snapshot.l3_ports(vrouter_spine):
+            leaf = snapshot.topology().peer(spine, port)[0]
+            vrouter_leaf = snapshot.vrouter(leaf)
 
             bgp_leaf = dict_bgp_as[leaf]
             bgp_spine = dict_bgp_as[spine]
 
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name %s ' % (
-                vrouter_spine)
-            cli += ' l3-port %s format ip no-show-headers ' % port
-            ip = run_cli(module, cli).split()
-            ip = list(set(ip))
-            ip.remove(vrouter_spine)
-            ip = ip[0]
-
+            ip = snapshot.interface_ip(vrouter_spine, port)
             ip = ip.split('/')[0]
             ip_spine = ip
 
@@ -426,13 +385,7 @@ def add_bgp_neighbor(module, dict_bgp_as):
             leaf_last_octet = int(ip[3]) - 1
             ip_leaf = static_part + str(leaf_last_octet)
 
-            cli = clicopy
-            cli += ' vrouter-bgp-show remote-as ' + bgp_leaf
-            cli += ' neighbor %s format switch no-show-headers ' % (
-                ip_leaf)
-            already_added = run_cli(module, cli).split()
-
-            if vrouter_spine in already_added:
+            if snapshot.has_bgp_neighbor(vrouter_spine, ip_leaf, bgp_leaf):
                 output += ' %s: ' % spine
                 output += 'BGP Neighbor %s already exists for %s \n' % (
                     ip_leaf, vrouter_spine
@@ -446,18 +399,16 @@ def add_bgp_neighbor(module, dict_bgp_as):
                     cli += ' bfd '
 
                 if 'Success' in run_cli(module, cli):
+                    snapshot.record('vrouter-bgp-show', {
+                        'vrouter-name': vrouter_spine, 'neighbor': ip_leaf,
+                        'remote-as': bgp_leaf
+                    })
                     output += ' %s: Added BGP Neighbor %s for %s \n' % (
                         spine, ip_leaf, vrouter_spine
                     )
                     CHANGED_FLAG.append(True)
 
-            cli = clicopy
-            cli += ' vrouter-bgp-show remote-as ' + bgp_spine
-            cli += ' neighbor %s format switch no-show-headers ' % (
-                ip_spine)
-            already_added = run_cli(module, cli).split()
-
-            if vrouter_leaf in already_added:
+            if snapshot.has_bgp_neighbor(vrouter_leaf, ip_spine, bgp_spine):
                 output += ' %s: ' % leaf
                 output += 'BGP Neighbor %s already exists for %s \n' % (
                     ip_spine, vrouter_leaf
@@ -470,15 +421,14 @@ def add_bgp_neighbor(module, dict_bgp_as):
                 if module.params['pn_bfd']:
                     cli += ' bfd '
 
-                temp_cli = clicopy
-                temp_cli += ' cluster-show format name no-show-headers'
-                cluster_list = run_cli(module, temp_cli).split()
-                for cluster in cluster_list:
-                    if leaf in cluster:
-                        cli += ' weight 100 allowas-in '
-                        break
+                if snapshot.cluster(leaf) is not None:
+                    cli += ' weight 100 allowas-in '
 
                 if 'Success' in run_cli(module, cli):
+                    snapshot.record('vrouter-bgp-show', {
+                        'vrouter-name': vrouter_leaf, 'neighbor': ip_spine,
+                        'remote-as': bgp_spine
+                    })
                     output += ' %s: Added BGP Neighbor %s for %s \n' % (
                         leaf, ip_spine, vrouter_leaf
                     )
@@ -487,10 +437,11 @@ def add_bgp_neighbor(module, dict_bgp_as):
     return output
 
 
-def assign_router_id(module, vrouter_names):
+def assign_router_id(module, snapshot, vrouter_names):
     """
     Method to assign router-id to vrouters which is same as loopback ip.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param vrouter_names: List of vrouter names.
     :return: String describing if router id got assigned or not.
     """
@@ -499,35 +450,30 @@ def assign_router_id(module, vrouter_names):
     cli = pn_cli(module)
     clicopy = cli
 
-    if len(vrouter_names) > 0:
-        for vrouter in vrouter_names:
-            cli = clicopy
-            cli += ' vrouter-loopback-interface-show vrouter-name ' + vrouter
-            cli += ' format ip no-show-headers '
-            loopback_ip = run_cli(module, cli).split()
-            loopback_ip.remove(vrouter)
-
-            cli = clicopy
-            cli += ' vrouter-modify name %s router-id %s ' % (vrouter,
-                                                              loopback_ip[0])
-            if 'Success' in run_cli(module, cli):
-                cli = clicopy
-                cli += ' vrouter-show name ' + vrouter
-                cli += ' format location no-show-headers '
-                switch = run_cli(module, cli).split()[0]
+    for vrouter in vrouter_names:
+        loopback_ip = snapshot.loopbacks.get(vrouter)
+        if not loopback_ip:
+            continue
 
-                output += ' %s: Added router id %s to %s \n' % (switch,
-                                                                loopback_ip[0],
-                                                                vrouter)
-                CHANGED_FLAG.append(True)
+        cli = clicopy
+        cli += ' vrouter-modify name %s router-id %s ' % (vrouter,
+                                                          loopback_ip[0])
+        if 'Success' in run_cli(module, cli):
+            switch = snapshot.location(vrouter)
+            output += ' %s: Added router id %s to %s \n' % (switch,
+                                                            loopback_ip[0],
+                                                            vrouter)
+            CHANGED_FLAG.append(True)
 
     return output
 
 
-def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
+def configure_bgp(module, snapshot, vrouter_names, dict_bgp_as, bgp_max,
+                  bgp_redis):
     """
     Method to add bgp_redistribute to the vrouter.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param dict_bgp_as: Dictionary containing the bgp-as for all the switches.
     :param vrouter_names: List of vrouter names.
     :param bgp_max: Maxpath for bgp.
@@ -540,10 +486,13 @@ def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
     clicopy = cli
 
     for vrouter in vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-show name ' + vrouter
-        cli += ' format location no-show-headers '
-        switch = run_cli(module, cli).split()[0]
+        switch = snapshot.location(vrouter)
+        row = snapshot.vrouter_row(vrouter)
+        if (row.bgp_as, row.bgp_max_paths, row.bgp_redistribute) == (
+                dict_bgp_as[switch], str(bgp_max), bgp_redis):
+            output += ' %s: BGP_AS %s is already configured for %s\n' % (
+                switch, dict_bgp_as[switch], vrouter)
+            continue
 
         cli = clicopy
         cli += ' vrouter-modify name %s bgp-as %s bgp-max-paths %s bgp-redistribute %s' % (vrouter,
@@ -557,29 +506,27 @@ def configure_bgp(module, vrouter_names, dict_bgp_as, bgp_max, bgp_redis):
     return output
 
 
-def find_non_clustered_leafs(module):
+def find_non_clustered_leafs(module, snapshot):
     """
     Method to find leafs which are not part of any cluster.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :return: List of non clustered leaf switches.
     """
     non_clustered_leafs = []
-    cli = pn_cli(module)
-    cli += ' cluster-show format cluster-node-1,cluster-node-2 '
-    cli += ' no-show-headers '
-    clustered_nodes = run_cli(module, cli).split()
 
     for leaf in module.params['pn_leaf_list']:
-        if leaf not in clustered_nodes:
+        if snapshot.cluster(leaf) is None:
             non_clustered_leafs.append(leaf)
 
     return non_clustered_leafs
 
 
-def create_cluster(module, switch, name, node1, node2):
+def create_cluster(module, snapshot, switch, name, node1, node2):
     """
     Method to create a cluster between two switches.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch: Name of the local switch.
     :param name: The name of the cluster to create.
     :param node1: First node of the cluster.
@@ -588,31 +535,29 @@ def create_cluster(module, switch, name, node1, node2):
     """
     global CHANGED_FLAG
     cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s cluster-show format name no-show-headers ' % node1
-    cluster_list = run_cli(module, cli).split()
-    if name not in cluster_list:
-        cli = clicopy
+    if name not in snapshot.clusters:
         cli += ' switch %s cluster-create name %s ' % (switch, name)
         cli += ' cluster-node-1 %s cluster-node-2 %s ' % (node1, node2)
         if 'Success' in run_cli(module, cli):
+            snapshot.record('cluster-show', {
+                'name': name, 'cluster-node-1': node1, 'cluster-node-2': node2
+            })
             CHANGED_FLAG.append(True)
             return ' %s: %s created successfully \n' % (switch, name)
     else:
         return ' %s: %s already exists \n' % (switch, name)
 
 
-def create_leaf_clusters(module):
+def create_leaf_clusters(module, snapshot):
     """
     Method to create cluster between two physically connected leaf switches.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :return: Output of create_cluster() method.
     """
     output = ''
-    non_clustered_leafs = find_non_clustered_leafs(module)
+    non_clustered_leafs = find_non_clustered_leafs(module, snapshot)
     non_clustered_leafs_count = 0
-    cli = pn_cli(module)
-    clicopy = cli
 
     while non_clustered_leafs_count == 0:
         if len(non_clustered_leafs) == 0:
@@ -621,44 +566,24 @@ def create_leaf_clusters(module):
             node1 = non_clustered_leafs[0]
             non_clustered_leafs.remove(node1)
 
-            cli = clicopy
-            cli += ' switch %s lldp-show ' % node1
-            cli += ' format sys-name no-show-headers '
-            system_names = run_cli(module, cli).split()
-            system_names = list(set(system_names))
-
-            cli = clicopy
-            cli += ' switch %s fabric-node-show ' % node1
-            cli += ' format name no-show-headers '
-            nodes_in_fabric = run_cli(module, cli).split()
-            nodes_in_fabric = list(set(nodes_in_fabric))
-
-            for system in system_names:
-                if system not in nodes_in_fabric:
-                    system_names.remove(system)
-
-            terminate_flag = 0
-            node_count = 0
-            while (node_count < len(system_names)) and (terminate_flag == 0):
-                node2 = system_names[node_count]
+            for node2 in snapshot.topology().fabric_peers(node1):
                 if node2 in non_clustered_leafs:
                     # Cluster creation
                     cluster_name = node1 + '-to-' + node2 + '-cluster'
-                    output += create_cluster(module, node2, cluster_name,
-                                             node1, node2)
+                    output += create_cluster(module, snapshot, node2,
+                                             cluster_name, node1, node2)
 
                     non_clustered_leafs.remove(node2)
-                    terminate_flag += 1
-
-                node_count += 1
+                    break
 
     return output
 
 
-def configure_ospf_bfd(module, vrouter, ip):
+def configure_ospf_bfd(module, snapshot, vrouter, ip):
     """
     Method to add ospf_bfd to the vrouter.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param vrouter: The vrouter name to add ospf bfd.
     :param ip: The interface ip to associate the ospf bfd.
     :return: String describing if OSPF BFD got added or if it already exists.
@@ -666,36 +591,27 @@ def configure_ospf_bfd(module, vrouter, ip):
     global CHANGED_FLAG
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' vrouter-interface-show vrouter-name %s' % vrouter
-    cli += ' ip %s format nic no-show-headers ' % ip
-    nic_interface = run_cli(module, cli).split()
-    nic_interface = list(set(nic_interface))
-    nic_interface.remove(vrouter)
+    nic_interface = snapshot.interface_nic(vrouter, ip)
 
-    cli = clicopy
     cli += ' vrouter-interface-config-show vrouter-name %s' % vrouter
-    cli += ' nic %s format ospf-bfd no-show-headers ' % nic_interface[0]
+    cli += ' nic %s format ospf-bfd no-show-headers ' % nic_interface
     ospf_status = run_cli(module, cli).split()
     ospf_status = list(set(ospf_status))
 
-    cli = clicopy
-    cli += ' vrouter-show name ' + vrouter
-    cli += ' format location no-show-headers '
-    switch = run_cli(module, cli).split()[0]
+    switch = snapshot.location(vrouter)
 
     if 'Success' in ospf_status:
         cli = clicopy
         cli += ' vrouter-interface-config-add vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
+        cli += ' nic %s ospf-bfd enable' % nic_interface
         if 'Success' in run_cli(module, cli):
             CHANGED_FLAG.append(True)
             return ' %s: Added OSPF BFD to %s \n' % (switch, vrouter)
 
     elif 'enable' not in ospf_status:
-        ospf_status.remove(vrouter)        
         cli = clicopy
         cli += ' vrouter-interface-config-modify vrouter-name %s' % vrouter
-        cli += ' nic %s ospf-bfd enable' % nic_interface[0]
+        cli += ' nic %s ospf-bfd enable' % nic_interface
         if 'Success' in run_cli(module, cli):
             CHANGED_FLAG.append(True)
             return ' %s: Modified OSPF BFD to enable for %s \n' % (switch, vrouter)
@@ -703,10 +619,12 @@ def configure_ospf_bfd(module, vrouter, ip):
         return ' %s: OSPF BFD already enabled for %s \n' % (switch, vrouter)
 
 
-def add_ospf_loopback_spine(module, switch, vrouter, ospf_network, ospf_area_id):
+def add_ospf_loopback_spine(module, snapshot, switch, vrouter, ospf_network,
+                            ospf_area_id):
     """
     Method to add ospf_neighbor for loopback network for spines.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch: The name of the ansible switch to add neighbor.
     :param vrouter: The vrouter name to add ospf bfd.
     :param ospf_network: The network for adding the ospf neighbor.
@@ -716,23 +634,21 @@ def add_ospf_loopback_spine(module, switch, vrouter, ospf_network, ospf_area_id)
     global CHANGED_FLAG
     output = ''
     cli = pn_cli(module)
-    clicopy = cli
-
-    cli += ' vrouter-ospf-show'
-    cli += ' network %s format switch no-show-headers ' % ospf_network
-    already_added = run_cli(module, cli).split()
 
-    if vrouter in already_added:
+    if snapshot.has_ospf_network(vrouter, ospf_network):
         output += ' %s: OSPF Neighbor %s already exists for %s \n' % (
             switch, ospf_network, vrouter
         )
     else:
-        cli = clicopy
         cli += ' vrouter-ospf-add vrouter-name ' + vrouter
         cli += ' network %s ospf-area %s' % (ospf_network,
                                              ospf_area_id)
 
         if 'Success' in run_cli(module, cli):
+            snapshot.record('vrouter-ospf-show', {
+                'vrouter-name': vrouter, 'network': ospf_network,
+                'ospf-area': ospf_area_id
+            })
             output += ' %s: Added OSPF neighbor %s to %s \n' % (
                 switch, ospf_network, vrouter
             )
@@ -741,49 +657,46 @@ def add_ospf_loopback_spine(module, switch, vrouter, ospf_network, ospf_area_id)
     return output
 
 
-def dict_area_id_leaf(module):
+def dict_area_id_leaf(module, snapshot):
     """
-    Method to find area_id for all leaf and store in dictionary.
+    Method to find area_id for all leaf and store in dictionary. The area
+    the leafs already advertise their networks in is kept, only leafs
+    without one get the next free area, so re-runs and added leafs renumber
+    nothing.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :return: Dictionary containing area_id of all leaf.
     """
     leaf_list = module.params['pn_leaf_list']
     ospf_area_id = int(module.params['pn_ospf_area_id'])
-    cluster_leaf_list = []
-    cli = pn_cli(module)
-    clicopy = cli
-    dict_area_id = {}
-
-    cli += ' cluster-show format name no-show-headers'
-    cluster_list = run_cli(module, cli).split()
-
-    if 'Success' not in cluster_list:
-        for cluster in cluster_list:
+    cluster_leaf_list = set()
 
-            cli = clicopy
-            cli += ' cluster-show name %s' % cluster
-            cli += ' format cluster-node-1,cluster-node-2 no-show-headers'
-            cluster_nodes = run_cli(module, cli).split()
+    # Area of the first non backbone network of every leaf.
+    leafs = set(leaf_list)
+    current = {}
+    for row in snapshot.rows['vrouter-ospf-show']:
+        leaf = snapshot.location(row.vrouter_name)
+        if leaf in leafs and row.ospf_area not in ('', '0'):
+            current.setdefault(leaf, row.ospf_area)
+    numbering = GroupNumbering(ospf_area_id + 1, current)
 
-            if cluster_nodes[0] in leaf_list and cluster_nodes[1] in leaf_list:
-                ospf_area_id += 1
-                dict_area_id[cluster_nodes[0]] = str(ospf_area_id)
-                dict_area_id[cluster_nodes[1]] = str(ospf_area_id)
-                cluster_leaf_list.append(cluster_nodes[0])
-                cluster_leaf_list.append(cluster_nodes[1])
+    for cluster, node1, node2 in snapshot.cluster_nodes():
+        if node1 in leafs and node2 in leafs:
+            numbering.assign((node1, node2))
+            cluster_leaf_list.update((node1, node2))
 
-    noncluster_leaf_list = list(set(leaf_list) - set(cluster_leaf_list))
-    for leaf in noncluster_leaf_list:
-        ospf_area_id += 1
-        dict_area_id[leaf] = str(ospf_area_id)
+    for leaf in leaf_list:
+        if leaf not in cluster_leaf_list:
+            numbering.assign((leaf,))
 
-    return dict_area_id
+    return numbering.mapping()
 
 
-def add_ospf_neighbor(module, dict_area_id):
+def add_ospf_neighbor(module, snapshot, dict_area_id):
     """
     Method to add ospf_neighbor to the vrouters.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param dict_area_id: Dictionary containing area_id of leafs.
     :return: String describing if ospf neighbors got added or not.
     """
@@ -791,58 +704,26 @@ def add_ospf_neighbor(module, dict_area_id):
     output = ''
     cli = pn_cli(module)
     clicopy = cli
-    leaf_list = module.params['pn_leaf_list']
     spine_list = module.params['pn_spine_list']
 
     for spine in spine_list:
-        cli = clicopy
-        cli += ' vrouter-show location %s' % spine
-        cli += ' format name no-show-headers'
-        vrouter_spine = run_cli(module, cli).split()[0]
+        vrouter_spine = snapshot.vrouter(spine)
 
         if spine_list.index(spine) == 0:
-            cli = clicopy
-            cli += ' vrouter-loopback-interface-show vrouter-name ' + vrouter_spine
-            cli += ' format ip no-show-headers '
-            loopback_ip = run_cli(module, cli).split()
-            loopback_ip.remove(vrouter_spine)
-            vrouter_loopback_ip = loopback_ip[0]
-
-            loopback_ip = loopback_ip[0].split('.')
+            loopback_ip = snapshot.loopbacks[vrouter_spine][0].split('.')
             loopback_network = loopback_ip[0] + '.' + loopback_ip[1] + '.'
             loopback_network += loopback_ip[2] + '.' + '0/24'
 
-        output += add_ospf_loopback_spine(module, spine, vrouter_spine, loopback_network, '0')
+        output += add_ospf_loopback_spine(module, snapshot, spine,
+                                          vrouter_spine, loopback_network, '0')
 
-        cli = clicopy
-        cli += ' vrouter-interface-show vrouter-name %s ' % vrouter_spine
-        cli += ' format l3-port no-show-headers '
-        port_list = run_cli(module, cli).split()
-        port_list = list(set(port_list))
-        port_list.remove(vrouter_spine)
-
-        for port in port_list:
-            cli = clicopy
-            cli += ' switch %s port-show port %s' % (spine, port)
-            cli += ' format hostname no-show-headers'
-            hostname = run_cli(module, cli).split()[0]
+        for port in snapshot.l3_ports(vrouter_spine):
+            hostname = snapshot.topology().peer(spine, port)[0]
 
             ospf_area_id = dict_area_id[hostname]
+            vrouter_hostname = snapshot.vrouter(hostname)
 
-            cli = clicopy
-            cli += ' vrouter-show location %s' % hostname
-            cli += ' format name no-show-headers'
-            vrouter_hostname = run_cli(module, cli).split()[0]
-
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name %s l3-port %s' % (
-                vrouter_spine, port
-            )
-            cli += ' format ip no-show-headers'
-            ip = run_cli(module, cli).split()
-            ip = list(set(ip))
-            ip.remove(vrouter_spine)
-            ip = ip[0]
+            ip = snapshot.interface_ip(vrouter_spine, port)
 
             ip = ip.split('.')
             static_part = str(ip[0]) + '.' + str(ip[1]) + '.'
@@ -858,19 +739,14 @@ def add_ospf_neighbor(module, dict_area_id):
             ip_leaf = static_part + str(leaf_last_octet)
             ip_spine = static_part + last_octet[0]
 
-            cli = clicopy
-            cli += ' vrouter-ospf-show'
-            cli += ' network %s format switch no-show-headers ' % ospf_network
-            already_added = run_cli(module, cli).split()
-
-            if vrouter_spine in already_added:
+            if snapshot.has_ospf_network(vrouter_spine, ospf_network):
                 output += ' %s: OSPF Neighbor %s already exists for %s \n' % (
                     spine, ospf_network, vrouter_spine
                 )
             else:
                 if module.params['pn_bfd']:
-                    output += configure_ospf_bfd(module, vrouter_spine,
-                                                 ip_spine)
+                    output += configure_ospf_bfd(module, snapshot,
+                                                 vrouter_spine, ip_spine)
 
                 cli = clicopy
                 cli += ' vrouter-ospf-add vrouter-name ' + vrouter_spine
@@ -878,19 +754,23 @@ def add_ospf_neighbor(module, dict_area_id):
                                                      ospf_area_id)
 
                 if 'Success' in run_cli(module, cli):
+                    snapshot.record('vrouter-ospf-show', {
+                        'vrouter-name': vrouter_spine,
+                        'network': ospf_network, 'ospf-area': ospf_area_id
+                    })
                     output += ' %s: Added OSPF neighbor %s to %s \n' % (
                         spine, ospf_network, vrouter_spine
                     )
                     CHANGED_FLAG.append(True)
 
-            if vrouter_hostname in already_added:
+            if snapshot.has_ospf_network(vrouter_hostname, ospf_network):
                 output += ' %s: OSPF Neighbor %s already exists for %s \n' % (
                     hostname, ospf_network, vrouter_hostname
                 )
             else:
                 if module.params['pn_bfd']:
-                    output += configure_ospf_bfd(module, vrouter_hostname,
-                                                 ip_leaf)
+                    output += configure_ospf_bfd(module, snapshot,
+                                                 vrouter_hostname, ip_leaf)
 
                 cli = clicopy
                 cli += ' vrouter-ospf-add vrouter-name ' + vrouter_hostname
@@ -898,6 +778,10 @@ def add_ospf_neighbor(module, dict_area_id):
                                                      ospf_area_id)
 
                 if 'Success' in run_cli(module, cli):
+                    snapshot.record('vrouter-ospf-show', {
+                        'vrouter-name': vrouter_hostname,
+                        'network': ospf_network, 'ospf-area': ospf_area_id
+                    })
                     output += ' %s: Added OSPF neighbor %s to %s \n' % (
                         hostname, ospf_network, vrouter_hostname
                     )
@@ -906,10 +790,11 @@ def add_ospf_neighbor(module, dict_area_id):
     return output
 
 
-def add_ospf_redistribute(module, vrouter_names):
+def add_ospf_redistribute(module, snapshot, vrouter_names):
     """
     Method to add ospf_redistribute to the vrouters.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param vrouter_names: List of vrouter names.
     :return: String describing if ospf-redistribute got added or not.
     """
@@ -919,15 +804,17 @@ def add_ospf_redistribute(module, vrouter_names):
     clicopy = cli
 
     for vrouter in vrouter_names:
+        switch = snapshot.location(vrouter)
+        if snapshot.vrouter_row(vrouter).ospf_redistribute == \
+                'static,connected':
+            output += ' %s: OSPF_REDISTRIBUTE is already configured ' % switch
+            output += 'for %s \n' % vrouter
+            continue
+
         cli = clicopy
         cli += ' vrouter-modify name %s' % vrouter
         cli += ' ospf-redistribute static,connected'
         if 'Success' in run_cli(module, cli):
-            cli = clicopy
-            cli += ' vrouter-show name ' + vrouter
-            cli += ' format location no-show-headers '
-            switch = run_cli(module, cli).split()[0]
-
             output += ' %s: Added OSPF_REDISTRIBUTE to %s \n' % (switch,
                                                                  vrouter)
             CHANGED_FLAG.append(True)
@@ -935,11 +822,12 @@ def add_ospf_redistribute(module, vrouter_names):
     return output
 
 
-def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
+def vrouter_leafcluster_ospf_add(module, snapshot, switch_name, interface_ip,
                                  ospf_network, ospf_area_id):
     """
     Method to create interfaces and add ospf neighbors.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch_name: The name of the switch to run interface.
     :param interface_ip: Interface ip to create a vrouter interface.
     :param ospf_network: Ospf network for the ospf neighbor.
@@ -964,22 +852,17 @@ def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
                                                                    vlan_id)
         CHANGED_FLAG.append(True)
 
-    cli = clicopy
-    cli += ' vrouter-show location %s format name' % switch_name
-    cli += ' no-show-headers'
-    vrouter = run_cli(module, cli).split()[0]
-
-    cli = clicopy
-    cli += ' vrouter-interface-show ip %s vlan %s' % (interface_ip, vlan_id)
-    cli += ' format switch no-show-headers'
-    existing_vrouter_interface = run_cli(module, cli).split()
+    vrouter = snapshot.vrouter(switch_name)
 
-    if vrouter not in existing_vrouter_interface:
+    if not snapshot.has_interface(vrouter, interface_ip):
         cli = clicopy
         cli += ' vrouter-interface-add vrouter-name %s ip %s vlan %s ' % (
             vrouter, interface_ip, vlan_id
         )
         run_cli(module, cli)
+        snapshot.record('vrouter-interface-show', {
+            'vrouter-name': vrouter, 'ip': interface_ip, 'vlan': vlan_id
+        })
         output += ' %s: Added vrouter interface with ip %s on %s \n' % (
             switch_name, interface_ip, vrouter
         )
@@ -989,24 +872,23 @@ def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
             switch_name, interface_ip, vrouter
         )
 
-    cli = clicopy
-    cli += ' vrouter-ospf-show'
-    cli += ' network %s format switch no-show-headers ' % ospf_network
-    already_added = run_cli(module, cli).split()
-
-    if vrouter in already_added:
+    if snapshot.has_ospf_network(vrouter, ospf_network):
         output += ' %s: OSPF Neighbor %s already exists for %s \n' % (switch_name,
                                                                   ospf_network, vrouter)
     else:
         interface_ip_without_supernet = interface_ip.split('/')[0]
         if module.params['pn_bfd']:
-            output += configure_ospf_bfd(module, vrouter,
+            output += configure_ospf_bfd(module, snapshot, vrouter,
                                          interface_ip_without_supernet)
         cli = clicopy
         cli += ' vrouter-ospf-add vrouter-name ' + vrouter
         cli += ' network %s ospf-area %s' % (ospf_network, ospf_area_id)
 
         if 'Success' in run_cli(module, cli):
+            snapshot.record('vrouter-ospf-show', {
+                'vrouter-name': vrouter, 'network': ospf_network,
+                'ospf-area': ospf_area_id
+            })
             output += ' %s: Added OSPF neighbor %s to %s \n' % (switch_name,
                                                              ospf_network, vrouter)
             CHANGED_FLAG.append(True)
@@ -1014,10 +896,11 @@ def vrouter_leafcluster_ospf_add(module, switch_name, interface_ip,
     return output
 
 
-def assign_leafcluster_ospf_interface(module, dict_area_id):
+def assign_leafcluster_ospf_interface(module, snapshot, dict_area_id):
     """
     Method to create interfaces and add ospf neighbor for leaf cluster.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param dict_area_id: Dictionary containing area_id of leafs.
     :return: The output of vrouter_interface_ibgp_add() method.
     """
@@ -1028,39 +911,29 @@ def assign_leafcluster_ospf_interface(module, dict_area_id):
     subnet_count = 0
     supernet = 30
 
-    cli = pn_cli(module)
-    clicopy = cli
-
     address = iospf_ip_range.split('.')
     static_part = str(address[0]) + '.' + str(address[1]) + '.'
     static_part += str(address[2]) + '.'
 
-    cli += ' cluster-show format name no-show-headers '
-    cluster_list = run_cli(module, cli).split()
-
-    if len(cluster_list) > 0 and cluster_list[0] != 'Success':
-        for cluster in cluster_list:
-            cli = clicopy
-            cli += ' cluster-show name %s format cluster-node-1' % cluster
-            cli += ' no-show-headers'
-            cluster_node_1 = run_cli(module, cli).split()[0]
+    cluster_list = snapshot.cluster_nodes()
 
+    if len(cluster_list) > 0:
+        for cluster, cluster_node_1, cluster_node_2 in cluster_list:
             if cluster_node_1 not in spine_list and cluster_node_1 in leaf_list:
                 ip_count = subnet_count * 4
                 ip1 = static_part + str(ip_count + 1) + '/' + str(supernet)
                 ip2 = static_part + str(ip_count + 2) + '/' + str(supernet)
                 ospf_network = static_part + str(ip_count) + '/' + str(supernet)
 
-                cli = clicopy
-                cli += ' cluster-show name %s format cluster-node-2' % cluster
-                cli += ' no-show-headers'
-                cluster_node_2 = run_cli(module, cli).split()[0]
-
                 ospf_area_id = dict_area_id[cluster_node_1]
-                output += vrouter_leafcluster_ospf_add(module, cluster_node_1,
-                                                       ip1, ospf_network, ospf_area_id)
-                output += vrouter_leafcluster_ospf_add(module, cluster_node_2,
-                                                       ip2, ospf_network, ospf_area_id)
+                output += vrouter_leafcluster_ospf_add(module, snapshot,
+                                                       cluster_node_1, ip1,
+                                                       ospf_network,
+                                                       ospf_area_id)
+                output += vrouter_leafcluster_ospf_add(module, snapshot,
+                                                       cluster_node_2, ip2,
+                                                       ospf_network,
+                                                       ospf_area_id)
 
                 subnet_count += 1
     else:
@@ -1101,38 +974,30 @@ def main():
     dict_area_id = {}
     dict_bgp_as = {}
 
-    # Get the list of vrouter names.
-    cli = pn_cli(module)
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
+    # Pull the fabric state once, every lookup below is served from it.
+    snapshot = FabricSnapshot(module, pn_cli(module), SNAPSHOT_TABLES)
+    vrouter_names = snapshot.vrouter_names()
 
-    message = assign_router_id(module, vrouter_names)
-    message += create_leaf_clusters(module)
+    message = assign_router_id(module, snapshot, vrouter_names)
+    message += create_leaf_clusters(module, snapshot)
 
     if routing_protocol == 'ebgp':
-        dict_bgp_as = find_dict_bgp_as(module)
-        message += configure_bgp(module,
+        dict_bgp_as = find_dict_bgp_as(module, snapshot)
+        message += configure_bgp(module, snapshot,
                                  vrouter_names, dict_bgp_as,
            module.params['pn_bgp_maxpath'], module.params['pn_bgp_redistribute'])
-        message += add_bgp_neighbor(module, dict_bgp_as)
-        message += assign_ibgp_interface(module, dict_bgp_as)
+        message += add_bgp_neighbor(module, snapshot, dict_bgp_as)
+        message += assign_ibgp_interface(module, snapshot, dict_bgp_as)
     elif routing_protocol == 'ospf':
-        dict_area_id = dict_area_id_leaf(module)
-        message += add_ospf_neighbor(module, dict_area_id)
-        message += add_ospf_redistribute(module, vrouter_names)
-        message += assign_leafcluster_ospf_interface(module, dict_area_id)
+        dict_area_id = dict_area_id_leaf(module, snapshot)
+        message += add_ospf_neighbor(module, snapshot, dict_area_id)
+        message += add_ospf_redistribute(module, snapshot, vrouter_names)
+        message += assign_leafcluster_ospf_interface(module, snapshot,
+                                                     dict_area_id)
 
 
-    message_string = message
-    results = []
-    switch_list = module.params['pn_spine_list'] + module.params['pn_leaf_list']
-    for switch in switch_list:
-        replace_string = switch + ': '
-
-        for line in message_string.splitlines():
-            if replace_string in line:
-                json_msg = {'switch' : switch , 'output' : (line.replace(replace_string, '')).strip() }
-                results.append(json_msg)
+    results = message_summary(message, module.params['pn_spine_list'] +
+                              module.params['pn_leaf_list'])
 
     # Exit the module and return the required JSON.
     module.exit_json(
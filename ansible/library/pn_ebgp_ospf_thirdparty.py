@@ -19,6 +19,8 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_journal import Journal
+from ansible.module_utils.pn_nvos import pn_run_command
 import shlex
 
 DOCUMENTATION = """
@@ -169,7 +171,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -185,6 +187,17 @@ def run_cli(module, cli):
         return 'Success'
 
 
+def get_vrouter_names(module):
+    """
+    Method to get the names of all vrouters of the fabric.
+    :param module: The Ansible module to fetch input parameters.
+    :return: List of vrouter names.
+    """
+    cli = pn_cli(module)
+    cli += ' vrouter-show format name no-show-headers '
+    return run_cli(module, cli).split()
+
+
 def find_dict_bgp_as(module):
     """
     Method to find bgp-as for all switches and store in dictionary.
@@ -978,27 +991,31 @@ def main():
     routing_protocol = module.params['pn_routing_protocol']
     dict_area_id = {}
     dict_bgp_as = {}
+    # A retry resumes after the stages the failed attempt completed. Reads
+    # run again, only the stages changing the configuration are journaled.
+    journal = Journal(module, 'pn_ebgp_ospf_thirdparty', CHANGED_FLAG)
 
     # Get the list of vrouter names.
-    cli = pn_cli(module)
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
+    vrouter_names = get_vrouter_names(module)
 
-    message = assign_router_id(module, vrouter_names)
-    message += create_leaf_clusters(module)
+    message = journal.run(assign_router_id, vrouter_names)
+    message += journal.run(create_leaf_clusters)
 
     if routing_protocol == 'ebgp':
         dict_bgp_as = find_dict_bgp_as(module)
-        message += configure_bgp(module,
-                                 vrouter_names, dict_bgp_as,
+        message += journal.run(configure_bgp,
+                               vrouter_names, dict_bgp_as,
            module.params['pn_bgp_maxpath'], module.params['pn_bgp_redistribute'])
-        message += add_bgp_neighbor(module)
-        message += assign_ibgp_interface(module, dict_bgp_as)
+        message += journal.run(add_bgp_neighbor)
+        message += journal.run(assign_ibgp_interface, dict_bgp_as)
     elif routing_protocol == 'ospf':
         dict_area_id = dict_area_id_leaf(module)
-        message += add_ospf_neighbor(module, dict_area_id)
-        message += add_ospf_redistribute(module, vrouter_names)
-        message += assign_leafcluster_ospf_interface(module, dict_area_id)
+        message += journal.run(add_ospf_neighbor, dict_area_id)
+        message += journal.run(add_ospf_redistribute, vrouter_names)
+        message += journal.run(assign_leafcluster_ospf_interface,
+                               dict_area_id)
+
+    journal.finish()
 
     module.exit_json(
         stdout=message,
@@ -19,6 +19,8 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_results import message_summary
 import shlex
 
 DOCUMENTATION = """
@@ -169,7 +171,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     results = []
     if out:
         return out
@@ -1006,16 +1008,8 @@ def main():
         message += add_ospf_redistribute(module, vrouter_names)
         message += assign_leafcluster_ospf_interface(module, dict_area_id)
 
-    message_string = message
-    results = []
-    switch_list = module.params['pn_spine_list'] + module.params['pn_leaf_list']
-    for switch in switch_list:
-        replace_string = switch + ': '
-
-        for line in message_string.splitlines():
-            if replace_string in line:
-                json_msg = {'switch' : switch , 'output' : (line.replace(replace_string, '')).strip() }
-                results.append(json_msg)
+    results = message_summary(message, module.params['pn_spine_list'] +
+                              module.params['pn_leaf_list'])
 
     # Exit the module and return the required JSON.
     module.exit_json(
@@ -19,6 +19,10 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_fabric_snapshot import (FabricSnapshot,
+                                                     TOPOLOGY_TABLES)
+from ansible.module_utils.pn_fanout import fan_out
+from ansible.module_utils.pn_nvos import pn_run_command
 import shlex
 
 DOCUMENTATION = """
@@ -116,7 +120,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -265,8 +269,11 @@ def add_wan_ibgp_interface(module):
     subnet = 4
 
     # Disable auto trunk on all switches.
-    for switch in wan_switch_list:
-        modify_auto_trunk_setting(module, switch, 'disable')
+    fan_out(module, lambda switch: modify_auto_trunk_setting(
+        module, switch, 'disable'), wan_switch_list)
+
+    # One fabric wide pull of the cabling between the wan switches.
+    topology = FabricSnapshot(module, clicopy, TOPOLOGY_TABLES).topology()
 
     while len(wan_switch_list) > 1:
         wan_switch = wan_switch_list[0]
@@ -283,16 +290,10 @@ def add_wan_ibgp_interface(module):
             cli += ' vrouter-show location %s format name no-show-headers ' % host_switch
             vrouter_switch2 = run_cli(module, cli).split()[0]
 
-            cli = clicopy
-            cli += ' switch %s port-show hostname %s ' % (wan_switch, host_switch)
-            cli += ' format port no-show-headers '
-            port_list = run_cli(module, cli).split()
-        
-            while len(port_list) > 0 and 'Success' not in port_list:
-        
+            for lport, rport in topology.links(wan_switch, host_switch):
+
                 network = network_count * subnet
-                lport = port_list[0]
-        
+
                 ip1 = static_part + str(int(network) + 1)
                 ip2 = static_part + str(int(network) + 2)
                 ip1_interface = ip1 + '/30'
@@ -300,13 +301,7 @@ def add_wan_ibgp_interface(module):
 
                 delete_trunk(module, wan_switch, lport, host_switch)
                 output += create_interface(module, wan_switch, ip1_interface, lport, vrouter_switch1)
-                port_list.remove(lport)
-        
-                cli = clicopy
-                cli += ' switch %s port-show port %s ' % (wan_switch, lport)
-                cli += ' format rport no-show-headers '
-                rport = run_cli(module, cli).split()[0]
-        
+
                 delete_trunk(module, host_switch, rport, wan_switch)
                 output += create_interface(module, host_switch, ip2_interface, rport, vrouter_switch2)
         
@@ -400,8 +395,8 @@ def create_vrouter(module):
     vnet_name = str(fabric_name) + '-global'
 
     # Create vrouter on all switches.
-    for switch in module.params['pn_wan_switch_list']:
-        output += create_vrouter_command(module, switch, vnet_name)
+    output += ''.join(fan_out(module, lambda switch: create_vrouter_command(
+        module, switch, vnet_name), module.params['pn_wan_switch_list']))
 
 
 def main():
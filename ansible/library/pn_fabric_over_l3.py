@@ -19,7 +19,6 @@
 #
 
 import shlex
-import time
 
 DOCUMENTATION = """
 ---
@@ -159,7 +158,7 @@ def run_cli(module, cli):
     the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if out:
         return out
@@ -185,7 +184,7 @@ def auto_accept_eula(module):
     password = module.params['pn_clipassword']
     cli = ' /usr/bin/cli --quiet --skip-setup eula-show '
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if err:
         cli = '/usr/bin/cli --quiet'
@@ -230,22 +229,17 @@ def assign_inband_ip(module, inband_ip):
     leaf_list = module.params['pn_leaf_list']
     current_switch = module.params['pn_current_switch']
     output = ''
-    ip_count = 0
+    position = 0
 
     if current_switch in spine_list:
-        spine_pos = int(spine_list.index(current_switch))
-        ip_count = (supernet * spine_pos) + 1
+        position = spine_list.index(current_switch)
     elif current_switch in leaf_list:
-        spine_count = len(spine_list)
-        leaf_pos = int(leaf_list.index(current_switch))
-        ip_count = (supernet * leaf_pos) + 1
-        ip_count += (int(spine_count) * supernet)
+        position = len(spine_list) + leaf_list.index(current_switch)
 
-    address = inband_ip.split('.')
-    static_part = str(address[0]) + '.' + str(address[1]) + '.'
-    static_part += str(address[2]) + '.'
-
-    ip = static_part + str(ip_count) + '/' + str(30)
+    # Every switch takes the first host of the /30 at its position.
+    ledger = fabric_inband_ledger(module, clicopy, inband_ip,
+                                  stride=supernet, offset=1, prefix_len=30)
+    ip = assign_address(module, ledger, current_switch, position)
 
     cli = clicopy
     cli += 'switch-setup-modify in-band-ip %s ' % ip
@@ -348,7 +342,7 @@ def join_fabric(module, switch_ip):
     cli = clicopy
     cli += ' fabric-info format name no-show-headers'
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if err:
         cli = clicopy
@@ -717,8 +711,9 @@ def toggle_40g_local(module):
     """
     Method to toggle 40g ports to 10g ports.
     :param module: The Ansible module to fetch input parameters.
-    :return: The output messages for assignment.
+    :return: The output messages for the toggled ports.
     """
+    switch = module.params['pn_current_switch']
     output = ''
     cli = pn_cli(module)
     clicopy = cli
@@ -732,6 +727,7 @@ def toggle_40g_local(module):
     if len(ports_40g) > 0 and ports_40g != 'Success':
         ports_40g = ports_40g.split()
         ports_to_modify = list(set(ports_40g) - set(local_ports))
+        modified = []
 
         for port in ports_to_modify:
             next_port = str(int(port) + 1)
@@ -743,26 +739,32 @@ def toggle_40g_local(module):
             if '.2' in bezel_port:
                 end_port = int(port) + 3
                 range_port = port + '-' + str(end_port)
+                modified.append(range_port)
     
                 cli = clicopy
                 cli += ' port-config-modify port %s ' % port
                 cli += ' disable '
-                output += 'port ' + port + ' disabled'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
     
                 cli = clicopy
                 cli += ' port-config-modify port %s ' % port
                 cli += ' speed 10g '
-                output += 'port ' + port + ' converted to 10g'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
     
                 cli = clicopy
                 cli += ' port-config-modify port %s ' % range_port
                 cli += ' enable '
-                output += 'port range_port ' + range_port + '  enabled'
-                output += run_cli(module, cli)
-
-        time.sleep(10)
+                run_cli(module, cli)
+
+        # Wait for the converted ports to be enabled rather than a fixed
+        # delay. They have no LLDP neighbor, so they may never come up.
+        if modified:
+            output += ' %s: Toggled 40G ports to 10G \n' % switch
+            ports = ','.join(modified)
+            enabled = ports_enabled(module, clicopy, ports, '10g')
+            if not wait_for(enabled, PORT_TIMEOUT):
+                output += ' %s: Ports %s not enabled after %d seconds \n' % (
+                    switch, ports, PORT_TIMEOUT)
 
     return output
 
@@ -810,8 +812,9 @@ def main():
     
         # Toggle 40g ports to 10g
         if toggle_40g_flag:
-            if toggle_40g_local(module):
-                message += ' %s: Toggled 40G ports to 10G \n' % current_switch
+            toggled = toggle_40g_local(module)
+            if toggled:
+                message += toggled
                 CHANGED_FLAG.append(True)
     else:
         message += configure_fabric_over_l3(module)
@@ -825,6 +828,10 @@ def main():
 
 # AnsibleModule boilerplate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_wait import PORT_TIMEOUT, ports_enabled, wait_for
+from ansible.module_utils.pn_addressing import assign_address
+from ansible.module_utils.pn_addressing import fabric_inband_ledger
 
 if __name__ == '__main__':
     main()
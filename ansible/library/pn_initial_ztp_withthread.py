@@ -19,8 +19,11 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_addressing import assign_address
+from ansible.module_utils.pn_addressing import fabric_inband_ledger
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_wait import PORT_TIMEOUT, ports_enabled, wait_for
 import shlex
-import time
 import threading
 from Queue import Queue
 from multiprocessing import Process
@@ -196,7 +199,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -221,7 +224,7 @@ def auto_accept_eula(module):
     password = module.params['pn_clipassword']
     cli = ' /usr/bin/cli --quiet --skip-setup eula-show '
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if err:
         cli = '/usr/bin/cli --quiet'
@@ -420,7 +423,7 @@ def create_or_join_fabric(module, fabric_name, fabric_network):
         cli = clicopy
         cli += ' fabric-info format name no-show-headers'
         cli = shlex.split(cli)
-        rc, out, err = module.run_command(cli)
+        rc, out, err = pn_run_command(module, cli)
 
         if err:
             cli = clicopy
@@ -458,8 +461,9 @@ def toggle_40g_local(module):
     """
     Method to toggle 40g ports to 10g ports.
     :param module: The Ansible module to fetch input parameters.
-    :return: The output messages for assignment.
+    :return: The output messages for the toggled ports.
     """
+    switch = module.params['pn_current_switch']
     output = ''
     cli = pn_cli(module)
     clicopy = cli
@@ -473,6 +477,7 @@ def toggle_40g_local(module):
     if len(ports_40g) > 0 and ports_40g != 'Success':
         ports_40g = ports_40g.split()
         ports_to_modify = list(set(ports_40g) - set(local_ports))
+        modified = []
 
         for port in ports_to_modify:
             next_port = str(int(port) + 1)
@@ -485,28 +490,35 @@ def toggle_40g_local(module):
             if '.2' in bezel_port:
                 end_port = int(port) + 3
                 range_port = port + '-' + str(end_port)
+                modified.append(range_port)
     
                 cli = clicopy
                 cli += ' switch-local port-config-modify port %s ' % port
                 cli += ' disable '
-                output += 'port ' + port + ' disabled'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
     
                 cli = clicopy
                 cli += ' switch-local port-config-modify port %s ' % port
                 cli += ' speed 10g '
-                output += 'port ' + port + ' converted to 10g'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
     
                 cli = clicopy
                 cli += ' switch-local port-config-modify port %s ' % range_port
                 cli += ' enable '
-                output += 'port range_port ' + range_port + '  enabled'
-                output += run_cli(module, cli)
+                run_cli(module, cli)
         f= open('output.txt', 'a')
         f.write("toggle \n")
         f.close()
-        time.sleep(10)
+        # Wait for the converted ports to be enabled rather than a fixed
+        # delay. They have no LLDP neighbor, so they may never come up.
+        if modified:
+            output += ' %s: Toggled 40G ports to 10G \n' % switch
+            ports = ','.join(modified)
+            enabled = ports_enabled(module, clicopy + ' switch-local ', ports,
+                                    '10g')
+            if not wait_for(enabled, PORT_TIMEOUT):
+                output += ' %s: Ports %s not enabled after %d seconds \n' % (
+                    switch, ports, PORT_TIMEOUT)
 
     return output
 
@@ -518,33 +530,23 @@ def assign_inband_ip(module, inband_address):
     :param inband_address: The network ip for the in-band ips.
     :return: Assigned inband ip or None.
     """
-    address = inband_address.split('.')
-    static_part = str(address[0]) + '.' + str(address[1]) + '.'
-    static_part += str(address[2]) + '.'
-    last_octet = str(address[3]).split('/')
-    subnet = last_octet[1]
-
     cli = pn_cli(module)
     clicopy = cli
-    ip_count = 1
-    ip = static_part + str(ip_count) + '/' + subnet
+    ledger = fabric_inband_ledger(module, cli, inband_address)
+    ip = ledger.address(1)
 
     # Get existing in-band ip.
     cli += ' switch-local switch-setup-show format in-band-ip '
     existing_inband_ip = run_cli(module, cli)
     # If existing in-band ip is not the same then assign new ip.
     if ip not in existing_inband_ip:
-        cli = clicopy
-        cli += ' fabric-node-show format in-band-ip '
-        cli += ' no-show-headers '
-        assigned_ips = run_cli(module, cli).split()
-        # Make sure ip has not been assigned to any of the switches.
-        while ip in assigned_ips:
-            # If ip is not unique, increase the ip count by 1.
-            ip_count += 1
-            ip = static_part + str(ip_count) + '/' + subnet
-            if ip in existing_inband_ip:
+        # Take the lowest ip not assigned to any of the switches, unless
+        # this switch already holds one of the lower ones.
+        slot = ledger.first_free()
+        for used in range(1, slot):
+            if ledger.address(used) in existing_inband_ip:
                 return None
+        ip = ledger.address(slot)
         f= open('output.txt', 'a')
         f.write("inband \n")
         f.close()
@@ -681,8 +683,9 @@ def main():
     q.join()
     '''
     if toggle_40g_flag:
-        if toggle_40g_local(module):
-            message += ' %s: Toggled 40G ports to 10G \n' % current_switch
+        toggled = toggle_40g_local(module)
+        if toggled:
+            message += toggled
             CHANGED_FLAG.append(True)
 
     module.exit_json(
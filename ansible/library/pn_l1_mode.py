@@ -19,7 +19,6 @@
 #
 
 import shlex
-import time
 
 DOCUMENTATION = """
 ---
@@ -119,7 +118,7 @@ def run_cli(module, cli):
     the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if out:
         return out
@@ -149,39 +148,22 @@ def modify_switch_mode_to_l1(module, l1_switch):
     cli += ' switch-mode-modify switch-mode virtual-wire '
 
     run_cli(module, cli)
-    time.sleep(10)   # Wait for nvOS to restart
+    # Wait for nvOS to restart in the new mode
+    if not wait_for(switch_mode(module, pn_cli(module), 'virtual-wire'),
+                    RESTART_TIMEOUT):
+        module.exit_json(
+            error='1',
+            failed=True,
+            msg='Operation Failed: nvOS not restarted in virtual-wire mode '
+                'after %d seconds' % RESTART_TIMEOUT,
+            changed=True
+        )
 
     cli = pn_cli(module)
     cli += ' switch-mode-show '
     return run_cli(module, cli)
 
 
-def get_ports(module, l1_switch, end_switch):
-    """
-    Method to get list of ports on L1 switch connected to end switch.
-    :param module: The Ansible module to fetch input parameters.
-    :param l1_switch: Name of the L1 switch.
-    :param end_switch: Name of the end switch connected to L1 switch.
-    :return: List of ports.
-    """
-    cli = pn_cli(module)
-    # cli += ' switch ' + l1_switch
-    cli += ' lldp-show format local-port no-show-headers '
-    ports = run_cli(module, cli).split()
-
-    cli = pn_cli(module)
-    # cli += ' switch ' + l1_switch
-    cli += ' lldp-show format sys-name no-show-headers '
-    sys_names = run_cli(module, cli).split()
-
-    port_list = []
-    for index, system in enumerate(sys_names):
-        if system in end_switch:
-            port_list.append(ports[index])
-
-    return port_list
-
-
 def create_port_association(module, l1_switch, port_assn_name,
                             master_ports, slave_ports):
     """
@@ -233,12 +215,16 @@ def main():
     if port_assn_name is None:
         port_assn_name = end_switch1 + '-assn-' + end_switch2
 
+    # The LLDP neighbors of the L1 switch, pulled once for both end switches.
+    topology = FabricSnapshot(module, pn_cli(module),
+                              ('lldp-show',)).topology()
+
     # Get the list of master ports
-    master_ports = get_ports(module, l1_switch, end_switch1)
+    master_ports = topology.ports(l1_switch, end_switch1)
     message = ' List of master ports: ' + ','.join(master_ports) + '\n'
 
     # Get the list of slave ports
-    slave_ports = get_ports(module, l1_switch, end_switch2)
+    slave_ports = topology.ports(l1_switch, end_switch2)
     message += ' List of slave ports: ' + ','.join(slave_ports) + '\n'
 
     # Put switch in L1 mode
@@ -259,6 +245,9 @@ def main():
 
 # AnsibleModule boilerplate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_wait import RESTART_TIMEOUT, switch_mode, wait_for
 
 if __name__ == '__main__':
     main()
@@ -19,6 +19,11 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_fabric_snapshot import (FabricSnapshot,
+                                                     TOPOLOGY_TABLES)
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_results import message_summary
+from ansible.module_utils.pn_topology import port_key
 import shlex
 import json
 
@@ -119,7 +124,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     results = []
     if out:
         return out
@@ -171,10 +176,11 @@ def modify_stp(module, modify_flag):
     return output
 
 
-def create_cluster(module, switch, name, node1, node2):
+def create_cluster(module, snapshot, switch, name, node1, node2):
     """
     Method to create a cluster between two switches.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch: Name of the local switch.
     :param name: The name of the cluster to create.
     :param node1: First node of the cluster.
@@ -182,12 +188,8 @@ def create_cluster(module, switch, name, node1, node2):
     :return: The output of run_cli() method.
     """
     global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s cluster-show format name no-show-headers ' % node1
-    cluster_list = run_cli(module, cli).split()
-    if name not in cluster_list:
-        cli = clicopy
+    if not snapshot.has_cluster(name):
+        cli = pn_cli(module)
         cli += ' switch %s cluster-create name %s ' % (switch, name)
         cli += ' cluster-node-1 %s cluster-node-2 %s ' % (node1, node2)
         if 'Success' in run_cli(module, cli):
@@ -197,37 +199,19 @@ def create_cluster(module, switch, name, node1, node2):
         return ' %s: %s already exists \n' % (switch, name)
 
 
-def get_ports(module, switch, peer_switch):
-    """
-    Method to figure out connected ports between two switches.
-    :param module: The Ansible module to fetch input parameters.
-    :param switch: Name of the local switch.
-    :param peer_switch: Name of the connected peer switch.
-    :return: List of connected ports.
-    """
-    cli = pn_cli(module)
-    cli += ' switch %s port-show hostname %s' % (switch, peer_switch)
-    cli += ' format port no-show-headers '
-    return run_cli(module, cli).split()
-
-
-def create_trunk(module, switch, name, ports):
+def create_trunk(module, snapshot, switch, name, ports):
     """
     Method to create a trunk on a switch.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch: Name of the local switch.
     :param name: The name of the trunk to create.
     :param ports: List of connected ports.
     :return: The output of run_cli() method.
     """
     global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    msg  = ''
-    cli += ' switch %s trunk-show format name no-show-headers ' % switch
-    trunk_list = run_cli(module, cli).split()
-    if name not in trunk_list:
-        cli = clicopy
+    if not snapshot.has_trunk(switch, name):
+        cli = pn_cli(module)
         ports_string = ','.join(ports)
         cli += ' switch %s trunk-create name %s ' % (switch, name)
         cli += ' ports %s ' % ports_string
@@ -238,30 +222,22 @@ def create_trunk(module, switch, name, ports):
         return ' %s: %s trunk already exists \n' % (switch, name)
 
 
-def find_non_clustered_leafs(module, leaf_list):
+def find_non_clustered_leafs(snapshot, leaf_list):
     """
     Method to find leafs which are not part of any cluster.
-    :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param leaf_list: The list of leaf switches.
     :return: List of non clustered leaf switches.
     """
-    non_clustered_leafs = []
-    cli = pn_cli(module)
-    cli += ' cluster-show format cluster-node-1,cluster-node-2 '
-    cli += ' no-show-headers '
-    clustered_nodes = run_cli(module, cli).split()
-
-    for leaf in leaf_list:
-        if leaf not in clustered_nodes:
-            non_clustered_leafs.append(leaf)
+    return [leaf for leaf in leaf_list if snapshot.cluster(leaf) is None]
 
-    return non_clustered_leafs
 
-
-def create_vlag(module, switch, name, peer_switch, port, peer_port):
+def create_vlag(module, snapshot, switch, name, peer_switch, port,
+                peer_port):
     """
     Method to create virtual link aggregation groups.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch: Name of the local switch.
     :param name: The name of the vlag to create.
     :param peer_switch: Name of the peer switch.
@@ -270,12 +246,8 @@ def create_vlag(module, switch, name, peer_switch, port, peer_port):
     :return: String describing if vlag got created or if it already exists.
     """
     global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s vlag-show format name no-show-headers ' % switch
-    vlag_list = run_cli(module, cli).split()
-    if name not in vlag_list:
-        cli = clicopy
+    if not snapshot.has_vlag(switch, name):
+        cli = pn_cli(module)
         cli += ' switch %s vlag-create name %s port %s ' % (switch, name, port)
         cli += ' peer-switch %s peer-port %s mode active-active' % (peer_switch,
                                                                     peer_port)
@@ -286,159 +258,72 @@ def create_vlag(module, switch, name, peer_switch, port, peer_port):
         return ' %s: %s vlag is already configured \n' % (switch, name)
 
 
-def configure_trunk(module, cluster_node, switch_list):
+def plan_trunk(topology, switch, peers):
     """
-    Method to configure trunk vlags.
-    :param module: The Ansible module to fetch input parameters.
-    :param cluster_node: The node from which lag needs to be created.
-    :param switch_list: The list of connected switches to find
-    physical linked port.
-    :return: Name of the trunk that got created.
+    Method to plan the trunk of a switch over its links to the peers.
+    :param topology: The FabricTopology of the fabric.
+    :param switch: Name of the switch the trunk is created on.
+    :param peers: The list of connected switches to find physical linked port.
+    :return: Tuple of (switch, trunk name, ports).
     """
-    switch_names = ''
-    src_ports = []
-    for switch in switch_list:
-        src_ports += get_ports(module, cluster_node, switch)
-        switch_names += str(switch)
-
-    src_ports = list(set(src_ports))
-    name = cluster_node + '-to-' + switch_names
-    if len(name) > 59:
-        name = name[:59]
+    ports = []
+    for peer in peers:
+        ports += topology.ports(switch, peer)
 
-    output = create_trunk(module, cluster_node, name, src_ports)
+    name = switch + '-to-' + ''.join(peers)
+    return switch, name[:59], sorted(set(ports), key=port_key)
 
-    return output + name
 
-
-def configure_trunk_vlag_for_clustered_leafs(module, non_clustered_leafs,
-                                             spine_list):
+def plan_auto_vlag(topology, spine_list, leaf_list, non_clustered_leafs):
     """
-    Method to create clusters, trunks and vlag for the switches having
-    physical links (clustered leafs).
-    :param module: The Ansible module to fetch input parameters.
-    :param non_clustered_leafs: The list of non clustered leaf switches.
+    Method to plan the clusters, trunks and vlags of the whole fabric at
+    once. Leafs cabled to each other are paired into clusters by one pass
+    over the adjacency graph.
+    :param topology: The FabricTopology of the fabric.
     :param spine_list: The list of spine switches.
-    :return: Output of create_cluster() and create_vlag() methods.
+    :param leaf_list: The list of leaf switches.
+    :param non_clustered_leafs: The leafs not part of any cluster yet.
+    :return: Tuple of the lists of clusters (switch, name, node1, node2),
+    trunks (switch, name, ports) and vlags (switch, name, peer switch, trunk,
+    peer trunk) to create, in creation order.
     """
-    cli = pn_cli(module)
-    clicopy = cli
-    output = ''
-    non_clustered_leafs_count = 0
-    while non_clustered_leafs_count == 0:
-        if len(non_clustered_leafs) == 0:
-            non_clustered_leafs_count += 1
-        else:
-            node1 = non_clustered_leafs[0]
-            non_clustered_leafs.remove(node1)
-
-            cli = clicopy
-            cli += ' switch %s lldp-show ' % node1
-            cli += ' format sys-name no-show-headers '
-            system_names = run_cli(module, cli).split()
-            system_names = list(set(system_names))
-
-            cli = clicopy
-            cli += ' switch %s fabric-node-show ' % node1
-            cli += ' format name no-show-headers '
-            nodes_in_fabric = run_cli(module, cli).split()
-            nodes_in_fabric = list(set(nodes_in_fabric))
-
-            for system in system_names:
-                if system not in nodes_in_fabric:
-                    system_names.remove(system)
-
-            terminate_flag = 0
-            node_count = 0
-            while (node_count < len(system_names)) and (terminate_flag == 0):
-                node2 = system_names[node_count]
-                if node2 in non_clustered_leafs:
-                    # Cluster creation
-                    cluster_name = node1 + '-to-' + node2 + '-cluster'
-                    if len(cluster_name) > 59:
-                        cluster_name = cluster_name[:59]
-
-                    output += create_cluster(module, node2, cluster_name,
-                                             node1, node2)
-
-                    non_clustered_leafs.remove(node2)
-
-                    # Trunk creation (leaf to spines)
-                    trunk_message1 = configure_trunk(module, node1, spine_list).split('\n')
-                    trunk_message2 = configure_trunk(module, node2, spine_list).split('\n')
-                    trunk_name1 = trunk_message1[1]
-                    trunk_name2 = trunk_message2[1]
-                    output += trunk_message1[0] + '\n'
-                    output += trunk_message2[0] + '\n'
-                    # Vlag creation (leaf to spines)
-                    vlag_name = node1 + '-' + node2 + '-to-' + 'spine'
-                    if len(vlag_name) > 59:
-                        vlag_name = vlag_name[:59]
-
-                    output += create_vlag(module, node1, vlag_name, node2,
-                                          trunk_name1, trunk_name2)
-
-                    leafs_list = [node1, node2]
-                    spine1 = str(spine_list[0])
-                    spine2 = str(spine_list[1])
-
-                    # Trunk creation (spine to leafs)
-                    trunk_message1 = configure_trunk(module, spine1, leafs_list).split('\n')
-                    trunk_message2 = configure_trunk(module, spine2, leafs_list).split('\n')
-                    trunk_name1 = trunk_message1[1]
-                    trunk_name2 = trunk_message2[1]
-                    output += trunk_message1[0] + '\n'
-                    output += trunk_message2[0] + '\n'
-
-                    # Vlag creation (spine to leafs)
-                    name =  'spine-to-' + node1 + '-' + node2
-                    if len(name) > 59:
-                        name = name[:59]
-
-                    output += create_vlag(module, spine1, name, spine2,
-                                          trunk_name1, trunk_name2)
-
-                    terminate_flag += 1
-
-                node_count += 1
-    return output
-
+    spine1 = spine_list[0]
+    spine2 = spine_list[1]
+    clusters = [(spine1, 'spine-cluster', spine1, spine2)]
+    trunks = []
+    vlags = []
+
+    def trunk(switch, peers):
+        trunks.append(plan_trunk(topology, switch, peers))
+        return trunks[-1][1]
+
+    paired = set()
+    for node1, node2 in topology.cluster_pairs(leaf_list):
+        paired.update((node1, node2))
+        name = node1 + '-to-' + node2 + '-cluster'
+        clusters.append((node2, name[:59], node1, node2))
+
+        # Leafs to spines.
+        name = node1 + '-' + node2 + '-to-' + 'spine'
+        vlags.append((node1, name[:59], node2, trunk(node1, spine_list),
+                      trunk(node2, spine_list)))
+
+        # Spines to leafs.
+        name = 'spine-to-' + node1 + '-' + node2
+        vlags.append((spine1, name[:59], spine2,
+                      trunk(spine1, [node1, node2]),
+                      trunk(spine2, [node1, node2])))
 
-def configure_trunk_non_clustered_leafs(module, non_clustered_leafs,
-                                        spine_list):
-    """
-    Method to create clusters, trunks and vlag for non clustered leafs.
-    :param module: The Ansible module to fetch input parameters.
-    :param non_clustered_leafs: The list of all non clustered leaf switches.
-    :param spine_list: The list of all spine switches.
-    :return: Output of configure_trunk() method.
-    """
-    output = ''
     for leaf in non_clustered_leafs:
-        # Trunk creation (leaf to spines)
-        trunk_message = configure_trunk(module, leaf, spine_list).split('\n')
-        output += trunk_message[0] + '\n'
-
-        spine1 = str(spine_list[0])
-        spine2 = str(spine_list[1])
-
-        # Trunk creation (spine to leafs)
-        trunk_message1 = configure_trunk(module, spine1, [leaf]).split('\n')
-        trunk_message2 = configure_trunk(module, spine2, [leaf]).split('\n')
-        trunk_name1 = trunk_message1[1]
-        trunk_name2 = trunk_message2[1]
-        output += trunk_message1[0] + '\n'
-        output += trunk_message2[0] + '\n'
-
-        # Vlag creation (spine to leafs)
-        name = 'spine-to-' + leaf
-        if len(name) > 59:
-            name = name[:59]
+        if leaf in paired:
+            continue
 
-        output += create_vlag(module, spine1, name, spine2, trunk_name1,
-                              trunk_name2)
+        trunk(leaf, spine_list)
+        name = 'spine-to-' + leaf
+        vlags.append((spine1, name[:59], spine2, trunk(spine1, [leaf]),
+                      trunk(spine2, [leaf])))
 
-    return output
+    return clusters, trunks, vlags
 
 
 def configure_auto_vlag(module):
@@ -449,21 +334,28 @@ def configure_auto_vlag(module):
     """
     spine_list = module.params['pn_spine_list']
     leaf_list = module.params['pn_leaf_list']
-    spine1 = spine_list[0]
-    spine2 = spine_list[1]
 
-    # Create cluster between two spines.
-    output = create_cluster(module, spine1, 'spine-cluster', spine1, spine2)
+    # One fabric wide pull of the cabling and of the clusters, trunks and
+    # vlags, then the plan of the whole fabric. Only what is missing from
+    # the snapshot gets created.
+    snapshot = FabricSnapshot(module, pn_cli(module), TOPOLOGY_TABLES + (
+        'cluster-show', 'trunk-show', 'vlag-show'))
+    clusters, trunks, vlags = plan_auto_vlag(
+        snapshot.topology(), spine_list, leaf_list,
+        find_non_clustered_leafs(snapshot, leaf_list))
+
+    output = ''
+    for switch, name, node1, node2 in clusters:
+        output += create_cluster(module, snapshot, switch, name, node1,
+                                 node2)
+
+    for switch, name, ports in trunks:
+        output += create_trunk(module, snapshot, switch, name, ports)
 
-    # Configure trunk, vlag for clustered leaf switches.
-    output += configure_trunk_vlag_for_clustered_leafs(module,
-                                                       list(leaf_list),
-                                                       spine_list)
+    for switch, name, peer_switch, port, peer_port in vlags:
+        output += create_vlag(module, snapshot, switch, name, peer_switch,
+                              port, peer_port)
 
-    # Configure trunk, vlag for non clustered leaf switches.
-    non_clustered_leafs = find_non_clustered_leafs(module, leaf_list)
-    output += configure_trunk_non_clustered_leafs(module, non_clustered_leafs,
-                                                  spine_list)
     return output
 
 
@@ -523,16 +415,8 @@ def main():
     if module.params['pn_stp']:
         message += modify_stp(module, 'enable')
 
-    message_string = message
-    results = []
-    switch_list = module.params['pn_spine_list'] + module.params['pn_leaf_list']
-    for switch in switch_list:
-        replace_string = switch + ': '
-        
-        for line in message_string.splitlines():
-            if replace_string in line:
-                json_msg = {'switch' : switch , 'output' : (line.replace(replace_string, '')).strip() }
-                results.append(json_msg)
+    results = message_summary(message, module.params['pn_spine_list'] +
+                              module.params['pn_leaf_list'])
 
     # Exit the module and return the required JSON.
     module.exit_json(
@@ -19,6 +19,14 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_addressing import allocate_link, link_allocator
+from ansible.module_utils.pn_addressing import loopback_plan
+from ansible.module_utils.pn_fabric_snapshot import (FabricSnapshot,
+                                                     TOPOLOGY_TABLES)
+from ansible.module_utils.pn_fanout import fan_out
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_reconcile import apply_plan, Lookup, Reconciler
+from ansible.module_utils.pn_reconcile import save_plans, saved_plans
 import shlex
 
 DOCUMENTATION = """
@@ -43,6 +51,7 @@ options:
     pn_net_address:
       description:
         - Specify network address to be used in configuring link IPs for layer3.
+        - IPv4 or IPv6.
       required: False
       type: str
     pn_cidr:
@@ -53,6 +62,8 @@ options:
     pn_supernet:
       description:
         - Specify supernet value to be used in configuring link IPs for layer3.
+        - Prefix length of every link, e.g. 30, or 31 (127 for IPv6) to use
+          both addresses of the link.
       required: False
       type: str
     pn_spine_list:
@@ -109,6 +120,15 @@ options:
       required: False
       default: False
       type: bool
+    pn_plan_file:
+      description:
+        - File holding the planned vrouter, interface and loopback commands.
+        - In check mode the plan gets written to it, otherwise the plan it
+          holds is applied without planning again and the file is removed.
+          If the fabric changed since it was written, e.g. by a failed run,
+          what is left of the plan is diffed against the fabric first.
+      required: False
+      type: str
 """
 
 EXAMPLES = """
@@ -139,6 +159,11 @@ failed:
 
 CHANGED_FLAG = []
 
+# Show tables the layer3 setup is planned against.
+SNAPSHOT_TABLES = TOPOLOGY_TABLES + ('vrouter-show', 'vrouter-interface-show',
+                                     'vrouter-loopback-interface-show',
+                                     'trunk-show')
+
 
 def pn_cli(module):
     """
@@ -166,7 +191,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -239,161 +264,68 @@ def update_fabric_network_to_inband(module):
     return output
 
 
-def calculate_link_ip_addresses(address_str, cidr_str, supernet_str):
-    """
-    Method to calculate link IPs for layer 3 fabric.
-    :param address_str: Host/network address.
-    :param cidr_str: Subnet mask.
-    :param supernet_str: Supernet mask.
-    :return: List of available IP addresses that can be assigned to vrouter
-    interfaces for layer 3 fabric.
+def create_vrouter(reconciler, switch, vrouter_name, vnet_name):
     """
-    # Split address into octets and turn CIDR, supernet mask into int
-    address = address_str.split('.')
-    cidr = int(cidr_str)
-    supernet = int(supernet_str)
-    supernet_mapping = {
-        30: 2,
-        29: 6,
-        28: 14,
-        27: 30
-    }
-    supernet_range = supernet_mapping[supernet]
-    base_addr = int(address[3])
-    # Initialize the netmask and calculate based on CIDR mask
-    mask = [0, 0, 0, 0]
-    for i in range(cidr):
-        mask[i / 8] += (1 << (7 - i % 8))
-
-    # Initialize net and binary and netmask with addr to get network
-    network = []
-    for i in range(4):
-        network.append(int(address[i]) & mask[i])
-
-    # Duplicate net into broad array, gather host bits, and generate broadcast
-    broadcast = list(network)
-    broadcast_range = 32 - cidr
-    for i in range(broadcast_range):
-        broadcast[3 - i / 8] += (1 << (i % 8))
-
-    last_ip = list(broadcast)
-    diff = base_addr % (supernet_range + 2)
-    host = base_addr - diff
-    count, hostmin, hostmax = 0, 0, 0
-    third_octet = network[2]
-    available_ips = []
-    while third_octet <= last_ip[2]:
-        ips_list = []
-        while count < last_ip[3]:
-            hostmin = host + 1
-            hostmax = hostmin + supernet_range - 1
-            while hostmin <= hostmax:
-                ips_list.append(hostmin)
-                hostmin += 1
-            host = hostmax + 2
-            count = host
-
-        list_index = 0
-        ip_address = str(last_ip[0]) + '.' + str(last_ip[1]) + '.'
-        ip_address += str(third_octet)
-        while list_index < len(ips_list):
-            ip = ip_address + '.' + str(ips_list[list_index]) + "/"
-            ip += supernet_str
-            available_ips.append(ip)
-            list_index += 1
-
-        host, count, hostmax, hostmin = 0, 0, 0, 0
-        third_octet += 1
-
-    return available_ips
-
-
-def create_vrouter(module, switch, vnet_name):
-    """
-    Method to create vrouter on a switch.
-    :param module: The Ansible module to fetch input parameters.
+    Method to declare the vrouter of a switch.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: The switch name on which vrouter will be created.
+    :param vrouter_name: The name of the vrouter.
     :param vnet_name: The name of the vnet for vrouter creation.
-    :return: String describing if vrouter got created or if it already exists.
+    :return: String describing if vrouter already exists.
     """
-    global CHANGED_FLAG
-    vrouter_name = switch + '-vrouter'
-    cli = pn_cli(module)
-    cli += ' switch ' + switch
-    clicopy = cli
+    if reconciler.want('vrouter', switch, [('name', vrouter_name),
+                                           ('vnet', vnet_name)],
+                       message=' %s: Created vrouter with name %s \n' % (
+                           switch, vrouter_name)):
+        return ''
+    return ' %s: Vrouter with name %s already exists \n' % (switch,
+                                                            vrouter_name)
 
-    # Check if vrouter already exists.
-    cli += ' vrouter-show format name no-show-headers '
-    existing_vrouter_names = run_cli(module, cli).split()
 
-    # If vrouter doesn't exists then create it.
-    if vrouter_name not in existing_vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-create name %s vnet %s ' % (vrouter_name, vnet_name)
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        return ' %s: Created vrouter with name %s \n' % (switch, vrouter_name)
-    else:
-        return ' %s: Vrouter with name %s already exists \n' % (switch,
-                                                                vrouter_name)
+def add_bfd_config(module, reconciler, switch, vrouter_name, ip, interface):
+    """
+    Method to declare the BFD config of a vrouter interface added by the
+    plan. Its nic is looked up once the interface got added.
+    :param module: The Ansible module to fetch input parameters.
+    :param reconciler: The Reconciler of the fabric.
+    :param switch: Name of the switch hosting the vrouter.
+    :param vrouter_name: Name of the vrouter.
+    :param ip: IP address of the interface.
+    :param interface: The planned Operation adding the interface.
+    """
+    nic = Lookup('vrouter-interface-show', 'nic',
+                 'vrouter-name %s ip %s' % (vrouter_name, ip))
+    reconciler.want('vrouter-interface-config', switch, [
+        ('vrouter-name', vrouter_name), ('nic', nic),
+        ('bfd-min-rx', module.params['pn_bfd_min_rx']),
+        ('bfd-multiplier', module.params['pn_bfd_multiplier'])
+    ], message=' %s: Added BFD config to %s \n' % (switch, vrouter_name),
+        after=[interface])
 
 
-def create_interface(module, switch, ip, port):
+def create_interface(module, reconciler, switch, vrouter_name, ip, port):
     """
-    Method to create vrouter interface and assign IP to it.
+    Method to declare a vrouter interface with its IP.
     :param module: The Ansible module to fetch input parameters.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: The switch name on which vrouter will be created.
+    :param vrouter_name: The name of the vrouter of the switch.
     :param ip: IP address to be assigned to vrouter interfaces.
     :param port: l3-port for the interface.
-    :return: The output string informing details of vrouter created and
-    interface added or if vrouter already exists.
+    :return: String describing if the interface already exists.
     """
-    output = ''
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-show location %s format name no-show-headers ' % switch
-    vrouter_name = run_cli(module, cli).split()[0]
-
-    cli = clicopy
-    cli += ' vrouter-interface-show l3-port %s ip %s ' % (port, ip)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
-
-    if vrouter_name not in existing_vrouter:
-        # Add vrouter interface.
-        cli = clicopy
-        cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
-        cli += ' ip ' + ip
-        cli += ' l3-port ' + port
-        run_cli(module, cli)
-        output += ' %s: Added vrouter interface with ip %s on %s \n' % (
-            switch, ip, vrouter_name
-        )
-
-        # Add BFD config to vrouter interface.
+    interface = reconciler.want('vrouter-interface', switch, [
+        ('vrouter-name', vrouter_name), ('ip', ip), ('l3-port', port)
+    ], message=' %s: Added vrouter interface with ip %s on %s \n' % (
+        switch, ip, vrouter_name))
+    if interface:
         if module.params['pn_bfd']:
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name ' + vrouter_name
-            cli += ' l3-port %s format nic no-show-headers ' % port
-            nic = run_cli(module, cli).split()[1]
-
-            cli = clicopy
-            cli += ' vrouter-interface-config-add '
-            cli += ' vrouter-name %s nic %s ' % (vrouter_name, nic)
-            cli += ' bfd-min-rx ' + module.params['pn_bfd_min_rx']
-            cli += ' bfd-multiplier ' + module.params['pn_bfd_multiplier']
-            run_cli(module, cli)
-            output += ' %s: Added BFD config to %s \n' % (switch, vrouter_name)
-
-        CHANGED_FLAG.append(True)
-    else:
-        output += ' %s: Vrouter interface %s already exists on %s \n' % (
-            switch, ip, vrouter_name
-        )
-
-    return output
+            add_bfd_config(module, reconciler, switch, vrouter_name, ip,
+                           interface)
+        return ''
+    return ' %s: Vrouter interface %s already exists on %s \n' % (
+        switch, ip, vrouter_name
+    )
 
 
 def modify_auto_trunk_setting(module, switch, flag):
@@ -413,91 +345,69 @@ def modify_auto_trunk_setting(module, switch, flag):
         return run_cli(module, cli)
 
 
-def delete_trunk(module, switch, switch_port, peer_switch):
+def delete_trunk(reconciler, trunks, switch, switch_port):
     """
-    Method to delete a conflicting trunk on a switch.
-    :param module: The Ansible module to fetch input parameters.
+    Method to declare the removal of a trunk conflicting with an l3-port.
+    :param reconciler: The Reconciler of the fabric.
+    :param trunks: Dictionary mapping (switch, port) to the trunk of the port.
     :param switch: Name of the local switch.
     :param switch_port: The l3-port which is part of conflicting trunk for l3.
-    :param peer_switch: Name of the peer switch.
-    :return: String describing if trunk got deleted or not.
     """
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s port-show port %s hostname %s ' % (switch, switch_port,
-                                                          peer_switch)
-    cli += ' format trunk no-show-headers '
-    trunk = run_cli(module, cli).split()
-    trunk = list(set(trunk))
-    if 'Success' not in trunk and len(trunk) > 0:
-        cli = clicopy
-        cli += ' switch %s trunk-delete name %s ' % (switch, trunk[0])
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: Deleted %s trunk successfully \n' % (switch, trunk[0])
+    trunk = trunks.get((switch, switch_port))
+    if trunk:
+        reconciler.absent('trunk', switch, [('name', trunk)],
+                          message=' %s: Deleted %s trunk successfully \n' % (
+                              switch, trunk))
 
 
-def assign_loopback_ip(module, loopback_address):
+def assign_loopback_ip(module, snapshot, reconciler, vrouters,
+                       loopback_address):
     """
-    Method to add loopback interface to vrouters.
+    Method to declare the loopback interfaces of the vrouters.
     :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
+    :param vrouters: Dictionary mapping switch names to their vrouter.
     :param loopback_address: The loopback ip to be assigned.
-    :return: String describing if loopback ips got assigned or not.
+    :return: String describing if loopback ips already exist.
     """
-    global CHANGED_FLAG
     output = ''
-    address = loopback_address.split('.')
-    static_part = str(address[0]) + '.' + str(address[1]) + '.'
-    static_part += str(address[2]) + '.'
-
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
+    locations = dict((vrouter, switch) for switch, vrouter in vrouters.items())
+    vrouter_names = sorted(set(snapshot.vrouter_names()) | set(locations))
 
     if len(vrouter_names) > 0:
-        vrouter_count = 1
+        # Vrouters keep the loopback they have, the others take the lowest
+        # free ips by name, independently of the order they got created in.
+        plan = loopback_plan(module, vrouter_names, snapshot.loopbacks,
+                             loopback_address)
+
         for vrouter in vrouter_names:
-            if vrouter_count <= 255:
-                ip = static_part + str(vrouter_count)
-                cli = clicopy
-                cli += ' vrouter-show name ' + vrouter
-                cli += ' format location no-show-headers '
-                switch = run_cli(module, cli).split()[0]
-                cli = clicopy
-                cli += ' vrouter-loopback-interface-show ip ' + ip
-                cli += ' format switch no-show-headers '
-                existing_vrouter = run_cli(module, cli).split()
-
-                if vrouter not in existing_vrouter:
-                    cli = clicopy
-                    cli += ' vrouter-loopback-interface-add vrouter-name '
-                    cli += vrouter
-                    cli += ' ip ' + ip
-                    run_cli(module, cli)
-                    output += ' %s: Added loopback ip %s to %s \n' % (
-                        switch, ip, vrouter
-                    )
-                    CHANGED_FLAG.append(True)
-                else:
-                    output += ' %s: Loopback ip %s for %s already exists \n' % (
-                        switch, ip, vrouter
-                    )
-
-                vrouter_count += 1
-            else:
+            switch = locations.get(vrouter) or snapshot.location(vrouter)
+            ip = plan.ips.get(vrouter)
+            if ip is None:
                 output += ' Not enough loopback ips available for vrouters \n'
+            elif not reconciler.want(
+                    'vrouter-loopback-interface', switch,
+                    [('vrouter-name', vrouter), ('ip', ip)],
+                    message=' %s: Added loopback ip %s to %s \n' % (
+                        switch, ip, vrouter)):
+                output += ' %s: Loopback ip %s for %s already exists \n' % (
+                    switch, ip, vrouter
+                )
     else:
         output += ' No vrouters exists to assign loopback ips \n'
 
     return output
 
 
-def auto_configure_link_ips(module):
+def plan_link_ips(module, snapshot):
     """
-    Method to auto configure link IPs for layer3 fabric.
+    Method to plan the link IPs for layer3 fabric. The vrouters, link
+    interfaces and loopbacks are declared against one snapshot of the
+    fabric, and only the missing ones get planned.
     :param module: The Ansible module to fetch input parameters.
-    :return: String describing output of configuration.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :return: Tuple of (string describing what is configured already, plan).
     """
     spine_list = module.params['pn_spine_list']
     leaf_list = module.params['pn_leaf_list']
@@ -505,74 +415,87 @@ def auto_configure_link_ips(module):
     supernet = module.params['pn_supernet']
     output = ''
 
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' fabric-node-show format name no-show-headers '
-    switch_names = run_cli(module, cli).split()
-    switch_names = list(set(switch_names))
-
-    # Disable auto trunk on all switches.
-    for switch in switch_names:
-        modify_auto_trunk_setting(module, switch, 'disable')
+    reconciler = Reconciler(snapshot)
+    switch_names = sorted(snapshot.nodes)
 
-    # Get the list of available link ips to assign.
-    available_ips = calculate_link_ip_addresses(module.params['pn_net_address'],
-                                                module.params['pn_cidr'],
-                                                supernet)
+    # Plan the link subnets to assign.
+    links = link_allocator(module, module.params['pn_net_address'],
+                           module.params['pn_cidr'], supernet)
 
     # Get the fabric name and create vnet name required for vrouter creation.
-    cli = clicopy
-    cli += ' fabric-node-show format fab-name no-show-headers '
-    fabric_name = list(set(run_cli(module, cli).split()))[0]
+    fabric_name = snapshot.rows['fabric-node-show'][0].fab_name
     vnet_name = str(fabric_name) + '-global'
 
-    # Create vrouter on all switches.
+    # Every switch keeps the vrouter it has, if any.
+    vrouters = dict((switch, snapshot.vrouter(switch) or switch + '-vrouter')
+                    for switch in switch_names)
     for switch in switch_names:
-        output += create_vrouter(module, switch, vnet_name)
+        output += create_vrouter(reconciler, switch, vrouters[switch],
+                                 vnet_name)
 
+    # Hand out the link ips in spine/leaf/port order so every link keeps its
+    # ips across runs.
+    leaf_links = snapshot.topology().spine_leaf_links(spine_list, leaf_list)
+    interfaces = dict((switch, []) for switch in spine_list + leaf_list)
     for spine in spine_list:
         for leaf in leaf_list:
-            cli = clicopy
-            cli += ' switch %s port-show hostname %s ' % (leaf, spine)
-            cli += ' format port no-show-headers '
-            leaf_port = run_cli(module, cli).split()
-
-            if 'Success' in leaf_port:
-                continue
-
-            while len(leaf_port) > 0:
-                lport = leaf_port[0]
-                ip = available_ips[0]
-                delete_trunk(module, leaf, lport, spine)
-                output += create_interface(module, leaf, ip, lport)
-
-                leaf_port.remove(lport)
-                available_ips.remove(ip)
-                ip = available_ips[0]
-
-                cli = clicopy
-                cli += ' switch %s port-show port %s ' % (leaf, lport)
-                cli += ' format rport no-show-headers '
-                rport = run_cli(module, cli)
-
-                delete_trunk(module, spine, rport, leaf)
-                output += create_interface(module, spine, ip, rport)
-                available_ips.remove(ip)
-
-                ip_count = 0
-                diff = 32 - int(supernet)
-                count = (1 << diff) - 4
-                while ip_count < count:
-                    available_ips.pop(0)
-                    ip_count += 1
+            for lport, rport in leaf_links[leaf][spine]:
+                leaf_ip, spine_ip = allocate_link(module, links)
+                interfaces[leaf].append((lport, leaf_ip))
+                interfaces[spine].append((rport, spine_ip))
+
+    trunks = dict(((row.switch, row.port), row.trunk)
+                  for row in snapshot.rows['port-show'] if row.trunk)
+    for switch in spine_list + leaf_list:
+        for port, ip in interfaces[switch]:
+            delete_trunk(reconciler, trunks, switch, port)
+            output += create_interface(module, reconciler, switch,
+                                       vrouters[switch], ip, port)
 
     if fabric_loopback:
         # Assign loopback ip to vrouters.
-        output += assign_loopback_ip(module, module.params['pn_loopback_ip'])
+        output += assign_loopback_ip(module, snapshot, reconciler, vrouters,
+                                     module.params['pn_loopback_ip'])
 
-    for switch in switch_names:
-        # Enable auto trunk.
-        modify_auto_trunk_setting(module, switch, 'enable')
+    return output, reconciler.plan()
+
+
+def auto_configure_link_ips(module):
+    """
+    Method to auto configure link IPs for layer3 fabric, as planned now or
+    by an earlier check mode run.
+    :param module: The Ansible module to fetch input parameters.
+    :return: String describing output of configuration.
+    """
+    global CHANGED_FLAG
+    output = ''
+    cli = pn_cli(module)
+    saved = saved_plans(module, cli, SNAPSHOT_TABLES)
+    if saved is None:
+        snapshot = FabricSnapshot(module, cli, SNAPSHOT_TABLES)
+        output, plan = plan_link_ips(module, snapshot)
+        plans = [plan]
+    else:
+        snapshot, plans = saved
+
+    switch_names = sorted(snapshot.nodes)
+    for plan in plans:
+        if not plan:
+            continue
+        if module.check_mode:
+            output += apply_plan(module, cli, snapshot, plan)
+        else:
+            # Auto trunk stays disabled while the l3-ports get configured.
+            fan_out(module, lambda switch: modify_auto_trunk_setting(
+                module, switch, 'disable'), switch_names)
+            output += apply_plan(module, cli, snapshot, plan)
+            fan_out(module, lambda switch: modify_auto_trunk_setting(
+                module, switch, 'enable'), switch_names)
+        CHANGED_FLAG.append(True)
+
+    if module.check_mode:
+        # Check mode stops at the plan, saved for a later run to apply.
+        save_plans(module, snapshot)
 
     return output
 
@@ -597,7 +520,9 @@ def main():
             pn_bfd_min_rx=dict(required=False, type='str'),
             pn_bfd_multiplier=dict(required=False, type='str'),
             pn_stp=dict(required=False, type='bool', default=False),
-        )
+            pn_plan_file=dict(required=False, type='str'),
+        ),
+        supports_check_mode=True
     )
 
     global CHANGED_FLAG
@@ -605,13 +530,15 @@ def main():
     # L3 setup (link ips)
     message = auto_configure_link_ips(module)
 
-    # Update fabric network to in-band if flag is True
-    if module.params['pn_update_fabric_to_inband']:
-        message += update_fabric_network_to_inband(module)
+    # Only the link ips are planned, check mode stops there.
+    if not module.check_mode:
+        # Update fabric network to in-band if flag is True
+        if module.params['pn_update_fabric_to_inband']:
+            message += update_fabric_network_to_inband(module)
 
-    # Enable STP if flag is True
-    if module.params['pn_stp']:
-        message += modify_stp(module, 'enable')
+        # Enable STP if flag is True
+        if module.params['pn_stp']:
+            message += modify_stp(module, 'enable')
 
     # Exit the module and return the required JSON
     module.exit_json(
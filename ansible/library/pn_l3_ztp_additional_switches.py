@@ -19,6 +19,12 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_addressing import allocate_link, link_allocator
+from ansible.module_utils.pn_addressing import loopback_plan
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot
+from ansible.module_utils.pn_fanout import fan_out
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_parsable import show
 import shlex
 
 DOCUMENTATION = """
@@ -43,6 +49,7 @@ options:
     pn_net_address:
       description:
         - Specify network address to be used in configuring link IPs for layer3.
+        - IPv4 or IPv6.
       required: False
       type: str
     pn_cidr:
@@ -53,6 +60,8 @@ options:
     pn_supernet:
       description:
         - Specify supernet value to be used in configuring link IPs for layer3.
+        - Prefix length of every link, e.g. 30, or 31 (127 for IPv6) to use
+          both addresses of the link.
       required: False
       type: str
     pn_spine_list:
@@ -166,7 +175,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -239,75 +248,6 @@ def update_fabric_network_to_inband(module):
     return output
 
 
-def calculate_link_ip_addresses(address_str, cidr_str, supernet_str):
-    """
-    Method to calculate link IPs for layer 3 fabric.
-    :param address_str: Host/network address.
-    :param cidr_str: Subnet mask.
-    :param supernet_str: Supernet mask.
-    :return: List of available IP addresses that can be assigned to vrouter
-    interfaces for layer 3 fabric.
-    """
-    # Split address into octets and turn CIDR, supernet mask into int
-    address = address_str.split('.')
-    cidr = int(cidr_str)
-    supernet = int(supernet_str)
-    supernet_mapping = {
-        30: 2,
-        29: 6,
-        28: 14,
-        27: 30
-    }
-    supernet_range = supernet_mapping[supernet]
-    base_addr = int(address[3])
-    # Initialize the netmask and calculate based on CIDR mask
-    mask = [0, 0, 0, 0]
-    for i in range(cidr):
-        mask[i / 8] += (1 << (7 - i % 8))
-
-    # Initialize net and binary and netmask with addr to get network
-    network = []
-    for i in range(4):
-        network.append(int(address[i]) & mask[i])
-
-    # Duplicate net into broad array, gather host bits, and generate broadcast
-    broadcast = list(network)
-    broadcast_range = 32 - cidr
-    for i in range(broadcast_range):
-        broadcast[3 - i / 8] += (1 << (i % 8))
-
-    last_ip = list(broadcast)
-    diff = base_addr % (supernet_range + 2)
-    host = base_addr - diff
-    count, hostmin, hostmax = 0, 0, 0
-    third_octet = network[2]
-    available_ips = []
-    while third_octet <= last_ip[2]:
-        ips_list = []
-        while count < last_ip[3]:
-            hostmin = host + 1
-            hostmax = hostmin + supernet_range - 1
-            while hostmin <= hostmax:
-                ips_list.append(hostmin)
-                hostmin += 1
-            host = hostmax + 2
-            count = host
-
-        list_index = 0
-        ip_address = str(last_ip[0]) + '.' + str(last_ip[1]) + '.'
-        ip_address += str(third_octet)
-        while list_index < len(ips_list):
-            ip = ip_address + '.' + str(ips_list[list_index]) + "/"
-            ip += supernet_str
-            available_ips.append(ip)
-            list_index += 1
-
-        host, count, hostmax, hostmin = 0, 0, 0, 0
-        third_octet += 1
-
-    return available_ips
-
-
 def create_vrouter(module, switch, vnet_name):
     """
     Method to create vrouter on a switch.
@@ -338,10 +278,11 @@ def create_vrouter(module, switch, vnet_name):
                                                                 vrouter_name)
 
 
-def create_interface(module, switch, ip, port):
+def create_interface(module, vrouters, switch, ip, port):
     """
     Method to create vrouter interface and assign IP to it.
     :param module: The Ansible module to fetch input parameters.
+    :param vrouters: Dictionary mapping switch names to their vrouter.
     :param switch: The switch name on which vrouter will be created.
     :param ip: IP address to be assigned to vrouter interfaces.
     :param port: l3-port for the interface.
@@ -352,16 +293,12 @@ def create_interface(module, switch, ip, port):
     global CHANGED_FLAG
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' vrouter-show location %s format name no-show-headers ' % switch
-    vrouter_name = run_cli(module, cli).split()[0]
+    vrouter_name = vrouters[switch]
 
-    cli = clicopy
-    cli += ' vrouter-interface-show l3-port %s ip %s ' % (port, ip)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
+    interfaces = show(module, clicopy, 'vrouter-interface-show', ('ip', 'nic'),
+                      'vrouter-name %s l3-port %s' % (vrouter_name, port))
 
-    if vrouter_name not in existing_vrouter:
+    if ip not in [interface.ip for interface in interfaces]:
         # Add vrouter interface.
         cli = clicopy
         cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
@@ -374,10 +311,8 @@ def create_interface(module, switch, ip, port):
 
         # Add BFD config to vrouter interface.
         if module.params['pn_bfd']:
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name ' + vrouter_name
-            cli += ' l3-port %s format nic no-show-headers ' % port
-            nic = run_cli(module, cli).split()[1]
+            nic = show(module, clicopy, 'vrouter-interface-show', ('nic',),
+                       'vrouter-name %s ip %s' % (vrouter_name, ip))[0].nic
 
             cli = clicopy
             cli += ' vrouter-interface-config-add '
@@ -437,47 +372,103 @@ def delete_trunk(module, switch, switch_port, peer_switch):
             return ' %s: Deleted %s trunk successfully \n' % (switch, trunk[0])
 
 
-def assign_loopback_ip(module, loopback_address, old_switches_count, switch_list):
+def add_loopback_ip(module, switch, vrouter, ip, missing):
     """
-    Method to add loopback interface to vrouters.
+    Method to add the loopback interface of one vrouter.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch: Name of the switch of the vrouter.
+    :param vrouter: Name of the vrouter.
+    :param ip: The loopback ip of the vrouter, None if none is left.
+    :param missing: True if the vrouter does not have the loopback yet.
+    :return: String describing if the loopback ip got assigned or not.
+    """
+    global CHANGED_FLAG
+    if ip is None:
+        return ' Not enough loopback ips available for vrouters \n'
+    if not missing:
+        return ' %s: Loopback ip %s for %s already exists \n' % (
+            switch, ip, vrouter
+        )
+
+    cli = pn_cli(module)
+    cli += ' vrouter-loopback-interface-add vrouter-name '
+    cli += vrouter
+    cli += ' ip ' + ip
+    run_cli(module, cli)
+    CHANGED_FLAG.append(True)
+    return ' %s: Added loopback ip %s to %s \n' % (switch, ip, vrouter)
+
+
+def assign_loopback_ip(module, loopback_address, switch_list):
+    """
+    Method to add loopback interface to the vrouters of new switches.
     :param module: The Ansible module to fetch input parameters.
     :param loopback_address: The loopback ip to be assigned.
+    :param switch_list: Names of the new switches.
     :return: String describing if loopback ips got assigned or not.
     """
-    global CHANGED_FLAG
-    output = ''
     cli = pn_cli(module)
-    clicopy = cli
-    address = loopback_address.split('.')
-    static_part = str(address[0]) + '.' + str(address[1]) + '.'
-    static_part += str(address[2]) + '.'
-
-    vrouter_count = int(old_switches_count) + 1
-    for switch in switch_list:
-        vrouter = switch + '-vrouter' 
-        ip = static_part + str(vrouter_count)
-        
+    snapshot = FabricSnapshot(module, cli, ('vrouter-show',
+                                            'vrouter-loopback-interface-show'))
+
+    # The vrouters of the existing switches keep their loopbacks, the new
+    # ones take the lowest free ips.
+    new_vrouters = [switch + '-vrouter' for switch in switch_list]
+    vrouter_names = [vrouter for vrouter in snapshot.vrouter_names()
+                     if vrouter not in new_vrouters] + new_vrouters
+    plan = loopback_plan(module, vrouter_names, snapshot.loopbacks,
+                         loopback_address)
+    missing = set(plan.missing)
+
+    vrouters = dict(zip(new_vrouters, switch_list))
+    return ''.join(fan_out(module, lambda vrouter: add_loopback_ip(
+        module, vrouters[vrouter], vrouter, plan.ips.get(vrouter),
+        vrouter in missing), new_vrouters))
+
+
+def find_leaf_links(module, clicopy, leaf, spine_list):
+    """
+    Method to find the links of a leaf to spines.
+    :param module: The Ansible module to fetch input parameters.
+    :param clicopy: The cli prefix returned by pn_cli().
+    :param leaf: Name of the leaf switch.
+    :param spine_list: Names of the spine switches.
+    :return: Dict mapping spine name to the list of (leaf port, spine port).
+    """
+    links = {}
+    for spine in spine_list:
         cli = clicopy
-        cli += ' vrouter-loopback-interface-show ip ' + ip
-        cli += ' format switch no-show-headers '
-        existing_vrouter = run_cli(module, cli).split()
+        cli += ' switch %s port-show hostname %s ' % (leaf, spine)
+        cli += ' format port no-show-headers '
+        leaf_port = run_cli(module, cli).split()
+
+        links[spine] = []
+        if 'Success' in leaf_port:
+            continue
 
-        if vrouter not in existing_vrouter:
+        for lport in leaf_port:
             cli = clicopy
-            cli += ' vrouter-loopback-interface-add vrouter-name '
-            cli += vrouter
-            cli += ' ip ' + ip
-            run_cli(module, cli)
-            output += ' %s: Added loopback ip %s to %s \n' % (
-                switch, ip, vrouter
-            )
-            CHANGED_FLAG.append(True)
-        else:
-            output += ' %s: Loopback ip %s for %s already exists \n' % (
-                switch, ip, vrouter
-            )
+            cli += ' switch %s port-show port %s ' % (leaf, lport)
+            cli += ' format rport no-show-headers '
+            rport = run_cli(module, cli)
+            links[spine].append((lport, rport))
+
+    return links
+
 
-        vrouter_count += 1
+def configure_switch_link_ips(module, vrouters, switch, interfaces):
+    """
+    Method to configure the link ips of one switch.
+    :param module: The Ansible module to fetch input parameters.
+    :param vrouters: Dictionary mapping switch names to their vrouter.
+    :param switch: Name of the switch.
+    :param interfaces: List of (port, ip, peer switch) to configure.
+    :return: String describing output of configuration.
+    """
+    output = ''
+    for port, ip, peer in interfaces:
+        delete_trunk(module, switch, port, peer)
+        output += create_interface(module, vrouters, switch, ip, port)
 
     return output
 
@@ -495,31 +486,21 @@ def auto_configure_link_ips(module):
     fabric_loopback = module.params['pn_assign_loopback']
     supernet = module.params['pn_supernet']
     output = ''
-
-    cli = pn_cli(module)
-    clicopy = cli
-
-
-    ####This is the change
-    switch_list = []
-    switch_list += new_spine_list
-    switch_list += new_leaf_list
-    ####Ends here
+    switch_list = new_spine_list + new_leaf_list
 
     cli = pn_cli(module)
     clicopy = cli
     cli += ' fabric-node-show format name no-show-headers '
     switch_names = run_cli(module, cli).split()
-    switch_names = list(set(switch_names))
+    switch_names = sorted(set(switch_names))
 
     # Disable auto trunk on all switches.
-    for switch in switch_names:
-        modify_auto_trunk_setting(module, switch, 'disable')
+    fan_out(module, lambda switch: modify_auto_trunk_setting(
+        module, switch, 'disable'), switch_names)
 
-    # Get the list of available link ips to assign.
-    available_ips = calculate_link_ip_addresses(module.params['pn_net_address'],
-                                                module.params['pn_cidr'],
-                                                supernet)
+    # Plan the link subnets to assign.
+    links = link_allocator(module, module.params['pn_net_address'],
+                           module.params['pn_cidr'], supernet)
 
     # Get the fabric name and create vnet name required for vrouter creation.
     cli = clicopy
@@ -528,91 +509,51 @@ def auto_configure_link_ips(module):
     vnet_name = str(fabric_name) + '-global'
 
     # Create vrouter on all switches.
-    for switch in switch_list:
-        output += create_vrouter(module, switch, vnet_name)
-
-    if len(new_leaf_list) > 0:
-        for spine in spine_list:
-            for leaf in new_leaf_list:
-                cli = clicopy
-                cli += ' switch %s port-show hostname %s ' % (leaf, spine)
-                cli += ' format port no-show-headers '
-                leaf_port = run_cli(module, cli).split()
-    
-                if 'Success' in leaf_port:
-                    continue
-    
-                while len(leaf_port) > 0:
-                    lport = leaf_port[0]
-                    ip = available_ips[0]
-                    delete_trunk(module, leaf, lport, spine)
-                    output += create_interface(module, leaf, ip, lport)
-    
-                    leaf_port.remove(lport)
-                    available_ips.remove(ip)
-                    ip = available_ips[0]
-    
-                    cli = clicopy
-                    cli += ' switch %s port-show port %s ' % (leaf, lport)
-                    cli += ' format rport no-show-headers '
-                    rport = run_cli(module, cli)
-    
-                    delete_trunk(module, spine, rport, leaf)
-                    output += create_interface(module, spine, ip, rport)
-                    available_ips.remove(ip)
-    
-                    ip_count = 0
-                    diff = 32 - int(supernet)
-                    count = (1 << diff) - 4
-                    while ip_count < count:
-                        available_ips.pop(0)
-                        ip_count += 1
-
-    if len(new_spine_list) > 0:
-        for spine in new_spine_list:
-            for leaf in leaf_list:
-                cli = clicopy
-                cli += ' switch %s port-show hostname %s ' % (leaf, spine)
-                cli += ' format port no-show-headers '
-                leaf_port = run_cli(module, cli).split()
-
-                if 'Success' in leaf_port:
-                    continue
-
-                while len(leaf_port) > 0:
-                    lport = leaf_port[0]
-                    ip = available_ips[0]
-                    delete_trunk(module, leaf, lport, spine)
-                    output += create_interface(module, leaf, ip, lport)
-
-                    leaf_port.remove(lport)
-                    available_ips.remove(ip)
-                    ip = available_ips[0]
-
-                    cli = clicopy
-                    cli += ' switch %s port-show port %s ' % (leaf, lport)
-                    cli += ' format rport no-show-headers '
-                    rport = run_cli(module, cli)
-
-                    delete_trunk(module, spine, rport, leaf)
-                    output += create_interface(module, spine, ip, rport)
-                    available_ips.remove(ip)
-
-                    ip_count = 0
-                    diff = 32 - int(supernet)
-                    count = (1 << diff) - 4
-                    while ip_count < count:
-                        available_ips.pop(0)
-                        ip_count += 1
+    output += ''.join(fan_out(module, lambda switch: create_vrouter(
+        module, switch, vnet_name), switch_list))
+
+    # Map every switch to its vrouter with one multi-column show.
+    vrouters = dict((row.location, row.name) for row in show(
+        module, clicopy, 'vrouter-show', ('name', 'location')))
+
+    # Skip the link subnets already assigned to the existing switches.
+    for row in show(module, clicopy, 'vrouter-interface-show', ('ip',)):
+        if row.ip:
+            links.reserve(row.ip)
+
+    # The links of the new leafs to the spines and of the leafs to the new
+    # spines. Every leaf is probed once, then the link subnets are handed
+    # out in that order so every link keeps its ips across runs.
+    pairs = [(spine, leaf) for spine in spine_list for leaf in new_leaf_list]
+    pairs += [(spine, leaf) for spine in new_spine_list for leaf in leaf_list]
+    spines = {}
+    for spine, leaf in pairs:
+        if spine not in spines.setdefault(leaf, []):
+            spines[leaf].append(spine)
+    leafs = list(spines)
+    leaf_links = dict(zip(leafs, fan_out(module, lambda leaf: (
+        find_leaf_links(module, clicopy, leaf, spines[leaf])), leafs)))
+
+    interfaces = {}
+    for spine, leaf in pairs:
+        for lport, rport in leaf_links[leaf][spine]:
+            leaf_ip, spine_ip = allocate_link(module, links)
+            interfaces.setdefault(leaf, []).append((lport, leaf_ip, spine))
+            interfaces.setdefault(spine, []).append((rport, spine_ip, leaf))
+
+    # The interfaces of every switch are independent of the other switches.
+    switches = sorted(interfaces)
+    output += ''.join(fan_out(module, lambda switch: configure_switch_link_ips(
+        module, vrouters, switch, interfaces[switch]), switches))
 
     if fabric_loopback:
         # Assign loopback ip to vrouters.
-        old_switches_count = str(int(len(leaf_list)) + int(len(spine_list)))
-        output += assign_loopback_ip(module, module.params['pn_loopback_ip'], old_switches_count, switch_list)
+        output += assign_loopback_ip(module, module.params['pn_loopback_ip'],
+                                     switch_list)
 
-    for switch in switch_names:
-        # Enable auto trunk.
-        modify_auto_trunk_setting(module, switch, 'enable')
+    # Enable auto trunk.
+    fan_out(module, lambda switch: modify_auto_trunk_setting(
+        module, switch, 'enable'), switch_names)
 
     return output
 
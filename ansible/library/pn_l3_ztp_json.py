@@ -19,6 +19,13 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_addressing import allocate_link, link_allocator
+from ansible.module_utils.pn_addressing import loopback_plan
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot
+from ansible.module_utils.pn_fanout import fan_out
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_parsable import show
+from ansible.module_utils.pn_results import message_summary
 import shlex
 
 DOCUMENTATION = """
@@ -43,6 +50,7 @@ options:
     pn_net_address:
       description:
         - Specify network address to be used in configuring link IPs for layer3.
+        - IPv4 or IPv6.
       required: False
       type: str
     pn_cidr:
@@ -53,6 +61,8 @@ options:
     pn_supernet:
       description:
         - Specify supernet value to be used in configuring link IPs for layer3.
+        - Prefix length of every link, e.g. 30, or 31 (127 for IPv6) to use
+          both addresses of the link.
       required: False
       type: str
     pn_spine_list:
@@ -166,7 +176,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     results = []
     if out:
         return out
@@ -245,75 +255,6 @@ def update_fabric_network_to_inband(module):
     return output
 
 
-def calculate_link_ip_addresses(address_str, cidr_str, supernet_str):
-    """
-    Method to calculate link IPs for layer 3 fabric.
-    :param address_str: Host/network address.
-    :param cidr_str: Subnet mask.
-    :param supernet_str: Supernet mask.
-    :return: List of available IP addresses that can be assigned to vrouter
-    interfaces for layer 3 fabric.
-    """
-    # Split address into octets and turn CIDR, supernet mask into int
-    address = address_str.split('.')
-    cidr = int(cidr_str)
-    supernet = int(supernet_str)
-    supernet_mapping = {
-        30: 2,
-        29: 6,
-        28: 14,
-        27: 30
-    }
-    supernet_range = supernet_mapping[supernet]
-    base_addr = int(address[3])
-    # Initialize the netmask and calculate based on CIDR mask
-    mask = [0, 0, 0, 0]
-    for i in range(cidr):
-        mask[i / 8] += (1 << (7 - i % 8))
-
-    # Initialize net and binary and netmask with addr to get network
-    network = []
-    for i in range(4):
-        network.append(int(address[i]) & mask[i])
-
-    # Duplicate net into broad array, gather host bits, and generate broadcast
-    broadcast = list(network)
-    broadcast_range = 32 - cidr
-    for i in range(broadcast_range):
-        broadcast[3 - i / 8] += (1 << (i % 8))
-
-    last_ip = list(broadcast)
-    diff = base_addr % (supernet_range + 2)
-    host = base_addr - diff
-    count, hostmin, hostmax = 0, 0, 0
-    third_octet = network[2]
-    available_ips = []
-    while third_octet <= last_ip[2]:
-        ips_list = []
-        while count < last_ip[3]:
-            hostmin = host + 1
-            hostmax = hostmin + supernet_range - 1
-            while hostmin <= hostmax:
-                ips_list.append(hostmin)
-                hostmin += 1
-            host = hostmax + 2
-            count = host
-
-        list_index = 0
-        ip_address = str(last_ip[0]) + '.' + str(last_ip[1]) + '.'
-        ip_address += str(third_octet)
-        while list_index < len(ips_list):
-            ip = ip_address + '.' + str(ips_list[list_index]) + "/"
-            ip += supernet_str
-            available_ips.append(ip)
-            list_index += 1
-
-        host, count, hostmax, hostmin = 0, 0, 0, 0
-        third_octet += 1
-
-    return available_ips
-
-
 def create_vrouter(module, switch, vnet_name):
     """
     Method to create vrouter on a switch.
@@ -344,10 +285,11 @@ def create_vrouter(module, switch, vnet_name):
                                                                 vrouter_name)
 
 
-def create_interface(module, switch, ip, port):
+def create_interface(module, vrouters, switch, ip, port):
     """
     Method to create vrouter interface and assign IP to it.
     :param module: The Ansible module to fetch input parameters.
+    :param vrouters: Dictionary mapping switch names to their vrouter.
     :param switch: The switch name on which vrouter will be created.
     :param ip: IP address to be assigned to vrouter interfaces.
     :param port: l3-port for the interface.
@@ -358,16 +300,12 @@ def create_interface(module, switch, ip, port):
     global CHANGED_FLAG
     cli = pn_cli(module)
     clicopy = cli
-    cli += ' vrouter-show location %s format name no-show-headers ' % switch
-    vrouter_name = run_cli(module, cli).split()[0]
+    vrouter_name = vrouters[switch]
 
-    cli = clicopy
-    cli += ' vrouter-interface-show l3-port %s ip %s ' % (port, ip)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
+    interfaces = show(module, clicopy, 'vrouter-interface-show', ('ip', 'nic'),
+                      'vrouter-name %s l3-port %s' % (vrouter_name, port))
 
-    if vrouter_name not in existing_vrouter:
+    if ip not in [interface.ip for interface in interfaces]:
         # Add vrouter interface.
         cli = clicopy
         cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
@@ -380,10 +318,8 @@ def create_interface(module, switch, ip, port):
 
         # Add BFD config to vrouter interface.
         if module.params['pn_bfd']:
-            cli = clicopy
-            cli += ' vrouter-interface-show vrouter-name ' + vrouter_name
-            cli += ' l3-port %s format nic no-show-headers ' % port
-            nic = run_cli(module, cli).split()[1]
+            nic = show(module, clicopy, 'vrouter-interface-show', ('nic',),
+                       'vrouter-name %s ip %s' % (vrouter_name, ip))[0].nic
 
             cli = clicopy
             cli += ' vrouter-interface-config-add '
@@ -443,6 +379,33 @@ def delete_trunk(module, switch, switch_port, peer_switch):
             return ' %s: Deleted %s trunk successfully \n' % (switch, trunk[0])
 
 
+def add_loopback_ip(module, switch, vrouter, ip, missing):
+    """
+    Method to add the loopback interface of one vrouter.
+    :param module: The Ansible module to fetch input parameters.
+    :param switch: Name of the switch of the vrouter.
+    :param vrouter: Name of the vrouter.
+    :param ip: The loopback ip of the vrouter, None if none is left.
+    :param missing: True if the vrouter does not have the loopback yet.
+    :return: String describing if the loopback ip got assigned or not.
+    """
+    global CHANGED_FLAG
+    if ip is None:
+        return ' Not enough loopback ips available for vrouters \n'
+    if not missing:
+        return ' %s: Loopback ip %s for %s already exists \n' % (
+            switch, ip, vrouter
+        )
+
+    cli = pn_cli(module)
+    cli += ' vrouter-loopback-interface-add vrouter-name '
+    cli += vrouter
+    cli += ' ip ' + ip
+    run_cli(module, cli)
+    CHANGED_FLAG.append(True)
+    return ' %s: Added loopback ip %s to %s \n' % (switch, ip, vrouter)
+
+
 def assign_loopback_ip(module, loopback_address):
     """
     Method to add loopback interface to vrouters.
@@ -450,55 +413,75 @@ def assign_loopback_ip(module, loopback_address):
     :param loopback_address: The loopback ip to be assigned.
     :return: String describing if loopback ips got assigned or not.
     """
-    global CHANGED_FLAG
     output = ''
-    address = loopback_address.split('.')
-    static_part = str(address[0]) + '.' + str(address[1]) + '.'
-    static_part += str(address[2]) + '.'
-
     cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-show format name no-show-headers '
-    vrouter_names = run_cli(module, cli).split()
+    snapshot = FabricSnapshot(module, cli, ('vrouter-show',
+                                            'vrouter-loopback-interface-show'))
+    vrouter_names = sorted(snapshot.vrouter_names())
 
     if len(vrouter_names) > 0:
-        vrouter_count = 1
-        for vrouter in vrouter_names:
-            if vrouter_count <= 255:
-                ip = static_part + str(vrouter_count)
-                cli = clicopy
-                cli += ' vrouter-show name ' + vrouter
-                cli += ' format location no-show-headers '
-                switch = run_cli(module, cli).split()[0]
-                cli = clicopy
-                cli += ' vrouter-loopback-interface-show ip ' + ip
-                cli += ' format switch no-show-headers '
-                existing_vrouter = run_cli(module, cli).split()
-
-                if vrouter not in existing_vrouter:
-                    cli = clicopy
-                    cli += ' vrouter-loopback-interface-add vrouter-name '
-                    cli += vrouter
-                    cli += ' ip ' + ip
-                    run_cli(module, cli)
-                    output += ' %s: Added loopback ip %s to %s \n' % (
-                        switch, ip, vrouter
-                    )
-                    CHANGED_FLAG.append(True)
-                else:
-                    output += ' %s: Loopback ip %s for %s already exists \n' % (
-                        switch, ip, vrouter
-                    )
-
-                vrouter_count += 1
-            else:
-                output += ' Not enough loopback ips available for vrouters \n'
+        # Vrouters keep the loopback they have, the others take the lowest
+        # free ips by vrouter name, as vrouter-show order depends on the
+        # order the vrouters got created in.
+        plan = loopback_plan(module, vrouter_names, snapshot.loopbacks,
+                             loopback_address)
+        missing = set(plan.missing)
+        output += ''.join(fan_out(module, lambda vrouter: add_loopback_ip(
+            module, snapshot.location(vrouter), vrouter,
+            plan.ips.get(vrouter), vrouter in missing), vrouter_names))
     else:
         output += ' No vrouters exists to assign loopback ips \n'
 
     return output
 
 
+def find_leaf_links(module, clicopy, leaf, spine_list):
+    """
+    Method to find the links of a leaf to spines.
+    :param module: The Ansible module to fetch input parameters.
+    :param clicopy: The cli prefix returned by pn_cli().
+    :param leaf: Name of the leaf switch.
+    :param spine_list: Names of the spine switches.
+    :return: Dict mapping spine name to the list of (leaf port, spine port).
+    """
+    links = {}
+    for spine in spine_list:
+        cli = clicopy
+        cli += ' switch %s port-show hostname %s ' % (leaf, spine)
+        cli += ' format port no-show-headers '
+        leaf_port = run_cli(module, cli).split()
+
+        links[spine] = []
+        if 'Success' in leaf_port:
+            continue
+
+        for lport in leaf_port:
+            cli = clicopy
+            cli += ' switch %s port-show port %s ' % (leaf, lport)
+            cli += ' format rport no-show-headers '
+            rport = run_cli(module, cli)
+            links[spine].append((lport, rport))
+
+    return links
+
+
+def configure_switch_link_ips(module, vrouters, switch, interfaces):
+    """
+    Method to configure the link ips of one switch.
+    :param module: The Ansible module to fetch input parameters.
+    :param vrouters: Dictionary mapping switch names to their vrouter.
+    :param switch: Name of the switch.
+    :param interfaces: List of (port, ip, peer switch) to configure.
+    :return: String describing output of configuration.
+    """
+    output = ''
+    for port, ip, peer in interfaces:
+        delete_trunk(module, switch, port, peer)
+        output += create_interface(module, vrouters, switch, ip, port)
+
+    return output
+
+
 def auto_configure_link_ips(module):
     """
     Method to auto configure link IPs for layer3 fabric.
@@ -515,16 +498,15 @@ def auto_configure_link_ips(module):
     clicopy = cli
     cli += ' fabric-node-show format name no-show-headers '
     switch_names = run_cli(module, cli).split()
-    switch_names = list(set(switch_names))
+    switch_names = sorted(set(switch_names))
 
     # Disable auto trunk on all switches.
-    for switch in switch_names:
-        modify_auto_trunk_setting(module, switch, 'disable')
+    fan_out(module, lambda switch: modify_auto_trunk_setting(
+        module, switch, 'disable'), switch_names)
 
-    # Get the list of available link ips to assign.
-    available_ips = calculate_link_ip_addresses(module.params['pn_net_address'],
-                                                module.params['pn_cidr'],
-                                                supernet)
+    # Plan the link subnets to assign.
+    links = link_allocator(module, module.params['pn_net_address'],
+                           module.params['pn_cidr'], supernet)
 
     # Get the fabric name and create vnet name required for vrouter creation.
     cli = clicopy
@@ -533,52 +515,39 @@ def auto_configure_link_ips(module):
     vnet_name = str(fabric_name) + '-global'
 
     # Create vrouter on all switches.
-    for switch in switch_names:
-        output += create_vrouter(module, switch, vnet_name)
+    output += ''.join(fan_out(module, lambda switch: create_vrouter(
+        module, switch, vnet_name), switch_names))
 
+    # Map every switch to its vrouter with one multi-column show.
+    vrouters = dict((row.location, row.name) for row in show(
+        module, clicopy, 'vrouter-show', ('name', 'location')))
+
+    # Discover the links of every leaf, then hand out the link subnets in
+    # spine/leaf/port order so every link keeps its ips across runs.
+    leaf_links = dict(zip(leaf_list, fan_out(module, lambda leaf: (
+        find_leaf_links(module, clicopy, leaf, spine_list)), leaf_list)))
+
+    interfaces = dict((switch, []) for switch in spine_list + leaf_list)
     for spine in spine_list:
         for leaf in leaf_list:
-            cli = clicopy
-            cli += ' switch %s port-show hostname %s ' % (leaf, spine)
-            cli += ' format port no-show-headers '
-            leaf_port = run_cli(module, cli).split()
-
-            if 'Success' in leaf_port:
-                continue
-
-            while len(leaf_port) > 0:
-                lport = leaf_port[0]
-                ip = available_ips[0]
-                delete_trunk(module, leaf, lport, spine)
-                output += create_interface(module, leaf, ip, lport)
-
-                leaf_port.remove(lport)
-                available_ips.remove(ip)
-                ip = available_ips[0]
-
-                cli = clicopy
-                cli += ' switch %s port-show port %s ' % (leaf, lport)
-                cli += ' format rport no-show-headers '
-                rport = run_cli(module, cli)
-
-                delete_trunk(module, spine, rport, leaf)
-                output += create_interface(module, spine, ip, rport)
-                available_ips.remove(ip)
-
-                ip_count = 0
-                diff = 32 - int(supernet)
-                count = (1 << diff) - 4
-                while ip_count < count:
-                    available_ips.pop(0)
-                    ip_count += 1
+            for lport, rport in leaf_links[leaf][spine]:
+                leaf_ip, spine_ip = allocate_link(module, links)
+                interfaces[leaf].append((lport, leaf_ip, spine))
+                interfaces[spine].append((rport, spine_ip, leaf))
+
+    # The interfaces of every switch are independent of the other switches.
+    switches = [switch for switch in spine_list + leaf_list
+                if interfaces[switch]]
+    output += ''.join(fan_out(module, lambda switch: configure_switch_link_ips(
+        module, vrouters, switch, interfaces[switch]), switches))
 
     if fabric_loopback:
         # Assign loopback ip to vrouters.
         output += assign_loopback_ip(module, module.params['pn_loopback_ip'])
 
-    for switch in switch_names:
-        # Enable auto trunk.
-        modify_auto_trunk_setting(module, switch, 'enable')
+    # Enable auto trunk.
+    fan_out(module, lambda switch: modify_auto_trunk_setting(
+        module, switch, 'enable'), switch_names)
 
     return output
 
@@ -619,16 +588,8 @@ def main():
     if module.params['pn_stp']:
         message += modify_stp(module, 'enable')
 
-    message_string = message
-    results = []
-    switch_list = module.params['pn_spine_list'] + module.params['pn_leaf_list']
-    for switch in switch_list:
-        replace_string = switch + ': '
-
-        for line in message_string.splitlines():
-            if replace_string in line:
-                json_msg = {'switch' : switch , 'output' : (line.replace(replace_string, '')).strip() }
-                results.append(json_msg)
+    results = message_summary(message, module.params['pn_spine_list'] +
+                              module.params['pn_leaf_list'])
 
     # Exit the module and return the required JSON.
     module.exit_json(
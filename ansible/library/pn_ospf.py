@@ -1,7 +1,6 @@
 #!/usr/bin/python
 """ PN-CLI vrouter-ospf-add/remove """
 
-import subprocess
 import shlex
 
 DOCUMENTATION = """
@@ -129,7 +128,7 @@ def check_cli(module, cli):
     # Check for vRouter
     check_vrouter = cli + ' vrouter-show format name no-show-headers '
     check_vrouter = shlex.split(check_vrouter)
-    out = module.run_command(check_vrouter)[1]
+    out = pn_run_command(module, check_vrouter)[1]
     out = out.split()
 
     VROUTER_EXISTS = True if vrouter_name in out else False
@@ -138,7 +137,7 @@ def check_cli(module, cli):
     show = cli + ' vrouter-ospf-show vrouter-name %s ' % vrouter_name
     show += 'format network no-show-headers'
     show = shlex.split(show)
-    out = module.run_command(show)[1]
+    out = pn_run_command(module, show)[1]
     out = out.split()
 
     NETWORK_EXISTS = True if network_ip in out else False
@@ -154,11 +153,9 @@ def run_cli(module, cli):
     cliswitch = module.params['pn_cliswitch']
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    response = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                stdout=subprocess.PIPE, universal_newlines=True)
     # 'out' contains the output
     # 'err' contains the error messages
-    out, err = response.communicate()
+    rc, out, err = pn_run_command(module, cmd)
 
     print_cli = cli.split(cliswitch)[1]
 
@@ -251,6 +248,7 @@ def main():
     run_cli(module, cli)
 # AnsibleModule boilerplate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
@@ -19,7 +19,6 @@
 #
 
 import shlex
-import re
 
 DOCUMENTATION = """
 ---
@@ -45,6 +44,8 @@ options:
     pn_commands_file:
       description:
         - Specify commands to be run on the switches.
+        - Commands can use ranges, e.g. {100..3999} or {100..3999..2}, and
+          variables, {switch} or set in [vars] sections.
         required: True
         type: str
 """
@@ -95,7 +96,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success message depending upon the response.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if out:
         return out
@@ -112,98 +113,15 @@ def run_cli(module, cli):
         return 'Success '
 
 
-def execute_commands(module, commands_data):
+def command_message(switch, cli, output):
     """
-    This method executes the cli commands from a local file.
-    :param module: The Ansible module to fetch input parameters.
-    :param commands_data: Cli commands in the form of string.
-    :return: Output/Error or Success message depending upon the response.
+    Method to build the text of an executed command in stdout.
+    :param switch: Name of the switch, None for fabric wide commands.
+    :param cli: The complete cli string executed.
+    :param output: The output of run_cli().
+    :return: The message.
     """
-    output = ''
-    commands_list = commands_data.split('\n')
-    line_count = 0
-    cli = pn_cli(module)
-    clicopy = cli
-
-    while line_count < len(commands_list):
-        if commands_list[line_count] == "":
-            line_count += 1
-
-        # Execute commands from [ALL] group.
-        # It will be executed on all switches.
-        elif re.match("(^\[ALL.*)", commands_list[line_count]) is not None:
-            line_count += 1
-            cli = clicopy
-            cli += " fabric-node-show format name no-show-headers "
-            switch_list = run_cli(module, cli).split()
-
-            while (line_count < len(commands_list) and
-                           re.match("(^\[switch.*)",
-                                    commands_list[line_count]) is None and
-                           re.match("(^\[fabric.*)",
-                                    commands_list[line_count]) is None):
-                if commands_list[line_count] != "":
-                    command = commands_list[line_count]
-                    for switch in switch_list:
-                        cli = clicopy
-                        cli += ' switch %s ' % switch
-                        cli += str(command)
-                        output += run_cli(module, cli)
-                        output += cli + ' successfully executed '
-
-                line_count += 1
-
-        # Execute commands from [fabric] group.
-        # It will be executed fabric wide on first switch from hosts file.
-        elif re.match("(^\[fabric.*)", commands_list[line_count]) is not None:
-            line_count += 1
-            while (line_count < len(commands_list) and
-                           re.match("(^\[switch.*)",
-                                    commands_list[line_count]) is None and
-                           re.match("(^\[ALL.*)",
-                                    commands_list[line_count]) is None):
-                if commands_list[line_count] != "":
-                    command = commands_list[line_count]
-                    cli = clicopy
-                    cli += str(command)
-                    output += run_cli(module, cli)
-                    output += cli + ' successfully executed '
-
-                line_count += 1
-
-        # Execute commands from [switch] group.
-        # It will be executed on mentioned switches.
-        elif re.match("(^\[switch.*)", commands_list[line_count]) is not None:
-            switch_to_run = commands_list[line_count].split(",")
-            switch_to_run[0] = switch_to_run[0].split(" ")[1]
-            last_arg = len(switch_to_run) - 1
-            switch_to_run[last_arg] = switch_to_run[last_arg].split("]")[0]
-            line_count += 1
-
-            while (line_count < len(commands_list) and
-                           re.match("(^\[ALL.*)",
-                                    commands_list[line_count]) is None and
-                           re.match("(^\[switch.*)",
-                                    commands_list[line_count]) is None and
-                           re.match("(^\[fabric.*)",
-                                    commands_list[line_count]) is None):
-                if commands_list[line_count] != "":
-                    command = commands_list[line_count]
-                    for switch in switch_to_run:
-                        switch = switch.replace(" ", "")
-                        cli = clicopy
-                        cli += ' switch %s ' % switch
-                        cli += str(command)
-                        output += run_cli(module, cli)
-                        output += cli + ' successfully executed '
-
-                line_count += 1
-
-        # It will take care of comments at the top if any
-        else:
-            line_count += 1
-
-    return output
+    return output + cli + ' successfully executed '
 
 
 def main():
@@ -216,10 +134,13 @@ def main():
         )
     )
 
-    message = execute_commands(module, module.params['pn_commands_file'])
+    results = ResultRecorder()
+    execute_commands(module, module.params['pn_commands_file'], results,
+                     pn_cli(module), run_cli, command_message)
+    results.close()
 
     module.exit_json(
-        stdout=message,
+        stdout=results.stdout(),
         error='0',
         failed=False,
         msg='Operation Completed',
@@ -229,6 +150,9 @@ def main():
 
 # AnsibleModule boilerplate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_commands import execute_commands
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_results import ResultRecorder
 
 if __name__ == '__main__':
     main()
@@ -15,7 +15,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
 import shlex
 
 DOCUMENTATION = """
@@ -126,11 +125,9 @@ def run_cli(module, cli):
     cliswitch = module.params['pn_cliswitch']
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    response = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                stdout=subprocess.PIPE, universal_newlines=True)
     # 'out' contains the output
     # 'err' contains the error messages
-    out, err = response.communicate()
+    rc, out, err = pn_run_command(module, cmd)
 
     print_cli = cli.split(cliswitch)[1]
 
@@ -189,6 +186,7 @@ def main():
 
 # AnsibleModule boilerplate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
@@ -15,7 +15,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
 import shlex
 
 DOCUMENTATION = """
@@ -213,7 +212,7 @@ def check_cli(module, cli):
 
     show = cli + ' trunk-show format switch,name no-show-headers'
     show = shlex.split(show)
-    out = module.run_command(show)[1]
+    out = pn_run_command(module, show)[1]
 
     out = out.split()
     # Global flags
@@ -231,11 +230,9 @@ def run_cli(module, cli):
     cliswitch = module.params['pn_cliswitch']
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    response = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                stdout=subprocess.PIPE, universal_newlines=True)
     # 'out' contains the output
     # 'err' contains the error messages
-    out, err = response.communicate()
+    rc, out, err = pn_run_command(module, cmd)
 
     print_cli = cli.split(cliswitch)[1]
 
@@ -436,6 +433,7 @@ def main():
 
 # Ansible boiler-plate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
@@ -357,7 +357,7 @@ def check_vflow_exists(module, cli):
     name = module.params['pn_name']
     show = cli + ' vflow-show format switch,name no-show-headers'
     show = shlex.split(show)
-    out = module.run_command(show)[1]
+    out = pn_run_command(module, show)[1]
     out = out.split()
 
     return True if name in out else False
@@ -372,7 +372,7 @@ def run_cli(module, cli):
     """
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    rc, out, err = module.run_command(cmd)
+    rc, out, err = pn_run_command(module, cmd)
 
     # Response in JSON format
     if err:
@@ -745,6 +745,7 @@ def main():
 
 # Ansible boiler-plate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
@@ -15,7 +15,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
 import shlex
 
 DOCUMENTATION = """
@@ -201,14 +200,14 @@ def check_cli(module, cli):
     # Get the name of the local switch
     location = cli + ' switch-setup-show format switch-name'
     location = shlex.split(location)
-    out = module.run_command(location)[1]
+    out = pn_run_command(module, location)[1]
     location = out.split()[1]
 
     # Check for any vRouters on the switch
     check_vrouter = cli + ' vrouter-show location %s ' % location
     check_vrouter += 'format name no-show-headers'
     check_vrouter = shlex.split(check_vrouter)
-    out = module.run_command(check_vrouter)[1]
+    out = pn_run_command(module, check_vrouter)[1]
 
     VROUTER_EXISTS = True if out else False
 
@@ -216,7 +215,7 @@ def check_cli(module, cli):
     # Check for any vRouters with the given name
     show = cli + ' vrouter-show format name no-show-headers '
     show = shlex.split(show)
-    out = module.run_command(show)[1]
+    out = pn_run_command(module, show)[1]
     out = out.split()
 
     VROUTER_NAME_EXISTS = True if name in out else False
@@ -232,11 +231,9 @@ def run_cli(module, cli):
     cliswitch = module.params['pn_cliswitch']
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    response = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                stdout=subprocess.PIPE, universal_newlines=True)
     # 'out' contains the output
     # 'err' contains the error messages
-    out, err = response.communicate()
+    rc, out, err = pn_run_command(module, cmd)
 
     print_cli = cli.split(cliswitch)[1]
 
@@ -394,6 +391,7 @@ def main():
 
 # AnsibleModule boilerplate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
@@ -15,7 +15,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
 import shlex
 
 DOCUMENTATION = """
@@ -222,7 +221,7 @@ def check_cli(module, cli):
     # Check for vRouter
     check_vrouter = cli + ' vrouter-show format name no-show-headers '
     check_vrouter = shlex.split(check_vrouter)
-    out = module.run_command(check_vrouter)[1]
+    out = pn_run_command(module, check_vrouter)[1]
     out = out.split()
 
     VROUTER_EXISTS = True if vrouter_name in out else False
@@ -231,7 +230,7 @@ def check_cli(module, cli):
     show = cli + ' vrouter-bgp-show vrouter-name %s ' % vrouter_name
     show += 'format neighbor no-show-headers'
     show = shlex.split(show)
-    out = module.run_command(show)[1]
+    out = pn_run_command(module, show)[1]
     out = out.split()
 
     NEIGHBOR_EXISTS = True if neighbor in out else False
@@ -247,11 +246,9 @@ def run_cli(module, cli):
     cliswitch = module.params['pn_cliswitch']
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    response = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                stdout=subprocess.PIPE, universal_newlines=True)
     # 'out' contains the output
     # 'err' contains the error messages
-    out, err = response.communicate()
+    rc, out, err = pn_run_command(module, cmd)
 
     print_cli = cli.split(cliswitch)[1]
 
@@ -459,6 +456,7 @@ def main():
     run_cli(module, cli)
 # Ansible boiler-plate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
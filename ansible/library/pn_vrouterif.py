@@ -1,7 +1,6 @@
 #!/usr/bin/python
 """ PN-CLI vrouter-interface-add/remove/modify """
 
-import subprocess
 import shlex
 
 DOCUMENTATION = """
@@ -211,7 +210,7 @@ def check_cli(module, cli):
     # Check for vRouter
     check_vrouter = cli + ' vrouter-show format name no-show-headers '
     check_vrouter = shlex.split(check_vrouter)
-    out = module.run_command(check_vrouter)[1]
+    out = pn_run_command(module, check_vrouter)[1]
     out = out.split()
 
     VROUTER_EXISTS = True if vrouter_name in out else False
@@ -221,7 +220,7 @@ def check_cli(module, cli):
         show = cli + ' vrouter-interface-show vrouter-name %s ' % vrouter_name
         show += 'ip %s format ip,nic no-show-headers' % interface_ip
         show = shlex.split(show)
-        out = module.run_command(show)[1]
+        out = pn_run_command(module, show)[1]
         INTERFACE_EXISTS = True if out else False
 
     if nic_str:
@@ -229,7 +228,7 @@ def check_cli(module, cli):
         show = cli + ' vrouter-interface-show vrouter-name %s ' % vrouter_name
         show += ' format nic no-show-headers'
         show = shlex.split(show)
-        out = module.run_command(show)[1]
+        out = pn_run_command(module, show)[1]
         NIC_EXISTS = True if nic_str in out else False
 
 
@@ -252,7 +251,7 @@ def get_nic(module, cli):
     show = cli + ' vrouter-interface-show vrouter-name %s ' % vrouter_name
     show += 'ip %s format ip,nic no-show-headers' % interface_ip
     show = shlex.split(show)
-    out = module.run_command(show)[1]
+    out = pn_run_command(module, show)[1]
     out = out.split()
 
     if len(out) > 3:
@@ -274,11 +273,9 @@ def run_cli(module, cli):
     cliswitch = module.params['pn_cliswitch']
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    response = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                stdout=subprocess.PIPE, universal_newlines=True)
     # 'out' contains the output
     # 'err' contains the error messages
-    out, err = response.communicate()
+    rc, out, err = pn_run_command(module, cmd)
 
     print_cli = cli.split(cliswitch)[1]
 
@@ -444,6 +441,7 @@ def main():
     run_cli(module, cli)
 # Ansible boiler-plate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
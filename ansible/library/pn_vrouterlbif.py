@@ -15,7 +15,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import subprocess
 import shlex
 
 DOCUMENTATION = """
@@ -150,7 +149,7 @@ def check_cli(module, cli):
     # Check for vRouter
     check_vrouter = cli + ' vrouter-show format name no-show-headers '
     check_vrouter = shlex.split(check_vrouter)
-    out = module.run_command(check_vrouter)[1]
+    out = pn_run_command(module, check_vrouter)[1]
     out = out.split()
 
     VROUTER_EXISTS = True if vrouter_name in out else False
@@ -159,7 +158,7 @@ def check_cli(module, cli):
     show = (cli + ' vrouter-loopback-interface-show vrouter-name %s format ip '
             'no-show-headers' % vrouter_name)
     show = shlex.split(show)
-    out = module.run_command(show)[1]
+    out = pn_run_command(module, show)[1]
     out = out.split()
 
     LB_INTERFACE_EXISTS = True if interface_ip in out else False
@@ -175,11 +174,9 @@ def run_cli(module, cli):
     cliswitch = module.params['pn_cliswitch']
     command = module.params['pn_command']
     cmd = shlex.split(cli)
-    response = subprocess.Popen(cmd, stderr=subprocess.PIPE,
-                                stdout=subprocess.PIPE, universal_newlines=True)
     # 'out' contains the output
     # 'err' contains the error messages
-    out, err = response.communicate()
+    rc, out, err = pn_run_command(module, cmd)
 
     print_cli = cli.split(cliswitch)[1]
 
@@ -270,7 +267,7 @@ def main():
             get_index += 'format index no-show-headers'
 
             get_index = shlex.split(get_index)
-            out = module.run_command(get_index)[1]
+            out = pn_run_command(module, get_index)[1]
             index = out.split()[1]
 
         cli += ' %s vrouter-name %s index %s' % (command, vrouter_name, index)
@@ -297,6 +294,7 @@ def main():
 
 # Ansible boiler-plate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
 
 if __name__ == '__main__':
     main()
@@ -19,6 +19,8 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_csv import parse_csv, VxlanRow
+from ansible.module_utils.pn_nvos import pn_run_command
 import re
 import shlex
 
@@ -106,7 +108,7 @@ def run_cli(module, cli):
     the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
 
     if out:
         return out
@@ -362,29 +364,19 @@ def configure_vxlan(module, csv_data):
     :return: String describing output of vxlan configuration.
     """
     output = ''
-    csv_data = csv_data.replace(" ", "")
-    csv_data_list = csv_data.split('\n')
-    for row in csv_data_list:
-        elements = row.split(',')
-        vlan_id = elements[0]
-        leaf_switch_1 = elements[2]
-        if len(elements) == 8:
-            leaf_switch_2 = elements[3]
-            vxlan_id = elements[6]
-            loopback_port = elements[7]
-            output += add_vxlan_to_vlan(module, vlan_id, vxlan_id)
-            output += configure_vtep_for_clustered_leafs(module, leaf_switch_1,
-                                                         vlan_id, vxlan_id)
-            output += configure_vtep_for_clustered_leafs(module, leaf_switch_2,
-                                                         vlan_id, vxlan_id)
-            add_ports_to_vxlan_loopback_trunk(module, loopback_port)
-        elif len(elements) == 5:
-            vxlan_id = elements[3]
-            loopback_port = elements[4]
-            output += add_vxlan_to_vlan(module, vlan_id, vxlan_id)
+    # Validate the whole csv before running any command.
+    rows = parse_csv(module, csv_data, VxlanRow)
+    for row in rows:
+        output += add_vxlan_to_vlan(module, row.vlan, row.vxlan)
+        if row.clustered():
+            for switch in row.switches():
+                output += configure_vtep_for_clustered_leafs(module, switch,
+                                                             row.vlan,
+                                                             row.vxlan)
+        else:
             output += configure_vtep_for_non_clustered_leafs(
-                module, leaf_switch_1, vlan_id, vxlan_id)
-            add_ports_to_vxlan_loopback_trunk(module, loopback_port)
+                module, row.switch1, row.vlan, row.vxlan)
+        add_ports_to_vxlan_loopback_trunk(module, row.loopback_port)
 
     return output
 
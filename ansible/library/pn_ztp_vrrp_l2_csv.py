@@ -19,6 +19,9 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_csv import parse_csv, VrrpL2Row
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_vlans import vlan_engine
 import shlex
 
 DOCUMENTATION = """
@@ -118,7 +121,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -134,27 +137,31 @@ def run_cli(module, cli):
         return 'Success'
 
 
-def create_vlan(module, vlan_id, switch):
+def create_vlans(module, requests):
     """
-    Method to create a vlan.
+    Method to create the fabric scoped vlans missing from the fabric.
     :param module: The Ansible module to fetch input parameters.
-    :param vlan_id: vlan id to be created.
-    :param switch: Name of the switch on which vlan creation will be executed.
-    :return: String describing if vlan got created or if it already exists.
+    :param requests: List of (switch, vlan id), switch being the name of
+    the switch that must have the vlan.
+    :return: List telling for every vlan id if it got created.
     """
     global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
+    created = vlan_engine(module, pn_cli(module)).create(
+        [(switch, vlan_id, 'fabric') for switch, vlan_id in requests])
+    if True in created:
+        CHANGED_FLAG.append(True)
+    return created
 
-    cli += ' vlan-show format id no-show-headers '
-    existing_vlans = run_cli(module, cli).split()
-    existing_vlans = list(set(existing_vlans))
 
-    if vlan_id not in existing_vlans:
-        cli = clicopy
-        cli += ' vlan-create id %s scope fabric ' % vlan_id
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
+def vlan_message(vlan_id, switch, created):
+    """
+    Method to describe the creation of a vlan.
+    :param vlan_id: The vlan id.
+    :param switch: Name of the switch on which vlan creation was executed.
+    :param created: True if the vlan got created.
+    :return: String describing if vlan got created or if it already exists.
+    """
+    if created:
         return ' %s: Vlan id %s with scope fabric created successfully \n' % (
             switch, vlan_id
         )
@@ -293,7 +300,8 @@ def create_vrouter_interface(module, switch, ip, vlan_id, vrrp_id, ip_count,
     return output
 
 
-def configure_vrrp(module, vrrp_id, vrrp_ip, active_switch, vlan_id):
+def configure_vrrp(module, vrrp_id, vrrp_ip, active_switch, vlan_id,
+                   vlan_created):
     """
     Method to configure vrrp interfaces.
     :param module: The Ansible module to fetch input parameters.
@@ -301,9 +309,10 @@ def configure_vrrp(module, vrrp_id, vrrp_ip, active_switch, vlan_id):
     :param vrrp_ip: The vrrp_ip needed to be assigned.
     :param active_switch: The name of the active switch.
     :param vlan_id: The vlan_id to be assigned.
+    :param vlan_created: True if the vlan got created.
     :return: Output of the created vrrp configuration.
     """
-    output = create_vlan(module, vlan_id, active_switch)
+    output = vlan_message(vlan_id, active_switch, vlan_created)
     host_count = 1
     for spine in module.params['pn_spine_list']:
         host_count += 1
@@ -323,6 +332,8 @@ def configure_vrrp_l2(module, csv_data, vrrp_id):
     :return: Output of created vrrp configuration.
     """
     output = ''
+    # Validate the whole csv before running any command.
+    rows = parse_csv(module, csv_data, VrrpL2Row)
     cli = pn_cli(module)
     cli += ' fabric-node-show format fab-name no-show-headers '
     fabric_name = list(set(run_cli(module, cli).split()))[0]
@@ -331,15 +342,12 @@ def configure_vrrp_l2(module, csv_data, vrrp_id):
     for switch in module.params['pn_spine_list']:
         output += create_vrouter(module, switch, vrrp_id, vnet_name)
 
-    csv_data = csv_data.replace(" ", "")
-    csv_data_list = csv_data.split('\n')
-    for row in csv_data_list:
-        elements = row.split(',')
-        vrrp_ip = elements[0]
-        vlan_id = elements[1]
-        active_switch = str(elements[2])
-        output += configure_vrrp(module, vrrp_id, vrrp_ip, active_switch,
-                                 vlan_id)
+    # Create the vlans of all rows at once.
+    vlans_created = create_vlans(module, [(row.active_switch, row.vlan)
+                                          for row in rows])
+    for row, vlan_created in zip(rows, vlans_created):
+        output += configure_vrrp(module, vrrp_id, row.ip, row.active_switch,
+                                 row.vlan, vlan_created)
 
     return output
 
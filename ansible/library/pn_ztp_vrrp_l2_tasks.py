@@ -142,7 +142,7 @@ def run_cli(module, cli):
     :return: Output/Error or Success msg depending upon the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -167,31 +167,10 @@ def create_vlan(module, start, end):
     :return: List of created vlans.
     """
     global CHANGED_FLAG
-    vlan = []
-    output = ''
-    cli = pn_cli(module)
-    clicopy = cli
-    clicopy += ' vlan-show format id no-show-headers '
-    already_vlan_id = run_cli(module, clicopy).split()
-    already_vlan_id = list(set(already_vlan_id))
-
-    vlan_id = int(start)
-    while vlan_id < int(end):
-        id_str = str(vlan_id)
-        vlan.append(id_str)
-        if id_str not in already_vlan_id:
-            clicopy = cli
-            clicopy += ' vlan-create id '
-            clicopy += id_str
-            clicopy += ' scope fabric '
-            output += run_cli(module, clicopy)
-            output += ' vlan with id ' + id_str + ' created! '
-            CHANGED_FLAG.append(True)
-        else:
-            output += ' vlan with id ' + id_str + ' already exists! '
-            CHANGED_FLAG.append(False)
-
-        vlan_id += 1
+    vlan = [str(vlan_id) for vlan_id in range(int(start), int(end))]
+    requests = [(None, vlan_id, 'fabric') for vlan_id in vlan]
+    created = vlan_engine(module, pn_cli(module)).create(requests)
+    CHANGED_FLAG += created
 
     return vlan
 
@@ -395,6 +374,8 @@ def main():
 
 # AnsibleModule boilerplate
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_vlans import vlan_engine
 
 if __name__ == '__main__':
     main()
@@ -19,6 +19,11 @@
 #
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.pn_csv import parse_csv, VrrpRow
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_reconcile import apply_plan, Lookup, Reconciler
+from ansible.module_utils.pn_reconcile import save_plans, saved_plans
 import shlex
 
 DOCUMENTATION = """
@@ -53,6 +58,15 @@ options:
         - String containing vrrp data parsed from csv file.
       required: False
       type: str
+    pn_plan_file:
+      description:
+        - File holding the planned VRRP commands.
+        - In check mode the plan gets written to it, otherwise the plan it
+          holds is applied without planning again and the file is removed.
+          If the fabric changed since it was written, e.g. by a failed run,
+          what is left of the plan is diffed against the fabric first.
+      required: False
+      type: str
 """
 
 EXAMPLES = """
@@ -82,6 +96,10 @@ failed:
 
 CHANGED_FLAG = []
 
+# Show tables the VRRP setup is planned against.
+SNAPSHOT_TABLES = ('fabric-node-show', 'cluster-show', 'vlan-show',
+                   'vrouter-show', 'vrouter-interface-show')
+
 
 def pn_cli(module):
     """
@@ -110,7 +128,7 @@ def run_cli(module, cli):
     the response from cli.
     """
     cli = shlex.split(cli)
-    rc, out, err = module.run_command(cli)
+    rc, out, err = pn_run_command(module, cli)
     if out:
         return out
 
@@ -126,109 +144,91 @@ def run_cli(module, cli):
         return 'Success'
 
 
-def get_vrouter_name(module, switch_name):
+def get_vrouter_name(snapshot, switch_name):
     """
-    Method to return name of the vrouter.
-    :param module: The Ansible module to fetch input parameters.
+    Method to return name of the vrouter. A switch keeps the vrouter it has,
+    otherwise it gets one named after it.
+    :param snapshot: The FabricSnapshot of the fabric.
     :param switch_name: Name of the switch for which to find the vrouter.
     :return: Vrouter name.
     """
-    cli = pn_cli(module)
-    cli += ' vrouter-show location ' + switch_name
-    cli += ' format name no-show-headers '
-    return run_cli(module, cli).split()[0]
+    return snapshot.vrouter(switch_name) or str(switch_name) + '-vrouter'
 
 
-def create_vlan(module, vlan_id, switch):
+def get_interface_nic(snapshot, vrouter_name, ip):
     """
-    Method to create vlans.
-    :param module: The Ansible module to fetch input parameters.
+    Method to return the nic of a vrouter interface, looked up on the switch
+    once the plan added it if the snapshot does not have it.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param vrouter_name: Name of the vrouter.
+    :param ip: IP address of the interface.
+    :return: Nic of the interface, or its Lookup.
+    """
+    return snapshot.interface_nic(vrouter_name, ip) or Lookup(
+        'vrouter-interface-show', 'nic',
+        'vrouter-name %s ip %s' % (vrouter_name, ip))
+
+
+def create_vlan(reconciler, vlan_id, switch):
+    """
+    Method to declare a fabric scoped vlan.
+    :param reconciler: The Reconciler of the fabric.
     :param vlan_id: vlan id to be created.
     :param switch: Name of the switch on which vlan creation will be executed.
-    :return: String describing if vlan got created or if it already exists.
+    :return: String describing if vlan already exists.
     """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vlan-show format id no-show-headers '
-    existing_vlan_ids = run_cli(module, cli).split()
-    existing_vlan_ids = list(set(existing_vlan_ids))
-
-    if vlan_id not in existing_vlan_ids:
-        cli = clicopy
-        cli += ' vlan-create id %s scope fabric ' % vlan_id
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        return ' %s: Vlan id %s with scope fabric created successfully \n' % (
-            switch, vlan_id
-        )
-
-    else:
-        return ' %s: Vlan id %s with scope fabric already exists \n' % (
-            switch, vlan_id
-        )
+    if reconciler.want('vlan', None, [('id', vlan_id), ('scope', 'fabric')],
+                       message=' %s: Vlan id %s with scope fabric created '
+                               'successfully \n' % (switch, vlan_id)):
+        return ''
+    return ' %s: Vlan id %s with scope fabric already exists \n' % (
+        switch, vlan_id
+    )
 
 
-def create_vrouter(module, switch, vrrp_id, vnet_name):
+def create_vrouter(snapshot, reconciler, switch, vrrp_id, vnet_name):
     """
-    Method to create vrouter and assign vrrp_id to the switches.
-    :param module: The Ansible module to fetch input parameters.
+    Method to declare a vrouter with its vrrp_id.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: The switch name on which vrouter will be created.
     :param vrrp_id: The vrrp_id to be assigned.
     :param vnet_name: The name of the vnet for vrouter creation.
-    :return: String describing if vrouter got created or if it already exists.
+    :return: Empty string, the changes are described once applied.
     """
-    global CHANGED_FLAG
-    output = ''
-    vrouter_name = str(switch) + '-vrouter'
-    cli = pn_cli(module)
-    cli += ' switch ' + switch
-    clicopy = cli
-
-    # Check if vrouter already exists
-    cli += ' vrouter-show format name no-show-headers '
-    existing_vrouter_names = run_cli(module, cli).split()
-
-    # If vrouter doesn't exists then create it
-    if vrouter_name not in existing_vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-create name %s vnet %s hw-vrrp-id %s enable ' % (
-            vrouter_name, vnet_name, vrrp_id)
-        run_cli(module, cli)
-        output = ' %s: Created vrouter with name %s \n' % (switch, vrouter_name)
-        CHANGED_FLAG.append(True)
-    else:
-        cli = clicopy
-        cli += ' vrouter-show name ' + vrouter_name
-        cli += ' format hw-vrrp-id no-show-headers'
-        hw_vrrp_id = run_cli(module, cli).split()[0]
-
-        if hw_vrrp_id != vrrp_id:
-            cli = clicopy
-            cli += ' vrouter-modify name %s hw-vrrp-id %s ' % (vrouter_name,
-                                                               vrrp_id)
-            run_cli(module, cli)
-            CHANGED_FLAG.append(True)
+    vrouter_name = get_vrouter_name(snapshot, switch)
+    operation = reconciler.want('vrouter', switch, [
+        ('name', vrouter_name), ('vnet', vnet_name), ('hw-vrrp-id', vrrp_id),
+        ('enable', None)
+    ], compare=('hw-vrrp-id',),
+        message=' %s: Created vrouter with name %s \n' % (switch,
+                                                          vrouter_name))
+
+    if operation is not None and operation.action == 'modify':
+        operation.message = ' %s: Assigned hw-vrrp-id %s to %s \n' % (
+            switch, vrrp_id, vrouter_name
+        )
 
-    return output
+    return ''
 
 
-def create_vrouter_interface(module, switch, ip, vlan_id, vrrp_id,
-                             ip_count, vrrp_priority):
+def create_vrouter_interface(snapshot, reconciler, switch, ip, vlan_id,
+                             vrrp_id, ip_count, vrrp_priority):
     """
-    Method to add vrouter interface and assign IP to it along with
+    Method to declare a vrouter interface and its VRRP interface, along with
     vrrp_id and vrrp_priority.
-    :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: The switch name on which interfaces will be created.
     :param ip: IP address to be assigned to vrouter interface.
     :param vlan_id: vlan_id to be assigned.
     :param vrrp_id: vrrp_id to be assigned.
     :param vrrp_priority: priority to be given(110 for active switch).
     :param ip_count: The value of fourth octet in the ip
-    :return: String describing if vrouter interface got added or not.
+    :return: String describing if vrouter interfaces already exist.
     """
-    global CHANGED_FLAG
-    vrouter_name = get_vrouter_name(module, switch)
+    output = ''
+    vrouter_name = get_vrouter_name(snapshot, switch)
     ip_addr = ip.split('.')
     fourth_octet = ip_addr[3].split('/')
     subnet = fourth_octet[1]
@@ -237,60 +237,25 @@ def create_vrouter_interface(module, switch, ip, vlan_id, vrrp_id,
     ip_vip = static_ip + '1' + '/' + subnet
     ip2 = static_ip + ip_count + '/' + subnet
 
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-interface-show vlan %s ip %s ' % (vlan_id, ip2)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
-
-    if vrouter_name not in existing_vrouter:
-        cli = clicopy
-        cli += ' switch ' + switch
-        cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
-        cli += ' ip ' + ip2
-        cli += ' vlan %s if data ' % vlan_id
-        run_cli(module, cli)
-        output = ' %s: Added vrouter interface with ip %s to %s \n' % (
-            switch, ip2, vrouter_name
-        )
-        CHANGED_FLAG.append(True)
-    else:
-        output = ' %s: Vrouter interface %s already exists for %s \n' % (
+    interface = reconciler.want('vrouter-interface', switch, [
+        ('vrouter-name', vrouter_name), ('ip', ip2), ('vlan', vlan_id),
+        ('if', 'data')
+    ], message=' %s: Added vrouter interface with ip %s to %s \n' % (
+        switch, ip2, vrouter_name))
+    if not interface:
+        output += ' %s: Vrouter interface %s already exists for %s \n' % (
             switch, ip2, vrouter_name
         )
 
-    cli = clicopy
-    cli += ' vrouter-interface-show vrouter-name %s ip %s vlan %s ' % (
-        vrouter_name, ip2, vlan_id
-    )
-    cli += ' format nic no-show-headers '
-    eth_port = run_cli(module, cli).split()
-    eth_port.remove(vrouter_name)
-
-    cli = clicopy
-    cli += ' vrouter-interface-show vlan %s ip %s vrrp-primary %s ' % (
-        vlan_id, ip_vip, eth_port[0]
-    )
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
-
-    if vrouter_name not in existing_vrouter:
-        cli = clicopy
-        cli += ' switch ' + switch
-        cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
-        cli += ' ip ' + ip_vip
-        cli += ' vlan %s if data vrrp-id %s ' % (vlan_id, vrrp_id)
-        cli += ' vrrp-primary %s vrrp-priority %s ' % (eth_port[0],
-                                                       vrrp_priority)
-        run_cli(module, cli)
-        output += ' %s: Added vrouter interface with ip %s to %s \n' % (
-            switch, ip_vip, vrouter_name
-        )
-        CHANGED_FLAG.append(True)
-
-    else:
+    # The VRRP interface is primary on the interface above, which may only
+    # get its nic once the plan runs.
+    primary = get_interface_nic(snapshot, vrouter_name, ip2)
+    if not reconciler.want('vrouter-interface', switch, [
+            ('vrouter-name', vrouter_name), ('ip', ip_vip), ('vlan', vlan_id),
+            ('if', 'data'), ('vrrp-id', vrrp_id), ('vrrp-primary', primary),
+            ('vrrp-priority', vrrp_priority)
+    ], message=' %s: Added vrouter interface with ip %s to %s \n' % (
+            switch, ip_vip, vrouter_name), after=[interface]):
         output += ' %s: Vrouter interface %s already exists for %s \n' % (
             switch, ip_vip, vrouter_name
         )
@@ -298,75 +263,55 @@ def create_vrouter_interface(module, switch, ip, vlan_id, vrrp_id,
     return output
 
 
-def create_cluster(module, switch, name, node1, node2):
+def create_cluster(reconciler, switch, name, node1, node2):
     """
-    Method to create a cluster between two switches.
-    :param module: The Ansible module to fetch input parameters.
+    Method to declare a cluster between two switches.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: Name of the local switch.
     :param name: The name of the cluster to create.
     :param node1: First node of the cluster.
     :param node2: Second node of the cluster.
-    :return: The output of run_cli() method.
+    :return: String describing if cluster already exists.
     """
-    global CHANGED_FLAG
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' switch %s cluster-show format name no-show-headers ' % node1
-    cluster_list = run_cli(module, cli).split()
-    if name not in cluster_list:
-        cli = clicopy
-        cli += ' switch %s cluster-create name %s ' % (switch, name)
-        cli += ' cluster-node-1 %s cluster-node-2 %s ' % (node1, node2)
-        if 'Success' in run_cli(module, cli):
-            CHANGED_FLAG.append(True)
-            return ' %s: %s created successfully \n' % (switch, name)
-    else:
-        return ' %s: %s already exists \n' % (switch, name)
+    if reconciler.want('cluster', switch, [
+            ('name', name), ('cluster-node-1', node1),
+            ('cluster-node-2', node2)
+    ], message=' %s: %s created successfully \n' % (switch, name)):
+        return ''
+    return ' %s: %s already exists \n' % (switch, name)
 
 
-def create_vrouter_without_vrrp(module, switch, vnet_name):
+def create_vrouter_without_vrrp(snapshot, reconciler, switch, vnet_name):
     """
-    Method to create vrouter without assigning vrrp id to it.
-    :param module: The Ansible module to fetch input parameters.
+    Method to declare a vrouter without assigning vrrp id to it.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param switch: The switch name on which vrouter will be created.
     :param vnet_name: The name of the vnet for vrouter creation.
-    :return: String describing if vrouter got created or if it already exists.
+    :return: String describing if vrouter already exists.
     """
-    global CHANGED_FLAG
-    vrouter_name = str(switch) + '-vrouter'
-    cli = pn_cli(module)
-    cli += ' switch ' + switch
-    clicopy = cli
-
-    # Check if vrouter already exists
-    cli += ' vrouter-show format name no-show-headers '
-    existing_vrouter_names = run_cli(module, cli).split()
-
-    # If vrouter doesn't exists then create it
-    if vrouter_name not in existing_vrouter_names:
-        cli = clicopy
-        cli += ' vrouter-create name %s vnet %s ' % (vrouter_name, vnet_name)
-        run_cli(module, cli)
-        output = ' %s: Created vrouter with name %s \n' % (switch, vrouter_name)
-        CHANGED_FLAG.append(True)
-    else:
-        output = ' %s: Vrouter with name %s already exists \n' % (switch,
-                                                                  vrouter_name)
-
-    return output
-
-
-def configure_vrrp_for_non_cluster_leafs(module, ip, non_cluster_leaf, vlan_id):
+    vrouter_name = get_vrouter_name(snapshot, switch)
+    if reconciler.want('vrouter', switch, [('name', vrouter_name),
+                                           ('vnet', vnet_name)],
+                       message=' %s: Created vrouter with name %s \n' % (
+                           switch, vrouter_name)):
+        return ''
+    return ' %s: Vrouter with name %s already exists \n' % (switch,
+                                                            vrouter_name)
+
+
+def configure_vrrp_for_non_cluster_leafs(snapshot, reconciler, ip,
+                                         non_cluster_leaf, vlan_id):
     """
-    Method to configure vrrp for non-cluster switches.
-    :param module: The Ansible module to fetch input parameters.
+    Method to declare the gateway interface of non-cluster switches.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param ip: IP address for the default gateway
     :param non_cluster_leaf: Name of non-cluster leaf switch.
     :param vlan_id: The vlan id to be assigned.
-    :return: String describing whether interfaces got added or not.
+    :return: String describing whether interfaces already exist.
     """
-    global CHANGED_FLAG
-    vrouter_name = get_vrouter_name(module, non_cluster_leaf)
+    vrouter_name = get_vrouter_name(snapshot, non_cluster_leaf)
 
     ip_addr = ip.split('.')
     fourth_octet = ip_addr[3].split('/')
@@ -375,36 +320,24 @@ def configure_vrrp_for_non_cluster_leafs(module, ip, non_cluster_leaf, vlan_id):
     static_ip = ip_addr[0] + '.' + ip_addr[1] + '.' + ip_addr[2] + '.'
     ip_gateway = static_ip + '1' + '/' + subnet
 
-    cli = pn_cli(module)
-    clicopy = cli
-    cli += ' vrouter-interface-show ip %s vlan %s ' % (ip_gateway, vlan_id)
-    cli += ' format switch no-show-headers '
-    existing_vrouter = run_cli(module, cli).split()
-    existing_vrouter = list(set(existing_vrouter))
-
-    if vrouter_name not in existing_vrouter:
-        cli = clicopy
-        cli += 'switch ' + non_cluster_leaf
-        cli += ' vrouter-interface-add vrouter-name ' + vrouter_name
-        cli += ' vlan ' + vlan_id
-        cli += ' ip ' + ip_gateway
-        run_cli(module, cli)
-        CHANGED_FLAG.append(True)
-        return ' %s: Added vrouter interface with ip %s on %s \n' % (
-            non_cluster_leaf, ip_gateway, vrouter_name
-        )
-
-    else:
-        return ' %s: Vrouter interface %s already exists on %s \n' % (
-            non_cluster_leaf, ip_gateway, vrouter_name
-        )
+    if reconciler.want('vrouter-interface', non_cluster_leaf, [
+            ('vrouter-name', vrouter_name), ('vlan', vlan_id),
+            ('ip', ip_gateway)
+    ], message=' %s: Added vrouter interface with ip %s on %s \n' % (
+            non_cluster_leaf, ip_gateway, vrouter_name)):
+        return ''
+    return ' %s: Vrouter interface %s already exists on %s \n' % (
+        non_cluster_leaf, ip_gateway, vrouter_name
+    )
 
 
-def configure_vrrp_for_clustered_switches(module, vrrp_id, vrrp_ip,
-                                          active_switch, vlan_id, switch_list):
+def configure_vrrp_for_clustered_switches(snapshot, reconciler, vrrp_id,
+                                          vrrp_ip, active_switch, vlan_id,
+                                          switch_list):
     """
     Method to configure vrrp interfaces for clustered leaf switches.
-    :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param vrrp_id: The vrrp_id to be assigned.
     :param vrrp_ip: The vrrp_ip to be assigned.
     :param active_switch: The name of the active switch.
@@ -417,92 +350,124 @@ def configure_vrrp_for_clustered_switches(module, vrrp_id, vrrp_ip,
     name = node1 + '-to-' + node2 + '-cluster'
     host_count = 1
 
-    output = create_cluster(module, node2, name, node1, node2)
-    output += create_vlan(module, vlan_id, node2)
+    output = create_cluster(reconciler, node2, name, node1, node2)
+    output += create_vlan(reconciler, vlan_id, node2)
 
-    vnet_name = get_global_vnet_name(module)
+    vnet_name = get_global_vnet_name(snapshot)
 
     for switch in switch_list:
-        output += create_vrouter(module, switch, vrrp_id, vnet_name)
+        output += create_vrouter(snapshot, reconciler, switch, vrrp_id,
+                                 vnet_name)
 
     for switch in switch_list:
         host_count += 1
         vrrp_priority = '110' if switch == active_switch else '100'
-        output += create_vrouter_interface(module, switch, vrrp_ip, vlan_id,
-                                           vrrp_id, str(host_count),
-                                           vrrp_priority)
+        output += create_vrouter_interface(snapshot, reconciler, switch,
+                                           vrrp_ip, vlan_id, vrrp_id,
+                                           str(host_count), vrrp_priority)
 
     return output
 
 
-def configure_vrrp_for_non_clustered_switches(module, vlan_id, ip,
-                                              non_cluster_leaf):
+def configure_vrrp_for_non_clustered_switches(snapshot, reconciler, vlan_id,
+                                              ip, non_cluster_leaf):
     """
     Method to configure VRRP for non clustered leafs.
-    :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param reconciler: The Reconciler of the fabric.
     :param vlan_id: vlan id to be assigned.
     :param ip: Ip address to be assigned.
     :param non_cluster_leaf: Name of non-clustered leaf switch.
     :return: Output string of configuration.
     """
-    vnet_name = get_global_vnet_name(module)
-    output = create_vrouter_without_vrrp(module, non_cluster_leaf, vnet_name)
-    output += create_vlan(module, vlan_id, non_cluster_leaf)
-    output += configure_vrrp_for_non_cluster_leafs(module, ip,
+    vnet_name = get_global_vnet_name(snapshot)
+    output = create_vrouter_without_vrrp(snapshot, reconciler,
+                                         non_cluster_leaf, vnet_name)
+    output += create_vlan(reconciler, vlan_id, non_cluster_leaf)
+    output += configure_vrrp_for_non_cluster_leafs(snapshot, reconciler, ip,
                                                    non_cluster_leaf, vlan_id)
     return output
 
 
-def configure_vrrp(module, csv_data):
+def plan_vrrp(module, snapshot, rows):
     """
-    Method to configure VRRP L3.
+    Method to plan VRRP L3. The whole csv is declared against one snapshot
+    of the fabric, and only the missing or changed objects get planned.
     :param module: The Ansible module to fetch input parameters.
-    :param csv_data: String containing vrrp data passed from csv file.
-    :return: Output string of configuration.
+    :param snapshot: The FabricSnapshot of the fabric.
+    :param rows: The VrrpRow rows of the csv file.
+    :return: Tuple of (string describing what is configured already, plan).
     """
     output = ''
-    vnet_name = get_global_vnet_name(module)
+    reconciler = Reconciler(snapshot)
+
+    vnet_name = get_global_vnet_name(snapshot)
     for switch in module.params['pn_spine_list']:
-        output += create_vrouter_without_vrrp(module, switch, vnet_name)
-
-    csv_data = csv_data.replace(" ", "")
-    csv_data_list = csv_data.split('\n')
-    # Parse csv file data and configure VRRP.
-    for row in csv_data_list:
-        elements = row.split(',')
-        switch_list = []
-        vlan_id = elements[0]
-        vrrp_ip = elements[1]
-        leaf_switch_1 = str(elements[2])
-        if len(elements) > 5:
-            leaf_switch_2 = str(elements[3])
-            vrrp_id = elements[4]
-            active_switch = str(elements[5])
-            switch_list.append(leaf_switch_1)
-            switch_list.append(leaf_switch_2)
-            output += configure_vrrp_for_clustered_switches(module, vrrp_id,
-                                                            vrrp_ip,
-                                                            active_switch,
-                                                            vlan_id,
+        output += create_vrouter_without_vrrp(snapshot, reconciler, switch,
+                                              vnet_name)
+
+    # Configure VRRP for the rows of the csv file.
+    for row in rows:
+        if row.clustered():
+            switch_list = list(row.switches())
+            output += configure_vrrp_for_clustered_switches(snapshot,
+                                                            reconciler,
+                                                            row.vrrp_id,
+                                                            row.ip,
+                                                            row.active_switch,
+                                                            row.vlan,
                                                             switch_list)
 
         else:
-            output += configure_vrrp_for_non_clustered_switches(module, vlan_id,
-                                                                vrrp_ip,
-                                                                leaf_switch_1)
+            output += configure_vrrp_for_non_clustered_switches(snapshot,
+                                                                reconciler,
+                                                                row.vlan,
+                                                                row.ip,
+                                                                row.switch1)
+
+    return output, reconciler.plan()
+
+
+def configure_vrrp(module, csv_data):
+    """
+    Method to configure VRRP L3, as planned now or by an earlier check mode
+    run.
+    :param module: The Ansible module to fetch input parameters.
+    :param csv_data: String containing vrrp data passed from csv file.
+    :return: Output string of configuration.
+    """
+    global CHANGED_FLAG
+    output = ''
+    # Validate the whole csv before running any command.
+    rows = parse_csv(module, csv_data, VrrpRow)
+    cli = pn_cli(module)
+    saved = saved_plans(module, cli, SNAPSHOT_TABLES)
+    if saved is None:
+        snapshot = FabricSnapshot(module, cli, SNAPSHOT_TABLES)
+        output, plan = plan_vrrp(module, snapshot, rows)
+        plans = [plan]
+    else:
+        snapshot, plans = saved
+
+    for plan in plans:
+        if plan:
+            output += apply_plan(module, cli, snapshot, plan)
+            CHANGED_FLAG.append(True)
+
+    if module.check_mode:
+        # Check mode stops at the plan, saved for a later run to apply.
+        save_plans(module, snapshot)
 
     return output
 
 
-def get_global_vnet_name(module):
+def get_global_vnet_name(snapshot):
     """
     Method to get global vnet name, required for vrouters creation.
-    :param module: The Ansible module to fetch input parameters.
+    :param snapshot: The FabricSnapshot of the fabric.
     :return: Global vnet name.
     """
-    cli = pn_cli(module)
-    cli += ' fabric-node-show format fab-name no-show-headers '
-    fabric_name = list(set(run_cli(module, cli).split()))[0]
+    fabric_name = snapshot.rows['fabric-node-show'][0].fab_name
     return str(fabric_name) + '-global'
 
 
@@ -515,7 +480,9 @@ def main():
             pn_spine_list=dict(required=False, type='list'),
             pn_leaf_list=dict(required=False, type='list'),
             pn_csv_data=dict(required=True, type='str'),
-        )
+            pn_plan_file=dict(required=False, type='str'),
+        ),
+        supports_check_mode=True
     )
 
     global CHANGED_FLAG
@@ -0,0 +1,474 @@
+""" Integer based IP address planning for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import binascii
+import socket
+
+from ansible.module_utils.pn_parsable import show
+
+# Ip version -> (address bits, socket address family).
+FAMILIES = {4: (32, socket.AF_INET), 6: (128, socket.AF_INET6)}
+
+
+def parse_address(address):
+    """
+    Method to turn an IPv4 or IPv6 address into an integer.
+    :param address: The address, optionally followed by '/<prefix length>'.
+    :return: Tuple of (integer, ip version).
+    """
+    address = str(address).strip().split('/')[0]
+    version = 6 if ':' in address else 4
+    try:
+        packed = socket.inet_pton(FAMILIES[version][1], address)
+    except (socket.error, ValueError):
+        raise ValueError('invalid ip address %s' % address)
+
+    return int(binascii.hexlify(packed), 16), version
+
+
+def format_address(value, version):
+    """
+    Method to turn an integer back into an address string.
+    :param value: The address as an integer.
+    :param version: Its ip version, 4 or 6.
+    :return: The address, e.g. '10.20.0.1' or 'fd00::1'.
+    """
+    bits, family = FAMILIES[version]
+    packed = binascii.unhexlify('%0*x' % (bits // 4, value))
+    return socket.inet_ntop(family, packed)
+
+
+class LinkSubnetAllocator(object):
+    """
+    Allocator of point-to-point link subnets carved out of a base prefix.
+    Link subnets are numbered from the one holding the base address, so
+    handing out the next one, reserving and releasing one take constant
+    time and nothing is computed up front, whatever the size of the prefix.
+    /31 (and IPv6 /127) links use both of their addresses, longer subnets
+    their first two host addresses.
+    """
+
+    def __init__(self, address, prefix_len, link_prefix_len):
+        """
+        :param address: Address within the base prefix, allocation starts at
+        the link subnet holding it, e.g. '10.20.0.0' or 'fd00::'.
+        :param prefix_len: Prefix length of the base prefix, e.g. 16.
+        :param link_prefix_len: Prefix length of the links, e.g. 30, 31 or
+        127.
+        """
+        value, self.version = parse_address(address)
+        bits = FAMILIES[self.version][0]
+        prefix_len = int(prefix_len)
+        self.link_prefix_len = int(link_prefix_len)
+        if not 0 <= prefix_len <= self.link_prefix_len < bits:
+            raise ValueError('/%s links do not fit in a /%s prefix' % (
+                self.link_prefix_len, prefix_len))
+
+        self.size = 1 << (bits - self.link_prefix_len)
+        self.host_offset = 0 if self.size == 2 else 1
+        self.first = value - value % self.size
+        end = value - value % (1 << (bits - prefix_len))
+        end += 1 << (bits - prefix_len)
+        self.count = (end - self.first) // self.size
+
+        # Links below next_index were handed out, except the released ones
+        # (a stack plus a set, entries reserved again are skipped lazily).
+        # Links from next_index on are free, except the reserved ones.
+        self.next_index = 0
+        self.released = []
+        self.free = set()
+        self.reserved = set()
+
+    def index(self, address):
+        """
+        Method to find the link subnet an address belongs to.
+        :param address: The address, optionally with a prefix length.
+        :return: Index of the link subnet, or None outside of the prefix.
+        """
+        value, version = parse_address(address)
+        if version != self.version or value < self.first:
+            return None
+        index = (value - self.first) // self.size
+        return index if index < self.count else None
+
+    def link(self, index):
+        """
+        Method to compute the two addresses of a link subnet.
+        :param index: Index of the link subnet.
+        :return: Tuple of the two addresses with the link prefix length,
+        e.g. ('10.20.0.1/30', '10.20.0.2/30').
+        """
+        host = self.first + index * self.size + self.host_offset
+        return tuple('%s/%d' % (format_address(value, self.version),
+                                self.link_prefix_len)
+                     for value in (host, host + 1))
+
+    def available(self):
+        """
+        :return: Number of link subnets left to allocate.
+        """
+        return (self.count - self.next_index - len(self.reserved) +
+                len(self.free))
+
+    def allocate(self):
+        """
+        Method to hand out the lowest never used link subnet, or the most
+        recently released one.
+        :return: Tuple of the two addresses of the link, see link().
+        """
+        while self.released:
+            index = self.released.pop()
+            if index in self.free:
+                self.free.discard(index)
+                return self.link(index)
+
+        while self.next_index in self.reserved:
+            self.reserved.discard(self.next_index)
+            self.next_index += 1
+        if self.next_index >= self.count:
+            raise ValueError('no /%d link subnet left' % self.link_prefix_len)
+
+        self.next_index += 1
+        return self.link(self.next_index - 1)
+
+    def links(self):
+        """
+        Generator allocating link subnets until none is left.
+        """
+        while self.available():
+            yield self.allocate()
+
+    def reserve(self, address):
+        """
+        Method to mark the link subnet of an address as used, e.g. for links
+        configured by an earlier run.
+        :param address: Any address of the link subnet.
+        :return: True if the link subnet was free, False otherwise.
+        """
+        index = self.index(address)
+        if index is None:
+            return False
+        if index >= self.next_index:
+            if index in self.reserved:
+                return False
+            self.reserved.add(index)
+            return True
+        if index in self.free:
+            self.free.discard(index)
+            return True
+        return False
+
+    def release(self, address):
+        """
+        Method to return the link subnet of an address to the allocator.
+        :param address: Any address of the link subnet.
+        :return: True if the link subnet was in use, False otherwise.
+        """
+        index = self.index(address)
+        if index is None:
+            return False
+        if index >= self.next_index:
+            if index not in self.reserved:
+                return False
+            self.reserved.discard(index)
+            return True
+        if index in self.free:
+            return False
+        self.free.add(index)
+        self.released.append(index)
+        return True
+
+
+class AddressLedger(object):
+    """
+    Ledger of the addresses of a subnet handed out to switches, e.g. their
+    in-band ips. The address of a switch is computed from a fixed slot, e.g.
+    its position in the switch lists of the playbook, so every switch can
+    take its address at the same time as the others without coordinating.
+    Addresses already in use are recorded with their owner and looked up in
+    constant time, so a collision is reported instead of duplicated.
+    """
+
+    def __init__(self, subnet, stride=1, offset=0, prefix_len=None):
+        """
+        :param subnet: The subnet, e.g. '172.16.0.0/24'.
+        :param stride: Number of addresses between two consecutive slots.
+        :param offset: Offset of the address of slot 0 from the network
+        address.
+        :param prefix_len: Prefix length the addresses are assigned with,
+        defaults to the one of the subnet.
+        """
+        value, self.version = parse_address(subnet)
+        bits = FAMILIES[self.version][0]
+        subnet = str(subnet).strip()
+        length = int(subnet.split('/')[1]) if '/' in subnet else bits
+        if not 0 <= length <= bits:
+            raise ValueError('invalid subnet %s' % subnet)
+
+        self.size = 1 << (bits - length)
+        self.network = value - value % self.size
+        self.stride = int(stride)
+        self.offset = int(offset)
+        self.prefix_len = int(prefix_len or length)
+        self.owners = {}
+
+    def slot_value(self, slot):
+        """
+        :return: The address of a slot as an integer.
+        """
+        host = self.offset + int(slot) * self.stride
+        if not 0 <= host < self.size:
+            raise ValueError('slot %s is outside of the subnet' % slot)
+        return self.network + host
+
+    def host(self, slot):
+        """
+        Method to compute the address of a slot.
+        :param slot: The slot number.
+        :return: The address, e.g. '172.16.0.3'.
+        """
+        return format_address(self.slot_value(slot), self.version)
+
+    def address(self, slot):
+        """
+        Method to compute the address of a slot.
+        :param slot: The slot number.
+        :return: The address with its prefix length, e.g. '172.16.0.3/24'.
+        """
+        return '%s/%d' % (self.host(slot), self.prefix_len)
+
+    def contains(self, address):
+        """
+        :return: True if the address is part of the subnet.
+        """
+        value, version = parse_address(address)
+        return (version == self.version and
+                self.network <= value < self.network + self.size)
+
+    def record(self, owner, address):
+        """
+        Method to record an address as used.
+        :param owner: Name of the switch using it.
+        :param address: The address, optionally with a prefix length.
+        """
+        self.owners[parse_address(address)[0]] = owner
+
+    def owner(self, address):
+        """
+        :return: Name of the switch using an address, or None.
+        """
+        return self.owners.get(parse_address(address)[0])
+
+    def assign(self, owner, slot):
+        """
+        Method to take the address of a slot.
+        :param owner: Name of the switch taking it.
+        :param slot: The slot number of the switch.
+        :return: The address with its prefix length.
+        """
+        address = self.address(slot)
+        current = self.owners.get(self.slot_value(slot))
+        if current not in (None, owner):
+            raise ValueError('%s is already used by %s' % (address, current))
+        self.record(owner, address)
+        return address
+
+    def first_free(self, start=1):
+        """
+        Method to find the lowest slot whose address is not used.
+        :param start: The first slot to consider.
+        :return: The slot number.
+        """
+        slot = start
+        while self.slot_value(slot) in self.owners:
+            slot += 1
+        return slot
+
+
+class LoopbackPlan(object):
+    """
+    Assignment of one loopback ip, also used as router-id, to every vrouter
+    of the fabric, computed at once from the loopbacks the vrouters already
+    have. A vrouter keeps the loopback it has in the prefix, the others
+    take the lowest free hosts of the prefix in the order given, so the
+    prefix can be of any size and re-runs change nothing.
+    """
+
+    def __init__(self, vrouter_names, loopbacks, prefix=None):
+        """
+        :param vrouter_names: Names of the vrouters, in assignment order.
+        :param loopbacks: Dict mapping vrouter name to the list of its
+        loopback ips, e.g. FabricSnapshot.loopbacks.
+        :param prefix: The loopback prefix, e.g. '109.109.109.0/24'. Without
+        it only the existing loopbacks are mapped.
+        """
+        self.ips = {}
+        # Vrouters which still need their loopback to be added, in order,
+        # and vrouters left without one because the prefix is exhausted.
+        self.missing = []
+        self.unassigned = []
+
+        ledger = AddressLedger(prefix) if prefix else None
+        for vrouter in vrouter_names:
+            for ip in loopbacks.get(vrouter, []):
+                ip = ip.split('/')[0]
+                if ledger is None:
+                    self.ips[vrouter] = ip
+                    break
+                if ledger.contains(ip) and ledger.owner(ip) is None:
+                    ledger.record(vrouter, ip)
+                    self.ips[vrouter] = ip
+                    break
+
+        if ledger is None:
+            self.unassigned = [vrouter for vrouter in vrouter_names
+                               if vrouter not in self.ips]
+            return
+
+        slot = 1
+        for vrouter in vrouter_names:
+            if vrouter in self.ips:
+                continue
+            try:
+                slot = ledger.first_free(slot)
+            except ValueError:
+                self.unassigned.append(vrouter)
+                continue
+            self.ips[vrouter] = ledger.host(slot)
+            ledger.record(vrouter, self.ips[vrouter])
+            self.missing.append(vrouter)
+
+
+def loopback_plan(module, vrouter_names, loopbacks, prefix=None):
+    """
+    Method to compute the LoopbackPlan of the fabric.
+    :param module: The Ansible module, exited if the prefix is invalid.
+    :param vrouter_names: Names of the vrouters, in assignment order.
+    :param loopbacks: Dict mapping vrouter name to its loopback ips.
+    :param prefix: The loopback prefix.
+    :return: The LoopbackPlan.
+    """
+    try:
+        return LoopbackPlan(vrouter_names, loopbacks, prefix)
+    except (IndexError, TypeError, ValueError) as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=str(error),
+            msg='Operation Failed: invalid loopback prefix %s' % prefix,
+            changed=False
+        )
+
+
+def fabric_inband_ledger(module, cli, subnet, stride=1, offset=0,
+                         prefix_len=None):
+    """
+    Method to build the ledger of the in-band ips used in the fabric.
+    :param module: The Ansible module, exited if the subnet is invalid or
+    the fabric-node-show fails.
+    :param cli: The cli prefix returned by pn_cli().
+    :param subnet: The in-band subnet, see AddressLedger.
+    :param stride: Number of addresses between two consecutive slots.
+    :param offset: Offset of the address of slot 0 from the network address.
+    :param prefix_len: Prefix length the addresses are assigned with.
+    :return: The AddressLedger.
+    """
+    try:
+        ledger = AddressLedger(subnet, stride, offset, prefix_len)
+    except (IndexError, TypeError, ValueError) as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=str(error),
+            msg='Operation Failed: invalid in-band subnet %s' % subnet,
+            changed=False
+        )
+
+    # An unreadable fabric-node-show fails the module rather than leaving
+    # every in-band ip of the fabric looking free.
+    for row in show(module, cli, 'fabric-node-show', ('name', 'in-band-ip')):
+        try:
+            ledger.record(row.name, row.in_band_ip)
+        except ValueError:
+            # Switches without an in-band ip.
+            continue
+
+    return ledger
+
+
+def assign_address(module, ledger, owner, slot):
+    """
+    Method to take the address of a slot from a ledger.
+    :param module: The Ansible module, exited on a collision.
+    :param ledger: The AddressLedger.
+    :param owner: Name of the switch taking the address.
+    :param slot: The slot number of the switch.
+    :return: The address with its prefix length.
+    """
+    try:
+        return ledger.assign(owner, slot)
+    except ValueError as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=str(error),
+            msg='Operation Failed: could not assign an address to %s' % owner,
+            changed=False
+        )
+
+
+def link_allocator(module, address, prefix_len, link_prefix_len):
+    """
+    Method to create a LinkSubnetAllocator from module parameters.
+    :param module: The Ansible module, exited if the parameters are invalid.
+    :param address: Address within the base prefix.
+    :param prefix_len: Prefix length of the base prefix.
+    :param link_prefix_len: Prefix length of the links.
+    :return: The LinkSubnetAllocator.
+    """
+    try:
+        return LinkSubnetAllocator(address, prefix_len, link_prefix_len)
+    except (TypeError, ValueError) as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=str(error),
+            msg='Operation Failed: invalid link addressing %s/%s, /%s links'
+                % (address, prefix_len, link_prefix_len),
+            changed=False
+        )
+
+
+def allocate_link(module, allocator):
+    """
+    Method to allocate the next link subnet.
+    :param module: The Ansible module, exited if no link subnet is left.
+    :param allocator: The LinkSubnetAllocator.
+    :return: Tuple of the two addresses of the link.
+    """
+    try:
+        return allocator.allocate()
+    except ValueError as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=str(error),
+            msg='Operation Failed: not enough link ips, use a larger prefix',
+            changed=False
+        )
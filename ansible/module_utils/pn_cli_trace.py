@@ -0,0 +1,263 @@
+""" Opt-in per command instrumentation of the Netvisor cli transport """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import atexit
+import json
+import math
+import os
+import threading
+import time
+
+# Environment variables enabling the instrumentation, normally set with the
+# 'environment' keyword of a play or task. PN_CLI_TRACE is '1' to add the
+# aggregated cli_stats to the module result and 'full' to add every
+# recorded command as cli_trace as well. PN_CLI_TRACE_FILE names a file the
+# trace is written to as json lines, on the host the module runs on.
+TRACE_ENV = 'PN_CLI_TRACE'
+TRACE_FILE_ENV = 'PN_CLI_TRACE_FILE'
+
+# Number of commands listed in cli_stats['slowest'].
+SLOWEST_COUNT = 10
+
+# Time the module process started, close enough: module_utils are imported
+# before the module does anything else.
+_START = time.time()
+
+_TRACER = None
+_TRACER_LOCK = threading.Lock()
+
+
+def command_target(args):
+    """
+    Method to find the command name and the switch a cli command runs on.
+    :param args: The command arguments (without the cli path/options).
+    :return: Tuple of (command name, switch name or '' for the local switch).
+    """
+    switch = ''
+    index = 0
+    while index < len(args):
+        if args[index] == 'switch' and index + 1 < len(args):
+            switch = args[index + 1]
+            index += 2
+        elif args[index] == 'switch-local':
+            index += 1
+        else:
+            return args[index], switch
+
+    return '', switch
+
+
+def percentile(values, fraction):
+    """
+    Method to compute a nearest-rank percentile.
+    :param values: Sorted list of numbers.
+    :param fraction: The percentile as a fraction, e.g. 0.95.
+    :return: The percentile, 0 for an empty list.
+    """
+    if not values:
+        return 0
+    rank = int(math.ceil(fraction * len(values))) - 1
+    return values[min(max(rank, 0), len(values) - 1)]
+
+
+def busy_time(records):
+    """
+    Method to compute the time at least one command was running, commands
+    running at the same time on different threads counted once.
+    :param records: The recorded commands, see CliTracer.record().
+    :return: The length of the union of their [start, start + latency]
+    intervals, in seconds.
+    """
+    total = 0.0
+    end = None
+    for start, latency in sorted((record['start'], record['latency'])
+                                 for record in records):
+        if end is None or start > end:
+            total += latency
+            end = start + latency
+        elif start + latency > end:
+            total += start + latency - end
+            end = start + latency
+    return total
+
+
+class CliTracer(object):
+    """
+    Recorder of every command sent through pn_run_command(). Aggregated
+    statistics are added to the result of the module on exit_json() and
+    fail_json().
+    """
+
+    def __init__(self, mode, path=None):
+        """
+        :param mode: '1' for the aggregated statistics only, 'full' to
+        return every recorded command as well.
+        :param path: Optional file the trace is written to.
+        """
+        self.full = mode == 'full'
+        self.path = path
+        self.records = []
+        self.plans = []
+        self.lock = threading.Lock()
+        self.written = False
+        self.modules = []
+
+    def attach(self, module):
+        """
+        Method to make exit_json()/fail_json() of a module report the
+        statistics. Attaching a module twice has no effect.
+        :param module: The Ansible module.
+        """
+        if any(known is module for known in self.modules):
+            return
+        self.modules.append(module)
+        for name in ('exit_json', 'fail_json'):
+            setattr(module, name, self._wrap(getattr(module, name)))
+
+    def _wrap(self, method):
+        def report(**kwargs):
+            kwargs['cli_stats'] = self.stats()
+            if self.full:
+                kwargs['cli_trace'] = self.trace()
+            self.write()
+            return method(**kwargs)
+        return report
+
+    def record(self, args, start, end, rc, out, err):
+        """
+        Method to record one command.
+        :param args: The command arguments (without the cli path/options).
+        :param start: Time the command was sent.
+        :param end: Time its output was complete.
+        :param rc: Exit status of the command.
+        :param out: Its stdout.
+        :param err: Its stderr.
+        """
+        verb, switch = command_target(args)
+        record = {
+            'verb': verb,
+            'switch': switch,
+            'start': round(start - _START, 6),
+            'latency': round(end - start, 6),
+            'bytes': len(out or '') + len(err or ''),
+            'rc': rc,
+            'thread': threading.current_thread().name,
+        }
+        with self.lock:
+            self.records.append(record)
+
+    def record_plan(self, plan):
+        """
+        Method to record the statistics of one executed plan, see
+        pn_reconcile.apply_plan().
+        :param plan: Dict of the plan statistics.
+        """
+        with self.lock:
+            self.plans.append(plan)
+
+    def trace(self):
+        """
+        :return: List of the recorded commands, in the order they completed.
+        """
+        with self.lock:
+            return list(self.records)
+
+    def stats(self):
+        """
+        Method to aggregate the recorded commands.
+        :return: Dict with the time at least one command was running
+        (cli_time) against the time spent in python alone, the summed
+        latency of the commands (cli_busy_time, above cli_time when commands
+        ran in parallel), count and p50/p95/max latency per verb and the
+        slowest commands. 'started' is the epoch time the 'start' offsets of
+        the recorded commands are relative to. 'plans' lists the statistics
+        of the executed plans, e.g. their critical path.
+        """
+        records = self.trace()
+        wall_time = time.time() - _START
+        cli_time = busy_time(records)
+        cli_busy_time = sum(record['latency'] for record in records)
+
+        latencies = {}
+        for record in records:
+            latencies.setdefault(record['verb'], []).append(record['latency'])
+        verbs = {}
+        for verb, values in latencies.items():
+            values.sort()
+            verbs[verb] = {
+                'count': len(values),
+                'total': round(sum(values), 6),
+                'p50': percentile(values, 0.5),
+                'p95': percentile(values, 0.95),
+                'max': values[-1],
+            }
+
+        slowest = sorted(records, key=lambda record: record['latency'],
+                         reverse=True)[:SLOWEST_COUNT]
+        return {
+            'started': _START,
+            'commands': len(records),
+            'failed_commands': len([r for r in records if r['rc']]),
+            'bytes': sum(record['bytes'] for record in records),
+            'wall_time': round(wall_time, 6),
+            'cli_time': round(cli_time, 6),
+            'cli_busy_time': round(cli_busy_time, 6),
+            'python_time': round(max(wall_time - cli_time, 0), 6),
+            'verbs': verbs,
+            'slowest': slowest,
+            'plans': list(self.plans),
+        }
+
+    def write(self):
+        """
+        Method to write the trace to the trace file, once.
+        """
+        if not self.path or self.written:
+            return
+        self.written = True
+        try:
+            with open(self.path, 'a') as trace_file:
+                for record in self.trace():
+                    trace_file.write(json.dumps(record, sort_keys=True))
+                    trace_file.write('\n')
+        except (IOError, OSError):
+            pass
+
+
+def get_tracer(module):
+    """
+    Method to fetch the tracer of this process, creating it on first use
+    when the instrumentation is enabled.
+    :param module: The Ansible module whose result reports the statistics.
+    :return: The CliTracer, or None if tracing is disabled.
+    """
+    global _TRACER
+    mode = os.environ.get(TRACE_ENV, '')
+    path = os.environ.get(TRACE_FILE_ENV)
+    if mode in ('', '0') and not path:
+        return None
+
+    with _TRACER_LOCK:
+        if _TRACER is None:
+            _TRACER = CliTracer(mode, path)
+            # Keep the trace of modules dying before exit_json().
+            atexit.register(_TRACER.write)
+        _TRACER.attach(module)
+
+    return _TRACER
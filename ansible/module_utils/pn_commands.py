@@ -0,0 +1,247 @@
+""" Commands file parsing and execution for the pn_run_cli_commands modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import itertools
+import re
+import time
+
+from ansible.module_utils.pn_fanout import run_graph
+
+# Section headers of a commands file: '[ALL]', '[fabric]',
+# '[switch leaf1, leaf2]' and '[vars leaf1, leaf2]'.
+SECTION = re.compile(r'\[(ALL|fabric|switch|vars)([^\]]*)')
+
+# Fields of a command: '{100..3999}' or '{100..3999..2}' ranges, and
+# '{name}' variables.
+FIELD = re.compile(r'\{(?:(-?\d+)\.\.(-?\d+)(?:\.\.(-?\d+))?|'
+                   r'([A-Za-z_][\w-]*))\}')
+
+# Targets of the commands of a section, other than a tuple of switches.
+ALL = 'ALL'
+FABRIC = None
+
+
+def _switches(header):
+    """
+    :param header: The text after the section name, e.g. ' leaf1, leaf2'.
+    :return: Tuple of the switch names.
+    """
+    return tuple(switch.replace(' ', '') for switch in
+                 header.strip().split(','))
+
+
+def parse_commands(commands_data, variables=None):
+    """
+    Method to parse a commands file in one pass. Commands of an [ALL]
+    section run on every switch of the fabric, commands of a [fabric]
+    section run once, fabric wide, and commands of a [switch ...] section
+    run on the switches listed in the header. 'name = value' lines of a
+    [vars ...] section set variables of the switches listed in the header,
+    or of every switch for a bare [vars]. Lines before the first section,
+    e.g. comments, and empty lines are skipped. Commands are returned as
+    written, see expand_command().
+    :param commands_data: The content of the commands file.
+    :param variables: Optional dict filled with the variables, mapping the
+    switch name, or None for every switch, to a dict of name and value.
+    :return: Generator of (target, command), target being ALL, FABRIC or a
+    tuple of switch names, in file order.
+    """
+    target = None
+    section = None
+    for line in commands_data.split('\n'):
+        header = SECTION.match(line)
+        if header is not None:
+            section = header.group(1)
+            if section == 'ALL':
+                target = ALL
+            elif section == 'fabric':
+                target = FABRIC
+            elif header.group(2).strip():
+                target = _switches(header.group(2))
+            else:
+                target = (None,)
+        elif section == 'vars':
+            name, separator, value = line.partition('=')
+            if separator and variables is not None:
+                for switch in target:
+                    variables.setdefault(switch, {})[name.strip()] = \
+                        value.strip()
+        elif section is not None and line != '':
+            yield target, line
+
+
+def switch_variables(variables, switch):
+    """
+    :param variables: The variables filled by parse_commands().
+    :param switch: Name of the switch, None for fabric wide commands.
+    :return: Dict of the variables of the switch, including 'switch'.
+    """
+    values = dict(variables.get(None, {}))
+    if switch is not None:
+        values.update(variables.get(switch, {}))
+        values['switch'] = switch
+    return values
+
+
+def _range(first, last, step):
+    """
+    :return: Generator of the numbers of an inclusive '{first..last..step}'
+    range, counting down if last is lower than first.
+    """
+    first, last = int(first), int(last)
+    step = abs(int(step or 1)) or 1
+    if last < first:
+        step = -step
+    number = first
+    while (number <= last) if step > 0 else (number >= last):
+        yield str(number)
+        number += step
+
+
+def expand_command(command, variables):
+    """
+    Method to expand the fields of a command. Variables are replaced by
+    their value, unknown ones are left as written. A command with one range
+    is expanded lazily, e.g. 'vlan-create id {100..3999} scope local'
+    yields its 3900 vlan-create commands one at a time. A command with
+    several ranges expands to every combination, the last range varying
+    fastest; the values of its ranges are read up front, the combinations
+    are still yielded one at a time.
+    :param command: The command, as returned by parse_commands().
+    :param variables: Dict of variable name and value, see
+    switch_variables().
+    :return: Generator of the commands to run.
+    """
+    pieces = FIELD.split(command)
+    if len(pieces) == 1:
+        yield command
+        return
+
+    # split() returns the text around the fields, then the four groups of
+    # every field. texts holds the text before, between and after the
+    # ranges, variables expanded.
+    texts = [pieces[0]]
+    ranges = []
+    for index in range(1, len(pieces), 5):
+        first, last, step, name = pieces[index:index + 4]
+        if name is not None:
+            texts[-1] += variables.get(name, '{%s}' % name)
+        else:
+            ranges.append(_range(first, last, step))
+            texts.append('')
+        texts[-1] += pieces[index + 4]
+
+    if not ranges:
+        yield texts[0]
+    elif len(ranges) == 1:
+        for value in ranges[0]:
+            yield texts[0] + value + texts[1]
+    else:
+        for values in itertools.product(*ranges):
+            yield texts[0] + ''.join(value + text for value, text in
+                                     zip(values, texts[1:]))
+
+
+def command_plan(commands, switch_list):
+    """
+    Method to turn parsed commands into a plan for pn_fanout.run_graph().
+    The commands of one switch keep their file order, commands of different
+    switches do not wait for each other, and a fabric wide command waits
+    for everything before it and holds up everything after it.
+    :param commands: The (target, command) pairs from parse_commands().
+    :param switch_list: Function returning the names of the switches of the
+    fabric, called once, for the first [ALL] section.
+    :return: Tuple of (items, parents). items is the list of (switch,
+    command), switch being None for fabric wide commands, in the order the
+    commands run sequentially; parents lists the indexes of the items each
+    item waits for.
+    """
+    items = []
+    parents = []
+    fabric_switches = None
+    last = {}
+    barrier = None
+    for target, command in commands:
+        if target is FABRIC:
+            depends = set(last.values())
+            if barrier is not None:
+                depends.add(barrier)
+            barrier = len(items)
+            last = {}
+            items.append((None, command))
+            parents.append(sorted(depends))
+            continue
+
+        if target == ALL:
+            if fabric_switches is None:
+                fabric_switches = switch_list()
+            target = fabric_switches
+
+        for switch in target:
+            depends = last.get(switch, barrier)
+            last[switch] = len(items)
+            items.append((switch, command))
+            parents.append([depends] if depends is not None else [])
+
+    return items, parents
+
+
+def execute_commands(module, commands_data, results, cli, run_cli,
+                     message):
+    """
+    Method to execute the cli commands of a commands file. The commands of
+    every switch run in file order, the switches in parallel. Ranges and
+    variables of a command are expanded on the switch it runs on, as it
+    runs, and every command is recorded as soon as it ran.
+    :param module: The Ansible module to fetch input parameters.
+    :param commands_data: Cli commands in the form of string.
+    :param results: The ResultRecorder the commands are recorded with, in
+    file order.
+    :param cli: The cli prefix returned by pn_cli().
+    :param run_cli: Function running a cli string, run_cli(module, cli),
+    returning its output.
+    :param message: Function building the text of a command in stdout,
+    message(switch, cli, output), switch being None for fabric wide
+    commands.
+    """
+    def switch_list():
+        return run_cli(module, cli + ' fabric-node-show format name '
+                       'no-show-headers ').split()
+
+    def run(item):
+        index, (switch, template) = item
+        values = switch_variables(variables, switch)
+        for command in expand_command(template, values):
+            start = time.time()
+            command_cli = cli
+            if switch is not None:
+                command_cli += ' switch %s ' % switch
+            command_cli += str(command)
+            output = run_cli(module, command_cli)
+            verb, separator, arguments = command.strip().partition(' ')
+            results.add(switch, verb, arguments,
+                        message(switch, command_cli, output),
+                        duration=time.time() - start, index=index)
+        results.done(index)
+
+    variables = {}
+    items, parents = command_plan(parse_commands(commands_data, variables),
+                                  switch_list)
+    run_graph(module, run, enumerate(items), parents,
+              [switch for switch, command in items])
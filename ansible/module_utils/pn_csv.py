@@ -0,0 +1,298 @@
+""" Schema validated csv ingestion for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import re
+from collections import OrderedDict
+
+# Columns of the non clustered rows padded out in fabric_over_l3.csv.
+PADDED = 3
+
+IP = re.compile(r'(\d{1,3})\.(\d{1,3})\.(\d{1,3})\.(\d{1,3})(?:/(\d{1,2}))?$')
+
+
+class CsvError(ValueError):
+    """
+    Invalid row of a csv file.
+    """
+
+    def __init__(self, line, message):
+        """
+        :param line: Line number of the row in the file, from 1.
+        :param message: What is wrong with the row.
+        """
+        ValueError.__init__(self, 'row %d: %s' % (line, message))
+        self.line = line
+
+
+def _number(low, high):
+    """
+    :return: Check of a column holding a number from low to high.
+    """
+    def check(value):
+        if not value.isdigit() or not low <= int(value) <= high:
+            return 'expected a number from %d to %d' % (low, high)
+    return check
+
+
+def _ip(prefix):
+    """
+    :param prefix: True if the ip comes with a prefix length.
+    :return: Check of a column holding an ip.
+    """
+    def check(value):
+        match = IP.match(value)
+        if (match is None or (match.group(5) is not None) != prefix or
+                max(int(octet) for octet in match.group(1, 2, 3, 4)) > 255 or
+                (prefix and int(match.group(5)) > 32)):
+            return 'expected an ip%s' % (' with prefix length' if prefix
+                                         else '')
+    return check
+
+
+def _name(value):
+    """
+    Check of a column holding a switch name or a port.
+    """
+    if len(value.split()) != 1:
+        return 'expected a name without spaces'
+
+
+# Column name -> check returning what is wrong with a value, or None.
+CHECKS = {
+    'vlan': _number(1, 4094),
+    'ip': _ip(True),
+    'switch': _name,
+    'switch1': _name,
+    'switch2': _name,
+    'active_switch': _name,
+    'vrrp_id': _number(1, 255),
+    'vxlan': _number(1, 16777215),
+    'loopback_port': _name,
+    'neighbor_name': _name,
+    'neighbor_ip': _ip(False),
+    'remote_as': _number(1, 4294967295),
+    'bgp_as': _number(1, 4294967295),
+}
+
+
+class CsvRow(object):
+    """
+    Base of the typed rows of a csv file. LAYOUTS maps every column count a
+    row class accepts to the names of its columns; the columns of the other
+    layouts are None. Values are kept as the strings of the file, stripped.
+    """
+
+    __slots__ = ('line',)
+    LAYOUTS = {}
+
+    def __init__(self, line, fields):
+        """
+        :param line: Line number of the row in the file, from 1.
+        :param fields: The comma separated fields of the row, stripped.
+        """
+        layout = self.LAYOUTS.get(len(fields))
+        if layout is None:
+            raise CsvError(line, 'expected %s columns, got %d' % (
+                ' or '.join(str(count) for count in sorted(self.LAYOUTS)),
+                len(fields)))
+
+        for name in self._columns():
+            setattr(self, name, None)
+        for column, (name, value) in enumerate(zip(layout, fields)):
+            if value == '':
+                raise CsvError(line, 'column %d (%s) is empty' % (column + 1,
+                                                                  name))
+            error = CHECKS[name](value)
+            if error is not None:
+                raise CsvError(line, "column %d (%s) '%s': %s" % (
+                    column + 1, name, value, error))
+            setattr(self, name, value)
+        self.line = line
+
+    @classmethod
+    def _columns(cls):
+        """
+        :return: Names of the columns of every layout.
+        """
+        return set(name for layout in cls.LAYOUTS.values() for name in layout)
+
+    def switches(self):
+        """
+        :return: Tuple of the names of the switches the row configures.
+        """
+        return ()
+
+
+class VrrpRow(CsvRow):
+    """
+    Row of the l3_auto_setup.csv format: vlan, vrrp ip, switch for non
+    clustered switches, followed by the second cluster node, vrrp id and
+    active switch for clusters.
+    """
+
+    __slots__ = ('vlan', 'ip', 'switch1', 'switch2', 'vrrp_id',
+                 'active_switch')
+    LAYOUTS = {
+        3: ('vlan', 'ip', 'switch1'),
+        6: ('vlan', 'ip', 'switch1', 'switch2', 'vrrp_id', 'active_switch'),
+    }
+
+    def clustered(self):
+        """
+        :return: True if the row configures the two nodes of a cluster.
+        """
+        return self.switch2 is not None
+
+    def switches(self):
+        if self.clustered():
+            return self.switch1, self.switch2
+        return self.switch1,
+
+
+class DciRow(VrrpRow):
+    """
+    Row of the dci.csv format: the l3_auto_setup.csv columns, optionally
+    followed by the vxlan id of the vlan.
+    """
+
+    __slots__ = ('vxlan',)
+    LAYOUTS = {
+        3: VrrpRow.LAYOUTS[3],
+        4: VrrpRow.LAYOUTS[3] + ('vxlan',),
+        6: VrrpRow.LAYOUTS[6],
+        7: VrrpRow.LAYOUTS[6] + ('vxlan',),
+    }
+
+
+class VxlanRow(DciRow):
+    """
+    Row of the pn_vxlan format: the dci.csv columns with the vxlan id,
+    followed by the port of the vxlan loopback trunk.
+    """
+
+    __slots__ = ('loopback_port',)
+    LAYOUTS = {
+        5: DciRow.LAYOUTS[4] + ('loopback_port',),
+        8: DciRow.LAYOUTS[7] + ('loopback_port',),
+    }
+
+
+class VrrpL2Row(CsvRow):
+    """
+    Row of the pn_vrrp_l2.csv format: vrrp ip, vlan, active switch.
+    """
+
+    __slots__ = ('ip', 'vlan', 'active_switch')
+    LAYOUTS = {
+        3: ('ip', 'vlan', 'active_switch'),
+    }
+
+    def switches(self):
+        return self.active_switch,
+
+
+class ThirdPartyRow(CsvRow):
+    """
+    Row of the third_party_dci.csv format: third party switch, neighbor ip,
+    remote as, bgp as of the switch, switch.
+    """
+
+    __slots__ = ('neighbor_name', 'neighbor_ip', 'remote_as', 'bgp_as',
+                 'switch')
+    LAYOUTS = {
+        5: ('neighbor_name', 'neighbor_ip', 'remote_as', 'bgp_as', 'switch'),
+    }
+
+    def switches(self):
+        return self.switch,
+
+
+def _lines(text):
+    """
+    Method to walk the lines of a text without splitting it into a list.
+    :param text: The text.
+    :return: Generator of (line number, line), from 1.
+    """
+    start = 0
+    number = 0
+    while start <= len(text):
+        end = text.find('\n', start)
+        if end < 0:
+            end = len(text)
+        number += 1
+        yield number, text[start:end]
+        start = end + 1
+
+
+def read_rows(csv_data, row_class):
+    """
+    Method to read the rows of a csv, one at a time. Empty lines are
+    skipped, and the fields of every row are stripped. A row whose fields
+    after the third are all empty, and span at least the three cluster
+    columns, is a padded non clustered row of fabric_over_l3.csv, e.g.
+    '104, 101.108.104.0/24, leaf3,, , ,', and reads as three columns. Any
+    other empty field is an error.
+    :param csv_data: The content of the csv file.
+    :param row_class: The CsvRow class of the rows.
+    :return: Generator of the rows. Raises CsvError at the first invalid row.
+    """
+    for number, line in _lines(csv_data):
+        fields = [field.strip() for field in line.split(',')]
+        if not any(fields):
+            continue
+        if (PADDED in row_class.LAYOUTS and len(fields) >= 2 * PADDED and
+                not any(fields[PADDED:])):
+            fields = fields[:PADDED]
+        yield row_class(number, fields)
+
+
+def parse_csv(module, csv_data, row_class):
+    """
+    Method to read and validate every row of a csv up front, before the
+    module runs any cli command. The module fails on the first invalid row,
+    naming its line number.
+    :param module: The Ansible module.
+    :param csv_data: The content of the csv file, None for no rows.
+    :param row_class: The CsvRow class of the rows.
+    :return: List of the rows, in file order.
+    """
+    try:
+        return list(read_rows(csv_data or '', row_class))
+    except CsvError as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            msg='Invalid csv data, %s' % error,
+            changed=False
+        )
+
+
+def group_by_switch(rows):
+    """
+    Method to group rows by the switches they configure. A row configuring
+    two switches is listed under both.
+    :param rows: List of CsvRow.
+    :return: OrderedDict mapping switch name to its rows, switches and rows
+    in file order.
+    """
+    groups = OrderedDict()
+    for row in rows:
+        for switch in row.switches():
+            groups.setdefault(switch, []).append(row)
+    return groups
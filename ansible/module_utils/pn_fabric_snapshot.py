@@ -0,0 +1,435 @@
+""" Fabric wide state snapshot for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import json
+
+from ansible.module_utils.pn_parsable import make_row, show
+from ansible.module_utils.pn_topology import FabricTopology, port_key
+
+# show command -> columns pulled for it, in output order.
+SHOW_COLUMNS = {
+    'fabric-node-show': ('name', 'fab-name', 'in-band-ip', 'state'),
+    'cluster-show': ('name', 'cluster-node-1', 'cluster-node-2'),
+    'vrouter-show': ('name', 'location', 'hw-vrrp-id', 'router-id', 'bgp-as',
+                     'bgp-max-paths', 'bgp-redistribute',
+                     'ospf-redistribute'),
+    'vrouter-interface-show': ('vrouter-name', 'nic', 'ip', 'l3-port',
+                               'vlan'),
+    'vrouter-interface-config-show': ('vrouter-name', 'nic', 'ospf-bfd'),
+    'vrouter-loopback-interface-show': ('vrouter-name', 'ip'),
+    'vrouter-bgp-show': ('vrouter-name', 'neighbor', 'remote-as'),
+    'vrouter-ospf-show': ('vrouter-name', 'network', 'ospf-area'),
+    'port-show': ('switch', 'port', 'hostname', 'rport', 'trunk'),
+    'lldp-show': ('switch', 'local-port', 'sys-name', 'port-id'),
+    'vlan-show': ('switch', 'id', 'scope'),
+    'trunk-show': ('switch', 'name', 'ports'),
+    'vlag-show': ('name', 'switch', 'port', 'peer-switch', 'peer-port'),
+    'tunnel-show': ('switch', 'name', 'local-ip', 'remote-ip'),
+}
+
+# show command -> lowercase parts of the errors the cli reports when the
+# table has no rows, e.g. no vrouter or no cluster is configured yet. Any
+# other error, e.g. an authentication error or nvOSd restarting, fails the
+# module: planning against a table wrongly read as empty would recreate
+# every object of it.
+NO_ROWS = {
+    'cluster-show': ('no clusters',),
+    'vrouter-show': ('no vrouters',),
+    'vrouter-interface-show': ('no vrouters', 'no interfaces'),
+    'vrouter-interface-config-show': ('no vrouters', 'no interfaces'),
+    'vrouter-loopback-interface-show': ('no vrouters',
+                                        'no loopback interfaces'),
+    'vrouter-bgp-show': ('no vrouters', 'bgp is not configured'),
+    'vrouter-ospf-show': ('no vrouters', 'ospf is not configured'),
+    'trunk-show': ('no trunks',),
+    'vlag-show': ('no clusters', 'no vlags'),
+    'tunnel-show': ('no tunnels',),
+}
+
+# Show commands the fabric topology is built from.
+TOPOLOGY_TABLES = ('fabric-node-show', 'port-show', 'lldp-show')
+
+
+class FabricSnapshot(object):
+    """
+    One bulk pull of every show table the fabric wide modules consult,
+    indexed in memory so lookups inside loops cost no cli round trip.
+    """
+
+    def __init__(self, module, cli, tables=None):
+        """
+        :param module: The Ansible module to run the show commands with.
+        :param cli: The cli prefix returned by pn_cli().
+        :param tables: Show commands to pull, defaults to all of them.
+        """
+        self.module = module
+        self.cli = cli
+        self.tables = tuple(tables or sorted(SHOW_COLUMNS))
+        self.rows = {}
+        self.show_count = 0
+        self._topology = None
+        for table in self.tables:
+            self.refresh(table)
+        # Plans made against the snapshot in check mode, see
+        # pn_reconcile.apply_plan().
+        self.plans = []
+        self.fingerprint = self.digest()
+
+    def digest(self):
+        """
+        Method to fingerprint the pulled tables. Row order is ignored, so
+        the fingerprint only changes with the fabric configuration.
+        :return: Hex digest of the rows of every table.
+        """
+        tables = [(table, sorted(list(row) for row in self.rows[table]))
+                  for table in sorted(self.tables)]
+        return hashlib.sha1(json.dumps(tables).encode('utf-8')).hexdigest()
+
+    def refresh(self, command):
+        """
+        Method to re-pull one show table and rebuild its indexes. The
+        module fails if the show reports an error other than its NO_ROWS
+        ones.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        """
+        self.show_count += 1
+        self._rebuild(command, show(self.module, self.cli, command,
+                                    SHOW_COLUMNS[command],
+                                    no_rows=NO_ROWS.get(command, ())))
+
+    def record(self, command, row):
+        """
+        Method to add one row to a table, e.g. to keep the snapshot in sync
+        after the module created the corresponding object.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        :param row: Dict mapping cli column name to value. Missing columns
+        are recorded as empty strings.
+        """
+        self._index(command, make_row(SHOW_COLUMNS[command], row))
+
+    def update(self, command, row, values):
+        """
+        Method to change columns of one row, e.g. after the module modified
+        the corresponding object. The row keeps its place in the table, and
+        only its index entries are updated.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        :param row: The row, as held in rows.
+        :param values: Dict mapping cli column name to the new value. Columns
+        the table does not pull are ignored.
+        """
+        changes = dict((column.replace('-', '_'), str(value))
+                       for column, value in values.items()
+                       if column in SHOW_COLUMNS[command])
+        changed = row._replace(**changes)
+        rows = self.rows[command]
+        rows[rows.index(row)] = changed
+        self._unindex(command, row)
+        self._add_entries(command, changed)
+
+    def remove(self, command, row):
+        """
+        Method to drop one row, e.g. after the module deleted the
+        corresponding object, along with its index entries.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        :param row: The row, as held in rows.
+        """
+        self.rows[command].remove(row)
+        self._unindex(command, row)
+
+    def _rebuild(self, command, rows):
+        """
+        Method to replace the rows of a table and rebuild its indexes.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        :param rows: The rows, as returned by pn_parsable.
+        """
+        self.rows[command] = []
+        self._reset(command)
+        for row in rows:
+            self._index(command, row)
+
+    def _index(self, command, row):
+        """
+        Method to add one parsed row to a table and its indexes.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        :param row: The row, as returned by pn_parsable.
+        """
+        self.rows[command].append(row)
+        self._add_entries(command, row)
+
+    def _add_entries(self, command, row):
+        """
+        Method to add the index entries of one row.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        :param row: The row, as returned by pn_parsable.
+        """
+        if command in TOPOLOGY_TABLES:
+            self._topology = None
+
+        if command == 'vrouter-show':
+            self.vrouter_rows[row.name] = row
+            self.vrouter_by_switch[row.location] = row.name
+            self.switch_by_vrouter[row.name] = row.location
+            self.router_ids[row.name] = row.router_id
+        elif command == 'vrouter-interface-show':
+            vrouter = row.vrouter_name
+            self.interfaces.setdefault(vrouter, []).append(row)
+            if row.l3_port:
+                self.interface_by_port[(vrouter, row.l3_port)] = row
+            self.interface_by_ip[(vrouter, row.ip.split('/')[0])] = row
+        elif command == 'vrouter-loopback-interface-show':
+            self.loopbacks.setdefault(row.vrouter_name, []).append(
+                row.ip)
+        elif command == 'vrouter-bgp-show':
+            self.bgp_neighbors.add(
+                (row.vrouter_name, row.neighbor, row.remote_as))
+        elif command == 'vrouter-ospf-show':
+            self.ospf_networks.add((row.vrouter_name, row.network))
+        elif command == 'cluster-show':
+            nodes = (row.cluster_node_1, row.cluster_node_2)
+            self.clusters[row.name] = nodes
+            for node in nodes:
+                self.cluster_by_node[node] = row.name
+        elif command == 'trunk-show':
+            self.trunks.add((row.switch, row.name))
+        elif command == 'vlag-show':
+            self.vlags.add((row.switch, row.name))
+            self.vlags.add((row.peer_switch, row.name))
+        elif command == 'fabric-node-show':
+            self.nodes[row.name] = row
+
+    def _unindex(self, command, row):
+        """
+        Method to drop the index entries of one row, leaving those of the
+        other rows of the table as they are. Names are unique in a table,
+        e.g. vrouter names, so an entry is only dropped if it is the one of
+        the row.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        :param row: The row, as returned by pn_parsable.
+        """
+        if command in TOPOLOGY_TABLES:
+            self._topology = None
+
+        if command == 'vrouter-show':
+            if self.vrouter_rows.get(row.name) == row:
+                del self.vrouter_rows[row.name]
+                self.switch_by_vrouter.pop(row.name, None)
+                self.router_ids.pop(row.name, None)
+            if self.vrouter_by_switch.get(row.location) == row.name:
+                del self.vrouter_by_switch[row.location]
+        elif command == 'vrouter-interface-show':
+            vrouter = row.vrouter_name
+            interfaces = self.interfaces.get(vrouter, [])
+            if row in interfaces:
+                interfaces.remove(row)
+                if not interfaces:
+                    del self.interfaces[vrouter]
+            if self.interface_by_port.get((vrouter, row.l3_port)) == row:
+                del self.interface_by_port[(vrouter, row.l3_port)]
+            ip = (vrouter, row.ip.split('/')[0])
+            if self.interface_by_ip.get(ip) == row:
+                del self.interface_by_ip[ip]
+        elif command == 'vrouter-loopback-interface-show':
+            loopbacks = self.loopbacks.get(row.vrouter_name, [])
+            if row.ip in loopbacks:
+                loopbacks.remove(row.ip)
+                if not loopbacks:
+                    del self.loopbacks[row.vrouter_name]
+        elif command == 'vrouter-bgp-show':
+            self.bgp_neighbors.discard(
+                (row.vrouter_name, row.neighbor, row.remote_as))
+        elif command == 'vrouter-ospf-show':
+            self.ospf_networks.discard((row.vrouter_name, row.network))
+        elif command == 'cluster-show':
+            nodes = (row.cluster_node_1, row.cluster_node_2)
+            if self.clusters.get(row.name) == nodes:
+                del self.clusters[row.name]
+            for node in nodes:
+                if self.cluster_by_node.get(node) == row.name:
+                    del self.cluster_by_node[node]
+        elif command == 'trunk-show':
+            self.trunks.discard((row.switch, row.name))
+        elif command == 'vlag-show':
+            self.vlags.discard((row.switch, row.name))
+            self.vlags.discard((row.peer_switch, row.name))
+        elif command == 'fabric-node-show':
+            if self.nodes.get(row.name) == row:
+                del self.nodes[row.name]
+
+    def _reset(self, command):
+        """
+        Method to clear the indexes built from one show table.
+        :param command: The show command, a key of SHOW_COLUMNS.
+        """
+        if command == 'vrouter-show':
+            self.vrouter_rows = {}
+            self.vrouter_by_switch = {}
+            self.switch_by_vrouter = {}
+            self.router_ids = {}
+        elif command == 'vrouter-interface-show':
+            self.interfaces = {}
+            self.interface_by_port = {}
+            self.interface_by_ip = {}
+        elif command == 'vrouter-loopback-interface-show':
+            self.loopbacks = {}
+        elif command == 'vrouter-bgp-show':
+            self.bgp_neighbors = set()
+        elif command == 'vrouter-ospf-show':
+            self.ospf_networks = set()
+        elif command == 'cluster-show':
+            self.clusters = {}
+            self.cluster_by_node = {}
+        elif command == 'trunk-show':
+            self.trunks = set()
+        elif command == 'vlag-show':
+            self.vlags = set()
+        elif command in TOPOLOGY_TABLES:
+            self._topology = None
+            if command == 'fabric-node-show':
+                self.nodes = {}
+
+    def vrouter_names(self):
+        """
+        :return: List of vrouter names in vrouter-show order.
+        """
+        return [row.name for row in self.rows['vrouter-show']]
+
+    def vrouter_row(self, vrouter):
+        """
+        :param vrouter: Name of the vrouter.
+        :return: The vrouter-show row of the vrouter, or None.
+        """
+        return self.vrouter_rows.get(vrouter)
+
+    def vrouter(self, switch):
+        """
+        :param switch: Name of the switch.
+        :return: Name of the vrouter located on the switch, or None.
+        """
+        return self.vrouter_by_switch.get(switch)
+
+    def location(self, vrouter):
+        """
+        :param vrouter: Name of the vrouter.
+        :return: Name of the switch hosting the vrouter, or None.
+        """
+        return self.switch_by_vrouter.get(vrouter)
+
+    def cluster(self, node):
+        """
+        :param node: Name of the switch.
+        :return: Name of the cluster the switch is part of, or None.
+        """
+        return self.cluster_by_node.get(node)
+
+    def has_cluster(self, name):
+        """
+        :param name: Name of the cluster.
+        :return: True if the fabric has the cluster.
+        """
+        return name in self.clusters
+
+    def has_trunk(self, switch, name):
+        """
+        :param switch: Name of the switch.
+        :param name: Name of the trunk.
+        :return: True if the switch has the trunk.
+        """
+        return (switch, name) in self.trunks
+
+    def has_vlag(self, switch, name):
+        """
+        :param switch: Name of the switch, either node of the vlag.
+        :param name: Name of the vlag.
+        :return: True if the switch has the vlag.
+        """
+        return (switch, name) in self.vlags
+
+    def cluster_nodes(self):
+        """
+        :return: List of (cluster name, node1, node2) in cluster-show order.
+        """
+        return [(row.name, row.cluster_node_1, row.cluster_node_2)
+                for row in self.rows['cluster-show']]
+
+    def topology(self):
+        """
+        Method to get the adjacency graph of the fabric, built on first use
+        from the port-show, lldp-show and fabric-node-show tables.
+        :return: The FabricTopology.
+        """
+        if self._topology is None:
+            self._topology = FabricTopology(
+                self.rows.get('port-show', []),
+                self.rows.get('lldp-show', []),
+                [row.name for row in self.rows.get('fabric-node-show', [])])
+        return self._topology
+
+    def l3_ports(self, vrouter):
+        """
+        :param vrouter: Name of the vrouter.
+        :return: Sorted list of the l3-ports of the vrouter interfaces.
+        """
+        ports = set(row.l3_port for row in self.interfaces.get(vrouter, [])
+                    if row.l3_port)
+        return sorted(ports, key=port_key)
+
+    def interface_ip(self, vrouter, port):
+        """
+        :param vrouter: Name of the vrouter.
+        :param port: The l3-port of the interface.
+        :return: The ip (with prefix length) of the interface, or None.
+        """
+        row = self.interface_by_port.get((vrouter, str(port)))
+        return row.ip if row else None
+
+    def interface_nic(self, vrouter, ip):
+        """
+        :param vrouter: Name of the vrouter.
+        :param ip: Interface ip, with or without prefix length.
+        :return: The nic of the interface, or None.
+        """
+        row = self.interface_by_ip.get((vrouter, ip.split('/')[0]))
+        return row.nic if row else None
+
+    def has_interface(self, vrouter, ip):
+        """
+        :param vrouter: Name of the vrouter.
+        :param ip: Interface ip, with or without prefix length.
+        :return: True if the vrouter already has an interface with that ip.
+        """
+        return (vrouter, ip.split('/')[0]) in self.interface_by_ip
+
+    def has_bgp_neighbor(self, vrouter, neighbor, remote_as):
+        """
+        :param vrouter: Name of the vrouter.
+        :param neighbor: Neighbor ip.
+        :param remote_as: Remote AS of the neighbor.
+        :return: True if the vrouter already has the neighbor.
+        """
+        return (vrouter, neighbor, str(remote_as)) in self.bgp_neighbors
+
+    def has_ospf_network(self, vrouter, network):
+        """
+        :param vrouter: Name of the vrouter.
+        :param network: OSPF network with prefix length.
+        :return: True if the vrouter already advertises the network.
+        """
+        return (vrouter, network) in self.ospf_networks
+
@@ -0,0 +1,277 @@
+""" Bounded concurrency per switch fan-out for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import bisect
+import os
+import threading
+
+# Environment variable capping the number of commands run at the same time
+# by one module, '1' runs everything sequentially.
+LIMIT_ENV = 'PN_FANOUT_LIMIT'
+DEFAULT_LIMIT = 16
+
+# Environment variable capping the number of commands run at the same time
+# against one switch by run_graph().
+SWITCH_LIMIT_ENV = 'PN_SWITCH_LIMIT'
+DEFAULT_SWITCH_LIMIT = 1
+
+_LOCAL = threading.local()
+
+
+class WorkerExit(Exception):
+    """
+    Raised in place of exit_json()/fail_json() called from a worker thread,
+    so the module exits once, from the main thread.
+    """
+
+    def __init__(self, method, kwargs):
+        Exception.__init__(self, kwargs.get('msg', ''))
+        self.method = method
+        self.kwargs = kwargs
+
+
+def fanout_limit():
+    """
+    :return: The maximum number of items run at the same time.
+    """
+    try:
+        return max(int(os.environ.get(LIMIT_ENV, DEFAULT_LIMIT)), 1)
+    except ValueError:
+        return DEFAULT_LIMIT
+
+
+def switch_limit():
+    """
+    :return: The maximum number of items run at the same time against one
+    switch.
+    """
+    try:
+        return max(int(os.environ.get(SWITCH_LIMIT_ENV,
+                                      DEFAULT_SWITCH_LIMIT)), 1)
+    except ValueError:
+        return DEFAULT_SWITCH_LIMIT
+
+
+def _guard(module):
+    """
+    Method to make exit_json()/fail_json() of a module raise WorkerExit when
+    called from a worker thread.
+    :param module: The Ansible module.
+    """
+    if getattr(module, '_pn_fanout_guard', False):
+        return
+    module._pn_fanout_guard = True
+
+    def guarded(name, method):
+        def call(**kwargs):
+            if getattr(_LOCAL, 'worker', False):
+                raise WorkerExit(name, kwargs)
+            return method(**kwargs)
+        return call
+
+    for name in ('exit_json', 'fail_json'):
+        setattr(module, name, guarded(name, getattr(module, name)))
+
+
+def fan_out(module, func, items, limit=None):
+    """
+    Method to run independent per switch work in parallel, e.g. the same
+    'switch X ...' commands against every switch of the fabric. The pool is
+    sized to the number of items, up to the fan-out limit.
+    Once an item fails no further item is started; the failure of the
+    lowest failing item is raised (or reported with exit_json()) after the
+    running ones finished, exactly as if the items had run in order.
+    :param module: The Ansible module the work runs with.
+    :param func: Function called with one item.
+    :param items: The items, e.g. switch names.
+    :param limit: Maximum number of threads, defaults to PN_FANOUT_LIMIT.
+    :return: List of the results of func, in the order of items.
+    """
+    items = list(items)
+    workers = min(len(items), limit or fanout_limit())
+    if workers <= 1 or getattr(_LOCAL, 'worker', False):
+        return [func(item) for item in items]
+
+    _guard(module)
+    results = [None] * len(items)
+    state = {'next': 0, 'error': None}
+    lock = threading.Lock()
+
+    def work():
+        _LOCAL.worker = True
+        while True:
+            with lock:
+                if state['error'] is not None or state['next'] >= len(items):
+                    return
+                index = state['next']
+                state['next'] += 1
+            try:
+                results[index] = func(items[index])
+            except BaseException as exc:
+                with lock:
+                    if state['error'] is None or index < state['error'][0]:
+                        state['error'] = (index, exc)
+                return
+
+    threads = [threading.Thread(target=work, name='pn-fanout-%d' % number)
+               for number in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if state['error'] is not None:
+        error = state['error'][1]
+        if isinstance(error, WorkerExit):
+            getattr(module, error.method)(**error.kwargs)
+        raise error
+
+    return results
+
+
+def run_graph(module, func, items, parents, switches=None, limit=None,
+              per_switch=None):
+    """
+    Method to run work items ordered by a dependency graph, e.g. the
+    commands of a plan where an interface waits for its vrouter but the
+    vlans of different switches do not wait for each other. Every item
+    starts as soon as the items it depends on are done, lowest index first,
+    within the global and per switch limits. Failures are handled as in
+    fan_out().
+    :param module: The Ansible module the work runs with.
+    :param func: Function called with one item.
+    :param items: The items.
+    :param parents: List holding, for every item, the indexes of the items
+    it depends on, all lower than its own index.
+    :param switches: Optional list of the switch every item runs against.
+    :param limit: Maximum number of threads, defaults to PN_FANOUT_LIMIT.
+    :param per_switch: Maximum number of items of one switch run at the
+    same time, defaults to PN_SWITCH_LIMIT.
+    :return: List of the results of func, in the order of items.
+    """
+    items = list(items)
+    count = len(items)
+    workers = min(count, limit or fanout_limit())
+    if workers <= 1 or getattr(_LOCAL, 'worker', False):
+        # Parents come first, so the index order is a valid order.
+        return [func(item) for item in items]
+
+    switches = switches or [None] * count
+    per_switch = per_switch or switch_limit()
+    children = [[] for item in items]
+    waiting = []
+    for index, depends in enumerate(parents):
+        depends = set(depends)
+        waiting.append(len(depends))
+        for parent in depends:
+            children[parent].append(index)
+
+    _guard(module)
+    results = [None] * count
+    running = {}
+    ready = [index for index in range(count) if not waiting[index]]
+    state = {'started': 0, 'error': None}
+    condition = threading.Condition()
+
+    def pick():
+        for position, index in enumerate(ready):
+            if running.get(switches[index], 0) < per_switch:
+                del ready[position]
+                return index
+        return None
+
+    def work():
+        _LOCAL.worker = True
+        while True:
+            with condition:
+                while True:
+                    if state['error'] is not None or \
+                            state['started'] >= count:
+                        return
+                    index = pick()
+                    if index is not None:
+                        break
+                    condition.wait()
+                state['started'] += 1
+                running[switches[index]] = running.get(switches[index], 0) + 1
+
+            try:
+                results[index] = func(items[index])
+            except BaseException as exc:
+                with condition:
+                    if state['error'] is None or index < state['error'][0]:
+                        state['error'] = (index, exc)
+                    condition.notify_all()
+                return
+
+            with condition:
+                running[switches[index]] -= 1
+                for child in children[index]:
+                    waiting[child] -= 1
+                    if not waiting[child]:
+                        bisect.insort(ready, child)
+                condition.notify_all()
+
+    threads = [threading.Thread(target=work, name='pn-fanout-%d' % number)
+               for number in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    if state['error'] is not None:
+        error = state['error'][1]
+        if isinstance(error, WorkerExit):
+            getattr(module, error.method)(**error.kwargs)
+        raise error
+
+    return results
+
+
+def critical_path(parents, weights=None):
+    """
+    Method to find the heaviest chain of a dependency graph, i.e. what no
+    amount of parallelism makes faster.
+    :param parents: List holding, for every item, the indexes of the items
+    it depends on, all lower than its own index.
+    :param weights: Optional list of the weight, e.g. the run time, of every
+    item, defaults to 1 each.
+    :return: Tuple of (total weight, list of the item indexes of the chain).
+    """
+    totals = []
+    previous = []
+    for index, depends in enumerate(parents):
+        weight = weights[index] if weights else 1
+        before = max(depends, key=lambda parent: totals[parent]) \
+            if depends else None
+        totals.append(weight + (totals[before] if before is not None else 0))
+        previous.append(before)
+
+    if not totals:
+        return 0, []
+
+    index = max(range(len(totals)), key=lambda item: totals[item])
+    total = totals[index]
+    chain = []
+    while index is not None:
+        chain.append(index)
+        index = previous[index]
+    return total, chain[::-1]
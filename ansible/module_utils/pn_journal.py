@@ -0,0 +1,148 @@
+""" Resume journal of the completed steps of a module run """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import hashlib
+import json
+import os
+import time
+
+# Environment variable naming the directory journals are kept in, on the
+# host the module runs on, normally set with the 'environment' keyword of a
+# play or task. Runs are not journaled when it is unset.
+JOURNAL_DIR_ENV = 'PN_JOURNAL_DIR'
+
+# Seconds a journal is resumed from. A retry comes within minutes, a run
+# much later starts over and probes the fabric again.
+MAX_AGE = 3600
+
+# Parameters not part of the plan, left out of the journal key.
+SECRET_PARAMS = ('pn_clipassword',)
+
+
+def _native(value):
+    """
+    Method to turn the unicode strings json returns on python 2 into str.
+    """
+    if isinstance(value, dict):
+        return dict((_native(key), _native(item))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [_native(item) for item in value]
+    if not isinstance(value, str) and hasattr(value, 'encode'):
+        return value.encode('utf-8')
+    return value
+
+
+class Journal(object):
+    """
+    Journal of the completed steps of a long module run. A step is one call
+    of a module function changing the configuration, identified by the
+    function name, the arguments and how many identical calls the run made
+    before it. Reads of live values are not steps, they run again on a
+    retry. With PN_JOURNAL_DIR set, every completed step, its result and
+    whether it changed anything is appended to a file named after a hash of
+    the module parameters (the plan). A retry of a failed run, e.g. by
+    'until'/'retries' in the playbook, then returns the recorded results of
+    the steps the failed attempt completed and resumes at the first
+    incomplete one, instead of probing the fabric from scratch. The file is
+    removed once the run completes.
+    """
+
+    def __init__(self, module, name, changed_flag):
+        """
+        :param module: The Ansible module, passed to every step.
+        :param name: Name of the module, part of the journal file name.
+        :param changed_flag: The CHANGED_FLAG list of the module, steps
+        append True to it when they change something. A replayed step that
+        changed something appends True again.
+        """
+        self.module = module
+        self.changed_flag = changed_flag
+        self.steps = {}
+        self.calls = {}
+        self.path = None
+
+        directory = os.environ.get(JOURNAL_DIR_ENV)
+        if not directory:
+            return
+
+        params = dict((key, value) for key, value in module.params.items()
+                      if key not in SECRET_PARAMS)
+        digest = hashlib.sha1(json.dumps([name, params], sort_keys=True)
+                              .encode('utf-8')).hexdigest()
+        self.path = os.path.join(directory, '%s-%s.journal' % (name,
+                                                               digest[:16]))
+        self._load()
+
+    def _load(self):
+        """
+        Method to read the steps completed by an earlier attempt. A torn
+        last line, left by an attempt killed while writing it, is ignored.
+        """
+        try:
+            if time.time() - os.path.getmtime(self.path) > MAX_AGE:
+                return
+            with open(self.path) as handle:
+                lines = handle.readlines()
+        except (IOError, OSError):
+            return
+
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            self.steps[_native(record['step'])] = (_native(record['result']),
+                                                   record['changed'])
+
+    def run(self, func, *args):
+        """
+        Method to run one step, unless an earlier attempt completed it.
+        :param func: The module function, called as func(module, *args).
+        :param args: The other arguments, json serializable.
+        :return: The result of the function, json serializable, or the
+        result it had when the step completed.
+        """
+        call = '%s %s' % (func.__name__, json.dumps(list(args),
+                                                    sort_keys=True))
+        self.calls[call] = self.calls.get(call, 0) + 1
+        step = '%s #%d' % (call, self.calls[call])
+        if step in self.steps:
+            result, changed = self.steps[step]
+            if changed:
+                self.changed_flag.append(True)
+            return result
+
+        flags = len(self.changed_flag)
+        result = func(self.module, *args)
+        if self.path is not None:
+            with open(self.path, 'a') as handle:
+                handle.write(json.dumps({
+                    'step': step, 'result': result,
+                    'changed': True in self.changed_flag[flags:]
+                }, sort_keys=True) + '\n')
+        return result
+
+    def finish(self):
+        """
+        Method to drop the journal once the run completed, so the next run
+        starts over.
+        """
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
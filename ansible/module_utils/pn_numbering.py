@@ -0,0 +1,79 @@
+""" Stable BGP AS and OSPF area numbering for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+class GroupNumbering(object):
+    """
+    Numbers, e.g. BGP AS or OSPF areas, shared by groups of switches such as
+    the two nodes of a leaf cluster. The fabric itself is the store: the
+    numbers switches already use are read back from it and kept, and new
+    groups take the numbers after the highest one in use. Re-runs therefore
+    reproduce the same assignment and adding switches never renumbers the
+    existing ones.
+    """
+
+    def __init__(self, first, current=None):
+        """
+        :param first: Number of the first group when none is in use yet.
+        :param current: Dict mapping switch name to the number it already
+        uses on the fabric.
+        """
+        self.numbers = {}
+        for switch, number in (current or {}).items():
+            if str(number).isdigit():
+                self.numbers[switch] = int(number)
+        self.next = max([int(first) - 1] + list(self.numbers.values())) + 1
+
+    def pin(self, switches, number):
+        """
+        Method to give a fixed number to switches, e.g. the AS of the spines.
+        :param switches: Names of the switches.
+        :param number: The number.
+        """
+        number = int(number)
+        for switch in switches:
+            self.numbers[switch] = number
+        self.next = max(self.next, number + 1)
+
+    def assign(self, switches):
+        """
+        Method to number a group of switches. The group keeps the number of
+        its first member having one, otherwise takes the next free number.
+        :param switches: Names of the switches of the group.
+        :return: The number of the group, as a string.
+        """
+        for switch in switches:
+            if switch in self.numbers:
+                number = self.numbers[switch]
+                break
+        else:
+            number = self.next
+            self.next += 1
+
+        for switch in switches:
+            self.numbers[switch] = number
+        return str(number)
+
+    def mapping(self):
+        """
+        :return: Dict mapping every numbered switch to its number, as a
+        string.
+        """
+        return dict((switch, str(number))
+                    for switch, number in self.numbers.items())
@@ -0,0 +1,395 @@
+""" Shared Netvisor CLI transport for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import atexit
+import errno
+import hashlib
+import os
+import select
+import subprocess
+import tempfile
+import threading
+import time
+
+try:
+    from shlex import quote
+except ImportError:
+    from pipes import quote
+
+from ansible.module_utils.pn_cli_trace import get_tracer
+
+CLI_PATH = '/usr/bin/cli'
+
+# Environment variable pointing the modules at another cli executable, e.g.
+# the fabric simulator under simulator/ in this repository.
+CLI_PATH_ENV = 'PN_CLI_PATH'
+
+# Options that the long lived session is started with. Any other option
+# (--skip-setup, --script-password, --no-login-prompt, ...) changes the
+# behaviour of the cli process itself, so such commands always run one-shot.
+SESSION_OPTIONS = ('--quiet', '--user')
+
+# Command used to mark the end of the output of every command sent to the
+# session. The cli echoes its argument back on stdout; a cli that does not,
+# or answers with an error, fails the handshake.
+MARKER_COMMAND = 'echo'
+
+# Seconds to wait for the session to answer the first marker before falling
+# back to launching one cli process per command.
+HANDSHAKE_TIMEOUT = 2
+
+# Environment variable turning sessions off when set to 0, so every command
+# runs in its own cli process.
+SESSION_ENV = 'PN_CLI_SESSION'
+
+# A failed handshake is remembered in a file of the temporary directory for
+# this many seconds, so the following module runs on the host fall back to
+# one-shot commands right away instead of waiting for the handshake again.
+UNUSABLE_TTL = 3600
+
+# Idle sessions, keyed by (pid, cli path, session options). Concurrent
+# commands each check out their own session, so the pool grows to the
+# number of commands ever run at the same time.
+_SESSIONS = {}
+_ALL_SESSIONS = []
+_UNUSABLE = set()
+_SESSIONS_LOCK = threading.Lock()
+
+
+def _to_text(data):
+    """
+    Method to convert data read from a pipe to a native string.
+    :param data: Bytes (python3) or str (python2) read from the pipe.
+    :return: The data as a native string.
+    """
+    if isinstance(data, str):
+        return data
+    return data.decode('utf-8', 'replace')
+
+
+def _to_bytes(data):
+    """
+    Method to convert a native string to bytes to be written to a pipe.
+    :param data: The native string.
+    :return: The data as bytes.
+    """
+    if isinstance(data, bytes):
+        return data
+    return data.encode('utf-8')
+
+
+def split_cli(cli):
+    """
+    Method to split a cli argument list into the cli options and the command.
+    :param cli: The cli argument list, e.g. as returned by shlex.split().
+    :return: Tuple of (cli path, list of options, list of command arguments).
+    """
+    options = []
+    index = 1
+    while index < len(cli) and cli[index].startswith('--'):
+        options.append(cli[index])
+        if cli[index] == '--user' and index + 1 < len(cli):
+            index += 1
+            options.append(cli[index])
+        index += 1
+
+    return cli[0], options, cli[index:]
+
+
+class CliSession(object):
+    """
+    A long lived Netvisor cli process. Commands are fed over stdin and the
+    output of each command is delimited by a marker echoed back by the cli,
+    so the startup and authentication cost is paid once per module run.
+    """
+
+    def __init__(self, cli_path, options):
+        self.cli_path = cli_path
+        self.options = list(options)
+        self.process = None
+        self.usable = True
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Method to launch the cli process and verify that it answers markers.
+        :return: True if the session is usable, False otherwise.
+        """
+        try:
+            self.process = subprocess.Popen(
+                [self.cli_path] + self.options,
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE, bufsize=0, close_fds=True
+            )
+        except (OSError, ValueError):
+            self.usable = False
+            return False
+
+        out, err, complete = self._exchange(None, HANDSHAKE_TIMEOUT)
+        if not complete or out or err:
+            self.close()
+            self.usable = False
+
+        return self.usable
+
+    def close(self):
+        """
+        Method to terminate the cli process.
+        """
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            process.stdin.close()
+        except (IOError, OSError):
+            pass
+        try:
+            process.terminate()
+        except OSError:
+            pass
+        process.wait()
+
+    def _exchange(self, command, timeout=None):
+        """
+        Method to send one command followed by a marker and collect the
+        output produced until the marker is echoed back.
+        :param command: The quoted command string, or None to only send
+        the marker.
+        :param timeout: Seconds to wait for the marker, None to wait forever.
+        :return: Tuple of (stdout, stderr, True if the marker was seen).
+        """
+        self.count += 1
+        marker = '__pn_end_of_command_%d_%d__' % (os.getpid(), self.count)
+        request = ''
+        if command is not None:
+            request += command + '\n'
+        request += '%s %s\n' % (MARKER_COMMAND, marker)
+
+        try:
+            self.process.stdin.write(_to_bytes(request))
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            return '', '', False
+
+        stdout_fd = self.process.stdout.fileno()
+        stderr_fd = self.process.stderr.fileno()
+        out_chunks, err_chunks = [], []
+        out_tail = ''
+        watched = [stdout_fd, stderr_fd]
+        deadline = None if timeout is None else time.time() + timeout
+        marker_line = marker + '\n'
+
+        while True:
+            wait = None
+            if deadline is not None:
+                wait = deadline - time.time()
+                if wait <= 0:
+                    return ''.join(out_chunks), ''.join(err_chunks), False
+            try:
+                readable = select.select(watched, [], [], wait)[0]
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            # Drain stderr first: the cli writes errors of a command before
+            # it echoes the marker of the following one.
+            if stderr_fd in readable:
+                chunk = os.read(stderr_fd, 65536)
+                if not chunk:
+                    watched.remove(stderr_fd)
+                else:
+                    err_chunks.append(_to_text(chunk))
+                    if command is None:
+                        # The cli does not understand the marker command.
+                        return '', ''.join(err_chunks), False
+
+            if stdout_fd in readable:
+                chunk = _to_text(os.read(stdout_fd, 65536))
+                if not chunk:
+                    return ''.join(out_chunks), ''.join(err_chunks), False
+                out_chunks.append(chunk)
+                out_tail = (out_tail + chunk)[-len(marker_line) - 1:]
+                if out_tail.endswith(marker_line):
+                    break
+
+        # Pick up whatever is left on stderr for this command.
+        while (stderr_fd in watched and
+               select.select([stderr_fd], [], [], 0)[0]):
+            chunk = os.read(stderr_fd, 65536)
+            if not chunk:
+                break
+            err_chunks.append(_to_text(chunk))
+
+        out = ''.join(out_chunks)
+        return out[:-len(marker_line)], ''.join(err_chunks), True
+
+    def run(self, args):
+        """
+        Method to run one command on the session.
+        :param args: The command arguments (without the cli path/options).
+        :return: Tuple of (rc, stdout, stderr) like module.run_command(). The
+        session cannot report the exit status of a command, so rc is 1 if
+        the command wrote to stderr, the way the one-shot cli fails.
+        """
+        command = ' '.join(quote(arg) for arg in args)
+        with self.lock:
+            out, err, complete = self._exchange(command)
+            if not complete:
+                self.close()
+                self.usable = False
+                err += 'Netvisor cli session terminated unexpectedly'
+
+        return (1 if err else 0), out, err
+
+
+def _unusable_path(cli_path, options):
+    """
+    :return: Path of the file remembering that the cli failed the session
+    handshake with these options. The options, which may hold a password,
+    only appear hashed.
+    """
+    digest = hashlib.sha1(_to_bytes('\0'.join([cli_path] + list(options))))
+    return os.path.join(tempfile.gettempdir(),
+                        'pn_cli_no_session_%s' % digest.hexdigest())
+
+
+def _known_unusable(cli_path, options):
+    """
+    :return: True if a recent module run found that the cli fails the
+    session handshake with these options.
+    """
+    try:
+        age = time.time() - os.path.getmtime(_unusable_path(cli_path,
+                                                            options))
+    except OSError:
+        return False
+    return age < UNUSABLE_TTL
+
+
+def _remember_unusable(cli_path, options):
+    """
+    Method to record for the following module runs that the cli fails the
+    session handshake with these options.
+    """
+    try:
+        with open(_unusable_path(cli_path, options), 'w'):
+            pass
+    except (IOError, OSError):
+        pass
+
+
+def get_session(cli_path, options):
+    """
+    Method to check out an idle session for the given cli options, starting
+    a new one if all of them are busy. Sessions are never shared across
+    forked processes.
+    :param cli_path: Path to the cli executable.
+    :param options: List of cli options the session is started with.
+    :return: A usable CliSession, to be handed back with release_session(),
+    or None.
+    """
+    key = (os.getpid(), cli_path, tuple(options))
+    with _SESSIONS_LOCK:
+        if key in _UNUSABLE:
+            return None
+        idle = _SESSIONS.setdefault(key, [])
+        if idle:
+            return idle.pop()
+        if (os.environ.get(SESSION_ENV) == '0' or
+                _known_unusable(cli_path, options)):
+            _UNUSABLE.add(key)
+            return None
+
+    session = CliSession(cli_path, options)
+    session.start()
+    with _SESSIONS_LOCK:
+        _ALL_SESSIONS.append((key, session))
+        if not session.usable:
+            # The cli does not support sessions, do not try again in this
+            # run nor in the next ones.
+            if key not in _UNUSABLE:
+                _UNUSABLE.add(key)
+                _remember_unusable(cli_path, options)
+            return None
+
+    return session
+
+
+def release_session(session):
+    """
+    Method to hand a session checked out with get_session() back to the
+    pool.
+    :param session: The CliSession.
+    """
+    if not session.usable:
+        return
+    key = (os.getpid(), session.cli_path, tuple(session.options))
+    with _SESSIONS_LOCK:
+        _SESSIONS.setdefault(key, []).append(session)
+
+
+def close_sessions():
+    """
+    Method to terminate all sessions opened by this process.
+    """
+    with _SESSIONS_LOCK:
+        for key, session in list(_ALL_SESSIONS):
+            if key[0] == os.getpid():
+                _ALL_SESSIONS.remove((key, session))
+                session.close()
+        _SESSIONS.clear()
+
+
+atexit.register(close_sessions)
+
+
+def pn_run_command(module, cli):
+    """
+    Method to execute a Netvisor cli command, routing it through the shared
+    long lived cli session whenever possible.
+    :param module: The Ansible module used to run one-shot commands.
+    :param cli: The cli argument list, e.g. as returned by shlex.split().
+    :return: Tuple of (rc, stdout, stderr) like module.run_command().
+    """
+    override = os.environ.get(CLI_PATH_ENV)
+    if override and cli and cli[0] == CLI_PATH:
+        cli = [override] + list(cli[1:])
+
+    tracer = get_tracer(module)
+    start = time.time()
+    cli_path, options, args = split_cli(cli)
+    result = None
+    if os.path.basename(cli_path) == 'cli' and args:
+        names = [opt for opt in options if opt.startswith('--')]
+        if all(name in SESSION_OPTIONS for name in names):
+            session = get_session(cli_path, options)
+            if session is not None:
+                try:
+                    result = session.run(args)
+                finally:
+                    release_session(session)
+
+    if result is None:
+        result = module.run_command(cli)
+    if tracer is not None:
+        tracer.record(args, start, time.time(), *result)
+
+    return result
@@ -0,0 +1,118 @@
+""" Parser for Netvisor cli parsable-delim output """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import shlex
+from collections import namedtuple
+
+from ansible.module_utils.pn_nvos import pn_run_command
+
+DELIMITER = ';'
+
+# Row classes, keyed by the tuple of cli column names.
+_ROW_TYPES = {}
+
+
+def row_type(columns):
+    """
+    Method to fetch the row class for a set of columns. Column names are
+    turned into attribute names by replacing '-' with '_', so the
+    l3-port column is available as row.l3_port.
+    :param columns: Tuple of cli column names, in format order.
+    :return: A namedtuple class.
+    """
+    columns = tuple(columns)
+    cls = _ROW_TYPES.get(columns)
+    if cls is None:
+        fields = [column.replace('-', '_') for column in columns]
+        cls = namedtuple('Row', fields)
+        _ROW_TYPES[columns] = cls
+
+    return cls
+
+
+def make_row(columns, values):
+    """
+    Method to build a row from a dict of cli column names to values.
+    Missing columns are set to empty strings.
+    :param columns: Tuple of cli column names, in format order.
+    :param values: Dict mapping cli column names to values.
+    :return: A row instance.
+    """
+    return row_type(columns)(*[str(values.get(column, ''))
+                               for column in columns])
+
+
+def parse(output, columns):
+    """
+    Method to parse parsable-delim output into rows.
+    :param output: The cli output.
+    :param columns: Tuple of cli column names requested with format.
+    :return: List of rows.
+    """
+    cls = row_type(columns)
+    count = len(columns)
+    rows = []
+    for line in output.splitlines():
+        if not line.strip():
+            continue
+        fields = line.split(DELIMITER)
+        if len(fields) < count:
+            continue
+        # Fabric wide shows may prepend the switch/vrouter column.
+        rows.append(cls(*[field.strip() for field in fields[-count:]]))
+
+    return rows
+
+
+def show(module, cli, command, columns, filters='', fail_on_error=True,
+         no_rows=()):
+    """
+    Method to run a show command with named columns and parse its output.
+    :param module: The Ansible module to run the command with.
+    :param cli: The cli prefix returned by pn_cli(), optionally followed by
+    ' switch <name> '.
+    :param command: The show command, e.g. 'vrouter-interface-show'.
+    :param columns: Tuple of cli column names to request.
+    :param filters: Optional filter arguments, e.g. 'l3-port 49'.
+    :param fail_on_error: Exit the module if the cli reports an error,
+    otherwise treat the error as an empty result.
+    :param no_rows: Lowercase parts of the errors the cli reports for a show
+    without rows, e.g. because the feature is not configured. Such errors
+    are an empty result, whatever fail_on_error says.
+    :return: List of rows.
+    """
+    cli += ' %s %s format %s parsable-delim %s no-show-headers ' % (
+        command, filters, ','.join(columns), DELIMITER
+    )
+    cli = shlex.split(cli)
+    rc, out, err = pn_run_command(module, cli)
+
+    if err and not out:
+        if fail_on_error and not any(message in err.lower()
+                                     for message in no_rows):
+            module.exit_json(
+                error='1',
+                failed=True,
+                stderr=err.strip(),
+                msg='Operation Failed: ' + str(cli),
+                changed=False
+            )
+        return []
+
+    return parse(out, columns)
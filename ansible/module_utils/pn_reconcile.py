@@ -0,0 +1,752 @@
+""" Desired state reconciliation for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import os
+import shlex
+import time
+from collections import namedtuple
+
+from ansible.module_utils.pn_cli_trace import get_tracer
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot, \
+    SHOW_COLUMNS
+from ansible.module_utils.pn_fanout import critical_path, run_graph
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_parsable import make_row, show
+
+# How an object kind is shown, identified and changed:
+# show: the FabricSnapshot table holding the objects.
+# key: columns identifying a desired object in that table, 'switch' being
+# the switch the object is declared on.
+# ident: columns naming an existing object in modify/delete commands.
+# create, modify, delete: the cli commands, None if not supported.
+Kind = namedtuple('Kind', ('show', 'key', 'ident', 'create', 'modify',
+                           'delete'))
+
+KINDS = {
+    'cluster': Kind('cluster-show', ('name',), ('name',), 'cluster-create',
+                    None, 'cluster-delete'),
+    'vlan': Kind('vlan-show', ('switch', 'id'), ('id',), 'vlan-create',
+                 'vlan-modify', 'vlan-delete'),
+    'vrouter': Kind('vrouter-show', ('name',), ('name',), 'vrouter-create',
+                    'vrouter-modify', 'vrouter-delete'),
+    'trunk': Kind('trunk-show', ('switch', 'name'), ('name',), 'trunk-create',
+                  'trunk-modify', 'trunk-delete'),
+    'vlag': Kind('vlag-show', ('name',), ('name',), 'vlag-create',
+                 'vlag-modify', 'vlag-delete'),
+    'tunnel': Kind('tunnel-show', ('switch', 'name'), ('name',),
+                   'tunnel-create', 'tunnel-modify', 'tunnel-delete'),
+    'vrouter-interface': Kind('vrouter-interface-show',
+                              ('vrouter-name', 'ip'), ('vrouter-name', 'nic'),
+                              'vrouter-interface-add',
+                              'vrouter-interface-modify',
+                              'vrouter-interface-remove'),
+    'vrouter-interface-config': Kind('vrouter-interface-config-show',
+                                     ('vrouter-name', 'nic'),
+                                     ('vrouter-name', 'nic'),
+                                     'vrouter-interface-config-add',
+                                     'vrouter-interface-config-modify',
+                                     'vrouter-interface-config-remove'),
+    'vrouter-loopback-interface': Kind('vrouter-loopback-interface-show',
+                                       ('vrouter-name', 'ip'), None,
+                                       'vrouter-loopback-interface-add',
+                                       None, None),
+    'vrouter-bgp': Kind('vrouter-bgp-show', ('vrouter-name', 'neighbor'),
+                        ('vrouter-name', 'neighbor'), 'vrouter-bgp-add',
+                        'vrouter-bgp-modify', 'vrouter-bgp-remove'),
+    'vrouter-ospf': Kind('vrouter-ospf-show', ('vrouter-name', 'network'),
+                         ('vrouter-name', 'network'), 'vrouter-ospf-add',
+                         None, 'vrouter-ospf-remove'),
+}
+
+# Kinds in dependency order: objects are created and modified in this
+# order, and deleted in the reverse one.
+RANK = ('cluster', 'vlan', 'vrouter', 'trunk', 'vlag', 'tunnel',
+        'vrouter-interface', 'vrouter-loopback-interface', 'vrouter-bgp',
+        'vrouter-ospf', 'vrouter-interface-config')
+
+
+def _attr(column):
+    """
+    :return: The row attribute of a cli column name.
+    """
+    return column.replace('-', '_')
+
+
+class Lookup(object):
+    """
+    Option value only known once earlier commands of a plan ran, e.g. the
+    nic of an interface the plan adds: one column of a show, fetched right
+    before the command needing it runs.
+    """
+
+    def __init__(self, command, column, filters):
+        """
+        :param command: The show command, e.g. 'vrouter-interface-show'.
+        :param column: The cli column holding the value.
+        :param filters: Filter arguments selecting the row.
+        """
+        self.command = command
+        self.column = column
+        self.filters = filters
+
+    def fetch(self, module, cli):
+        """
+        Method to look the value up on the fabric.
+        :param module: The Ansible module.
+        :param cli: The cli prefix returned by pn_cli().
+        :return: The value. The module fails if no row matches.
+        """
+        rows = show(module, cli, self.command, (self.column,), self.filters)
+        if not rows:
+            module.exit_json(
+                error='1',
+                failed=True,
+                stderr='%s returned no rows' % self.command,
+                msg='Operation Failed: could not look up %s' % self,
+                changed=False
+            )
+        return getattr(rows[0], _attr(self.column))
+
+    def __str__(self):
+        return '<%s of %s>' % (self.column, self.filters)
+
+
+class Operation(object):
+    """
+    One cli command of a plan: the create, modify or delete of one object.
+    """
+
+    def __init__(self, action, kind, switch, args, current=None,
+                 message=None, after=()):
+        """
+        :param action: 'create', 'modify' or 'delete'.
+        :param kind: Key of KINDS.
+        :param switch: Name of the switch the command runs on, or None to run
+        it on the local switch.
+        :param args: List of (option, value) of the command. None values are
+        flags, Lookup values are fetched right before the command runs.
+        :param current: The snapshot row of the object for modify/delete.
+        :param message: Line added to the output once the command ran.
+        :param after: Operations this one must run after, on top of the
+        dependencies plan_graph() finds itself.
+        """
+        self.action = action
+        self.kind = kind
+        self.switch = switch
+        self.args = args
+        self.current = current
+        self.message = message
+        self.after = [operation for operation in after if operation]
+        self.values = None
+
+    def resolve(self, module, cli):
+        """
+        Method to fix the values of the command options.
+        :param module: The Ansible module.
+        :param cli: The cli prefix returned by pn_cli().
+        :return: List of (option, value).
+        """
+        if self.values is None:
+            self.values = [(option, value.fetch(module, cli)
+                            if isinstance(value, Lookup) else value)
+                           for option, value in self.args]
+        return self.values
+
+    def command(self):
+        """
+        :return: The cli command, without the cli prefix. Lookup values not
+        fetched yet show as placeholders.
+        """
+        kind = KINDS[self.kind]
+        words = ['switch %s' % self.switch] if self.switch else []
+        words.append(getattr(kind, self.action))
+        for option, value in (self.values or self.args):
+            words.append(option if value is None else
+                         '%s %s' % (option, value))
+        return ' '.join(words)
+
+
+class Reconciler(object):
+    """
+    Desired state of the fabric objects a module manages, diffed against a
+    FabricSnapshot. Modules declare every object they want with want(), and
+    the ones that must go with absent(); only the missing, changed and extra
+    objects turn into operations, so a re-run against a configured fabric
+    plans nothing and costs the snapshot only.
+    """
+
+    def __init__(self, snapshot):
+        """
+        :param snapshot: The FabricSnapshot of the fabric, pulled with the
+        show tables of the declared kinds.
+        """
+        self.snapshot = snapshot
+        self.operations = []
+        self._current = {}
+        self._declared = {}
+
+    def _existing(self, kind):
+        """
+        Method to index the snapshot rows of a kind by key. Keys holding a
+        switch are also indexed with None in its place, matching an object
+        declared on any switch, e.g. a fabric scoped vlan.
+        :param kind: Key of KINDS.
+        :return: Dict mapping key to row.
+        """
+        index = self._current.get(kind)
+        if index is None:
+            index = {}
+            columns = KINDS[kind].key
+            for row in self.snapshot.rows.get(KINDS[kind].show, []):
+                key = tuple(getattr(row, _attr(column)) for column in columns)
+                index.setdefault(key, row)
+                if 'switch' in columns:
+                    key = tuple(None if column == 'switch' else value
+                                for column, value in zip(columns, key))
+                    index.setdefault(key, row)
+            self._current[kind] = index
+        return index
+
+    def _key(self, kind, switch, args):
+        """
+        :return: The key of a declared object.
+        """
+        values = dict(args)
+        values.setdefault('switch', switch)
+        return tuple(None if values[column] is None else str(values[column])
+                     for column in KINDS[kind].key)
+
+    def _ident(self, kind, row):
+        """
+        :return: List of (option, value) naming an existing object.
+        """
+        return [(column, getattr(row, _attr(column)))
+                for column in KINDS[kind].ident]
+
+    def want(self, kind, switch, args, compare=(), message=None, after=()):
+        """
+        Method to declare an object the fabric must have. Missing objects
+        are created; existing ones are modified if one of the compare
+        options differs. An object declared twice keeps its first
+        declaration.
+        :param kind: Key of KINDS.
+        :param switch: Name of the switch the object is configured on, None
+        for the local switch.
+        :param args: List of (option, value) of the create command, holding
+        the key columns.
+        :param compare: Options compared with the existing object.
+        :param message: Line added to the output once the command ran.
+        :param after: Planned operations this one must run after, e.g. the
+        interface a VRRP interface is primary on.
+        :return: The planned Operation, or None if nothing is to be done.
+        """
+        key = (kind, self._key(kind, switch, args))
+        if key in self._declared:
+            return self._declared[key]
+
+        current = self._existing(kind).get(key[1])
+        operation = None
+        if current is None:
+            operation = Operation('create', kind, switch, args,
+                                  message=message, after=after)
+        else:
+            values = dict(args)
+            changes = [(option, values[option]) for option in compare
+                       if str(values[option]) !=
+                       getattr(current, _attr(option))]
+            if changes:
+                operation = Operation('modify', kind, switch,
+                                      self._ident(kind, current) + changes,
+                                      current, message, after)
+
+        self._declared[key] = operation
+        if operation is not None:
+            self.operations.append(operation)
+        return operation
+
+    def absent(self, kind, switch, args, message=None):
+        """
+        Method to declare an object the fabric must not have, e.g. a trunk
+        holding ports about to become l3 ports.
+        :param kind: Key of KINDS.
+        :param switch: Name of the switch the object is configured on.
+        :param args: List of (option, value) holding the key columns.
+        :param message: Line added to the output once the command ran.
+        :return: The planned Operation, or None if nothing is to be done.
+        """
+        key = (kind, self._key(kind, switch, args))
+        current = self._existing(kind).get(key[1])
+        if key in self._declared or current is None:
+            return None
+
+        operation = Operation('delete', kind, switch,
+                              self._ident(kind, current), current, message)
+        self._declared[key] = operation
+        self.operations.append(operation)
+        return operation
+
+    def plan(self):
+        """
+        Method to order the operations: deletes first, dependents before
+        what they depend on, then creates and modifies in RANK order. The
+        declaration order is kept within a kind. Run one by one, this order
+        is always valid; apply_plan() runs what is independent in parallel.
+        :return: List of Operation.
+        """
+        def step(operation):
+            rank = RANK.index(operation.kind)
+            if operation.action == 'delete':
+                return (0, -rank)
+            return (1, rank)
+
+        return sorted(self.operations, key=step)
+
+    def replay(self, plan):
+        """
+        Method to diff a plan made against an older snapshot, e.g. a saved
+        plan partly applied by a run that failed, against the current one.
+        Operations already done drop out: objects the plan creates may exist
+        if they hold the planned values, and objects it modifies or deletes
+        may already be changed or gone. Any other object changed since.
+        :param plan: List of Operation.
+        :return: List of the operations left to run, in plan order, or None
+        if an object of the plan changed in a way the plan does not account
+        for.
+        """
+        replayed = {}
+        for operation in plan:
+            kind = KINDS[operation.kind]
+            columns = SHOW_COLUMNS[kind.show]
+            after = [replayed.get(id(before)) for before in operation.after]
+            if operation.action == 'create':
+                current = self._existing(operation.kind).get(self._key(
+                    operation.kind, operation.switch, operation.args))
+                wanted = operation.args
+            else:
+                current = self._existing(operation.kind).get(tuple(
+                    getattr(operation.current, _attr(column))
+                    for column in kind.key))
+                wanted = [(option, value) for option, value in operation.args
+                          if option not in kind.ident]
+
+            done = current is not None and all(
+                str(value) == getattr(current, _attr(option))
+                for option, value in wanted
+                if option in columns and value is not None and
+                not isinstance(value, Lookup))
+            if operation.action == 'create':
+                if current is not None and not done:
+                    return None
+                if current is None:
+                    replayed[id(operation)] = Operation(
+                        'create', operation.kind, operation.switch,
+                        operation.args, message=operation.message,
+                        after=after)
+            elif current is None:
+                if operation.action == 'modify':
+                    return None
+            elif operation.action == 'delete' or not done:
+                if tuple(current) != tuple(operation.current):
+                    return None
+                replayed[id(operation)] = Operation(
+                    operation.action, operation.kind, operation.switch,
+                    operation.args, current, operation.message, after)
+
+        return [replayed[id(operation)] for operation in plan
+                if id(operation) in replayed]
+
+
+def _run(module, cli):
+    """
+    Method to run one command of a plan.
+    :param module: The Ansible module.
+    :param cli: The complete cli string.
+    :return: The output of the command, or 'Success'.
+    """
+    cli = shlex.split(cli)
+    rc, out, err = pn_run_command(module, cli)
+    if out:
+        return out
+
+    if err:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=err.strip(),
+            msg='Operation Failed: ' + str(cli),
+            changed=False
+        )
+    return 'Success'
+
+
+def _resources(operation):
+    """
+    Method to find the resources an operation provides and the ones it
+    needs, e.g. an interface needs its vrouter and its vlan. Creates on a
+    switch also wait for the deletes on it, which free ports and names.
+    :param operation: The Operation.
+    :return: Tuple of (provided, required) lists of resources.
+    """
+    values = dict(operation.args)
+    if operation.current is not None:
+        for field, value in zip(operation.current._fields,
+                                operation.current):
+            values.setdefault(field.replace('_', '-'), value)
+    kind = operation.kind
+    switch = operation.switch
+    cleanup = ('cleanup', switch)
+    if operation.action == 'delete':
+        return [cleanup], [cleanup]
+
+    provided = []
+    required = [cleanup]
+    if kind == 'cluster':
+        provided += [('cluster-node', values.get('cluster-node-1')),
+                     ('cluster-node', values.get('cluster-node-2'))]
+    elif kind == 'vlan':
+        provided.append(('vlan', switch, values.get('id')))
+        if values.get('scope') == 'cluster':
+            required.append(('cluster-node', switch))
+    elif kind == 'vrouter':
+        provided.append(('vrouter', values.get('name')))
+    elif kind == 'trunk':
+        provided.append(('port', switch, values.get('name')))
+    elif kind == 'vlag':
+        required += [('cluster-node', switch),
+                     ('port', switch, values.get('port')),
+                     ('port', values.get('peer-switch'),
+                      values.get('peer-port'))]
+    elif kind == 'tunnel':
+        required.append(('vrouter', values.get('vrouter-name')))
+    else:
+        vrouter = values.get('vrouter-name')
+        required.append(('vrouter', vrouter))
+        if kind == 'vrouter-interface':
+            provided.append(('interface', vrouter))
+            vlan = values.get('vlan')
+            if vlan:
+                required += [('vlan', switch, vlan), ('vlan', None, vlan)]
+        elif kind in ('vrouter-bgp', 'vrouter-ospf',
+                      'vrouter-interface-config'):
+            required.append(('interface', vrouter))
+
+    return provided, required
+
+
+def plan_graph(plan):
+    """
+    Method to build the dependency graph of a plan. An operation depends on
+    the earlier operations providing a resource it requires and on the
+    operations it was declared after; everything else may run in parallel.
+    :param plan: List of Operation, as returned by Reconciler.plan().
+    :return: List holding the set of parent indexes of every operation.
+    """
+    providers = {}
+    positions = dict((id(operation), index)
+                     for index, operation in enumerate(plan))
+    parents = []
+    for index, operation in enumerate(plan):
+        provided, required = _resources(operation)
+        depends = set()
+        for resource in required:
+            depends.update(providers.get(resource, ()))
+        for before in operation.after:
+            if positions.get(id(before), index) < index:
+                depends.add(positions[id(before)])
+        parents.append(depends)
+
+        for resource in provided:
+            providers.setdefault(resource, []).append(index)
+
+    return parents
+
+
+def plan_stats(plan, parents, timings, wall_time):
+    """
+    Method to describe how much parallelism a plan allowed.
+    :param plan: List of Operation.
+    :param parents: The graph of the plan, see plan_graph().
+    :param timings: Run time of every operation, in seconds.
+    :param wall_time: Run time of the whole plan, in seconds.
+    :return: Dict with the number of commands, the number of commands and
+    the time of the critical path, the commands on it, the most commands
+    run against one switch (the bound with PN_SWITCH_LIMIT=1), and the time
+    all commands took against the wall time.
+    """
+    length = critical_path(parents)[0]
+    seconds, chain = critical_path(parents, timings)
+    per_switch = {}
+    for operation in plan:
+        per_switch[operation.switch] = per_switch.get(operation.switch, 0) + 1
+    return {
+        'commands': len(plan),
+        'critical_path': length,
+        'switch_commands': max(per_switch.values()) if per_switch else 0,
+        'parallelism': round(float(len(plan)) / length, 2) if length else 0,
+        'critical_path_time': round(seconds, 6),
+        'critical_path_commands': [plan[index].command() for index in chain],
+        'cli_time': round(sum(timings), 6),
+        'wall_time': round(wall_time, 6),
+    }
+
+
+def apply_plan(module, cli, snapshot, plan):
+    """
+    Method to run a plan. Every operation starts as soon as the operations
+    it depends on are done (see plan_graph()), within PN_FANOUT_LIMIT
+    commands at the same time and PN_SWITCH_LIMIT per switch. The snapshot
+    is updated with every change, so later plans diff against the
+    configured state. With PN_CLI_TRACE set, the cli_stats of the module
+    list the critical path of the plan.
+    In check mode nothing runs: the plan is only recorded into the snapshot,
+    for save_plans() to write once the module planned everything.
+    :param module: The Ansible module.
+    :param cli: The cli prefix returned by pn_cli().
+    :param snapshot: The FabricSnapshot the plan was made against.
+    :param plan: List of Operation, as returned by Reconciler.plan().
+    :return: String describing the changes, in plan order.
+    """
+    if module.check_mode:
+        for operation in plan:
+            _record(snapshot, operation)
+        snapshot.plans.append(plan)
+        return ''.join(' %s: Would run %s \n' % (
+            operation.switch or 'local', operation.command())
+            for operation in plan)
+
+    parents = plan_graph(plan)
+    timings = [0.0] * len(plan)
+
+    def run(index):
+        operation = plan[index]
+        start = time.time()
+        operation.resolve(module, cli)
+        _run(module, cli + ' ' + operation.command())
+        timings[index] = time.time() - start
+        return operation.message or ' %s: Ran %s \n' % (
+            operation.switch or 'local', operation.command())
+
+    start = time.time()
+    output = ''.join(run_graph(module, run, range(len(plan)), parents,
+                               [operation.switch for operation in plan]))
+    wall_time = time.time() - start
+
+    for operation in plan:
+        _record(snapshot, operation)
+
+    tracer = get_tracer(module)
+    if tracer is not None:
+        tracer.record_plan(plan_stats(plan, parents, timings, wall_time))
+
+    return output
+
+
+def _record(snapshot, operation):
+    """
+    Method to update the snapshot with an operation that ran.
+    :param snapshot: The FabricSnapshot.
+    :param operation: The Operation.
+    """
+    show = KINDS[operation.kind].show
+    if show not in snapshot.rows:
+        # The table was not pulled, nothing plans against it.
+        return
+
+    values = dict((option, value) for option, value in
+                  (operation.values or operation.args) if value is not None)
+    if operation.action == 'create':
+        values.setdefault('switch', operation.switch or '')
+        values.setdefault('location', operation.switch or '')
+        snapshot.record(show, values)
+        return
+
+    # Saved plans hold copies of the rows, see saved_plans().
+    row = operation.current
+    row = next((current for current in snapshot.rows.get(show, [])
+                if current == row), row)
+    if operation.action == 'modify':
+        snapshot.update(show, row, values)
+    else:
+        snapshot.remove(show, row)
+
+
+def _dump_value(value):
+    """
+    :return: The JSON form of an option value.
+    """
+    if isinstance(value, Lookup):
+        return {'lookup': [value.command, value.column, value.filters]}
+    return value
+
+
+def _load_value(value):
+    """
+    :return: The option value of its JSON form.
+    """
+    if isinstance(value, dict):
+        return Lookup(*value['lookup'])
+    return value
+
+
+def save_plans(module, snapshot):
+    """
+    Method to write the plans made in check mode to the pn_plan_file of the
+    module, if set, along with the fingerprint of the snapshot they were
+    made against. Every operation is saved with the command it would run, so
+    the file doubles as the change to review.
+    :param module: The Ansible module.
+    :param snapshot: The FabricSnapshot, holding the plans.
+    """
+    path = module.params.get('pn_plan_file')
+    if not path:
+        return
+
+    plans = []
+    for plan in snapshot.plans:
+        positions = dict((id(operation), index)
+                         for index, operation in enumerate(plan))
+        plans.append([{
+            'command': operation.command(),
+            'action': operation.action,
+            'kind': operation.kind,
+            'switch': operation.switch,
+            'args': [[option, _dump_value(value)]
+                     for option, value in operation.args],
+            'current': None if operation.current is None
+            else list(operation.current),
+            'message': operation.message,
+            'after': sorted(positions[id(before)]
+                            for before in operation.after
+                            if id(before) in positions),
+        } for operation in plan])
+
+    try:
+        with open(path + '.tmp', 'w') as handle:
+            json.dump({'fingerprint': snapshot.fingerprint,
+                       'tables': list(snapshot.tables),
+                       'plans': plans}, handle, indent=1, sort_keys=True)
+        os.rename(path + '.tmp', path)
+    except (IOError, OSError) as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=str(error),
+            msg='Operation Failed: could not write plan file %s' % path,
+            changed=False
+        )
+
+
+def saved_plans(module, cli, tables):
+    """
+    Method to load the plans a check mode run saved to the pn_plan_file of
+    the module. The saved tables are pulled again. If their fingerprint
+    changed since the plans were made, e.g. because a run applying them
+    failed halfway, every plan is diffed against the fabric again right
+    before it runs (see Reconciler.replay()), and the module fails if an
+    object of the plans changed in a way they do not account for.
+    :param module: The Ansible module.
+    :param cli: The cli prefix returned by pn_cli().
+    :param tables: The show tables the module plans against.
+    :return: Tuple of (FabricSnapshot, iterable of plans), or None if there
+    are no plans to replay, i.e. in check mode, without pn_plan_file or once
+    the plans of the file were applied. The plan file is removed when the
+    last plan was taken and applied.
+    """
+    path = module.params.get('pn_plan_file')
+    if not path or module.check_mode or not os.path.exists(path):
+        return None
+
+    try:
+        with open(path) as handle:
+            saved = json.load(handle)
+    except (IOError, ValueError) as error:
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr=str(error),
+            msg='Operation Failed: could not read plan file %s' % path,
+            changed=False
+        )
+
+    if tuple(saved['tables']) != tuple(tables):
+        module.exit_json(
+            error='1',
+            failed=True,
+            stderr='tables %s' % ', '.join(saved['tables']),
+            msg='Operation Failed: the plan file %s was made by another '
+                'module or with other options' % path,
+            changed=False
+        )
+
+    plans = []
+    for saved_plan in saved['plans']:
+        plan = []
+        for step in saved_plan:
+            current = step['current']
+            if current is not None:
+                columns = SHOW_COLUMNS[KINDS[step['kind']].show]
+                current = make_row(columns, dict(zip(columns, current)))
+            plan.append(Operation(
+                step['action'], step['kind'], step['switch'],
+                [(option, _load_value(value))
+                 for option, value in step['args']],
+                current, step['message'],
+                [plan[index] for index in step['after']]))
+        plans.append(plan)
+
+    snapshot = FabricSnapshot(module, cli, tables)
+    return snapshot, _replay(module, path, snapshot, plans,
+                             saved['fingerprint'])
+
+
+def _replay(module, path, snapshot, plans, fingerprint):
+    """
+    Method to hand the saved plans out one at a time, the caller applying
+    each before taking the next one.
+    :param module: The Ansible module.
+    :param path: The plan file.
+    :param snapshot: The FabricSnapshot the plans are applied to.
+    :param plans: The saved plans.
+    :param fingerprint: The fingerprint of the snapshot the plans were made
+    against.
+    :return: Generator of the plans.
+    """
+    applied = False
+    for plan in plans:
+        if snapshot.fingerprint != fingerprint:
+            plan = Reconciler(snapshot).replay(plan)
+            if plan is None:
+                module.exit_json(
+                    error='1',
+                    failed=True,
+                    stderr='fingerprint %s, planned against %s' % (
+                        snapshot.fingerprint, fingerprint),
+                    msg='Operation Failed: the fabric changed since the '
+                        'plan file %s was made, run in check mode again'
+                        % path,
+                    changed=applied
+                )
+        yield plan
+        applied = applied or bool(plan)
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,250 @@
+""" Per operation result records for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import json
+import os
+import threading
+from collections import namedtuple
+
+# Environment variable naming a JSON Lines file, on the host the module runs
+# on, the records of a big run spill to. Without it every record is kept in
+# memory.
+RESULTS_FILE_ENV = 'PN_RESULTS_FILE'
+
+# Environment variable capping the number of records kept in memory, and
+# returned in stdout and summary, once a spill file is set.
+RESULTS_LIMIT_ENV = 'PN_RESULTS_LIMIT'
+DEFAULT_RESULTS_LIMIT = 10000
+
+# One operation of a run. message is its text in stdout, e.g.
+# ' leaf1: Vlan with id 10 created \n'.
+Result = namedtuple('Result', ['switch', 'op', 'object', 'status',
+                               'duration', 'message'])
+
+
+def result(switch, op, obj, message, status='ok', duration=0.0):
+    """
+    Method to build the record of one operation, see ResultRecorder.add().
+    :return: The Result.
+    """
+    return Result(switch, op, obj, status, round(duration, 3), message)
+
+
+def results_limit():
+    """
+    :return: The maximum number of records kept in memory.
+    """
+    try:
+        return max(int(os.environ.get(RESULTS_LIMIT_ENV,
+                                      DEFAULT_RESULTS_LIMIT)), 1)
+    except ValueError:
+        return DEFAULT_RESULTS_LIMIT
+
+
+class ResultRecorder(object):
+    """
+    List backed buffer of the Result records of a run, replacing the
+    'output += ...' string the modules return. stdout and the json summary
+    are built once, at exit. With PN_RESULTS_FILE set, a run producing more
+    than PN_RESULTS_LIMIT records writes all of them to that file as JSON
+    Lines and keeps only the first ones in memory.
+    """
+
+    def __init__(self):
+        self.records = []
+        self.count = 0
+        self.path = os.environ.get(RESULTS_FILE_ENV) or None
+        self.limit = results_limit()
+        self._spill = None
+        # Index of each record kept in memory.
+        self._indexes = []
+        # Records of operations added while an earlier index is still
+        # running, by index, their number, the indexes completed out of
+        # order, and the index recorded next.
+        self._pending = {}
+        self._held = 0
+        self._done = set()
+        self._next = 0
+        # First index some records of were only spilled. Records from that
+        # index on are no longer kept in memory.
+        self._cut = None
+        self._lock = threading.Lock()
+
+    def add(self, switch, op, obj, message, status='ok', duration=0.0,
+            index=None):
+        """
+        Method to record one operation, as soon as it ran.
+        :param switch: Name of the switch it ran against, None if fabric wide.
+        :param op: The operation, e.g. the cli command verb.
+        :param obj: The object operated on, e.g. the command arguments.
+        :param message: Text of the operation in stdout.
+        :param status: 'ok' or 'failed'.
+        :param duration: Run time of the operation in seconds.
+        :param index: Position of the operation in the run, for operations
+        run in parallel, see done(). Records are kept in memory in index
+        order: the records of the index recorded next are kept at once,
+        those of a later index are held until every earlier one is done.
+        Once the spill file is open every record is written to it as soon as
+        it is added, with its index, so a slow early index never holds more
+        than PN_RESULTS_LIMIT records of the later ones in memory.
+        """
+        record = result(switch, op, obj, message, status, duration)
+        with self._lock:
+            self.count += 1
+            if self._spill is not None:
+                self._write(index, record)
+            if index is None or index == self._next:
+                self._keep(index, record)
+            else:
+                self._hold(index, record)
+
+    def done(self, index):
+        """
+        Method to tell that every operation of an index has been added.
+        Every index from 0 up must be done once.
+        :param index: Position of the operations in the run, see add().
+        """
+        with self._lock:
+            self._done.add(index)
+            while self._next in self._done:
+                self._done.remove(self._next)
+                self._next += 1
+                records = self._pending.pop(self._next, [])
+                self._held -= len(records)
+                for record in records:
+                    self._keep(self._next, record)
+
+    def _keep(self, index, record):
+        """
+        Method to keep one record of the index recorded next in memory, or
+        open the spill file once the limit is reached.
+        :param index: Position of the operation in the run, or None.
+        :param record: The Result.
+        """
+        if self.path is None or (
+                len(self.records) < self.limit and
+                (self._cut is None or
+                 (index is not None and index < self._cut))):
+            self.records.append(record)
+            self._indexes.append(index)
+        else:
+            self._open(index, record)
+
+    def _hold(self, index, record):
+        """
+        Method to hold one record of a later index in memory until every
+        earlier index is done. Once the records kept and held reach the
+        limit it is only spilled, along with the held records of its index
+        and of the later ones, and no record from that index on is kept in
+        memory any more.
+        :param index: Position of the operation in the run.
+        :param record: The Result.
+        """
+        if self.path is None or (
+                len(self.records) + self._held < self.limit and
+                (self._cut is None or index < self._cut)):
+            self._pending.setdefault(index, []).append(record)
+            self._held += 1
+            return
+
+        self._open(index, record)
+        if self._cut is None or index < self._cut:
+            self._cut = index
+            for later in [held for held in self._pending if held >= index]:
+                self._held -= len(self._pending.pop(later))
+
+    def _open(self, index, record):
+        """
+        Method to open the spill file, if not open yet, with the records
+        kept and held so far and the one being added.
+        :param index: Position of the operation in the run, or None.
+        :param record: The Result.
+        """
+        if self._spill is not None:
+            return
+
+        self._spill = open(self.path, 'w')
+        for kept_index, kept in zip(self._indexes, self.records):
+            self._write(kept_index, kept)
+        for held_index in sorted(self._pending):
+            for held in self._pending[held_index]:
+                self._write(held_index, held)
+        self._write(index, record)
+
+    def _write(self, index, record):
+        """
+        Method to append one record to the spill file.
+        :param index: Position of the operation in the run, or None.
+        :param record: The Result.
+        """
+        line = dict(zip(record._fields, record))
+        line['index'] = index
+        self._spill.write(json.dumps(line, sort_keys=True) + '\n')
+
+    def close(self):
+        """
+        Method to close the spill file, if any.
+        """
+        if self._spill is not None:
+            self._spill.close()
+
+    def stdout(self):
+        """
+        :return: The messages of the records kept in memory, followed by
+        where to find the others.
+        """
+        output = ''.join(record.message for record in self.records)
+        spilled = self.count - len(self.records)
+        if spilled:
+            output += ' %d more results in %s \n' % (spilled, self.path)
+        return output
+
+    def summary(self):
+        """
+        :return: List of {'switch', 'output'} dicts of the records kept in
+        memory, as the json modules return them. The switch is the one the
+        message starts with, e.g. 'fabric_wide'.
+        """
+        results = []
+        for record in self.records:
+            switch, separator, output = record.message.strip().partition(': ')
+            if not separator:
+                switch, output = record.switch or '', switch
+            results.append({'switch': switch, 'output': output.strip()})
+        return results
+
+
+def message_summary(message, switches):
+    """
+    Method to build the json summary of a module still returning its
+    output as one string of ' <switch>: <message> \\n' lines, in one pass.
+    :param message: The output string.
+    :param switches: Names of the switches to report, in summary order.
+    :return: List of {'switch', 'output'} dicts, grouped by switch.
+    """
+    lines = dict((switch, []) for switch in switches)
+    for line in message.splitlines():
+        switch, separator, output = line.strip().partition(': ')
+        if separator and switch in lines:
+            lines[switch].append({'switch': switch, 'output': output.strip()})
+
+    results = []
+    for switch in switches:
+        results += lines.pop(switch, [])
+    return results
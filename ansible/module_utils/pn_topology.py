@@ -0,0 +1,175 @@
+""" Adjacency graph of the fabric for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+def port_key(port):
+    """
+    Sort key placing numeric ports in numeric order.
+    """
+    port = str(port)
+    return (0, int(port), '') if port.isdigit() else (1, 0, port)
+
+
+class FabricTopology(object):
+    """
+    Adjacency graph of the fabric, switch -> peer -> [(local port, remote
+    port)], built from one fabric wide port-show and lldp-show. Peers are
+    other fabric nodes or third party devices only seen over LLDP. Every
+    question the modules ask about the cabling is a dict lookup, so they no
+    longer probe with a port-show per pair of switches and per port.
+    """
+
+    def __init__(self, port_rows, lldp_rows, nodes):
+        """
+        :param port_rows: Rows of port-show with the switch, port, hostname
+        and rport columns.
+        :param lldp_rows: Rows of lldp-show with the switch, local-port,
+        sys-name and port-id columns.
+        :param nodes: Names of the fabric nodes.
+        """
+        self.nodes = set(nodes)
+        self.graph = {}
+        self.by_port = {}
+
+        for row in port_rows:
+            if row.hostname:
+                self._add(row.switch, row.port, row.hostname, row.rport)
+        # LLDP fills in the links port-show does not name a peer for.
+        for row in lldp_rows:
+            if row.sys_name and (row.switch, row.local_port) not in \
+                    self.by_port:
+                self._add(row.switch, row.local_port, row.sys_name,
+                          row.port_id)
+
+        for peers in self.graph.values():
+            for links in peers.values():
+                links.sort(key=lambda link: port_key(link[0]))
+
+    def _add(self, switch, port, peer, rport):
+        """
+        Method to add one link to the graph.
+        """
+        self.by_port[(switch, port)] = (peer, rport)
+        self.graph.setdefault(switch, {}).setdefault(peer, []).append(
+            (port, rport))
+
+    def links(self, switch, peer):
+        """
+        :param switch: Name of the local switch.
+        :param peer: Name of the peer.
+        :return: List of (local port, remote port) in port order.
+        """
+        return self.graph.get(switch, {}).get(peer, [])
+
+    def ports(self, switch, peer):
+        """
+        :param switch: Name of the local switch.
+        :param peer: Name of the peer.
+        :return: List of the local ports connected to the peer.
+        """
+        return [port for port, rport in self.links(switch, peer)]
+
+    def peer(self, switch, port):
+        """
+        :param switch: Name of the local switch.
+        :param port: Local port number.
+        :return: Tuple of (peer name, remote port) or (None, None).
+        """
+        return self.by_port.get((switch, str(port)), (None, None))
+
+    def peers(self, switch):
+        """
+        :param switch: Name of the switch.
+        :return: Sorted list of everything cabled to the switch.
+        """
+        return sorted(self.graph.get(switch, {}))
+
+    def fabric_peers(self, switch):
+        """
+        :param switch: Name of the switch.
+        :return: Sorted list of the fabric nodes cabled to the switch.
+        """
+        return [peer for peer in self.peers(switch) if peer in self.nodes]
+
+    def third_party_peers(self, switch):
+        """
+        :param switch: Name of the switch.
+        :return: Sorted list of the non fabric devices cabled to the switch.
+        """
+        return [peer for peer in self.peers(switch)
+                if peer not in self.nodes]
+
+    def multi_links(self, switch):
+        """
+        :param switch: Name of the switch.
+        :return: Dict mapping every peer cabled with more than one link to
+        the links.
+        """
+        return dict((peer, links) for peer, links in
+                    self.graph.get(switch, {}).items() if len(links) > 1)
+
+    def spine_leaf_links(self, spines, leafs):
+        """
+        :param spines: Names of the spines.
+        :param leafs: Names of the leafs.
+        :return: Dict mapping leaf -> spine -> list of (leaf port, spine
+        port).
+        """
+        return dict((leaf, dict((spine, self.links(leaf, spine))
+                                for spine in spines)) for leaf in leafs)
+
+    def leaf_pairs(self, leafs):
+        """
+        Method to find the leafs cabled to each other, i.e. the cluster
+        candidates.
+        :param leafs: Names of the leafs.
+        :return: List of (leaf, peer leaf), each pair once, in leafs order.
+        """
+        position = dict((leaf, index) for index, leaf in enumerate(leafs))
+        pairs = set()
+        for leaf in leafs:
+            for peer in self.graph.get(leaf, {}):
+                if peer in position and peer != leaf:
+                    pairs.add(tuple(sorted((leaf, peer), key=position.get)))
+        return sorted(pairs, key=lambda pair: (position[pair[0]],
+                                               position[pair[1]]))
+
+    def cluster_pairs(self, leafs):
+        """
+        Method to pair the leafs cabled to each other into clusters, in time
+        linear in the leafs and their links. Every leaf, in leafs order, is
+        paired with its first still unpaired peer leaf, so a leaf ends up in
+        one cluster at most.
+        :param leafs: Names of the leafs.
+        :return: List of (leaf, peer leaf) in leafs order.
+        """
+        position = dict((leaf, index) for index, leaf in enumerate(leafs))
+        paired = set()
+        pairs = []
+        for leaf in leafs:
+            if leaf in paired:
+                continue
+            candidates = [peer for peer in self.graph.get(leaf, {})
+                          if peer in position and peer != leaf and
+                          peer not in paired]
+            if candidates:
+                peer = min(candidates, key=position.get)
+                paired.update((leaf, peer))
+                pairs.append((leaf, peer))
+        return pairs
@@ -0,0 +1,198 @@
+""" Bulk vlan provisioning for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import shlex
+
+from ansible.module_utils.pn_fanout import fan_out
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_parsable import show
+
+# Number of vlan ids, 0 and 4095 included.
+VLAN_IDS = 4096
+
+
+class VlanBitmap(object):
+    """
+    Set of the vlan ids of one switch, as one 4096 bit integer.
+    """
+
+    def __init__(self, vlan_ids=()):
+        """
+        :param vlan_ids: Vlan ids, as strings or integers.
+        """
+        self.bits = 0
+        for vlan_id in vlan_ids:
+            self.add(vlan_id)
+
+    def add(self, vlan_id):
+        """
+        Method to add one vlan id. Ids outside of 0-4095 are ignored.
+        :param vlan_id: The vlan id, as a string or integer.
+        """
+        vlan_id = int(vlan_id)
+        if 0 <= vlan_id < VLAN_IDS:
+            self.bits |= 1 << vlan_id
+
+    def __contains__(self, vlan_id):
+        vlan_id = int(vlan_id)
+        return 0 <= vlan_id < VLAN_IDS and bool(self.bits >> vlan_id & 1)
+
+
+class VlanEngine(object):
+    """
+    Bulk vlan creation: the vlans of every switch are pulled with one
+    fabric wide vlan-show into a VlanBitmap per switch, the missing ones
+    are computed in memory and created with one vlan-create per vlan, the
+    switches in parallel for local and cluster scoped vlans. A vlan created with scope cluster is recorded on
+    both nodes of the cluster, pulled with cluster-show on first use.
+    """
+
+    def __init__(self, module, cli):
+        """
+        :param module: The Ansible module to run the commands with.
+        :param cli: The cli prefix returned by pn_cli().
+        """
+        self.module = module
+        self.cli = cli
+        self.switches = {}
+        self.fabric = VlanBitmap()
+        # Switch name -> name of its cluster peer, None if not clustered.
+        self.peers = {}
+        for row in show(module, cli, 'vlan-show', ('switch', 'id')):
+            self.switches.setdefault(row.switch, VlanBitmap()).add(row.id)
+            self.fabric.add(row.id)
+
+    def exists(self, switch, vlan_id):
+        """
+        :param switch: Name of the switch, None for any switch.
+        :param vlan_id: The vlan id.
+        :return: True if the vlan exists on the switch.
+        """
+        return vlan_id in self._bitmap(switch)
+
+    def _bitmap(self, switch):
+        """
+        :param switch: Name of the switch, None for the fabric.
+        :return: The VlanBitmap of the switch.
+        """
+        if switch is None:
+            return self.fabric
+        return self.switches.setdefault(switch, VlanBitmap())
+
+    def create(self, requests):
+        """
+        Method to create the requested vlans missing from their switch.
+        :param requests: List of (switch, vlan id, scope). switch is the
+        name of the switch to create the vlan on, or None to create it on
+        the local switch if no switch of the fabric has it. Vlans with scope
+        fabric are created from the local switch whatever the switch, so
+        their fabric transactions run one at a time.
+        :return: List telling for every request if it created the vlan.
+        Requests repeating an earlier one are not created twice.
+        """
+        created = []
+        groups = {}
+        order = []
+        for switch, vlan_id, scope in requests:
+            vlan_id = str(vlan_id)
+            if self.exists(switch, vlan_id):
+                created.append(False)
+                continue
+
+            created.append(True)
+            self._mark(switch, vlan_id, scope)
+            if scope == 'fabric':
+                switch = None
+            if switch not in groups:
+                groups[switch] = []
+                order.append(switch)
+            groups[switch].append((vlan_id, scope))
+
+        fan_out(self.module, lambda switch: self._create(switch,
+                                                         groups[switch]),
+                order)
+        return created
+
+    def _mark(self, switch, vlan_id, scope):
+        """
+        Method to record a vlan about to be created.
+        """
+        self.fabric.add(vlan_id)
+        if scope == 'fabric':
+            for bitmap in self.switches.values():
+                bitmap.add(vlan_id)
+        if switch is not None:
+            self._bitmap(switch).add(vlan_id)
+            peer = self._peer(switch) if scope == 'cluster' else None
+            if peer is not None:
+                self._bitmap(peer).add(vlan_id)
+
+    def _peer(self, switch):
+        """
+        Method to find the cluster peer of a switch. cluster-show is pulled
+        again for a switch not seen yet, e.g. a cluster the module created
+        after the last pull.
+        :param switch: Name of the switch.
+        :return: Name of the other node of its cluster, or None.
+        """
+        if switch not in self.peers:
+            for row in show(self.module, self.cli, 'cluster-show',
+                            ('cluster-node-1', 'cluster-node-2'),
+                            no_rows=('no clusters',)):
+                self.peers[row.cluster_node_1] = row.cluster_node_2
+                self.peers[row.cluster_node_2] = row.cluster_node_1
+            self.peers.setdefault(switch, None)
+        return self.peers[switch]
+
+    def _create(self, switch, vlans):
+        """
+        Method to create vlans on one switch, in order.
+        :param switch: Name of the switch, None for the local switch.
+        :param vlans: List of (vlan id, scope).
+        """
+        prefix = self.cli
+        if switch is not None:
+            prefix += ' switch %s ' % switch
+        for vlan_id, scope in vlans:
+            cli = shlex.split(prefix + ' vlan-create id %s scope %s ' % (
+                vlan_id, scope))
+            rc, out, err = pn_run_command(self.module, cli)
+            if err and not out:
+                self.module.exit_json(
+                    error='1',
+                    failed=True,
+                    stderr=err.strip(),
+                    msg='Operation Failed: ' + str(cli),
+                    changed=False
+                )
+
+
+def vlan_engine(module, cli):
+    """
+    Method to get the VlanEngine of a module run, pulling the vlans of the
+    fabric on first use.
+    :param module: The Ansible module.
+    :param cli: The cli prefix returned by pn_cli().
+    :return: The VlanEngine.
+    """
+    engine = getattr(module, '_pn_vlans', None)
+    if engine is None:
+        engine = VlanEngine(module, cli)
+        module._pn_vlans = engine
+    return engine
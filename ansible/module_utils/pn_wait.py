@@ -0,0 +1,171 @@
+""" Readiness polling for the Pluribus Ansible modules """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import random
+import shlex
+import time
+
+from ansible.module_utils.pn_nvos import pn_run_command
+from ansible.module_utils.pn_parsable import show
+
+# Seconds before the first retry, growth factor of the delay between
+# retries, largest delay and the +/- fraction of random jitter applied to
+# every delay so switches polled in parallel do not retry in lock step.
+INITIAL_DELAY = 0.5
+BACKOFF = 2.0
+MAX_DELAY = 5.0
+JITTER = 0.2
+
+# Deadlines, in seconds, of the waits done by the modules.
+PORT_TIMEOUT = 30
+RESTART_TIMEOUT = 180
+ROUTE_TIMEOUT = 30
+FABRIC_TIMEOUT = 60
+
+
+def wait_for(condition, timeout, delay=INITIAL_DELAY, backoff=BACKOFF,
+             max_delay=MAX_DELAY, jitter=JITTER):
+    """
+    Method to poll a condition until it holds or the deadline passes. The
+    condition is checked right away, then with exponentially growing and
+    jittered delays.
+    :param condition: Function without arguments, true once ready.
+    :param timeout: Seconds after which to give up.
+    :param delay: Seconds before the first retry.
+    :param backoff: Factor the delay grows by after every retry.
+    :param max_delay: Upper bound of the delay.
+    :param jitter: Fraction of the delay randomly added or removed.
+    :return: The last value returned by the condition, false on timeout.
+    """
+    deadline = time.time() + timeout
+    while True:
+        result = condition()
+        remaining = deadline - time.time()
+        if result or remaining <= 0:
+            return result
+
+        pause = delay * random.uniform(1 - jitter, 1 + jitter)
+        time.sleep(min(pause, remaining))
+        delay = min(delay * backoff, max_delay)
+
+
+def ports_enabled(module, cli, ports, speed):
+    """
+    Condition: every port is listed by port-config-show, enabled and at the
+    given speed. Unlike the port status, this holds for converted ports
+    without a link partner, which never come up.
+    :param module: The Ansible module to run the show commands with.
+    :param cli: The cli prefix, e.g. pn_cli() + ' switch-local '.
+    :param ports: Port list or range as passed to the cli, e.g. '49-52'.
+    :param speed: The speed the ports were set to, e.g. '10g'.
+    :return: The condition function for wait_for().
+    """
+    wanted = set(expand_ports(ports))
+
+    def condition():
+        rows = show(module, cli, 'port-config-show',
+                    ('port', 'speed', 'enable'), 'port %s' % ports,
+                    fail_on_error=False)
+        ready = set(row.port for row in rows
+                    if row.speed == speed and row.enable in ('on', 'yes'))
+        return wanted <= ready
+    return condition
+
+
+def nvos_responding(module, cli):
+    """
+    Condition: nvOSd answers cli commands again, e.g. after a restart.
+    :param module: The Ansible module to run the show commands with.
+    :param cli: The cli prefix returned by pn_cli().
+    :return: The condition function for wait_for().
+    """
+    def condition():
+        rc, out, err = pn_run_command(
+            module, shlex.split(cli + ' switch-setup-show format switch-name '
+                                      'no-show-headers '))
+        return rc == 0 and not err
+    return condition
+
+
+def switch_mode(module, cli, mode):
+    """
+    Condition: nvOSd answers cli commands again and runs in the given switch
+    mode, e.g. after the restart caused by switch-mode-modify.
+    :param module: The Ansible module to run the show commands with.
+    :param cli: The cli prefix returned by pn_cli().
+    :param mode: The expected switch mode, e.g. 'virtual-wire'.
+    :return: The condition function for wait_for().
+    """
+    def condition():
+        rc, out, err = pn_run_command(
+            module, shlex.split(cli + ' switch-mode-show format switch-mode '
+                                      'no-show-headers '))
+        return rc == 0 and not err and mode in (out or '').split()
+    return condition
+
+
+def fabric_node_online(module, cli, switch):
+    """
+    Condition: the switch is an online node of the fabric.
+    :param module: The Ansible module to run the show commands with.
+    :param cli: The cli prefix returned by pn_cli().
+    :param switch: Name of the switch.
+    :return: The condition function for wait_for().
+    """
+    def condition():
+        rows = show(module, cli, 'fabric-node-show', ('name', 'state'),
+                    'name %s' % switch, fail_on_error=False)
+        return any(row.state == 'online' for row in rows)
+    return condition
+
+
+def routes_present(module, cli, networks):
+    """
+    Condition: every network has an active switch route.
+    :param module: The Ansible module to run the show commands with.
+    :param cli: The cli prefix returned by pn_cli().
+    :param networks: List of networks with prefix length.
+    :return: The condition function for wait_for().
+    """
+    wanted = set(network.strip() for network in networks)
+
+    def condition():
+        rows = show(module, cli, 'switch-route-show', ('network', 'state'),
+                    fail_on_error=False)
+        active = set(row.network for row in rows
+                     if row.state in ('', 'active', 'up'))
+        return wanted <= active
+    return condition
+
+
+def expand_ports(ports):
+    """
+    Method to expand a cli port list such as '1,5-8' into port numbers.
+    :param ports: The port list.
+    :return: List of port numbers as strings.
+    """
+    result = []
+    for part in str(ports).split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            result.extend(str(port) for port in range(int(start),
+                                                      int(end) + 1))
+        elif part:
+            result.append(part)
+    return result
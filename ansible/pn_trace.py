@@ -0,0 +1,154 @@
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+
+# Make coding more python3-ish
+from __future__ import (absolute_import, division, print_function)
+__metaclass__ = type
+
+import json
+import os
+import time
+
+from ansible.plugins.callback import CallbackBase
+
+# File the timeline is written to at the end of the playbook.
+OUTPUT_ENV = 'PN_TRACE_OUTPUT'
+DEFAULT_OUTPUT = 'pn_trace.json'
+
+# Lane of every switch holding the tasks its host ran.
+TASK_LANE = 0
+
+
+class CallbackModule(CallbackBase):
+    """
+    Merges the tasks of a playbook run and the cli commands the modules
+    recorded (PN_CLI_TRACE=full, see module_utils/pn_cli_trace.py) into one
+    Chrome trace event timeline, viewable in chrome://tracing or Perfetto.
+    Every switch is one process of the timeline: its first lane holds the
+    tasks run for that host, the following lanes the cli commands sent to
+    the switch, one lane per host (and thread) that sent them.
+    """
+    CALLBACK_VERSION = 2.0
+    CALLBACK_TYPE = 'aggregate'
+    CALLBACK_NAME = 'pn_trace'
+    CALLBACK_NEEDS_WHITELIST = True
+
+    def __init__(self, display=None):
+        super(CallbackModule, self).__init__(display)
+        self.events = []
+        self.origin = time.time()
+        self.play = ''
+        self.task_start = 0
+        self.host_start = {}
+        # Switch name -> pid, (pid, lane name) -> tid.
+        self.pids = {}
+        self.tids = {}
+
+    def _ts(self, when):
+        """
+        :return: Microseconds since the start of the playbook.
+        """
+        return int((when - self.origin) * 1000000)
+
+    def _pid(self, switch):
+        if switch not in self.pids:
+            pid = len(self.pids) + 1
+            self.pids[switch] = pid
+            self.events.append({'ph': 'M', 'name': 'process_name', 'pid': pid,
+                                'tid': TASK_LANE, 'args': {'name': switch}})
+            self.events.append({'ph': 'M', 'name': 'process_sort_index',
+                                'pid': pid, 'tid': TASK_LANE,
+                                'args': {'sort_index': pid}})
+            self._tid(pid, 'tasks')
+        return self.pids[switch]
+
+    def _tid(self, pid, lane):
+        key = (pid, lane)
+        if key not in self.tids:
+            tid = len([k for k in self.tids if k[0] == pid])
+            self.tids[key] = tid
+            self.events.append({'ph': 'M', 'name': 'thread_name', 'pid': pid,
+                                'tid': tid, 'args': {'name': lane}})
+        return self.tids[key]
+
+    def v2_playbook_on_play_start(self, play):
+        self.play = play.get_name()
+
+    def v2_playbook_on_task_start(self, task, is_conditional):
+        self.task_start = time.time()
+        self.host_start = {}
+
+    def v2_runner_on_start(self, host, task):
+        # Only called by Ansible 2.8 and newer, older versions time every
+        # host from the start of the task.
+        self.host_start[host.get_name()] = time.time()
+
+    def _add_result(self, result, status):
+        end = time.time()
+        host = result._host.get_name()
+        task = result._task.get_name()
+        start = self.host_start.get(host, self.task_start)
+        pid = self._pid(host)
+        self.events.append({
+            'ph': 'X', 'cat': 'task', 'name': task, 'pid': pid,
+            'tid': TASK_LANE, 'ts': self._ts(start),
+            'dur': self._ts(end) - self._ts(start),
+            'args': {'play': self.play, 'status': status},
+        })
+
+        data = result._result
+        stats = data.get('cli_stats')
+        trace = data.get('cli_trace')
+        if not stats or not trace:
+            return
+
+        # The commands are placed relative to the arrival of the result, so
+        # clock differences between the hosts and the control node do not
+        # shift them out of their task.
+        module_start = end - stats['wall_time']
+        for record in trace:
+            switch = record['switch'] or host
+            lane = 'cli from %s' % host
+            if record.get('thread', 'MainThread') != 'MainThread':
+                lane += ' (%s)' % record['thread']
+            target = self._pid(switch)
+            self.events.append({
+                'ph': 'X', 'cat': 'cli', 'name': record['verb'],
+                'pid': target, 'tid': self._tid(target, lane),
+                'ts': self._ts(module_start + record['start']),
+                'dur': int(record['latency'] * 1000000),
+                'args': {'task': task, 'host': host, 'rc': record['rc'],
+                         'bytes': record['bytes']},
+            })
+
+    def v2_runner_on_ok(self, result, **kwargs):
+        self._add_result(result, 'ok')
+
+    def v2_runner_on_failed(self, result, **kwargs):
+        self._add_result(result, 'failed')
+
+    def v2_runner_on_unreachable(self, result, **kwargs):
+        self._add_result(result, 'unreachable')
+
+    def v2_runner_on_skipped(self, result, **kwargs):
+        self._add_result(result, 'skipped')
+
+    def v2_playbook_on_stats(self, stats):
+        """Write the timeline"""
+        path = os.environ.get(OUTPUT_ENV, DEFAULT_OUTPUT)
+        with open(path, 'w') as trace_file:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, trace_file)
+        self._display.display('pn_trace: timeline written to %s' % path)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+""" Scaling benchmarks of the fabric wide modules against the simulator """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import gen_fabric
+from nvos_sim import LOG_ENV, SCALE_ENV, STATE_ENV, SWITCH_ENV
+
+SIMULATOR = os.path.dirname(os.path.realpath(__file__))
+LIBRARY = os.path.join(os.path.dirname(SIMULATOR), 'library')
+CLI = os.path.join(SIMULATOR, 'cli')
+RUNNER = os.path.join(SIMULATOR, 'run_module.py')
+
+CREDENTIALS = {'pn_cliusername': 'network-admin', 'pn_clipassword': 'admin'}
+FABRIC_NAME = 'bench-fabric'
+
+# Scenario -> (scenario whose final model it starts from, None for a
+# freshly generated fabric). 'dci' runs on its own fabric of leafs cabled
+# to third party routers.
+SCENARIOS = [
+    ('initial_ztp', None),
+    ('l2_ztp', 'initial_ztp'),
+    ('l3_ztp', 'initial_ztp'),
+    ('ztp_vrrp_l3', 'l3_ztp'),
+    ('ebgp', 'ztp_vrrp_l3'),
+    ('ospf', 'ztp_vrrp_l3'),
+    ('vxlan', 'ztp_vrrp_l3'),
+    ('dci', None),
+]
+
+
+def read(path):
+    with open(path) as handle:
+        return handle.read().strip()
+
+
+def scenario_runs(name, topology, files):
+    """
+    Method to list the module runs of a scenario, in playbook order.
+    :param name: The scenario.
+    :param topology: The generated gen_fabric.Topology.
+    :param files: Directory holding the generated csv files.
+    :return: List of (module name, switch the module runs on, params).
+    """
+    spines, leafs = topology.spines, topology.leafs
+    common = dict(CREDENTIALS, pn_spine_list=spines, pn_leaf_list=leafs)
+
+    if name == 'initial_ztp':
+        return [('pn_initial_ztp', switch, dict(
+            common, pn_fabric_name=FABRIC_NAME, pn_current_switch=switch,
+            pn_current_switch_ip='10.9.0.%d' % (index + 1),
+            pn_current_switch_ip_netmask='16', pn_toggle_40g=True,
+            pn_inband_ip='172.16.0.0/24', pn_fabric_network='mgmt',
+            pn_fabric_control_network='mgmt', pn_static_setup=False,
+            pn_web_api=True, pn_stp=False))
+            for index, switch in enumerate(spines + leafs)]
+    if name == 'l2_ztp':
+        return [('pn_l2_ztp', spines[0], dict(common, pn_stp=False))]
+    if name == 'l3_ztp':
+        return [('pn_l3_ztp', spines[0], dict(
+            common, pn_net_address='10.20.0.0', pn_cidr='16',
+            pn_supernet='30', pn_assign_loopback=True, pn_bfd=False,
+            pn_stp=False))]
+    if name == 'ztp_vrrp_l3':
+        return [('pn_ztp_vrrp_l3', spines[0], dict(
+            common, pn_csv_data=read(os.path.join(files,
+                                                  'l3_auto_setup.csv'))))]
+    if name in ('ebgp', 'ospf'):
+        return [('pn_ebgp_ospf', spines[0], dict(
+            common, pn_routing_protocol=name, pn_bfd=False,
+            pn_bgp_as_range='65000', pn_bgp_maxpath='16',
+            pn_bgp_redistribute='connected',
+            pn_ibgp_ip_range='75.75.75.0/24', pn_ibgp_vlan='4040',
+            pn_iospf_vlan='4040', pn_iospf_ip_range='75.75.75.0/24',
+            pn_ospf_area_id='0'))]
+    if name == 'vxlan':
+        return [('pn_vxlan', spines[0], dict(
+            CREDENTIALS, pn_leaf_list=leafs,
+            pn_csv_data=read(os.path.join(files, 'vxlan.csv'))))]
+    if name == 'dci':
+        params = dict(
+            CREDENTIALS, pn_fabric_name=FABRIC_NAME,
+            pn_spine_list=topology.third_party, pn_leaf_list=leafs,
+            pn_inband_ip='172.18.0.0/24', pn_loopback_ip='108.108.108.0/24',
+            pn_bgp_ip='100.1.1.0/30',
+            pn_csv_data=read(os.path.join(files, 'dci.csv')),
+            pn_third_party_bgp_data=read(os.path.join(
+                files, 'third_party_dci.csv')))
+        runs = [('pn_dci', leaf, dict(params, pn_current_switch=leaf,
+                                      pn_run_initial_setup=True))
+                for leaf in leafs]
+        runs.append(('pn_dci', leafs[0], dict(
+            params, pn_current_switch=leafs[0],
+            pn_run_initial_setup=False)))
+        return runs
+    raise ValueError('unknown scenario %s' % name)
+
+
+def run_module(module, switch, params, state, work, python, scale):
+    """
+    Method to run one module against the simulator.
+    :return: Dict of measurements of the run.
+    """
+    args_path = os.path.join(work, 'args.json')
+    stats_path = os.path.join(work, 'stats.json')
+    log_path = os.path.join(work, 'cli.log')
+    with open(args_path, 'w') as handle:
+        json.dump({'ANSIBLE_MODULE_ARGS': params}, handle)
+    for path in (stats_path, log_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    env = dict(os.environ)
+    env.update({
+        'PN_CLI_PATH': CLI, STATE_ENV: state, SWITCH_ENV: switch,
+        LOG_ENV: log_path, SCALE_ENV: str(scale),
+    })
+    start = time.time()
+    process = subprocess.Popen(
+        [python, RUNNER, os.path.join(LIBRARY, module + '.py'), args_path,
+         stats_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        env=env, universal_newlines=True)
+    out, err = process.communicate()
+    wall_time = time.time() - start
+
+    # The module prints its result as one json document on stdout.
+    try:
+        result = json.loads(out[out.index('{'):])
+    except ValueError:
+        result = {'failed': True, 'msg': err.strip()[-500:]}
+
+    run = {
+        'wall_time': wall_time, 'show_calls': 0, 'config_calls': 0,
+        'cli_processes': 0, 'bytes_parsed': 0, 'failed_calls': 0,
+        'peak_rss_kb': 0,
+        'failed': bool(result.get('failed')) or process.returncode != 0,
+        'msg': str(result.get('msg') or result.get('stderr') or '')[:500],
+    }
+    if os.path.exists(stats_path):
+        with open(stats_path) as handle:
+            run['peak_rss_kb'] = json.load(handle)['peak_rss_kb']
+    if os.path.exists(log_path):
+        with open(log_path) as handle:
+            for line in handle:
+                event = json.loads(line)
+                if event['event'] == 'start':
+                    run['cli_processes'] += 1
+                    continue
+                run[event['kind'] + '_calls'] += 1
+                run['bytes_parsed'] += event['bytes']
+                run['failed_calls'] += event['rc']
+    return run
+
+
+def run_scenario(name, topology, files, state, work, python, scale):
+    """
+    Method to run all module runs of a scenario and sum them up.
+    """
+    total = {
+        'scenario': name, 'runs': 0, 'wall_time': 0.0, 'show_calls': 0,
+        'config_calls': 0, 'cli_processes': 0, 'bytes_parsed': 0,
+        'failed_calls': 0, 'peak_rss_kb': 0, 'failed': False, 'msg': '',
+    }
+    for module, switch, params in scenario_runs(name, topology, files):
+        run = run_module(module, switch, params, state, work, python, scale)
+        total['runs'] += 1
+        for key in ('wall_time', 'show_calls', 'config_calls',
+                    'cli_processes', 'bytes_parsed', 'failed_calls'):
+            total[key] += run[key]
+        total['peak_rss_kb'] = max(total['peak_rss_kb'], run['peak_rss_kb'])
+        if run['failed'] and not total['failed']:
+            total['failed'] = True
+            total['msg'] = '%s on %s: %s' % (module, switch, run['msg'])
+    total['cli_calls'] = total['show_calls'] + total['config_calls']
+    return total
+
+
+def bench_size(spines, leafs, scenarios, args):
+    """
+    Method to benchmark the scenarios on one fabric size.
+    :return: List of result dicts.
+    """
+    results = []
+    work = tempfile.mkdtemp(prefix='pn-bench-')
+    try:
+        fabric_dir = os.path.join(work, 'fabric')
+        topology = gen_fabric.generate(
+            fabric_dir, spines, leafs, args.cluster_fraction, args.links,
+            0, args.breakout, latency=args.latency)
+        models = {None: os.path.join(fabric_dir, 'nvos_sim_state.json')}
+
+        needed = set(scenarios)
+        for name, base in reversed(SCENARIOS):
+            if name in needed and base:
+                needed.add(base)
+
+        for name, base in SCENARIOS:
+            if name not in needed or name == 'dci':
+                continue
+            state = os.path.join(work, name + '.json')
+            shutil.copy(models[base], state)
+            total = run_scenario(name, topology, fabric_dir, state, work,
+                                 args.python, args.latency_scale)
+            models[name] = state
+            if name in scenarios:
+                results.append(total)
+
+        if 'dci' in scenarios:
+            dci_dir = os.path.join(work, 'dci')
+            dci_topology = gen_fabric.generate(
+                dci_dir, 0, leafs, args.cluster_fraction, 1,
+                args.third_party, args.breakout, latency=args.latency)
+            results.append(run_scenario(
+                'dci', dci_topology, dci_dir,
+                os.path.join(dci_dir, 'nvos_sim_state.json'), work,
+                args.python, args.latency_scale))
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+        else:
+            sys.stderr.write('kept %s\n' % work)
+
+    for result in results:
+        result.update(spines=spines, leafs=leafs, switches=spines + leafs)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the fabric wide modules against simulated '
+                    'fabrics of increasing size.')
+    parser.add_argument('--leafs', default='4,8,16,32,64,128',
+                        help='Comma separated leaf counts.')
+    parser.add_argument('--spines', type=int, default=2)
+    parser.add_argument('--scenarios', default='all',
+                        help='Comma separated subset of: %s.' % ', '.join(
+                            name for name, _ in SCENARIOS))
+    parser.add_argument('--cluster-fraction', type=float, default=0.5)
+    parser.add_argument('--links', type=int, default=1)
+    parser.add_argument('--third-party', type=int, default=2,
+                        help='Third party routers of the dci fabric.')
+    parser.add_argument('--breakout', type=int, default=1)
+    parser.add_argument('--startup-latency', type=float, default=0.0)
+    parser.add_argument('--show-latency', type=float, default=0.0)
+    parser.add_argument('--config-latency', type=float, default=0.0)
+    parser.add_argument('--latency-scale', type=float, default=1.0)
+    parser.add_argument('--python', default='python2',
+                        help='Interpreter the modules run with.')
+    parser.add_argument('--label', default='',
+                        help='Free form label stored with the results, e.g. '
+                             'a git revision.')
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the generated fabrics and logs.')
+    args = parser.parse_args()
+
+    names = [name for name, _ in SCENARIOS]
+    scenarios = names if args.scenarios == 'all' else \
+        args.scenarios.split(',')
+    unknown = set(scenarios) - set(names)
+    if unknown:
+        parser.error('unknown scenarios: %s' % ', '.join(sorted(unknown)))
+    args.latency = {'startup': args.startup_latency,
+                    'show': args.show_latency,
+                    'config': args.config_latency}
+
+    results = []
+    for leafs in [int(count) for count in args.leafs.split(',')]:
+        for result in bench_size(args.spines, leafs, scenarios, args):
+            results.append(result)
+            print('%-12s %3d leafs %8.2fs %6d show %6d config %4d procs '
+                  '%10d bytes %8d KB%s' % (
+                      result['scenario'], leafs, result['wall_time'],
+                      result['show_calls'], result['config_calls'],
+                      result['cli_processes'], result['bytes_parsed'],
+                      result['peak_rss_kb'],
+                      '  FAILED' if result['failed'] else ''))
+
+    with open(args.output, 'w') as handle:
+        json.dump({
+            'label': args.label,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'latency': args.latency,
+            'latency_scale': args.latency_scale,
+            'results': results,
+        }, handle, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
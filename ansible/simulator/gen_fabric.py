@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+""" Synthetic spine/leaf fabric generator for the cli simulator """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+from nvos_sim import add_link, add_switch, empty_state
+
+# Host facing ports every leaf starts with, uplinks are numbered after them.
+HOST_PORTS = 48
+
+# First vlan id used for the generated csv rows.
+FIRST_VLAN = 100
+
+# First bgp-as of the leafs in third_party_dci.csv, clustered leafs share one.
+FIRST_LEAF_AS = 65001
+THIRD_PARTY_AS = 65000
+
+
+class Topology(object):
+    """
+    Description of a generated fabric, used to write the simulator model,
+    the inventory and the csv inputs of the playbooks.
+    """
+
+    def __init__(self, spines, leafs, cluster_pairs, third_party):
+        self.spines = spines
+        self.leafs = leafs
+        self.cluster_pairs = cluster_pairs
+        self.third_party = third_party
+        self.links = []
+        # Next free port number of every switch.
+        self.next_port = {}
+
+    def groups(self):
+        """
+        Method to group the leafs the way the csv files list them.
+        :return: List of tuples, (node1, node2) for clustered leafs and
+        (leaf,) for the others, in leaf order.
+        """
+        clustered = dict((pair[0], pair) for pair in self.cluster_pairs)
+        paired = set(leaf for pair in self.cluster_pairs for leaf in pair)
+        result = []
+        for leaf in self.leafs:
+            if leaf in clustered:
+                result.append(clustered[leaf])
+            elif leaf not in paired:
+                result.append((leaf,))
+        return result
+
+
+def build_topology(spines, leafs, cluster_fraction=0.5, links=1,
+                   third_party=0):
+    """
+    Method to lay out the switches and links of a fabric.
+    :param spines: Number of spine switches.
+    :param leafs: Number of leaf switches.
+    :param cluster_fraction: Fraction of the leafs cabled in cluster pairs
+    (consecutive leafs are paired).
+    :param links: Number of links between every spine and leaf.
+    :param third_party: Number of third party routers, each cabled to
+    every leaf.
+    :return: A Topology.
+    """
+    spine_names = ['spine%d' % (i + 1) for i in range(spines)]
+    leaf_names = ['leaf%d' % (i + 1) for i in range(leafs)]
+    pair_count = int(leafs * cluster_fraction) // 2
+    pairs = [(leaf_names[2 * i], leaf_names[2 * i + 1])
+             for i in range(pair_count)]
+    routers = ['ext-router%d' % (i + 1) for i in range(third_party)]
+    topology = Topology(spine_names, leaf_names, pairs, routers)
+
+    next_port = topology.next_port
+    next_port.update((name, 1) for name in spine_names + routers)
+    next_port.update((name, HOST_PORTS + 1) for name in leaf_names)
+
+    def cable(switch, peer):
+        topology.links.append((switch, str(next_port[switch]),
+                               peer, str(next_port[peer])))
+        next_port[switch] += 1
+        next_port[peer] += 1
+
+    for leaf in leaf_names:
+        for spine in spine_names:
+            for _ in range(links):
+                cable(spine, leaf)
+    for node1, node2 in pairs:
+        # Two cluster links between the nodes of every pair.
+        cable(node1, node2)
+        cable(node1, node2)
+    for router in routers:
+        for leaf in leaf_names:
+            cable(leaf, router)
+
+    return topology
+
+
+def build_state(topology, fabric='', breakout=0, latency=None):
+    """
+    Method to build the simulator model of a topology.
+    :param topology: The Topology.
+    :param fabric: Name of the fabric every switch is already part of, or
+    '' for switches fresh out of the box (eula not accepted, no fabric).
+    :param breakout: Number of unused 40g ports per switch that can be
+    broken out into 4x10g.
+    :param latency: Optional latency section of the model.
+    :return: The model as a dict.
+    """
+    state = empty_state()
+    if latency:
+        state['latency'].update(latency)
+    switches = topology.spines + topology.leafs
+    state['local'] = switches[0]
+
+    for index, name in enumerate(switches):
+        ports = {}
+        last = topology.next_port[name] - 1
+        if name in topology.leafs:
+            last = max(last, HOST_PORTS)
+        for port in range(1, last + 1):
+            ports[str(port)] = {}
+        # A 40g port occupies 4 port numbers, the bezel shows x.1 to x.4 and
+        # the 3 extra lanes are only used once it is broken out into 4x10g.
+        for quad in range(breakout):
+            first = last + 1 + 4 * quad
+            for lane in range(4):
+                ports[str(first + lane)] = {
+                    'speed': '40g' if lane == 0 else '10g',
+                    'bezel-port': '%d.%d' % (first, lane + 1),
+                    'enable': 'yes' if lane == 0 else 'no',
+                }
+        mgmt_ip = '10.9.%d.%d/16' % (index // 250, index % 250 + 1)
+        switch = add_switch(state, name, ports, mgmt_ip, fabric)
+        if not fabric:
+            setup = switch['settings']['switch-setup']
+            setup['eula-accepted'] = 'no'
+            setup['switch-name'] = 'nvos-%d' % (index + 1)
+
+    if fabric:
+        state['fabrics'][fabric] = {
+            'id': 'a0000001', 'vlan': '1', 'fabric-network': 'mgmt',
+            'control-network': 'mgmt', 'tid': len(switches),
+        }
+
+    for link in topology.links:
+        add_link(state, *link)
+
+    return state
+
+
+def subnet(index, base='172.168'):
+    """
+    Method to compute the /24 of the nth generated vlan. Past 256 vlans the
+    second octet is bumped.
+    """
+    first, second = [int(octet) for octet in base.split('.')]
+    return '%d.%d.%d.0/24' % (first, second + index // 256, index % 256)
+
+
+def csv_rows(topology, vlans_per_group=1):
+    """
+    Method to enumerate the vlans of the generated csv files.
+    :return: List of (vlan id, subnet, group) where group is a tuple of one
+    leaf or of the two nodes of a cluster.
+    """
+    rows = []
+    for group in topology.groups():
+        for _ in range(vlans_per_group):
+            index = len(rows)
+            rows.append((FIRST_VLAN + index, subnet(index), group))
+    return rows
+
+
+def write_hosts(topology, path, state):
+    """
+    Method to write the ansible inventory of a topology.
+    """
+    lines = ['#  Inventory of a generated fabric, see ansible/simulator', '#']
+    for group, names in (('spine', topology.spines), ('leaf', topology.leafs)):
+        lines += ['', '[%s]' % group]
+        for name in names:
+            ip = state['switches'][name]['mgmt-ip'].split('/')[0]
+            lines.append('%s ansible_host=%s' % (name, ip))
+    _write(path, lines)
+
+
+def write_l3_csv(topology, path, vlans_per_group=1, vrrp_id='19'):
+    """
+    Method to write a csv in the l3_auto_setup.csv format:
+    vlan, subnet, node1, node2, vrrp id, active switch for clusters and
+    vlan, subnet, leaf otherwise.
+    """
+    lines = []
+    for vlan, network, group in csv_rows(topology, vlans_per_group):
+        if len(group) == 2:
+            lines.append('%s, %s, %s, %s, %s, %s' % (
+                vlan, network, group[0], group[1], vrrp_id, group[0]))
+        else:
+            lines.append('%s, %s, %s' % (vlan, network, group[0]))
+    _write(path, lines)
+
+
+def write_dci_csv(topology, path, vlans_per_group=1, vrrp_id='19',
+                  first_vxlan=1000):
+    """
+    Method to write a csv in the dci.csv format, the l3_auto_setup.csv
+    columns followed by the vxlan id.
+    """
+    lines = []
+    rows = csv_rows(topology, vlans_per_group)
+    for index, (vlan, network, group) in enumerate(rows):
+        vxlan = first_vxlan + index
+        if len(group) == 2:
+            lines.append('%s, %s, %s, %s, %s, %s, %s' % (
+                vlan, network, group[0], group[1], vrrp_id, group[0], vxlan))
+        else:
+            lines.append('%s, %s, %s, %s' % (vlan, network, group[0], vxlan))
+    _write(path, lines)
+
+
+def write_vxlan_csv(topology, path, vlans_per_group=1, vrrp_id='19',
+                    first_vxlan=1000, loopback_port=HOST_PORTS):
+    """
+    Method to write a csv in the pn_vxlan format, the dci.csv columns
+    followed by the port of the vxlan loopback trunk. pn_vxlan expects the
+    vlan of every row on the clustered leafs, so the vlans of single leafs
+    are only written to fabrics without clusters.
+    """
+    lines = []
+    rows = csv_rows(topology, vlans_per_group)
+    for index, (vlan, network, group) in enumerate(rows):
+        vxlan = first_vxlan + index
+        if len(group) == 1 and topology.cluster_pairs:
+            continue
+        if len(group) == 2:
+            lines.append('%s, %s, %s, %s, %s, %s, %s, %s' % (
+                vlan, network, group[0], group[1], vrrp_id, group[0], vxlan,
+                loopback_port))
+        else:
+            lines.append('%s, %s, %s, %s, %s' % (vlan, network, group[0],
+                                                 vxlan, loopback_port))
+    _write(path, lines)
+
+
+def write_fabric_over_l3_csv(topology, path, vlans_per_group=1,
+                             vrrp_id='19'):
+    """
+    Method to write a csv in the fabric_over_l3.csv format, six columns
+    with the cluster columns left empty for non clustered leafs.
+    """
+    lines = []
+    for vlan, network, group in csv_rows(topology, vlans_per_group):
+        if len(group) == 2:
+            lines.append('%s, %s, %s, %s, %s, %s' % (
+                vlan, network, group[0], group[1], vrrp_id, group[0]))
+        else:
+            lines.append('%s, %s, %s,, , ,' % (vlan, network, group[0]))
+    _write(path, lines)
+
+
+def write_vrrp_l2_csv(topology, path, vlans):
+    """
+    Method to write a csv in the pn_vrrp_l2.csv format: vrrp ip subnet,
+    vlan, active spine. The active spine alternates between the spines.
+    """
+    lines = []
+    if not topology.spines:
+        vlans = 0
+    for index in range(vlans):
+        spine = topology.spines[index % len(topology.spines)]
+        lines.append('%s, %s, %s' % (subnet(index, '101.108'),
+                                     FIRST_VLAN + index, spine))
+    _write(path, lines)
+
+
+def write_third_party_csv(topology, path):
+    """
+    Method to write the bgp data of the third party routers in the
+    third_party_dci.csv format: router, neighbor ip, router bgp-as, leaf
+    bgp-as, leaf. Every router/leaf link gets a /30 out of 192.168.0.0/16.
+    """
+    leaf_as = {}
+    for index, group in enumerate(topology.groups()):
+        for leaf in group:
+            leaf_as[leaf] = FIRST_LEAF_AS + index
+
+    lines = []
+    count = 0
+    for router in topology.third_party:
+        for leaf in topology.leafs:
+            host = 4 * count + 2
+            neighbor = '192.168.%d.%d' % (host // 256, host % 256)
+            lines.append('%s, %s, %s, %s, %s' % (
+                router, neighbor, THIRD_PARTY_AS, leaf_as[leaf], leaf))
+            count += 1
+    _write(path, lines)
+
+
+def _write(path, lines):
+    with open(path, 'w') as handle:
+        handle.write('\n'.join(lines) + '\n')
+
+
+def generate(output, spines, leafs, cluster_fraction=0.5, links=1,
+             third_party=0, breakout=0, fabric='', vlans_per_group=1,
+             latency=None):
+    """
+    Method to generate a fabric and write all of its files to a directory:
+    nvos_sim_state.json, hosts, l3_auto_setup.csv, pn_vrrp_l2.csv, dci.csv,
+    vxlan.csv, fabric_over_l3.csv and third_party_dci.csv.
+    :return: The Topology.
+    """
+    topology = build_topology(spines, leafs, cluster_fraction, links,
+                              third_party)
+    state = build_state(topology, fabric, breakout, latency)
+
+    if not os.path.isdir(output):
+        os.makedirs(output)
+    with open(os.path.join(output, 'nvos_sim_state.json'), 'w') as handle:
+        json.dump(state, handle, sort_keys=True)
+
+    write_hosts(topology, os.path.join(output, 'hosts'), state)
+    write_l3_csv(topology, os.path.join(output, 'l3_auto_setup.csv'),
+                 vlans_per_group)
+    write_vrrp_l2_csv(topology, os.path.join(output, 'pn_vrrp_l2.csv'),
+                      len(csv_rows(topology, vlans_per_group)))
+    write_dci_csv(topology, os.path.join(output, 'dci.csv'),
+                  vlans_per_group)
+    write_vxlan_csv(topology, os.path.join(output, 'vxlan.csv'),
+                    vlans_per_group)
+    write_fabric_over_l3_csv(topology,
+                             os.path.join(output, 'fabric_over_l3.csv'),
+                             vlans_per_group)
+    write_third_party_csv(topology,
+                          os.path.join(output, 'third_party_dci.csv'))
+    return topology
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Generate a simulated spine/leaf fabric, its inventory '
+                    'and csv inputs.')
+    parser.add_argument('output', help='Directory to write the files to.')
+    parser.add_argument('--spines', type=int, default=2)
+    parser.add_argument('--leafs', type=int, default=4)
+    parser.add_argument('--cluster-fraction', type=float, default=0.5,
+                        help='Fraction of the leafs cabled in cluster pairs.')
+    parser.add_argument('--links', type=int, default=1,
+                        help='Links between every spine and leaf.')
+    parser.add_argument('--third-party', type=int, default=0,
+                        help='Third party routers cabled to every leaf.')
+    parser.add_argument('--breakout', type=int, default=0,
+                        help='Unused 40g breakout ports per switch.')
+    parser.add_argument('--fabric', default='',
+                        help='Fabric the switches are already part of. '
+                             'Without it the switches are fresh.')
+    parser.add_argument('--vlans-per-group', type=int, default=1,
+                        help='Csv vlans per leaf or cluster.')
+    parser.add_argument('--startup-latency', type=float, default=0.0)
+    parser.add_argument('--show-latency', type=float, default=0.0)
+    parser.add_argument('--config-latency', type=float, default=0.0)
+    args = parser.parse_args()
+
+    latency = {'startup': args.startup_latency, 'show': args.show_latency,
+               'config': args.config_latency}
+    topology = generate(args.output, args.spines, args.leafs,
+                        args.cluster_fraction, args.links, args.third_party,
+                        args.breakout, args.fabric, args.vlans_per_group,
+                        latency)
+    print('%d spines, %d leafs, %d clusters, %d links written to %s' % (
+        len(topology.spines), len(topology.leafs),
+        len(topology.cluster_pairs), len(topology.links), args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,1008 @@
+""" In-memory Netvisor fabric model backing the simulated cli """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import fcntl
+import json
+import os
+import shlex
+import sys
+import time
+
+# Environment variables understood by the simulator.
+STATE_ENV = 'PN_SIM_STATE'
+SWITCH_ENV = 'PN_SIM_SWITCH'
+SCALE_ENV = 'PN_SIM_LATENCY_SCALE'
+LOG_ENV = 'PN_SIM_LOG'
+DEFAULT_STATE = 'nvos_sim_state.json'
+
+# Cli options, as passed by pn_cli(). Only --user takes a value.
+VALUE_OPTIONS = ('--user',)
+
+# Tokens that never take a value. Any other token is a 'key value' pair,
+# except 'no-*' tokens and a trailing token, which are flags as well.
+FLAGS = frozenset([
+    'enable', 'disable', 'bfd', 'next-hop-self', 'allowas-in',
+    'auto-trunk', 'route-reflector-client', 'soft-reconfig-inbound',
+    'override-capability', 'stats', 'pause', 'routing', 'validate',
+    'jumbo', 'edge-switch', 'web', 'ssh', 'nfs', 'snmp', 'net-api',
+    'icmp', 'no-show-headers', 'count-output', 'lacp-fallback-timeout',
+    'bidir', 'loopback', 'host-enable',
+])
+
+# Output options, stripped from the command arguments.
+DISPLAY_OPTIONS = ('format', 'parsable-delim', 'no-show-headers',
+                   'count-output', 'show-interval', 'layout', 'sort-asc',
+                   'sort-desc', 'show-headers', 'show-diff-interval')
+
+# Flags mapped to explicit column values.
+FLAG_VALUES = {
+    'enable': ('enable', 'yes'),
+    'disable': ('enable', 'no'),
+}
+
+
+class Spec(object):
+    """
+    Description of a table of objects managed with <name>-create/add,
+    -modify, -delete/remove and -show.
+    scope is 'switch' for objects local to one switch, 'fabric' for objects
+    visible from every switch and 'vrouter' for objects of a vrouter.
+    """
+
+    def __init__(self, scope, key, columns):
+        self.scope = scope
+        self.key = key
+        self.columns = columns
+
+
+TABLES = {
+    'vlan': Spec('switch', ('id',), (
+        'switch', 'id', 'type', 'vxlan', 'scope', 'description', 'active',
+        'stats', 'ports', 'untagged-ports')),
+    'trunk': Spec('switch', ('name',), (
+        'switch', 'name', 'ports', 'speed', 'lacp-mode', 'status')),
+    'vlag': Spec('fabric', ('name',), (
+        'name', 'cluster', 'mode', 'switch', 'port', 'peer-switch',
+        'peer-port', 'status', 'local-state', 'lacp-mode')),
+    'tunnel': Spec('switch', ('name',), (
+        'switch', 'name', 'scope', 'type', 'vrouter-name',
+        'peer-vrouter-name', 'local-ip', 'remote-ip', 'next-hop', 'state')),
+    'tunnel-vxlan': Spec('switch', ('name', 'vxlan'), (
+        'switch', 'name', 'vxlan')),
+    'cluster': Spec('fabric', ('name',), (
+        'name', 'state', 'cluster-node-1', 'cluster-node-2', 'tid', 'mode',
+        'ports', 'remote-ports')),
+    'vrouter': Spec('fabric', ('name',), (
+        'name', 'type', 'scope', 'vnet', 'location', 'zone-id',
+        'router-type', 'hw-vrrp-id', 'router-id', 'bgp-as', 'bgp-max-paths',
+        'bgp-redistribute', 'ospf-redistribute', 'state')),
+    'vrouter-interface': Spec('vrouter', ('nic',), (
+        'vrouter-name', 'nic', 'ip', 'assignment', 'vlan', 'vxlan', 'if',
+        'exclusive', 'nic-state', 'l3-port', 'vrrp-id', 'vrrp-primary',
+        'vrrp-priority', 'vrrp-state')),
+    'vrouter-interface-config': Spec('vrouter', ('nic',), (
+        'vrouter-name', 'nic', 'ospf-hello-interval', 'ospf-cost',
+        'ospf-bfd')),
+    'vrouter-loopback-interface': Spec('vrouter', ('ip',), (
+        'vrouter-name', 'index', 'ip')),
+    'vrouter-bgp': Spec('vrouter', ('neighbor',), (
+        'vrouter-name', 'neighbor', 'remote-as', 'next-hop-self', 'bfd',
+        'allowas-in', 'weight', 'multi-protocol')),
+    'vrouter-bgp-network': Spec('vrouter', ('network',), (
+        'vrouter-name', 'network', 'netmask')),
+    'vrouter-ospf': Spec('vrouter', ('network',), (
+        'vrouter-name', 'network', 'ospf-area')),
+    'vrouter-ospf-area': Spec('vrouter', ('area',), (
+        'vrouter-name', 'area', 'stub-type')),
+    'vrouter-static-route': Spec('vrouter', ('network',), (
+        'vrouter-name', 'network', 'gateway-ip')),
+    'vflow': Spec('fabric', ('name',), (
+        'name', 'scope', 'type', 'vlan', 'action', 'precedence')),
+    'switch-route': Spec('switch', ('network',), (
+        'switch', 'network', 'gateway-ip', 'interface', 'state')),
+    'fabric-in-band-network': Spec('fabric', ('network',), (
+        'network', 'netmask')),
+    'fabric-comm-vrouter-bgp': Spec('fabric', ('name',), (
+        'name', 'bgp-as', 'neighbor', 'remote-as')),
+    'port-association': Spec('fabric', ('name',), (
+        'name', 'master-ports', 'slave-ports', 'bidir', 'virtual-wire')),
+}
+
+# Per switch settings, shown as 'column: value' lines.
+SETTINGS = {
+    'switch-setup': {
+        'switch-name': '', 'mgmt-ip': '', 'in-band-ip': '',
+        'gateway-ip': '', 'dns-ip': '', 'dns-secondary-ip': '',
+        'domain-name': '', 'ntp-server': '', 'eula-accepted': 'yes',
+    },
+    'stp': {'enable': 'yes', 'stp-mode': 'rstp'},
+    'system-settings': {'auto-trunk': 'on', 'optimize-arps': 'off'},
+    'fabric-local': {'fabric-network': 'mgmt', 'control-network': 'mgmt',
+                     'vlan': '1'},
+    'switch-mode': {'switch-mode': 'switched'},
+    'admin-service': {'if': 'mgmt', 'web': 'on', 'ssh': 'on'},
+}
+
+# Setting columns never shown back.
+HIDDEN = ('password',)
+
+PORT_COLUMNS = ('switch', 'port', 'bezel-port', 'status', 'speed',
+                'hostname', 'rport', 'trunk')
+PORT_CONFIG_COLUMNS = ('switch', 'port', 'bezel-port', 'speed', 'enable',
+                       'autoneg')
+LLDP_COLUMNS = ('switch', 'local-port', 'chassis-id', 'port-id', 'sys-name')
+FABRIC_NODE_COLUMNS = ('name', 'fab-name', 'mgmt-ip', 'in-band-ip',
+                       'fab-tid', 'state')
+FABRIC_COLUMNS = ('name', 'id', 'vlan', 'fabric-network',
+                  'control-network', 'tid')
+FABRIC_INFO_COLUMNS = ('name', 'id', 'vlan', 'fabric-network',
+                       'control-network', 'tid')
+
+
+class CliError(Exception):
+    """
+    A command failed. The message is printed on stderr.
+    """
+
+
+def empty_state():
+    """
+    Method to build an empty fabric model.
+    :return: The model as a dict.
+    """
+    return {
+        'local': '',
+        'latency': {'startup': 0.0, 'show': 0.0, 'config': 0.0,
+                    'commands': {}, 'settle': {}},
+        'switches': {},
+        'links': [],
+        'fabrics': {},
+        'tables': {},
+    }
+
+
+def add_switch(state, name, ports, mgmt_ip='', fabric=''):
+    """
+    Method to add a switch to the model.
+    :param state: The model.
+    :param name: Name of the switch.
+    :param ports: Dict of port number to a dict of port settings, e.g.
+    {'49': {'speed': '40g', 'bezel-port': '49'}}.
+    :param mgmt_ip: Management ip of the switch.
+    :param fabric: Name of the fabric the switch is part of, if any.
+    :return: The switch dict.
+    """
+    settings = dict((table, dict(values))
+                    for table, values in SETTINGS.items())
+    settings['switch-setup']['switch-name'] = name
+    settings['switch-setup']['mgmt-ip'] = mgmt_ip
+    switch = {
+        'mgmt-ip': mgmt_ip,
+        'fabric': fabric,
+        'settings': settings,
+        'ports': {},
+        'ready-at': 0,
+    }
+    for port, values in ports.items():
+        config = {'bezel-port': str(port), 'speed': '10g', 'enable': 'yes',
+                  'autoneg': 'off', 'ready-at': 0}
+        config.update(values)
+        switch['ports'][str(port)] = config
+    state['switches'][name] = switch
+    # Every switch ships with the trunk vxlan loopback ports are added to.
+    state['tables'].setdefault('trunk', []).append(
+        {'switch': name, 'name': 'vxlan-loopback-trunk', 'ports': ''})
+    return switch
+
+
+def add_link(state, switch, port, peer, peer_port):
+    """
+    Method to cable two ports. The peer may be a host outside the model
+    (e.g. a third party router), which only shows up over LLDP.
+    """
+    state['links'].append([switch, str(port), peer, str(peer_port)])
+
+
+def parse_args(tokens):
+    """
+    Method to parse command arguments into an ordered list of pairs.
+    :param tokens: The arguments following the command name.
+    :return: List of (name, value) tuples, value is None for flags.
+    """
+    pairs = []
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        if (token in FLAGS or token.startswith('no-') or
+                index + 1 == len(tokens)):
+            pairs.append((token, None))
+            index += 1
+        else:
+            pairs.append((token, tokens[index + 1]))
+            index += 2
+
+    return pairs
+
+
+def expand_ports(ports):
+    """
+    Method to expand a port list such as '1,5-8' into port numbers.
+    """
+    result = []
+    for part in str(ports).split(','):
+        if '-' in part and part.replace('-', '').isdigit():
+            start, end = part.split('-')
+            result.extend(str(p) for p in range(int(start), int(end) + 1))
+        elif part:
+            result.append(part)
+
+    return result
+
+
+def port_key(port):
+    """
+    Sort key placing numeric ports in numeric order.
+    """
+    return (0, int(port), '') if port.isdigit() else (1, 0, port)
+
+
+def matches(row, name, value):
+    """
+    Method to compare a show filter with a row value. Ip filters match
+    with or without the prefix length, port filters take lists and ranges.
+    """
+    current = str(row.get(name, ''))
+    if current == value:
+        return True
+    if name in ('port', 'local-port') and current in expand_ports(value):
+        return True
+    return '/' in current and current.split('/')[0] == value
+
+
+class Fabric(object):
+    """
+    Executes Netvisor cli commands against the fabric model.
+    """
+
+    def __init__(self, state, local):
+        self.state = state
+        self.local = local or state.get('local', '')
+        self.changed = False
+        # Simulated latency of the last command, slept off by the caller
+        # once the model is unlocked.
+        self.delay = 0.0
+        self.kind = None
+        self.scale = float(os.environ.get(SCALE_ENV, '1') or 1)
+
+    # Timing
+
+    def latency(self, command, verb):
+        """
+        Method to look up the simulated latency of one command.
+        """
+        latency = self.state.get('latency', {})
+        per_command = latency.get('commands', {})
+        if command in per_command:
+            return per_command[command] * self.scale
+        kind = 'show' if verb in ('show', 'info') else 'config'
+        return latency.get(kind, 0.0) * self.scale
+
+    def settle(self, event):
+        """
+        Method to compute when an asynchronous change becomes visible.
+        :param event: 'port', 'restart', 'fabric-join' or 'route'.
+        :return: Absolute time the change settles at.
+        """
+        delay = self.state.get('latency', {}).get('settle', {}).get(event, 0)
+        return time.time() + delay * self.scale
+
+    # Command dispatch
+
+    def execute(self, tokens):
+        """
+        Method to run one command.
+        :param tokens: The command tokens, without the cli path and options.
+        :return: The command output.
+        """
+        switch, targeted = self.local, False
+        if tokens and tokens[0] == 'switch-local':
+            tokens, targeted = tokens[1:], True
+        elif len(tokens) > 1 and tokens[0] == 'switch':
+            switch, tokens, targeted = tokens[1], tokens[2:], True
+        if not tokens:
+            raise CliError('command expected')
+
+        command = tokens[0]
+        pairs = parse_args(tokens[1:])
+        display = dict((name, value) for name, value in pairs
+                       if name in DISPLAY_OPTIONS)
+        args = [(name, value) for name, value in pairs
+                if name not in DISPLAY_OPTIONS]
+
+        if command == 'echo':
+            return ' '.join(tokens[1:]) + '\n'
+
+        if switch not in self.state['switches']:
+            raise CliError('switch %s not found' % switch)
+        if self.state['switches'][switch].get('ready-at', 0) > time.time():
+            raise CliError('nvOSd on %s is not responding' % switch)
+
+        obj, _, verb = command.rpartition('-')
+        self.delay = self.latency(command, verb)
+        self.kind = 'show' if verb in ('show', 'info') else 'config'
+
+        if verb == 'show':
+            columns, rows, record, prefix = self.show(obj, switch, targeted,
+                                                      args)
+            return render(columns, rows, record, prefix, display)
+        if command == 'fabric-info':
+            columns, rows = self.fabric_info(switch)
+            return render(columns, rows, True, None, display)
+
+        out = ''
+        handler = getattr(self, 'do_' + command.replace('-', '_'), None)
+        if handler is not None:
+            out = handler(switch, dict(args)) or ''
+        elif obj in TABLES and verb in ('create', 'add'):
+            self.create(obj, switch, args)
+        elif obj in TABLES and verb in ('delete', 'remove'):
+            self.delete(obj, switch, args)
+        elif obj in TABLES and verb == 'modify':
+            self.modify(obj, switch, args)
+        elif obj in SETTINGS and verb == 'modify':
+            self.modify_settings(obj, switch, args)
+        else:
+            raise CliError('unknown command')
+
+        self.changed = True
+        return out
+
+    # Generic tables
+
+    def table(self, obj):
+        return self.state['tables'].setdefault(obj, [])
+
+    def owner(self, obj, switch, values):
+        """
+        Method to check that the switch/vrouter owning a new row exists.
+        """
+        spec = TABLES[obj]
+        if spec.scope == 'vrouter':
+            vrouter = values.get('vrouter-name')
+            if not self.find('vrouter', name=vrouter):
+                raise CliError('vrouter %s not found' % vrouter)
+            values['switch'] = vrouter
+        elif spec.scope == 'switch':
+            values['switch'] = switch
+
+    def find(self, obj, **conditions):
+        """
+        Method to fetch the rows of a table matching column values. Keyword
+        names use '_' in place of '-'.
+        """
+        conditions = [(name.replace('_', '-'), str(value))
+                      for name, value in conditions.items()]
+        return [row for row in self.table(obj)
+                if all(row.get(name) == value for name, value in conditions)]
+
+    def select(self, obj, values):
+        """
+        Method to fetch the rows identified by the key columns in values.
+        """
+        spec = TABLES[obj]
+        key = list(spec.key)
+        if spec.scope == 'vrouter':
+            key.insert(0, 'vrouter-name')
+        elif spec.scope == 'switch':
+            key.insert(0, 'switch')
+        given = [name for name in key if name in values]
+        if not given:
+            raise CliError('%s: %s required' % (obj, ' '.join(spec.key)))
+        return [row for row in self.table(obj)
+                if all(matches(row, name, values[name]) for name in given)]
+
+    def create(self, obj, switch, args):
+        values = column_values(args)
+        self.owner(obj, switch, values)
+        spec = TABLES[obj]
+        if obj == 'vlan' and values.get('scope') in ('fabric', 'cluster'):
+            switches = self.scope_switches(switch, values['scope'])
+        else:
+            switches = [switch]
+
+        rows = []
+        for name in switches:
+            row = dict(values)
+            if spec.scope == 'switch':
+                row['switch'] = name
+            if self.select(obj, row):
+                raise CliError('%s %s already exists' % (
+                    obj, ' '.join(row.get(k, '') for k in spec.key)))
+            rows.append(row)
+
+        for row in rows:
+            self.table(obj).append(row)
+
+    def delete(self, obj, switch, args):
+        values = column_values(args)
+        if TABLES[obj].scope == 'switch':
+            values['switch'] = switch
+        rows = self.select(obj, values)
+        if not rows:
+            raise CliError('%s not found' % obj)
+        table = self.table(obj)
+        table[:] = [row for row in table if row not in rows]
+        return rows
+
+    def modify(self, obj, switch, args):
+        values = column_values(args)
+        if TABLES[obj].scope == 'switch':
+            values['switch'] = switch
+        rows = self.select(obj, values)
+        if not rows:
+            raise CliError('%s not found' % obj)
+        for row in rows:
+            row.update(values)
+
+    def modify_settings(self, obj, switch, args):
+        settings = self.state['switches'][switch]['settings']
+        settings.setdefault(obj, {}).update(setting_values(args))
+
+    def scope_switches(self, switch, scope):
+        """
+        Method to list the switches a fabric or cluster scoped object is
+        created on.
+        """
+        if scope == 'cluster':
+            for row in self.table('cluster'):
+                nodes = [row['cluster-node-1'], row['cluster-node-2']]
+                if switch in nodes:
+                    return nodes
+            return [switch]
+        fabric = self.state['switches'][switch].get('fabric')
+        if not fabric:
+            return [switch]
+        return sorted(name for name, data in self.state['switches'].items()
+                      if data.get('fabric') == fabric)
+
+    # Shows
+
+    def show(self, obj, switch, targeted, args):
+        """
+        Method to build the rows of a show command.
+        :param obj: The object shown, e.g. 'vrouter-interface'.
+        :param switch: The switch the command runs on.
+        :param targeted: True if the command named its switch, fabric wide
+        shows are then limited to that switch.
+        :param args: The parsed show filters.
+        :return: Tuple of (default columns, rows, True for 'column: value'
+        output, name of the implicit first column or None).
+        """
+        filters = column_values(args)
+        if obj in SETTINGS:
+            settings = dict(SETTINGS[obj])
+            settings.update(self.state['switches'][switch]['settings'].get(
+                obj, {}))
+            columns = tuple(name for name in sorted(settings)
+                            if name not in HIDDEN)
+            return columns, [settings], True, None
+
+        if obj == 'eula':
+            setup = self.state['switches'][switch]['settings']['switch-setup']
+            if setup.get('eula-accepted') not in ('yes', 'true'):
+                raise CliError('eula has not been accepted')
+            return ('eula-accepted',), [{'eula-accepted': 'yes'}], True, None
+
+        prefix = None
+        if obj in TABLES:
+            spec = TABLES[obj]
+            columns = spec.columns
+            rows = self.table(obj)
+            if obj == 'switch-route':
+                rows = self.route_rows()
+            if spec.scope == 'switch':
+                if targeted:
+                    filters.setdefault('switch', switch)
+                else:
+                    rows, prefix = self.fabric_scope(switch, rows)
+            elif spec.scope == 'vrouter':
+                prefix = 'vrouter-name'
+        elif obj in ('port', 'lldp'):
+            if obj == 'port':
+                columns, rows = PORT_COLUMNS, self.port_rows()
+            else:
+                columns, rows = LLDP_COLUMNS, self.lldp_rows()
+            if targeted:
+                filters.setdefault('switch', switch)
+            else:
+                rows, prefix = self.fabric_scope(switch, rows)
+        elif obj == 'port-config':
+            # Port configuration is only ever shown for one switch.
+            columns, rows = PORT_CONFIG_COLUMNS, self.port_config_rows()
+            filters.setdefault('switch', switch)
+        elif obj == 'fabric-node':
+            columns, rows = FABRIC_NODE_COLUMNS, self.fabric_node_rows(switch)
+        elif obj == 'fabric':
+            columns = FABRIC_COLUMNS
+            rows = [dict(data, name=name) for name, data in
+                    sorted(self.state['fabrics'].items())]
+        else:
+            raise CliError('unknown command')
+
+        rows = [row for row in rows
+                if all(matches(row, name, value)
+                       for name, value in filters.items())]
+        return columns, rows, False, prefix
+
+    def fabric_scope(self, switch, rows):
+        """
+        Method to limit the rows of an untargeted show to the fabric of the
+        switch. A switch outside of a fabric, or alone in it, only shows its
+        own rows and no switch column.
+        :return: Tuple of (rows, name of the implicit first column or None).
+        """
+        fabric = self.state['switches'][switch].get('fabric')
+        members = set(name for name, data in self.state['switches'].items()
+                      if fabric and data.get('fabric') == fabric)
+        members.add(switch)
+        rows = [row for row in rows if row.get('switch') in members]
+        return rows, 'switch' if len(members) > 1 else None
+
+    def route_rows(self):
+        now = time.time()
+        return [dict(row, state='active' if row['ready-at'] <= now
+                     else 'pending') for row in self.table('switch-route')]
+
+    def port_rows(self):
+        peers = {}
+        for switch, port, peer, peer_port in self.state['links']:
+            peers[(switch, port)] = (peer, peer_port)
+            peers[(peer, peer_port)] = (switch, port)
+        trunks = {}
+        for row in self.table('trunk'):
+            for port in expand_ports(row.get('ports', '')):
+                trunks[(row['switch'], port)] = row['name']
+
+        now = time.time()
+        rows = []
+        for switch, data in sorted(self.state['switches'].items()):
+            for port in sorted(data['ports'], key=port_key):
+                config = data['ports'][port]
+                up = config['enable'] == 'yes' and config['ready-at'] <= now
+                peer, rport = peers.get((switch, port), ('', ''))
+                rows.append({
+                    'switch': switch, 'port': port,
+                    'bezel-port': config['bezel-port'],
+                    'status': 'up' if up else 'down',
+                    'speed': config['speed'],
+                    'hostname': peer if up else '',
+                    'rport': rport if up else '',
+                    'trunk': trunks.get((switch, port), ''),
+                })
+        return rows
+
+    def port_config_rows(self):
+        rows = []
+        for switch, data in sorted(self.state['switches'].items()):
+            for port in sorted(data['ports'], key=port_key):
+                row = dict(data['ports'][port], switch=switch, port=port)
+                rows.append(row)
+        return rows
+
+    def lldp_rows(self):
+        rows = []
+        for row in self.port_rows():
+            if row['hostname']:
+                peer = self.state['switches'].get(row['hostname'], {})
+                rows.append({
+                    'switch': row['switch'], 'local-port': row['port'],
+                    'chassis-id': peer.get('mgmt-ip', row['hostname']),
+                    'port-id': row['rport'], 'sys-name': row['hostname'],
+                })
+        return rows
+
+    def fabric_node_rows(self, switch):
+        fabric = self.state['switches'][switch].get('fabric')
+        now = time.time()
+        rows = []
+        for name, data in sorted(self.state['switches'].items()):
+            if name != switch and (not fabric or data['fabric'] != fabric):
+                continue
+            setup = data['settings']['switch-setup']
+            online = data.get('online-at', 0) <= now
+            rows.append({
+                'name': name, 'fab-name': data['fabric'],
+                'mgmt-ip': setup.get('mgmt-ip', ''),
+                'in-band-ip': setup.get('in-band-ip', ''),
+                'fab-tid': str(self.state['fabrics'].get(
+                    data['fabric'], {}).get('tid', '')),
+                'state': 'online' if online else 'offline',
+            })
+        return rows
+
+    def fabric_info(self, switch):
+        data = self.state['switches'][switch]
+        if not data.get('fabric'):
+            raise CliError('switch is not part of a fabric')
+        fabric = dict(self.state['fabrics'].get(data['fabric'], {}))
+        fabric.update(data['settings']['fabric-local'])
+        fabric['name'] = data['fabric']
+        return FABRIC_INFO_COLUMNS, [fabric]
+
+    # Commands with side effects beyond their own table
+
+    def do_fabric_create(self, switch, args):
+        name = args.get('name')
+        if name in self.state['fabrics']:
+            raise CliError('fabric %s already exists' % name)
+        self.state['fabrics'][name] = {
+            'id': 'a000%04x' % (len(self.state['fabrics']) + 1),
+            'vlan': args.get('vlan', '1'),
+            'fabric-network': args.get('fabric-network', 'mgmt'),
+            'control-network': args.get('control-network', 'mgmt'),
+            'tid': 1,
+        }
+        self.join(switch, name)
+
+    def do_fabric_join(self, switch, args):
+        name = args.get('name')
+        if 'switch-ip' in args:
+            # Switches are joined through their mgmt or in-band ip.
+            for data in self.state['switches'].values():
+                setup = data['settings']['switch-setup']
+                ips = (data['mgmt-ip'], setup.get('in-band-ip', ''))
+                if args['switch-ip'] in [ip.split('/')[0] for ip in ips]:
+                    name = data['fabric']
+        if name not in self.state['fabrics']:
+            raise CliError('fabric %s not found' % name)
+        self.join(switch, name)
+
+    def join(self, switch, name):
+        data = self.state['switches'][switch]
+        data['fabric'] = name
+        data['online-at'] = self.settle('fabric-join')
+        self.state['fabrics'][name]['tid'] += 1
+
+    def do_port_config_modify(self, switch, args):
+        ports = self.state['switches'][switch]['ports']
+        values = setting_values(args.items())
+        values.pop('port', None)
+        for port in expand_ports(args.get('port', '')):
+            if port not in ports:
+                raise CliError('port %s not found' % port)
+            ports[port].update(values)
+            if 'enable' in values or 'speed' in values:
+                ports[port]['ready-at'] = self.settle('port')
+
+    def do_switch_mode_modify(self, switch, args):
+        self.modify_settings('switch-mode', switch, args.items())
+        self.state['switches'][switch]['ready-at'] = self.settle('restart')
+
+    def do_vrouter_create(self, switch, args):
+        if self.find('vrouter', location=switch):
+            raise CliError('switch %s already hosts a vrouter' % switch)
+        # nvOS reports hw-vrrp-id -1 for vrouters without vrrp.
+        self.create('vrouter', switch, [('hw-vrrp-id', '-1')] + list(
+            args.items()) + [('location', switch), ('state', 'enabled')])
+
+    def do_fabric_comm_vrouter_bgp_create(self, switch, args):
+        # Creates the vrouter of a switch joining a fabric over L3 along
+        # with its uplink interface and first bgp neighbor.
+        name = args.get('name')
+        self.do_vrouter_create(switch, {
+            'name': name, 'router-type': 'hardware',
+            'bgp-as': args.get('bgp-as', ''),
+            'router-id': args.get('router-id', '')})
+        self.create('fabric-comm-vrouter-bgp', switch, args.items())
+        self.do_vrouter_interface_add(switch, {
+            'vrouter-name': name, 'ip': args.get('bgp-nic-ip', ''),
+            'l3-port': args.get('bgp-nic-l3-port', '')})
+        self.create('vrouter-bgp', switch, [
+            (column, args[column]) for column in TABLES['vrouter-bgp'].columns
+            if column in args] + [('vrouter-name', name)])
+
+    def do_vrouter_delete(self, switch, args):
+        for row in self.delete('vrouter', switch, args.items()):
+            for obj, spec in TABLES.items():
+                if spec.scope == 'vrouter':
+                    table = self.table(obj)
+                    table[:] = [sub for sub in table
+                                if sub.get('vrouter-name') != row['name']]
+
+    def do_vrouter_interface_add(self, switch, args):
+        vrouter = args.get('vrouter-name')
+        ip = args.get('ip', '')
+        for row in self.find('vrouter-interface', vrouter_name=vrouter):
+            if ip and row['ip'].split('/')[0] == ip.split('/')[0]:
+                raise CliError('ip %s already exists on %s' % (ip, vrouter))
+        index = len(self.find('vrouter-interface', vrouter_name=vrouter))
+        nic = 'eth%d.%s' % (index, args.get('vlan', '0'))
+        values = list(args.items()) + [('nic', nic), ('nic-state', 'up')]
+        if 'netmask' in args and '/' not in ip:
+            values.append(('ip', '%s/%s' % (ip, args['netmask'])))
+        self.create('vrouter-interface', switch, values)
+
+    def do_vrouter_loopback_interface_add(self, switch, args):
+        vrouter = args.get('vrouter-name')
+        index = len(self.find('vrouter-loopback-interface',
+                              vrouter_name=vrouter)) + 1
+        self.create('vrouter-loopback-interface', switch,
+                    list(args.items()) + [('index', str(index))])
+
+    def do_switch_route_create(self, switch, args):
+        self.create('switch-route', switch, list(args.items()) + [
+            ('ready-at', self.settle('route'))])
+
+    def do_tunnel_vxlan_add(self, switch, args):
+        self.create('tunnel-vxlan', switch, args.items())
+
+    def do_cluster_create(self, switch, args):
+        if args.get('cluster-node-1') == args.get('cluster-node-2'):
+            raise CliError('cluster nodes must be distinct')
+        for node in (args.get('cluster-node-1'), args.get('cluster-node-2')):
+            if node not in self.state['switches']:
+                raise CliError('switch %s not found' % node)
+            if (self.find('cluster', cluster_node_1=node) or
+                    self.find('cluster', cluster_node_2=node)):
+                raise CliError('switch %s is already in a cluster' % node)
+        self.create('cluster', switch, list(args.items()) + [
+            ('state', 'online')])
+
+    def do_switch_setup_modify(self, switch, args):
+        values = setting_values(args.items())
+        if 'eula-accepted' in values:
+            values['eula-accepted'] = (
+                'yes' if values['eula-accepted'] in ('yes', 'true') else 'no')
+        setup = self.state['switches'][switch]['settings']['switch-setup']
+        accepted = setup.get('eula-accepted') == 'yes'
+        setup.update(values)
+        # The cli confirms the initial setup and mgmt-ip changes, which the
+        # ZTP modules check for.
+        if not accepted and setup.get('eula-accepted') == 'yes':
+            return 'Setup completed successfully\n'
+        if 'mgmt-ip' in values:
+            return 'mgmt-ip modified successfully\n'
+
+
+def column_values(args):
+    """
+    Method to turn parsed arguments into column values. Flags become
+    'yes' (or 'no' for no-* flags).
+    """
+    values = {}
+    for name, value in args:
+        if value is None:
+            name, value = flag_value(name, 'yes', 'no')
+        values[name] = value
+    return values
+
+
+def setting_values(args):
+    """
+    Method to turn parsed arguments into setting values. Flags become
+    'on' (or 'off' for no-* flags), except enable/disable.
+    """
+    values = {}
+    for name, value in args:
+        if value is None:
+            name, value = flag_value(name, 'on', 'off')
+        values[name] = value
+    return values
+
+
+def flag_value(flag, on, off):
+    if flag in FLAG_VALUES:
+        return FLAG_VALUES[flag]
+    if flag.startswith('no-'):
+        return flag[3:], off
+    return flag, on
+
+
+def render(columns, rows, record, prefix, display):
+    """
+    Method to print rows the way the Netvisor cli does.
+    :param columns: Default columns of the show.
+    :param rows: List of dicts.
+    :param record: True for single object shows printed as 'column: value'.
+    :param prefix: Column fabric wide shows print first even when format
+    does not ask for it, or None.
+    :param display: Dict of output options (format, parsable-delim, ...).
+    """
+    if display.get('format') and display['format'] != 'all':
+        columns = tuple(display['format'].split(','))
+    if prefix and prefix not in columns:
+        columns = (prefix,) + columns
+    else:
+        prefix = None
+    delim = display.get('parsable-delim')
+
+    lines = []
+    if record:
+        for row in rows:
+            if delim:
+                lines.append(delim.join(str(row.get(c, '')) for c in columns))
+            else:
+                lines.extend('%s: %s' % (c, row.get(c, '')) for c in columns)
+    else:
+        table = [[str(row.get(c, '')) for c in columns] for row in rows]
+        if delim:
+            lines = [delim.join(values) for values in table]
+        else:
+            header = list(columns)
+            if prefix:
+                header[0] = ''
+            widths = [len(name) for name in header]
+            for values in table:
+                widths = [max(w, len(v)) for w, v in zip(widths, values)]
+            if 'no-show-headers' not in display and table:
+                lines.append(format_line(header, widths))
+            lines.extend(format_line(values, widths) for values in table)
+
+    if 'count-output' in display:
+        lines.append('Count: %d' % len(rows))
+
+    return ''.join(line + '\n' for line in lines)
+
+
+def format_line(values, widths):
+    return '  '.join(v.ljust(w) for v, w in zip(values, widths)).rstrip()
+
+
+class StateFile(object):
+    """
+    The fabric model persisted as json, shared by every simulated cli
+    process. Reads take a shared lock, writes an exclusive one, and the
+    file is only re-read when it changed on disk.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = path + '.lock'
+        self.state = None
+        self.stamp = None
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size, stat.st_ino)
+
+    def load(self):
+        stamp = self._stamp()
+        if stamp is None:
+            self.state, self.stamp = empty_state(), None
+        elif stamp != self.stamp:
+            with open(self.path) as handle:
+                self.state = json.load(handle)
+            self.stamp = stamp
+        return self.state
+
+    def save(self):
+        tmp = '%s.%d.tmp' % (self.path, os.getpid())
+        with open(tmp, 'w') as handle:
+            json.dump(self.state, handle, sort_keys=True)
+        os.rename(tmp, self.path)
+        self.stamp = self._stamp()
+
+    def run(self, tokens, local):
+        """
+        Method to run one command against the model.
+        :return: Tuple of (stdout, stderr).
+        """
+        out, err = '', ''
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                fabric = Fabric(self.load(), local)
+                try:
+                    out = fabric.execute(tokens)
+                except CliError as exc:
+                    err = '%s: %s\n' % (command_name(tokens), exc)
+                if fabric.changed:
+                    self.save()
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+        if fabric.delay:
+            time.sleep(fabric.delay)
+        if fabric.kind:
+            log_event(event='command', command=command_name(tokens),
+                      kind=fabric.kind,
+                      switch=tokens[1] if tokens[0] == 'switch' else local,
+                      bytes=len(out) + len(err), rc=1 if err else 0)
+        return out, err
+
+
+def log_event(**event):
+    """
+    Method to append one event to the PN_SIM_LOG file, if set, as a json
+    line. The benchmarks count cli processes and commands from it.
+    """
+    path = os.environ.get(LOG_ENV)
+    if path:
+        with open(path, 'a') as handle:
+            handle.write(json.dumps(event, sort_keys=True) + '\n')
+
+
+def command_name(tokens):
+    """
+    Method to pick the command name out of the command tokens.
+    """
+    if tokens[0] == 'switch' and len(tokens) > 2:
+        return tokens[2]
+    if tokens[0] == 'switch-local' and len(tokens) > 1:
+        return tokens[1]
+    return tokens[0]
+
+
+def split_options(argv):
+    """
+    Method to split the cli arguments into options and command tokens.
+    """
+    index = 0
+    options = []
+    while index < len(argv) and argv[index].startswith('--'):
+        options.append(argv[index])
+        if argv[index] in VALUE_OPTIONS:
+            index += 1
+        index += 1
+    return options, argv[index:]
+
+
+def main(argv=None):
+    """
+    Entry point of the simulated cli. With a command on the command line
+    it runs that command and exits, otherwise it reads one command per line
+    from stdin like an interactive session.
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    options, tokens = split_options(argv)
+    state = StateFile(os.environ.get(STATE_ENV, DEFAULT_STATE))
+    local = os.environ.get(SWITCH_ENV, '')
+    log_event(event='start', session=not tokens)
+
+    startup = state.load().get('latency', {}).get('startup', 0.0)
+    startup *= float(os.environ.get(SCALE_ENV, '1') or 1)
+    if startup:
+        time.sleep(startup)
+
+    if tokens:
+        out, err = state.run(tokens, local)
+        sys.stdout.write(out)
+        sys.stderr.write(err)
+        return 1 if err else 0
+
+    while True:
+        line = sys.stdin.readline()
+        if not line:
+            return 0
+        try:
+            tokens = shlex.split(line)
+        except ValueError as exc:
+            out, err = '', '%s\n' % exc
+        else:
+            if not tokens:
+                continue
+            out, err = state.run(tokens, local)
+        if err:
+            sys.stderr.write(err)
+            sys.stderr.flush()
+        sys.stdout.write(out)
+        sys.stdout.flush()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+""" Run one Pluribus Ansible module outside of a playbook """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+# Usage: run_module.py <module.py> <args.json> <stats.json>
+#
+# args.json holds {"ANSIBLE_MODULE_ARGS": {...}} like the file ansible
+# passes to a module. The module prints its json result on stdout and the
+# wall time and peak rss of this process are written to stats.json.
+
+import json
+import os
+import resource
+import runpy
+import sys
+import time
+
+MODULE_UTILS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.realpath(__file__))), 'module_utils')
+
+
+def main():
+    module_path, args_path, stats_path = sys.argv[1:4]
+
+    # Serve ansible.module_utils.pn_* from this repository, the way the
+    # module_utils setting of ansible.cfg does.
+    import ansible.module_utils
+    ansible.module_utils.__path__.append(MODULE_UTILS)
+
+    sys.argv = [module_path, args_path]
+    start = time.time()
+    try:
+        runpy.run_path(module_path, run_name='__main__')
+    except SystemExit:
+        pass
+    finally:
+        stats = {
+            'wall_time': time.time() - start,
+            'peak_rss_kb': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss,
+        }
+        with open(stats_path, 'w') as handle:
+            json.dump(stats, handle)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+""" pytest fixtures of the unit tests of the shared module_utils """
+
+#
+# This file is part of Ansible
+#
+# Ansible is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Ansible is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Ansible.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+import importlib
+import os
+import sys
+import types
+
+import pytest
+
+MODULE_UTILS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'module_utils')
+
+# The shared code imports itself as ansible.module_utils.<name>, the way
+# Ansible ships it along with a module. Resolve that package to this tree,
+# on top of the installed Ansible if there is one.
+try:
+    importlib.import_module('ansible.module_utils')
+except ImportError:
+    for name in ('ansible', 'ansible.module_utils'):
+        package = types.ModuleType(name)
+        package.__path__ = []
+        sys.modules[name] = package
+    sys.modules['ansible'].module_utils = sys.modules['ansible.module_utils']
+package = sys.modules['ansible.module_utils']
+package.__path__ = [MODULE_UTILS] + [path for path in package.__path__
+                                     if path != MODULE_UTILS]
+
+from ansible.module_utils import pn_parsable, pn_reconcile
+
+
+class ModuleExit(Exception):
+    """
+    Raised by FakeModule.exit_json(), with its arguments.
+    """
+
+    def __init__(self, result):
+        Exception.__init__(self, result.get('msg'))
+        self.result = result
+
+
+class FakeModule(object):
+    """
+    The parts of AnsibleModule the shared code uses.
+    """
+
+    def __init__(self, params=None, check_mode=False):
+        self.params = params or {}
+        self.check_mode = check_mode
+
+    def exit_json(self, **result):
+        raise ModuleExit(result)
+
+    fail_json = exit_json
+
+
+class FakeFabric(object):
+    """
+    Show tables answering the parsable shows of pn_parsable.show(), and the
+    log of every other command run.
+    """
+
+    def __init__(self):
+        self.tables = {}
+        self.shows = []
+        self.commands = []
+
+    def run_command(self, module, cli):
+        """
+        Stand in for pn_nvos.pn_run_command().
+        :return: Tuple of (rc, out, err).
+        """
+        command = [word for word in cli if word.endswith('-show')]
+        if not command:
+            self.commands.append(' '.join(cli))
+            return 0, '', ''
+
+        self.shows.append(command[0])
+        columns = cli[cli.index('format') + 1].split(',')
+        rows = self.tables.get(command[0], [])
+        return 0, ''.join(
+            pn_parsable.DELIMITER.join(str(row.get(column, ''))
+                                       for column in columns) + '\n'
+            for row in rows), ''
+
+
+@pytest.fixture
+def module():
+    return FakeModule()
+
+
+@pytest.fixture
+def fabric(monkeypatch):
+    fake = FakeFabric()
+    monkeypatch.setattr(pn_parsable, 'pn_run_command', fake.run_command)
+    monkeypatch.setattr(pn_reconcile, 'pn_run_command', fake.run_command)
+    return fake
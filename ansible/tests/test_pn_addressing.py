@@ -0,0 +1,94 @@
+""" Tests of the link subnet and address allocation """
+
+import pytest
+
+from ansible.module_utils.pn_addressing import AddressLedger, \
+    LinkSubnetAllocator, LoopbackPlan, format_address, parse_address
+
+
+def test_parse_and_format_address():
+    assert parse_address('10.20.0.1/30') == (169082881, 4)
+    assert format_address(169082881, 4) == '10.20.0.1'
+    value, version = parse_address('fd00::1')
+    assert version == 6
+    assert format_address(value, 6) == 'fd00::1'
+    with pytest.raises(ValueError):
+        parse_address('10.20.0.300')
+
+
+def test_link_subnet_allocator_30():
+    links = LinkSubnetAllocator('10.20.0.0', 16, 30)
+    assert links.count == 16384
+    assert links.allocate() == ('10.20.0.1/30', '10.20.0.2/30')
+    assert links.allocate() == ('10.20.0.5/30', '10.20.0.6/30')
+    assert links.available() == 16382
+
+
+def test_link_subnet_allocator_31_and_127():
+    assert LinkSubnetAllocator('10.20.0.0', 24, 31).allocate() == (
+        '10.20.0.0/31', '10.20.0.1/31')
+    assert LinkSubnetAllocator('fd00::', 64, 127).allocate() == (
+        'fd00::/127', 'fd00::1/127')
+
+
+def test_link_subnet_allocator_starts_at_address():
+    links = LinkSubnetAllocator('10.20.0.9', 28, 30)
+    assert links.count == 2
+    assert links.allocate() == ('10.20.0.9/30', '10.20.0.10/30')
+
+
+def test_link_subnet_allocator_reserve_and_release():
+    links = LinkSubnetAllocator('10.20.0.0', 28, 30)
+    assert links.reserve('10.20.0.5')
+    assert not links.reserve('10.20.0.6/30')
+    assert not links.reserve('10.30.0.1')
+    assert links.allocate() == ('10.20.0.1/30', '10.20.0.2/30')
+    assert links.allocate() == ('10.20.0.9/30', '10.20.0.10/30')
+    assert links.release('10.20.0.1')
+    assert not links.release('10.20.0.2')
+    assert links.available() == 2
+    assert links.allocate() == ('10.20.0.1/30', '10.20.0.2/30')
+    assert links.allocate() == ('10.20.0.13/30', '10.20.0.14/30')
+    assert links.available() == 0
+    with pytest.raises(ValueError):
+        links.allocate()
+
+
+def test_link_subnet_allocator_links():
+    links = LinkSubnetAllocator('10.20.0.0', 29, 31)
+    assert [link[0] for link in links.links()] == [
+        '10.20.0.0/31', '10.20.0.2/31', '10.20.0.4/31', '10.20.0.6/31']
+
+
+def test_link_subnet_allocator_invalid_prefix():
+    with pytest.raises(ValueError):
+        LinkSubnetAllocator('10.20.0.0', 31, 30)
+
+
+def test_address_ledger():
+    ledger = AddressLedger('172.16.0.0/24', stride=2, offset=1)
+    assert ledger.address(0) == '172.16.0.1/24'
+    assert ledger.assign('leaf1', 1) == '172.16.0.3/24'
+    assert ledger.assign('leaf1', 1) == '172.16.0.3/24'
+    with pytest.raises(ValueError):
+        ledger.assign('leaf2', 1)
+    assert ledger.owner('172.16.0.3') == 'leaf1'
+    assert ledger.first_free(1) == 2
+    assert not ledger.contains('172.16.1.1')
+    with pytest.raises(ValueError):
+        ledger.host(200)
+
+
+def test_loopback_plan_keeps_existing_loopbacks():
+    plan = LoopbackPlan(['v1', 'v2', 'v3'], {'v2': ['10.0.0.1/32']},
+                        '10.0.0.0/24')
+    assert plan.ips == {'v1': '10.0.0.2', 'v2': '10.0.0.1',
+                        'v3': '10.0.0.3'}
+    assert plan.missing == ['v1', 'v3']
+    assert plan.unassigned == []
+
+
+def test_loopback_plan_exhausted_prefix():
+    plan = LoopbackPlan(['v1', 'v2', 'v3', 'v4'], {}, '10.0.0.0/30')
+    assert plan.missing == ['v1', 'v2', 'v3']
+    assert plan.unassigned == ['v4']
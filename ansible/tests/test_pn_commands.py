@@ -0,0 +1,107 @@
+""" Tests of the commands file parsing and planning """
+
+import itertools
+
+from ansible.module_utils.pn_commands import ALL, FABRIC, command_plan, \
+    expand_command, parse_commands, switch_variables
+
+COMMANDS = '''# vlans of the fabric
+[ALL]
+vlan-create id 10 scope local
+
+[switch leaf1, leaf2]
+vlan-create id 12 scope local
+[fabric]
+vlan-create id 13 scope fabric
+[ALL]
+vlan-create id 15 scope local
+'''
+
+
+def test_parse_commands_targets():
+    assert list(parse_commands(COMMANDS)) == [
+        (ALL, 'vlan-create id 10 scope local'),
+        (('leaf1', 'leaf2'), 'vlan-create id 12 scope local'),
+        (FABRIC, 'vlan-create id 13 scope fabric'),
+        (ALL, 'vlan-create id 15 scope local'),
+    ]
+
+
+def test_parse_commands_variables():
+    variables = {}
+    commands = list(parse_commands('[vars]\nas = 65000\n'
+                                   '[vars leaf1]\nip = 10.0.0.1\n'
+                                   '[switch leaf1]\nshow {ip}\n', variables))
+    assert commands == [(('leaf1',), 'show {ip}')]
+    assert variables == {None: {'as': '65000'}, 'leaf1': {'ip': '10.0.0.1'}}
+    assert switch_variables(variables, 'leaf1') == {
+        'as': '65000', 'ip': '10.0.0.1', 'switch': 'leaf1'}
+    assert switch_variables(variables, None) == {'as': '65000'}
+
+
+def test_expand_command_without_fields():
+    assert list(expand_command('vlan-show', {})) == ['vlan-show']
+
+
+def test_expand_command_range():
+    assert list(expand_command('vlan-create id {10..12} scope local',
+                               {})) == ['vlan-create id 10 scope local',
+                                        'vlan-create id 11 scope local',
+                                        'vlan-create id 12 scope local']
+
+
+def test_expand_command_range_step_and_count_down():
+    assert list(expand_command('id {10..15..2}', {})) == [
+        'id 10', 'id 12', 'id 14']
+    assert list(expand_command('id {3..1}', {})) == ['id 3', 'id 2', 'id 1']
+
+
+def test_expand_command_range_is_lazy():
+    commands = expand_command('id {1..1000000000}', {})
+    assert list(itertools.islice(commands, 2)) == ['id 1', 'id 2']
+
+
+def test_expand_command_ranges_product():
+    assert list(expand_command('port {1..2} vlan {5..6}', {})) == [
+        'port 1 vlan 5', 'port 1 vlan 6', 'port 2 vlan 5', 'port 2 vlan 6']
+
+
+def test_expand_command_variables():
+    assert list(expand_command('switch {switch} ip {ip} vlan {1..2}', {
+        'switch': 'leaf1'})) == ['switch leaf1 ip {ip} vlan 1',
+                                 'switch leaf1 ip {ip} vlan 2']
+
+
+def test_command_plan_order_and_parents():
+    calls = []
+
+    def switch_list():
+        calls.append(True)
+        return ['leaf1', 'leaf2', 'leaf3']
+
+    items, parents = command_plan(parse_commands(COMMANDS), switch_list)
+    assert items == [
+        ('leaf1', 'vlan-create id 10 scope local'),
+        ('leaf2', 'vlan-create id 10 scope local'),
+        ('leaf3', 'vlan-create id 10 scope local'),
+        ('leaf1', 'vlan-create id 12 scope local'),
+        ('leaf2', 'vlan-create id 12 scope local'),
+        (None, 'vlan-create id 13 scope fabric'),
+        ('leaf1', 'vlan-create id 15 scope local'),
+        ('leaf2', 'vlan-create id 15 scope local'),
+        ('leaf3', 'vlan-create id 15 scope local'),
+    ]
+    # The commands of a switch keep their order, the fabric wide command
+    # waits for the last command of every switch and holds up the others.
+    assert parents == [[], [], [], [0], [1], [2, 3, 4], [5], [5], [5]]
+    assert calls == [True]
+
+
+def test_command_plan_without_all_does_not_list_switches():
+    def switch_list():
+        raise AssertionError('switch_list called')
+
+    items, parents = command_plan([(('leaf1',), 'a'), (FABRIC, 'b')],
+                                  switch_list)
+    assert items == [('leaf1', 'a'), (None, 'b')]
+    assert parents == [[], [0]]
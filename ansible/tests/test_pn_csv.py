@@ -0,0 +1,92 @@
+""" Tests of the csv row layouts and reading """
+
+import pytest
+
+from ansible.module_utils.pn_csv import CsvError, DciRow, ThirdPartyRow, \
+    VrrpL2Row, VrrpRow, VxlanRow, group_by_switch, read_rows
+
+
+def test_vrrp_row_layouts():
+    rows = list(read_rows('101, 101.108.101.0/24, leaf1\n'
+                          '102, 101.108.102.0/24, leaf1, leaf2, 18, leaf2\n',
+                          VrrpRow))
+    assert [row.line for row in rows] == [1, 2]
+    assert not rows[0].clustered()
+    assert rows[0].switch2 is None
+    assert rows[0].switches() == ('leaf1',)
+    assert rows[1].clustered()
+    assert rows[1].switches() == ('leaf1', 'leaf2')
+    assert rows[1].vrrp_id == '18'
+
+
+def test_read_rows_skips_empty_lines_and_keeps_line_numbers():
+    rows = list(read_rows('\n101, 101.108.101.0/24, leaf1\n , ,\n\n'
+                          '103, 101.108.103.0/24, leaf3', VrrpRow))
+    assert [(row.line, row.vlan) for row in rows] == [(2, '101'),
+                                                      (5, '103')]
+
+
+def test_read_rows_padded_non_clustered_row():
+    row, = read_rows('104, 101.108.104.0/24, leaf3,, , ,', VrrpRow)
+    assert (row.vlan, row.switch1, row.switch2) == ('104', 'leaf3', None)
+
+
+def test_read_rows_empty_column():
+    with pytest.raises(CsvError) as error:
+        list(read_rows('101, 101.108.101.0/24, leaf1\n'
+                       '102, 101.108.102.0/24, leaf1, , 18, leaf1', VrrpRow))
+    assert str(error.value) == 'row 2: column 4 (switch2) is empty'
+    assert error.value.line == 2
+
+
+def test_read_rows_empty_vxlan_column():
+    with pytest.raises(CsvError) as error:
+        list(read_rows('101, 101.108.101.0/24, leaf1,', DciRow))
+    assert str(error.value) == 'row 1: column 4 (vxlan) is empty'
+
+
+def test_read_rows_column_count():
+    with pytest.raises(CsvError) as error:
+        list(read_rows('101, 101.108.101.0/24', VrrpRow))
+    assert str(error.value) == 'row 1: expected 3 or 6 columns, got 2'
+
+
+@pytest.mark.parametrize('line, message', [
+    ('5000, 101.108.101.0/24, leaf1',
+     "column 1 (vlan) '5000': expected a number from 1 to 4094"),
+    ('101, 101.108.101.0, leaf1',
+     "column 2 (ip) '101.108.101.0': expected an ip with prefix length"),
+    ('101, 101.108.301.0/24, leaf1',
+     "column 2 (ip) '101.108.301.0/24': expected an ip with prefix length"),
+    ('101, 101.108.101.0/24, leaf 1',
+     "column 3 (switch1) 'leaf 1': expected a name without spaces"),
+])
+def test_read_rows_checks(line, message):
+    with pytest.raises(CsvError) as error:
+        list(read_rows(line, VrrpRow))
+    assert str(error.value) == 'row 1: ' + message
+
+
+def test_dci_and_vxlan_rows():
+    row, = read_rows('101, 101.108.101.0/24, leaf1, 5101', DciRow)
+    assert row.vxlan == '5101'
+    row, = read_rows('101, 101.108.101.0/24, leaf1, leaf2, 18, leaf2, '
+                     '5101, 47', VxlanRow)
+    assert (row.vxlan, row.loopback_port) == ('5101', '47')
+    assert row.switches() == ('leaf1', 'leaf2')
+
+
+def test_vrrp_l2_and_third_party_rows():
+    row, = read_rows('101.108.101.1/24, 101, spine1', VrrpL2Row)
+    assert row.switches() == ('spine1',)
+    row, = read_rows('tp1, 10.1.1.1, 65100, 65000, spine1', ThirdPartyRow)
+    assert (row.neighbor_ip, row.switches()) == ('10.1.1.1', ('spine1',))
+
+
+def test_group_by_switch():
+    rows = list(read_rows('101, 101.108.101.0/24, leaf1, leaf2, 18, leaf2\n'
+                          '102, 101.108.102.0/24, leaf3\n'
+                          '103, 101.108.103.0/24, leaf2', VrrpRow))
+    groups = group_by_switch(rows)
+    assert list(groups) == ['leaf1', 'leaf2', 'leaf3']
+    assert [row.vlan for row in groups['leaf2']] == ['101', '103']
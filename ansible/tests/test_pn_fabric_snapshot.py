@@ -0,0 +1,115 @@
+""" Tests of the in-memory fabric snapshot """
+
+import copy
+
+import pytest
+
+from ansible.module_utils.pn_fabric_snapshot import SHOW_COLUMNS, \
+    FabricSnapshot
+
+# Index attributes of the snapshot, compared with a rebuilt snapshot.
+INDEXES = ('vrouter_rows', 'vrouter_by_switch', 'switch_by_vrouter',
+           'router_ids', 'interfaces', 'interface_by_port',
+           'interface_by_ip', 'loopbacks', 'bgp_neighbors', 'ospf_networks',
+           'clusters', 'cluster_by_node', 'trunks', 'vlags', 'nodes')
+
+
+@pytest.fixture
+def snapshot(module, fabric):
+    fabric.tables.update({
+        'fabric-node-show': [{'name': 'leaf1'}, {'name': 'leaf2'}],
+        'cluster-show': [{'name': 'leaf-cluster', 'cluster-node-1': 'leaf1',
+                          'cluster-node-2': 'leaf2'}],
+        'vrouter-show': [
+            {'name': 'leaf1-vrouter', 'location': 'leaf1', 'bgp-as': '65001',
+             'router-id': '10.0.0.1'},
+            {'name': 'leaf2-vrouter', 'location': 'leaf2', 'bgp-as': '65002',
+             'router-id': '10.0.0.2'},
+        ],
+        'vrouter-interface-show': [
+            {'vrouter-name': 'leaf1-vrouter', 'nic': 'eth0.1',
+             'ip': '10.20.0.1/30', 'l3-port': '49'},
+            {'vrouter-name': 'leaf1-vrouter', 'nic': 'eth0.2',
+             'ip': '10.20.0.5/30', 'l3-port': '50'},
+        ],
+        'vrouter-loopback-interface-show': [
+            {'vrouter-name': 'leaf1-vrouter', 'ip': '109.109.109.1'},
+        ],
+        'vrouter-bgp-show': [{'vrouter-name': 'leaf1-vrouter',
+                              'neighbor': '10.20.0.2', 'remote-as': '65000'}],
+        'trunk-show': [{'switch': 'leaf1', 'name': 'leaf1-to-spine1',
+                        'ports': '49,50'}],
+        'vlag-show': [{'name': 'leaf-to-spine', 'switch': 'leaf1',
+                       'port': 'leaf1-to-spine1', 'peer-switch': 'leaf2',
+                       'peer-port': 'leaf2-to-spine1'}],
+    })
+    return FabricSnapshot(module, 'cli', sorted(SHOW_COLUMNS))
+
+
+def assert_indexed(snapshot):
+    """
+    Check the indexes of a snapshot against the ones of its rows rebuilt.
+    """
+    rebuilt = copy.copy(snapshot)
+    rebuilt.rows = dict(snapshot.rows)
+    for table in snapshot.tables:
+        rebuilt._rebuild(table, list(snapshot.rows[table]))
+    for index in INDEXES:
+        assert getattr(snapshot, index) == getattr(rebuilt, index), index
+
+
+def test_lookups(snapshot):
+    assert snapshot.vrouter_names() == ['leaf1-vrouter', 'leaf2-vrouter']
+    assert snapshot.vrouter('leaf2') == 'leaf2-vrouter'
+    assert snapshot.location('leaf1-vrouter') == 'leaf1'
+    assert snapshot.cluster('leaf2') == 'leaf-cluster'
+    assert snapshot.has_trunk('leaf1', 'leaf1-to-spine1')
+    assert snapshot.has_vlag('leaf2', 'leaf-to-spine')
+    assert snapshot.l3_ports('leaf1-vrouter') == ['49', '50']
+    assert snapshot.interface_ip('leaf1-vrouter', 50) == '10.20.0.5/30'
+    assert snapshot.interface_nic('leaf1-vrouter', '10.20.0.1') == 'eth0.1'
+    assert snapshot.has_bgp_neighbor('leaf1-vrouter', '10.20.0.2', 65000)
+
+
+def test_record(snapshot):
+    snapshot.record('vrouter-ospf-show', {'vrouter-name': 'leaf2-vrouter',
+                                          'network': '10.20.0.4/30'})
+    assert snapshot.has_ospf_network('leaf2-vrouter', '10.20.0.4/30')
+    assert_indexed(snapshot)
+
+
+def test_update(snapshot):
+    row = snapshot.rows['vrouter-show'][0]
+    snapshot.update('vrouter-show', row, {'bgp-as': 65010,
+                                          'router-id': '10.0.0.9',
+                                          'vnet': 'ignored'})
+    assert snapshot.vrouter_names() == ['leaf1-vrouter', 'leaf2-vrouter']
+    assert snapshot.vrouter_row('leaf1-vrouter').bgp_as == '65010'
+    assert snapshot.router_ids['leaf1-vrouter'] == '10.0.0.9'
+    assert_indexed(snapshot)
+
+    row = snapshot.rows['vrouter-interface-show'][1]
+    snapshot.update('vrouter-interface-show', row, {'ip': '10.20.0.9/30'})
+    assert not snapshot.has_interface('leaf1-vrouter', '10.20.0.5')
+    assert snapshot.interface_ip('leaf1-vrouter', '50') == '10.20.0.9/30'
+    assert_indexed(snapshot)
+
+
+@pytest.mark.parametrize('table', sorted(SHOW_COLUMNS))
+def test_remove(snapshot, table):
+    rows = list(snapshot.rows[table])
+    for row in rows:
+        snapshot.remove(table, row)
+        assert_indexed(snapshot)
+    assert snapshot.rows[table] == []
+
+
+def test_remove_keeps_other_rows(snapshot):
+    snapshot.remove('vrouter-interface-show',
+                    snapshot.rows['vrouter-interface-show'][0])
+    assert snapshot.l3_ports('leaf1-vrouter') == ['50']
+    assert snapshot.has_interface('leaf1-vrouter', '10.20.0.5/30')
+    snapshot.remove('cluster-show', snapshot.rows['cluster-show'][0])
+    assert snapshot.cluster('leaf1') is None
+    assert not snapshot.has_cluster('leaf-cluster')
+    assert_indexed(snapshot)
@@ -0,0 +1,92 @@
+""" Tests of the journal of the completed steps of a run """
+
+import os
+
+import pytest
+
+from ansible.module_utils.pn_journal import JOURNAL_DIR_ENV, Journal
+
+from conftest import FakeModule
+
+PARAMS = {'pn_spine_list': ['spine1'], 'pn_clipassword': 'secret'}
+
+
+@pytest.fixture
+def journal_dir(tmpdir, monkeypatch):
+    monkeypatch.setenv(JOURNAL_DIR_ENV, str(tmpdir))
+    return tmpdir
+
+
+class Steps(object):
+    """
+    Module functions recording their calls.
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    def create_vlan(self, module, switch, vlan):
+        self.calls.append((switch, vlan))
+        module.changed_flag.append(True)
+        return ' %s: Created vlan %s \n' % (switch, vlan)
+
+
+def journal(changed_flag, params=PARAMS):
+    module = FakeModule(dict(params))
+    module.changed_flag = changed_flag
+    return Journal(module, 'pn_l3_ztp', changed_flag)
+
+
+def test_replay(journal_dir):
+    steps = Steps()
+    flags = []
+    first = journal(flags)
+    first.run(steps.create_vlan, 'leaf1', 10)
+    first.run(steps.create_vlan, 'leaf1', 10)
+    assert len(steps.calls) == 2
+
+    # The retry replays both identical calls and runs the third one.
+    flags = []
+    retry = journal(flags)
+    assert retry.path == first.path
+    assert retry.run(steps.create_vlan, 'leaf1', 10) == \
+        ' leaf1: Created vlan 10 \n'
+    retry.run(steps.create_vlan, 'leaf1', 10)
+    retry.run(steps.create_vlan, 'leaf1', 10)
+    assert len(steps.calls) == 3
+    assert flags == [True, True, True]
+
+    retry.finish()
+    assert not os.path.exists(retry.path)
+
+
+def test_key_ignores_password(journal_dir):
+    other = dict(PARAMS, pn_clipassword='other')
+    assert journal([]).path == journal([], other).path
+    assert journal([]).path != journal([], {'pn_spine_list': []}).path
+
+
+def test_torn_line(journal_dir):
+    steps = Steps()
+    first = journal([])
+    first.run(steps.create_vlan, 'leaf1', 10)
+    first.run(steps.create_vlan, 'leaf1', 20)
+    with open(first.path) as handle:
+        lines = handle.readlines()
+    with open(first.path, 'w') as handle:
+        handle.write(lines[0] + lines[1][:10])
+
+    retry = journal([])
+    retry.run(steps.create_vlan, 'leaf1', 10)
+    retry.run(steps.create_vlan, 'leaf1', 20)
+    assert steps.calls == [('leaf1', 10), ('leaf1', 20), ('leaf1', 20)]
+
+
+def test_without_journal_dir(monkeypatch):
+    monkeypatch.delenv(JOURNAL_DIR_ENV, raising=False)
+    steps = Steps()
+    unjournaled = journal([])
+    unjournaled.run(steps.create_vlan, 'leaf1', 10)
+    journal([]).run(steps.create_vlan, 'leaf1', 10)
+    assert unjournaled.path is None
+    assert len(steps.calls) == 2
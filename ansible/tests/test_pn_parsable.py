@@ -0,0 +1,51 @@
+""" Tests of the parsable show output parsing """
+
+import pytest
+
+from ansible.module_utils import pn_parsable
+from ansible.module_utils.pn_parsable import make_row, parse, row_type, show
+
+from conftest import ModuleExit
+
+COLUMNS = ('vrouter-name', 'ip', 'l3-port')
+
+
+def test_row_type_is_cached():
+    assert row_type(COLUMNS) is row_type(list(COLUMNS))
+    assert row_type(COLUMNS)._fields == ('vrouter_name', 'ip', 'l3_port')
+
+
+def test_make_row_fills_missing_columns():
+    row = make_row(COLUMNS, {'vrouter-name': 'v1', 'l3-port': 49})
+    assert row == ('v1', '', '49')
+
+
+def test_parse():
+    rows = parse('v1;10.0.0.1/30;49\n\n v2 ; 10.0.0.5/30 ; 50 \n', COLUMNS)
+    assert [tuple(row) for row in rows] == [('v1', '10.0.0.1/30', '49'),
+                                            ('v2', '10.0.0.5/30', '50')]
+    assert rows[1].l3_port == '50'
+
+
+def test_parse_drops_prepended_column_and_short_lines():
+    rows = parse('leaf1;v1;10.0.0.1/30;49\nv2;10.0.0.5/30\n', COLUMNS)
+    assert [tuple(row) for row in rows] == [('v1', '10.0.0.1/30', '49')]
+
+
+def test_show(module, fabric):
+    fabric.tables['vrouter-show'] = [{'name': 'v1', 'location': 'leaf1'}]
+    rows = show(module, 'cli', 'vrouter-show', ('name', 'location'))
+    assert [tuple(row) for row in rows] == [('v1', 'leaf1')]
+
+
+def test_show_errors(module, monkeypatch):
+    monkeypatch.setattr(pn_parsable, 'pn_run_command',
+                        lambda module, cli: (1, '', 'No vrouters found'))
+    assert show(module, 'cli', 'vrouter-show', ('name',),
+                no_rows=('no vrouters',)) == []
+    assert show(module, 'cli', 'vrouter-show', ('name',),
+                fail_on_error=False) == []
+    with pytest.raises(ModuleExit) as error:
+        show(module, 'cli', 'vrouter-show', ('name',))
+    assert error.value.result['failed']
+    assert error.value.result['stderr'] == 'No vrouters found'
@@ -0,0 +1,150 @@
+""" Tests of the desired state diff and plan ordering """
+
+import pytest
+
+from ansible.module_utils.pn_fabric_snapshot import FabricSnapshot
+from ansible.module_utils.pn_reconcile import Lookup, Reconciler, \
+    plan_graph
+
+from conftest import ModuleExit
+
+TABLES = ('trunk-show', 'vlan-show', 'vrouter-interface-show',
+          'vrouter-show')
+
+
+@pytest.fixture
+def snapshot(module, fabric):
+    fabric.tables['vlan-show'] = [
+        {'switch': 'leaf1', 'id': '10', 'scope': 'local'},
+        {'switch': 'leaf1', 'id': '20', 'scope': 'fabric'},
+    ]
+    fabric.tables['vrouter-show'] = [
+        {'name': 'leaf1-vrouter', 'location': 'leaf1', 'bgp-as': '65001'},
+    ]
+    fabric.tables['trunk-show'] = [
+        {'switch': 'leaf1', 'name': 'leaf1-to-spine1', 'ports': '49,50'},
+    ]
+    return FabricSnapshot(module, 'cli', TABLES)
+
+
+def test_want_missing_object(snapshot):
+    reconciler = Reconciler(snapshot)
+    operation = reconciler.want('vlan', 'leaf2', [('id', '10'),
+                                                  ('scope', 'local')])
+    assert operation.action == 'create'
+    assert operation.command() == 'switch leaf2 vlan-create id 10 scope local'
+    assert reconciler.operations == [operation]
+
+
+def test_want_existing_object(snapshot):
+    reconciler = Reconciler(snapshot)
+    assert reconciler.want('vlan', 'leaf1', [('id', '10'),
+                                             ('scope', 'local')]) is None
+    # A fabric scoped vlan is declared once, from the local switch.
+    assert reconciler.want('vlan', None, [('id', '20'),
+                                          ('scope', 'fabric')]) is None
+    assert reconciler.operations == []
+
+
+def test_want_changed_object(snapshot):
+    reconciler = Reconciler(snapshot)
+    operation = reconciler.want('vrouter', 'leaf1', [
+        ('name', 'leaf1-vrouter'), ('bgp-as', '65002')], compare=('bgp-as',))
+    assert operation.action == 'modify'
+    assert operation.command() == ('switch leaf1 vrouter-modify '
+                                   'name leaf1-vrouter bgp-as 65002')
+    assert operation.current.bgp_as == '65001'
+
+
+def test_want_keeps_first_declaration(snapshot):
+    reconciler = Reconciler(snapshot)
+    first = reconciler.want('vlan', 'leaf2', [('id', '30')])
+    assert reconciler.want('vlan', 'leaf2', [('id', '30'),
+                                             ('scope', 'local')]) is first
+    assert reconciler.operations == [first]
+
+
+def test_absent(snapshot):
+    reconciler = Reconciler(snapshot)
+    operation = reconciler.absent('trunk', 'leaf1',
+                                  [('name', 'leaf1-to-spine1')])
+    assert operation.command() == ('switch leaf1 trunk-delete '
+                                   'name leaf1-to-spine1')
+    assert reconciler.absent('trunk', 'leaf2',
+                             [('name', 'leaf1-to-spine1')]) is None
+
+
+def declare(reconciler):
+    """
+    :return: The operations of a small plan, in declaration order.
+    """
+    interface = reconciler.want('vrouter-interface', 'leaf1', [
+        ('vrouter-name', 'leaf2-vrouter'), ('ip', '10.0.0.1/30'),
+        ('vlan', '30')])
+    vrouter = reconciler.want('vrouter', 'leaf2', [
+        ('name', 'leaf2-vrouter')])
+    vlan = reconciler.want('vlan', 'leaf1', [('id', '30')])
+    other = reconciler.want('vlan', 'leaf3', [('id', '30')])
+    delete = reconciler.absent('trunk', 'leaf1',
+                               [('name', 'leaf1-to-spine1')])
+    return interface, vrouter, vlan, other, delete
+
+
+def test_plan_order(snapshot):
+    reconciler = Reconciler(snapshot)
+    interface, vrouter, vlan, other, delete = declare(reconciler)
+    assert reconciler.plan() == [delete, vlan, other, vrouter, interface]
+
+
+def test_plan_graph(snapshot):
+    reconciler = Reconciler(snapshot)
+    interface, vrouter, vlan, other, delete = declare(reconciler)
+    plan = reconciler.plan()
+    # Creates on leaf1 wait for the delete there, the interface for its
+    # vlan and its vrouter; the vlan of leaf3 and the vrouter do not wait.
+    assert plan_graph(plan) == [set(), {0}, set(), set(), {0, 1, 3}]
+
+
+def test_plan_graph_after(snapshot):
+    reconciler = Reconciler(snapshot)
+    first = reconciler.want('vlan', 'leaf2', [('id', '30')])
+    second = reconciler.want('vlan', 'leaf3', [('id', '30')], after=[first])
+    assert plan_graph(reconciler.plan()) == [set(), {0}]
+    assert second.after == [first]
+
+
+def test_replay(snapshot):
+    reconciler = Reconciler(snapshot)
+    interface, vrouter, vlan, other, delete = declare(reconciler)
+    plan = reconciler.plan()
+
+    # A failed run deleted the trunk and created the vlan of leaf1.
+    snapshot.remove('trunk-show', snapshot.rows['trunk-show'][0])
+    snapshot.record('vlan-show', {'switch': 'leaf1', 'id': '30'})
+    replayed = Reconciler(snapshot).replay(plan)
+    assert [operation.command() for operation in replayed] == [
+        'switch leaf3 vlan-create id 30',
+        'switch leaf2 vrouter-create name leaf2-vrouter',
+        'switch leaf1 vrouter-interface-add vrouter-name leaf2-vrouter '
+        'ip 10.0.0.1/30 vlan 30',
+    ]
+
+
+def test_replay_conflict(snapshot):
+    reconciler = Reconciler(snapshot)
+    reconciler.want('vlan', 'leaf2', [('id', '30'), ('scope', 'local')])
+    plan = reconciler.plan()
+    snapshot.record('vlan-show', {'switch': 'leaf2', 'id': '30',
+                                  'scope': 'fabric'})
+    assert Reconciler(snapshot).replay(plan) is None
+
+
+def test_lookup(module, fabric):
+    lookup = Lookup('vrouter-interface-show', 'nic', 'ip 10.0.0.1/30')
+    with pytest.raises(ModuleExit) as error:
+        lookup.fetch(module, 'cli')
+    assert error.value.result['failed']
+    assert str(lookup) in error.value.result['msg']
+
+    fabric.tables['vrouter-interface-show'] = [{'nic': 'eth0.30'}]
+    assert lookup.fetch(module, 'cli') == 'eth0.30'
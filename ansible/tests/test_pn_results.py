@@ -0,0 +1,98 @@
+""" Tests of the result records of a run """
+
+import json
+
+import pytest
+
+from ansible.module_utils.pn_results import RESULTS_FILE_ENV, \
+    RESULTS_LIMIT_ENV, ResultRecorder, message_summary
+
+
+@pytest.fixture
+def spill(tmpdir, monkeypatch):
+    path = str(tmpdir.join('results.jsonl'))
+    monkeypatch.setenv(RESULTS_FILE_ENV, path)
+    monkeypatch.setenv(RESULTS_LIMIT_ENV, '3')
+    return path
+
+
+def add(results, index, message):
+    results.add('leaf1', 'vlan-create', message, ' %s \n' % message,
+                index=index)
+
+
+def messages(records):
+    return [record.message.strip() for record in records]
+
+
+def test_records_in_index_order(monkeypatch):
+    monkeypatch.delenv(RESULTS_FILE_ENV, raising=False)
+    results = ResultRecorder()
+    add(results, 1, 'b1')
+    add(results, 2, 'c1')
+    results.done(2)
+    add(results, 0, 'a1')
+    add(results, 1, 'b2')
+    results.done(1)
+    assert messages(results.records) == ['a1']
+    results.done(0)
+    assert messages(results.records) == ['a1', 'b1', 'b2', 'c1']
+    assert results.count == 4
+
+
+def test_stdout_and_summary(monkeypatch):
+    monkeypatch.delenv(RESULTS_FILE_ENV, raising=False)
+    results = ResultRecorder()
+    results.add('leaf1', 'vlan-create', 'id 10',
+                ' leaf1: Vlan with id 10 created \n')
+    results.add(None, 'vlan-create', 'id 20', ' Vlan 20 created \n')
+    assert results.stdout() == (' leaf1: Vlan with id 10 created \n'
+                                ' Vlan 20 created \n')
+    assert results.summary() == [
+        {'switch': 'leaf1', 'output': 'Vlan with id 10 created'},
+        {'switch': '', 'output': 'Vlan 20 created'},
+    ]
+
+
+def test_spill(spill):
+    results = ResultRecorder()
+    for index in range(5):
+        add(results, index, 'r%d' % index)
+        results.done(index)
+    results.close()
+    assert messages(results.records) == ['r0', 'r1', 'r2']
+    assert results.stdout().endswith(' 2 more results in %s \n' % spill)
+    with open(spill) as handle:
+        lines = [json.loads(line) for line in handle]
+    assert [(line['index'], line['message'].strip()) for line in lines] == [
+        (index, 'r%d' % index) for index in range(5)]
+
+
+def test_spill_held_records(spill):
+    results = ResultRecorder()
+    add(results, 0, 'a1')
+    for index in range(1, 5):
+        add(results, index, 'r%d' % index)
+        add(results, index, 's%d' % index)
+        results.done(index)
+        assert len(results.records) + results._held <= results.limit
+    add(results, 0, 'a2')
+    results.done(0)
+    results.close()
+    # Memory keeps the first records in run order, the file has every
+    # record with its index.
+    assert messages(results.records) == ['a1', 'a2', 'r1']
+    with open(spill) as handle:
+        lines = [json.loads(line) for line in handle]
+    assert sorted((line['index'], line['message'].strip())
+                  for line in lines) == [(0, 'a1'), (0, 'a2')] + [
+        (index, '%s%d' % (name, index)) for index in range(1, 5)
+        for name in 'rs']
+
+
+def test_message_summary():
+    assert message_summary(' leaf2: b \n leaf1: a \nnoise\n leaf3: c \n',
+                           ['leaf1', 'leaf2']) == [
+        {'switch': 'leaf1', 'output': 'a'},
+        {'switch': 'leaf2', 'output': 'b'},
+    ]